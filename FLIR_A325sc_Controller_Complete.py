@@ -10,31 +10,43 @@
 ## Once the camera is focused, a burst of three images are saved at a specified frequency (e.g. every 5 seconds) for a specified durtation (e.g. 5 minutes).
 ## After images have been collected for a specified duration of time, the relay will be switched off and the camera will power down.
 ## While the program is running, statements are printed to the e-ink display hat to describe what the system is doing.
+## These steps run as a state machine on an asyncio event loop (see controller_state_machine.py), so the display, storage checks and capture don't wait on each other.
 ## Please consult the README file for a description of how to assemble the system. 
 
 # ======================== Import  Modules ==================================
 
 #Modules for establishing telnet connection between FLIR and pi
-import telnetlib # for establishing telnet connection to focus camera
+from camera_telnet import AutofocusTimeout, CameraCommandClient, CameraCommandError # keeps one telnet session open to focus the camera
+from focus_cache import FocusCache # restores the last focus position instead of running a full autofocus
 
 # Modules for working with GPIO input
-from gpiozero import MotionSensor # for reading PIR input
-import gpiozero # for controlling relay
+import gpiozero # for reading PIR input and controlling relay
+from motion_trigger import MotionTrigger # switches the relay on from PIR edges
 
 # Modules for capturing and saving images with the FLIR
 import datetime # for creating image filenames with datetime of image capture
 import PySpin # FLIR spinnaker SDK
+from camera_session import CameraSession, burst_intervals # keeps the camera initialized between captures
+from camera_monitor import CameraMonitor # tracks camera arrival/removal without re-scanning the bus
+from frame_writer import FrameWriter, save_frame # saves frames to the SD card in the background
+from frame_container import ContainerSink # appends frames to one file per capture window
 
 # Modules for controlling the e-paper display
 import os # for checking if directory for image export exists (avoids errors while swapping SD cards) and working with the e-ink display
 import sys 
 from waveshare_epd import epd2in7_V2 # Using the 2.7 inch Waveshare e-paper HAT
-from PIL import Image,ImageDraw,ImageFont
+from display_service import DisplayService # initializes the display once and draws messages in the background
 
 # Other modules
+import asyncio # runs the controller state machine
+from controller_state_machine import Controller, STATE_MESSAGES # IDLE -> POWERING -> CONNECTING -> FOCUSING -> CAPTURING -> COOLDOWN
+from capture_scheduler import CaptureScheduler # fires captures on absolute deadlines
+from scene_change import AdaptiveCapture # adapts the capture rate to movement in the scene
+from thermal_trigger import HybridTrigger # confirms PIR events with the camera while it is warm
 from time import sleep # for pausing code
 import time
-import subprocess # used to check if SD card is connected
+from storage_monitor import StorageMonitor, MOUNTINFO_PATH, parse_mountinfo, find_card_mount, list_sd_disks # used to check if SD card is connected
+from storage_manager import StorageManager, Volume # picks the SD card or the spillover directory for each burst
 
 # ======================== Connect to Camera and Grab Image ==================================
 # The function 'save_images_spinnaker' uses the PySpin library from the FLIR Spinnaker SDK to connect to the camera and grab images
@@ -42,84 +54,52 @@ import subprocess # used to check if SD card is connected
 # Argument 'filetype' specifies filetype of image to be saved ('png', 'jpg', 'tiff', etc). I recommend using tiff since this datatype can easily be converted to a numpy array for analysis in python. 
 # Argument 'burst' specifies whether a single image or a burst of images will be saved. The default is burst = True and is ideal for capturing images of free ranging animals.
 # Argument 'burst_num' specifies the number of images that are captured as a part of the burst. The default is 3. 
+# Argument 'session' is an open CameraSession (see camera_session.py). Passing a session keeps the camera initialized and streaming between captures.
+# If no session is given, the camera is initialized for this capture only and released afterwards.
 
-def save_image_spinnaker(directory, filetype, burst = True, burst_num = 3):
-   
-    # Initalize the system
-    system = PySpin.System.GetInstance()
-
-    # Get the camera
-    cam = system.GetCameras()[0]
-    
-    try:
-        if burst == False:
-            # Initialize the camera
-            cam.Init()
-
-            # Start aquisition
-            cam.BeginAcquisition()
-
-            # Grab image
-            image_result = cam.GetNextImage()
-        
-            # Save image
-            filename = directory + 'file-' + str(datetime.datetime.now().strftime('%Y%m%d-%H%M%S')) + "." + filetype
-            if os.path.exists(directory):
-                image_result.Save(filename)
-
-            # Release image
-            image_result.Release()
-
-            # Stop Acquisition
-            cam.EndAcquisition()
+def save_image_spinnaker(directory, filetype, burst = True, burst_num = 3, session = None):
 
-            # Deinitalize camera
-            cam.DeInit()
-        else:
-            # Initialize the camera
-            cam.Init()
-
-            # Start aquisition
-            cam.BeginAcquisition()
-
-            for i in range(0,burst_num):
-
-                # Grab image
-                image_result = cam.GetNextImage()
-        
-                # Save image
-                filename = directory + "file-" + str(datetime.datetime.now().strftime('%Y%m%d-%H%M%S')) +  "_burst" + str(i+1) + "." + filetype
-                if os.path.exists(directory):
-                    image_result.Save(filename)
+    if session is not None:
+        return session.capture(directory = directory, filetype = filetype, burst = burst, burst_num = burst_num)
 
-                # Release image
-                image_result.Release()
+    # Initialize the system and camera for a single capture
+    with CameraSession(pyspin = PySpin) as one_shot_session:
+        return one_shot_session.capture(directory = directory, filetype = filetype, burst = burst, burst_num = burst_num)
 
-            # Stop Acquisition
-            cam.EndAcquisition()
+# The function 'queued_frames' returns the number of frames of the last burst of 'session' that were queued to its FrameWriter.
+# The writer gives back the storage reserved for these frames once they are written (see StorageManager.tracked);
+# the space reserved for the other frames of the burst (not grabbed, or dropped by the writer) is released by the caller.
 
-            # Deinitalize camera
-            cam.DeInit()
-
-    finally:
-        # Release system instance
-        system.ReleaseInstance()
+def queued_frames(session):
+    if session is None or session.writer is None:
+        return 0
+    return sum(1 for frame in session.last_burst if frame['saved'])
 
 
 # ======================= Check for camera connection ========================================
-# The function 'check_connection' generates a list of  cameras that are connected to the raspberry pi using the FLIR spinnaker SDK 
+# The function 'check_connection' checks whether a camera is connected to the raspberry pi using the FLIR spinnaker SDK 
+# Argument 'monitor' is a CameraMonitor (see camera_monitor.py). If given, the cached camera state is returned without scanning the bus.
+# Without a monitor, a list of connected cameras is generated and the system instance is released afterwards.
 # The function returns 'False' if no cameras are connected
 # The function returns 'Returns' 'True' if a camera is connected
 
-def check_connection():
+def check_connection(monitor = None):
+    if monitor is not None:
+        return monitor.is_connected()
+
     # Initalize the system
     system = PySpin.System.GetInstance()
 
-    # Get the list of connected cameras
-    cam_list = system.GetCameras()
+    try:
+        # Get the list of connected cameras
+        cam_list = system.GetCameras()
 
-    # Get length of camera list
-    numcams = len(cam_list)
+        # Get length of camera list
+        numcams = cam_list.GetSize()
+        cam_list.Clear()
+    finally:
+        # Release system instance
+        system.ReleaseInstance()
 
     # Return true if the camera is connected. Return false is no camera is connected.
     if numcams > 0:
@@ -128,22 +108,31 @@ def check_connection():
         return False
 
 # ======================== Establishing Telnet Connection ==============================
-# The function 'establish_telnet_connection' establishes a telnet connection between the camera and the raspberry pi using the telnetlib module
+# The function 'establish_telnet_connection' establishes a telnet connection between the camera and the raspberry pi (see camera_telnet.py)
 # Argument 'cam_ip' is the ip address of the camera.
 # In order for the raspberry pi to recognize the camera, the camera and the raspberry pi must be on the same subnet.
 # The easiest way to ensure that the pi and the camera are on the same subnet is to change the ip address of the raspberry pi to align with the ip address of the camera. 
+# The connection can be kept and reused for every command; it is opened again if the camera was power cycled.
 
 def establish_telnet_connection(cam_ip):
-    telnet_connection = telnetlib.Telnet(cam_ip)
+    telnet_connection = CameraCommandClient(cam_ip)
+    telnet_connection.connect()
     return telnet_connection
 
 # ======================== Focusing the camera via telnet ==============================
 # The function 'focus' focuses the camera via a telent connection between the camera and the pi
 # Argument 'telnet connection' is the telnet connection object that is generated by the function 'establish_telent_connection'
-def focus(telnet_connection):
-    telnet_connection.read_until(b'>')
-    telnet_connection.write(b'rset .system.focus.autofull true\n') # telnet command to focus the camera
-    sleep(5)
+# Argument 'timeout' is the longest time (in seconds) to wait for the autofocus to finish.
+# The camera's focus status is polled, so this returns as soon as the autofocus has finished.
+# Returns the time (in seconds) the autofocus took, or None if it did not finish within 'timeout' (see CameraCommandClient.autofocus).
+def focus(telnet_connection, timeout = 10):
+    try:
+        seconds = telnet_connection.autofocus(timeout = timeout) # telnet command to focus the camera
+    except AutofocusTimeout as error:
+        print(error)
+        return None
+    print(f"Autofocus took {seconds:.1f} s")
+    return seconds
 
 # ======================== Drawing an image on the e-ink display ========================
 # The function 'print_to_display' is used to send images to the waveshare e-ink dipslay hat for the raspberry pi
@@ -153,243 +142,359 @@ def focus(telnet_connection):
 # Argument 'textX' specifies the X position where text is drawn
 # Argument 'textY' specifies the Y position where the text is drawn
 # Agument 'fontPath' specifies the font that you would like to use for the message. You can get a list of paths of fonts that are installed on your PI by typing "fc-list" in the terminal. 
+# Argument 'wait' specifies whether to wait for the display to refresh. By default the message is drawn in the background and
+# the function returns at once; if another message arrives before it is drawn, only the latest one is drawn.
+# The display is initialized once and the background, fonts and messages are cached (see display_service.py).
+
+# Messages rendered in advance: the controller states and the storage warnings
+DISPLAY_MESSAGES = [(message, 16 if message.count("\n") >= 3 else 18) for message in STATE_MESSAGES.values()] + [
+    ("WARNING.\nNo SD card \ndetected.", 18),
+    ("WARNING.\nStorage\nfull.", 18),
+    ("WARNING.\nStorage\nnearly full.", 18),
+    ("No cam\ndetected.\nRestarting\nsystem.", 16),
+]
+
+display = None
+display_layout = None
+
+def print_to_display(deer_on = True, deer_path = "/home/moorcroftlab/Documents/FLIR/FLIR_A325sc_Controller/raspi_text_background_wlogo.bmp", message = "hello deer",textX = 20,textY = 60,fontPath = "/usr/share/fonts/X11/Type1/NimbusMonoPS-Bold.pfb",fontSize = 18, wait = False):
+    global display, display_layout
+    layout = (deer_path if deer_on == True else None, textX, textY, fontPath)
+    if display is None or layout != display_layout:
+        # A different layout needs a different cache (this only happens if the arguments change between calls)
+        if display is not None:
+            display.close()
+        display = DisplayService(epd2in7_V2.EPD(), background_path = layout[0], font_path = fontPath, text_position = (textX, textY), messages = DISPLAY_MESSAGES)
+        display_layout = layout
+    if wait == True:
+        display.show(message, fontSize)
+    else:
+        display.post(message, fontSize)
 
+# =================== Clear the e-ink display ======================================
+# The function 'clear_display' clears the e-ink display 
 
-def print_to_display(deer_on = True, deer_path = "/home/moorcroftlab/Documents/FLIR/FLIR_A325sc_Controller/raspi_text_background_wlogo.bmp", message = "hello deer",textX = 20,textY = 60,fontPath = "/usr/share/fonts/X11/Type1/NimbusMonoPS-Bold.pfb",fontSize = 18):
-   
-    if deer_on == True:
-        
+def clear_display():
+    if display is None:
         epd = epd2in7_V2.EPD()
         epd.init()
         epd.Clear()
-        
-        #Create a blank image for drawing
-        canvas = Image.new('1',(epd.width,epd.height),255)
-        draw = ImageDraw.Draw(canvas)
-
-        # Load the bitmap image
-        image_path = deer_path
-        bmp_image = Image.open(image_path)
-        bw_image = bmp_image.convert('1')
-        bmp_width,bmp_height = bw_image.size
-
-        # Position to paste the bitmap image
-        x_offset = 0
-        y_offset = 0
-
-        # Paste the bitmap image onto the canvas
-        canvas.paste(bw_image,(x_offset,y_offset))
-
-        # Load a font
-        font_path = fontPath
-        txt_font = ImageFont.truetype(font_path,fontSize)
-
-        # Define the text to display
-        text = message
-
-        # Position to draw the text
-        text_x = textX
-        text_y = textY
-
-        # Draw the text on the canvas
-        draw.text((text_x, text_y),text,font=txt_font,fill=0)
-
-        # Display the image on the e-Paper display
-        epd.display_Fast(epd.getbuffer(canvas))
+        epd.sleep()
     else:
-        epd = epd2in7_V2.EPD()
-        epd.init()
-        epd.Clear()
-        
-        #Create a blank image for drawing
-        canvas = Image.new('1',(epd.width,epd.height),255)
-        draw = ImageDraw.Draw(canvas)
-        
-        # Load a font
-        font_path = fontPath
-        txt_font = ImageFont.truetype(font_path,fontSize)
-    
-        # Define the text to display
-        text = message
-        
-        # Position to draw the text
-        text_x = textX
-        text_y = textY
-        
-        # Draw the text on the canvas
-        draw.text((text_x, text_y),text,font=txt_font,fill=0)
-        
-        # Display the image on the e-Paper display
-        epd.display_Fast(epd.getbuffer(canvas))
+        display.clear()
 
-# =================== Clear the e-ink display ======================================
-# The function 'clear_display' clears the e-ink display 
+# =================== Close the e-ink display ======================================
+# The function 'close_display' draws the last posted message and puts the e-ink display to sleep
 
-def clear_display():
-    epd = epd2in7_V2.EPD()
-    epd.init()
-    epd.Clear()
+def close_display():
+    global display
+    if display is not None:
+        display.close()
+        display = None
     
 # ================= Check if SD card is connected ====================================
 # The function 'is_sd_card_connected' is used to check if an SD card is connected to the raspberry pi
 # For this project, I connected the SD card to the raspberry pi using a USB SD card reader
+# Argument 'sd_monitor' is a StorageMonitor (see storage_monitor.py). If given, its cached state is returned.
+# Without a monitor, /sys/block is checked for a USB disk (/dev/sdX) directly, without running lsblk.
 
-def is_sd_card_connected():
-    def list_block_devices():
-        # Execute lsblk command to list block devices
-        result = subprocess.run(['lsblk', '-o', 'NAME,TYPE'], capture_output=True, text=True)
-        return result.stdout
-
-    def find_sd_card(devices_info):
-        # Parse the output of lsblk to find the SD card
-        lines = devices_info.strip().split('\n')
-        for line in lines:
-            if 'sd' in line:  # Typically, SD cards will be named /dev/sdX where X is a letter
-                parts = line.split()
-                device_name = parts[0]
-                device_type = parts[1]
-                
-                if device_type == 'disk':
-                    return True
-        return False
-
-    devices_info = list_block_devices()
-    return find_sd_card(devices_info)
+def is_sd_card_connected(sd_monitor = None):
+    if sd_monitor is not None:
+        return sd_monitor.is_connected()
+    return len(list_sd_disks()) > 0
 
 # ====================== Find SD Mount Point ==========================================
 # The function 'find_sd_card_mount_point' identifies the mount point of the SD Card.
 # The mount point is the directory associated with the SD Card where images will be saved.
-
-def find_sd_card_mount_point():
-    try:
-        # Use the 'df' command to list all mounted filesystems
-        output = subprocess.check_output(['df', '-h']).decode('utf-8')
-        print(output)
-        # Split the output into lines and iterate over them
-        for line in output.splitlines():
-            # Check if the line contains '/media' or '/mnt'
-            if '/media' in line or '/mnt' in line:
-                # Split the line into columns and get the mount point
-                columns = line.split()
-                mount_point = columns[-1]
-                # You can add further checks to identify the SD card specifically
-                print(f"Possible SD card mount point: {mount_point}")
-                return(mount_point)
-                
-    except subprocess.CalledProcessError as e:
-        print(f"Error occurred: {e}")
+# Argument 'sd_monitor' is a StorageMonitor (see storage_monitor.py). If given, its cached mount point is returned.
+# Without a monitor, /proc/self/mountinfo is read directly, without running df. Returns None if no card is mounted.
+
+def find_sd_card_mount_point(sd_monitor = None):
+    if sd_monitor is not None:
+        return sd_monitor.mount_point
+    with open(MOUNTINFO_PATH) as f:
+        mount = find_card_mount(parse_mountinfo(f.read()))
+    if mount is None:
+        return None
+    print(f"Possible SD card mount point: {mount['mount_point']}")
+    return mount['mount_point']
+
+# ======================= Storage volumes ================================================
+# Images are saved to the SD card. When it is full (or missing), they spill over to a directory on the pi's internal disk,
+# which is capped at SPILLOVER_QUOTA bytes so the operating system never runs out of space.
+
+SPILLOVER_DIRECTORY = "/home/moorcroftlab/Documents/FLIR/spillover"
+SPILLOVER_QUOTA = 2e9
+
+# The function 'storage_volumes' returns a StorageManager for the SD card (tracked by 'sd_monitor') and the spillover directory
+
+def storage_volumes(sd_monitor):
+    os.makedirs(SPILLOVER_DIRECTORY, exist_ok = True)
+    return StorageManager([
+        Volume(sd_monitor.directory, name = "SD card"),
+        Volume(SPILLOVER_DIRECTORY, name = "internal disk", quota_bytes = SPILLOVER_QUOTA),
+    ])
 
 # ======================= Save pictures ==================================================
 
 # The function 'collect_data' is used to pull images from the camera and save them to the SD card.
 # Argument 'duration' sets the duration (in minutes) of data collection.
 # Argument 'frequency' sets the frequency (in seconds) at which images (or burst of images) are grabbed from the camera. 
-
-def collect_data(duration = 5, frequency = 5):
-    start_time = time.time()
-    elapsed_time = 0
+# Bursts are started on a fixed grid of deadlines (see capture_scheduler.py), so the time a capture takes doesn't stretch the period.
+# Argument 'monitor' is the CameraMonitor used to check that the camera is still connected.
+# Argument 'storage' sets how images are saved: "container" appends every frame to a single session file (see frame_container.py), "tiff" saves one tiff per frame.
+# Argument 'sd_monitor' is the StorageMonitor used to check that the SD card is still mounted. If none is given, one is started for this call.
+# Argument 'storage_manager' is the StorageManager that picks where each burst is saved (see storage_manager.py). If none is given, storage_volumes(sd_monitor) is used.
+# Argument 'burst_num' is the number of images in each burst.
+# A burst is only started if it fits on one of the volumes.
+
+def collect_data(duration = 5, frequency = 5, monitor = None, storage = "container", sd_monitor = None, storage_manager = None, burst_num = 3):
     check_sd_count = 0
+    full_count = 0
     image_capture_count = 0
-    while elapsed_time < duration * 60:
-        if is_sd_card_connected() == False:
-            image_capture_count = 0 # reset image capture count 
-            print("WARNING: SD Card missing.")
-            if check_sd_count == 0:
-                print_to_display(message = "WARNING.\nNo SD card \ndetected.")
-            check_sd_count += 1
-            sd_missing = True
-            while sd_missing == True:
-                sd_missing = os.path.exists(fpath)
-                sleep(1)
-        elif is_sd_card_connected() == True and check_connection() == True:
-            check_sd_count = 0 # reset check SD count
-            fpath = find_sd_card_mount_point()
-            if image_capture_count == 0:
-                print_to_display(message = "Capturing \nimages.")
-            print("Capturing image . . .")
-            save_image_spinnaker(directory = fpath, filetype = "tiff")
-            print ("Image saved.")
-            sleep(frequency)
-            image_capture_count += 1
-        elapsed_time = time.time() - start_time
+    own_sd_monitor = sd_monitor is None
+    if own_sd_monitor:
+        sd_monitor = StorageMonitor()
+    if storage_manager is None:
+        storage_manager = storage_volumes(sd_monitor)
+    burst_bytes = burst_num * storage_manager.frame_bytes
+    # Bursts are due every 'frequency' seconds from the start of the window, however long each capture takes
+    scheduler = CaptureScheduler(frequency, duration = duration * 60)
+    # Keep the camera initialized and streaming for the whole data collection window
+    # and write frames to the SD card in the background so the camera never waits on the card
+    with ContainerSink() as sink, FrameWriter(save = storage_manager.tracked(sink.save if storage == "container" else save_frame)) as writer, CameraSession(pyspin = PySpin, writer = writer) as session:
+        for slot in scheduler:
+            if slot.missed > 0:
+                print(f"WARNING: {slot.missed} capture slot(s) missed.")
+            if not is_sd_card_connected(sd_monitor):
+                print("WARNING: SD Card missing.")
+                if check_sd_count == 0:
+                    print_to_display(message = "WARNING.\nNo SD card \ndetected.")
+                check_sd_count += 1
+            else:
+                check_sd_count = 0 # reset check SD count
+            fpath = storage_manager.directory_for(burst_bytes)
+            if fpath is None:
+                # Nowhere to put the burst: don't start it
+                image_capture_count = 0 # reset image capture count 
+                print("WARNING: No storage space left.")
+                if full_count == 0:
+                    print_to_display(message = "WARNING.\nStorage\nfull.")
+                full_count += 1
+            elif check_connection(monitor) == True:
+                full_count = 0
+                if image_capture_count == 0:
+                    print_to_display(message = "Capturing \nimages.")
+                print("Capturing image . . .")
+                try:
+                    save_image_spinnaker(directory = fpath, filetype = "tiff", burst_num = burst_num, session = session)
+                    print ("Image saved.")
+                    # Report the frame spacing the camera actually achieved during the burst
+                    intervals = burst_intervals(session.last_burst)
+                    if len(intervals) > 0:
+                        print(f"Burst frame interval: {1000 * sum(intervals) / len(intervals):.1f} ms (max {1000 * max(intervals):.1f} ms)")
+                except PySpin.SpinnakerException as e:
+                    print(f"Capture failed: {e}")
+                finally:
+                    # Frames queued to the writer give their space back once written; give back the space of the others now
+                    storage_manager.release_frames(fpath, burst_num - queued_frames(session))
+                image_capture_count += 1
+            else:
+                storage_manager.release(fpath, burst_bytes)
+        writer.flush()
+        stats = writer.stats()
+        print(f"Frames written: {stats['written']}  dropped: {stats['dropped']}  write errors: {stats['errors']}")
+    slots = scheduler.stats()
+    print(f"Capture slots: {slots['fired']}  late: {slots['late']}  missed: {slots['missed']}  max lateness: {1000 * slots['max_lateness']:.0f} ms")
+    time_to_full = storage_manager.time_to_full()
+    if time_to_full is not None:
+        print(f"Storage full in {time_to_full / 3600:.1f} h at the current capture rate")
+    if own_sd_monitor:
+        sd_monitor.close()
          
+# ============== Hardware for the state machine ========================
+# The class 'TrapHardware' connects the controller state machine (see controller_state_machine.py) to the relay, PIR, camera, SD card and e-ink display.
+# Argument 'trigger' is the MotionTrigger for the PIR and relay.
+# Argument 'monitor' is the CameraMonitor, 'sd_monitor' the StorageMonitor and 'storage_manager' the StorageManager.
+# Argument 'storage' sets how images are saved (see collect_data).
+# Argument 'flir_ip' is the ip address of the camera, used to focus it over telnet.
+# Argument 'focus_cache' is an optional FocusCache. If given, the saved focus position is restored after a boot and a full
+# autofocus is only run if the last frame of the first burst is blurred. Without it, every boot runs a full autofocus.
+
+class TrapHardware:
+
+    def __init__(self, trigger, monitor, sd_monitor, storage_manager, storage = "container", flir_ip = '169.254.0.2', focus_cache = None):
+        self.trigger = trigger
+        self.monitor = monitor
+        self.sd_monitor = sd_monitor
+        self.storage_manager = storage_manager
+        self.flir_ip = flir_ip
+        self.focus_cache = focus_cache
+        self.sink = ContainerSink()
+        # Frames are written to the SD card in the background so the camera never waits on the card
+        self.writer = FrameWriter(save = storage_manager.tracked(self.sink.save if storage == "container" else save_frame))
+        self.session = None
+        self.latest_frame = None
+        # One telnet session for as long as the camera is powered
+        self.telnet = CameraCommandClient(flir_ip)
+
+    def is_motion(self):
+        return self.trigger.is_motion()
+
+    # Forward the PIR edges to 'function' (called with True on motion and False when the motion stops)
+    def set_motion_listener(self, function):
+        if function is None:
+            self.trigger.on_motion = None
+            self.trigger.on_no_motion = None
+        else:
+            self.trigger.on_motion = lambda: function(True)
+            self.trigger.on_no_motion = lambda: function(False)
+
+    def power_on(self):
+        self.trigger.power_on()
+
+    def power_off(self, hold = None):
+        self.telnet.close()
+        self.trigger.power_off(hold)
+
+    def camera_connected(self):
+        return check_connection(self.monitor)
+
+    # Capture unfocused rather than not at all if the camera doesn't answer over telnet
+    def focus(self):
+        try:
+            if self.focus_cache is not None:
+                self.focus_cache.focus(self.telnet)
+            else:
+                focus(self.telnet)
+        except CameraCommandError as error:
+            print(f"Could not focus the camera: {error}")
+
+    # Keep the camera initialized and streaming for the whole capture window
+    def start_capture(self):
+        if self.session is None:
+            self.session = CameraSession(pyspin = PySpin, writer = self.writer, on_frame = self._keep_frame)
+
+    # Keep a copy of the latest frame for the scene change detector
+    def _keep_frame(self, pixels, frame):
+        self.latest_frame = pixels.copy()
+
+    def last_frame(self):
+        return self.latest_frame
+
+    # The space reserved for the burst (see storage_directory) is settled here: frames queued to the writer give it back
+    # once they are written, the space of the other frames is released when the burst ends, whether it failed or not.
+    def capture(self, directory, burst_num = 3):
+        try:
+            filenames = save_image_spinnaker(directory = directory, filetype = "tiff", burst_num = burst_num, session = self.session)
+        finally:
+            self.storage_manager.release_frames(directory, burst_num - queued_frames(self.session))
+        # The first burst after a restored focus is saved as it is; its last frame is checked, and the camera refocused if it was blurred
+        if self.focus_cache is not None and self.focus_cache.needs_check() and self.latest_frame is not None:
+            try:
+                self.focus_cache.check(self.latest_frame, self.telnet)
+            except CameraCommandError as error:
+                print(f"Could not focus the camera: {error}")
+        # Report the frame spacing the camera actually achieved during the burst
+        intervals = burst_intervals(self.session.last_burst)
+        if len(intervals) > 0:
+            print(f"Burst frame interval: {1000 * sum(intervals) / len(intervals):.1f} ms (max {1000 * max(intervals):.1f} ms)")
+        return filenames
+
+    # Grab one frame for the thermal trigger without saving it
+    def preview_frame(self):
+        self.start_capture()
+        image_result = self.session.grab()
+        try:
+            return image_result.GetNDArray().copy()
+        finally:
+            image_result.Release()
+
+    # Finish writing the frames of the capture window. The next capture window starts new containers.
+    # The camera stays open, e.g. for the preview frames of the hybrid trigger.
+    def end_window(self):
+        self.writer.flush()
+        self.sink.new_session()
+
+    # Release the camera and finish writing the frames
+    def stop_capture(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        self.end_window()
+
+    def storage_directory(self, nbytes):
+        return self.storage_manager.directory_for(nbytes)
+
+    def release_storage(self, directory, nbytes):
+        self.storage_manager.release(directory, nbytes)
+
+    # Returns a message for the display if the SD card is missing or the storage is about to fill up, or None
+    def storage_warning(self):
+        if not is_sd_card_connected(self.sd_monitor):
+            return "WARNING.\nNo SD card \ndetected."
+        time_to_full = self.storage_manager.time_to_full()
+        if time_to_full is not None and time_to_full < 3600:
+            return "WARNING.\nStorage\nnearly full."
+        return None
+
+    def display(self, message):
+        # The controller already draws on its own thread and only keeps the latest message, so wait for the refresh here
+        print_to_display(message = message, fontSize = 16 if message.count("\n") >= 3 else 18, wait = True)
+
+    def telemetry(self):
+        stats = self.writer.stats()
+        return {
+            'frames_written': stats['written'],
+            'frames_dropped': stats['dropped'],
+            'write_errors': stats['errors'],
+            'sd_free_bytes': self.sd_monitor.free_bytes,
+        }
+
+    def close(self):
+        self.stop_capture()
+        self.writer.close()
+        self.sink.close()
+        self.telnet.close()
+
 # ============== Main Code =============================================
 
 def main():
 
     # Define PIR sensor GPIO pins on Raspberry Pi
-    pir = MotionSensor(20)
+    # The PIR is read with edge interrupts: the relay is switched on as soon as its output rises (see motion_trigger.py)
+    pir = gpiozero.DigitalInputDevice(20, pull_up = False)
     relay = gpiozero.OutputDevice(21, active_high = True, initial_value = False)
-
-    count = 0 # used to check if while loop is on first iteration
-    
-    while True: 
-        # Check if motion is detected
-        previous_motion = False
-        current_motion = pir.motion_detected
-        
-        if current_motion == True and previous_motion == False:
-
-            # Turn on camera
-            print("Motion detected. Turning on camera")
-            relay.on()
-            
-            # Pause code until camera is connected
-            print("Connecting to camera . . .")
-            print_to_display(message = "Connecting\nto camera.")
-            not_connected = True
-            start_time = time.time()
-            while not_connected == True:
-                connection_status = check_connection()
-                if connection_status == True:
-                    not_connected = False
-                else:
-                    current_time = time.time()
-                    if current_time - start_time > 60:
-                        # If the camera takes longer than 1 min to connect, it is likely frozen.
-                        # When this happens, turn the camera off for 1 minute and try connecting again. 
-                        print("Camera frozen. Restarting . . . ")
-                        print_to_display(message = "No cam\ndetected.\nRestarting\nsystem.", fontSize = 16)
-                        relay.off()
-                        sleep(60)
-                        relay.on()
-                        print("Connecting to camera . . .")
-                        print_to_display(message = "Connecting\nto camera.")
-                        sleep(1)
-                        start_time = time.time()
-                    else:
-                        sleep(1)
-            print("Camera connected.")
-
-            # Focus the camera
-            if check_connection() == True:
-                flir_ip = '169.254.0.2' 
-                tn = establish_telnet_connection(flir_ip)
-                print("Focusing camera . . .")
-                print_to_display(message = "Focusing\ncamera.")
-                focus(tn)
-                print("Camera is focused.")
-
-            # Grab and save images from the camera
-            collect_data(duration = 1)
-            
-            # Update global count variable
-            count = 0
-
-
-        if current_motion == False:
-            # If there is no motion, the camera should be powered off by switching off the relay. 
-            relay.off() 
-            print("No motion detected. Camera off.")
-            if count == 0:
-                print_to_display(message = "No motion\ndetected.\nCamera off.")
-            sleep(1) # prevents the camera from freezing from turning on/off to quickly
-            previous_motion = False
-            
-            # This prevents the display from constantly refreshing when there is no motion:
-            count +=1
-            if count == 2:
-                count -= 1
+    trigger = MotionTrigger(pir, relay)
+
+    # Track camera arrival/removal with one long-lived system instance
+    monitor = CameraMonitor(pyspin = PySpin)
+
+    # Track SD card insertion/removal and free space without running lsblk/df
+    sd_monitor = StorageMonitor()
+    sd_monitor.add_listener(lambda event, mount_point: print(f"SD card {event}: {mount_point}"))
+    storage_manager = storage_volumes(sd_monitor)
+
+    # Power on when motion is detected, connect, focus, capture bursts for 1 minute, then cool down.
+    # Bursts are every 2 seconds while a warm target moves in the scene, backing off to every 15 seconds when nothing changes.
+    # The window is extended while the target keeps moving (up to 5 minutes) and ends early if the scene stays static.
+    # The focus position found by the last autofocus is restored on every boot; a full autofocus only runs if the first burst is blurred
+    focus_cache = FocusCache("/home/moorcroftlab/Documents/FLIR/focus_position.json", threshold = 0.5)
+    hardware = TrapHardware(trigger, monitor, sd_monitor, storage_manager, focus_cache = focus_cache)
+    adaptive = AdaptiveCapture(fast_period = 2, slow_period = 15, extend = 30, max_duration = 300)
+    # After a capture window the camera stays warm for 10 minutes, and PIR events are only acted on if the camera sees a warm blob
+    hybrid = HybridTrigger(warm_time = 600, preview_period = 1, confirm_window = 5)
+    controller = Controller(hardware, duration = 60, frequency = 5, adaptive = adaptive, hybrid = hybrid)
+    try:
+        asyncio.run(controller.run())
+    finally:
+        hardware.close()
+        for state, seconds in controller.time_in_states().items():
+            print(f"{state:<12} {seconds:.1f} s")
+        close_display()
+        trigger.close()
+        monitor.close()
+        sd_monitor.close()
             
 if __name__ == '__main__':
     main()
\ No newline at end of file
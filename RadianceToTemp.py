@@ -3,17 +3,29 @@
 ## The script RadianceToTemp.py is used to converts the raw measurements from the FLIR camera to units of temperature (degrees Celcius).
 ## As input, this script accepts tiffs of raw data obtained from a thermal camera. 
 ## The tiffs should be saved using this file format "file-YYYYMMDD-HHMMSS" with the date and time that the image was captured in the filename. 
+## Tiffs saved by the controller also carry the exact capture time in their tags or in a sidecar index (see frame_metadata.py), which is used first.
+## Alternatively, a frame container written by the controller (session-YYYYMMDD-HHMMSS.frames, see frame_container.py) can be used as input.
 
 # ================================ Modules ===================================
 
+import argparse
 import imageio.v2 as imageio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections import deque
+import functools
+import hashlib
 import math
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import os
-from datetime import datetime
-import platform
+import sys
+import time
+from frame_dataset import FrameDataset
+from frame_metadata import capture_datetime
+from solar_radiation import get_solar_radiation
+from temperature_writers import WRITERS, TiffWriter, make_writer
 
 # ============================== Read in Images =============================
 
@@ -42,26 +54,65 @@ def tiffs_to_numpy_arrays(directory_path):
 
     return numpy_arrays
 
+def container_to_numpy_arrays(container_path):
+
+    """
+    Reads the frames stored in a frame container (see frame_container.py). Frames are not loaded into memory:
+    each array is a read-only view of the container file that is only read from disk when it is used.
+
+    Args:
+    container_path (str): The path to the frame container (.frames) file.
+
+    Returns:
+    dict: A dictionary in the same layout as tiffs_to_numpy_arrays. The keys are built from the capture time and frame ID
+    of each frame and the values are a list containing the numpy array and the date that the data was collected.
+
+    """
+    numpy_arrays = {}
+
+    for name, numpy_array, dt in load_frames(container_path).items():
+        numpy_arrays[name] = [numpy_array, dt]
+
+    return numpy_arrays
+
+def load_frames(path):
+
+    """
+    Indexes the frames in a directory of TIFF files or in a frame container without reading them.
+    Frames are read (memory-mapped where possible) one at a time as they are used, so processing can start right away
+    and memory use does not grow with the number of frames. See frame_dataset.py.
+
+    Args:
+    path (str): The path to a directory containing TIFF files or to a frame container (.frames) file.
+
+    Returns:
+    FrameDataset: dataset[i] returns frame i and dataset.items() yields the filename, numpy array and capture date of each frame.
+
+    """
+    return FrameDataset(path, get_datetime = get_image_datetime)
+
 
 # ============================ Get Image Metadata ==============================
 
 def get_image_datetime(file_path):
-    try:
-        if platform.system() == 'Windows':
-            # On Windows, use getctime for creation time
-            creation_time = os.path.getctime(file_path)
-        else:
-            # On Unix-like systems, use stat for creation time if available
-            stat = os.stat(file_path)
-            creation_time = getattr(stat, 'st_birthtime', stat.st_ctime)
-        
-        # Convert the timestamps to datetime objects
-        creation_datetime = datetime.fromtimestamp(creation_time)
-        
-        return creation_datetime
-    
-    except Exception as e:
-        return f'Error retrieving file dates: {e}'
+
+    """
+    Finds the date and time an image was captured, from the metadata saved with the image (see frame_metadata.py):
+    the sidecar index of the directory, the tiff tags (read without decoding the pixels), or the capture time in the
+    filename ("file-YYYYMMDD-HHMMSS"). The creation time of the file is not used, because it is the time the file was
+    copied rather than the time the image was captured.
+
+    Args:
+    file_path (str): Path to the image
+
+    Returns:
+    datetime: Date and time the image was captured
+
+    Raises:
+    ValueError: If the capture time can't be found.
+    """
+
+    return capture_datetime(file_path)
 
 # ========================= Get Weather Data =========================================
 
@@ -85,23 +136,109 @@ def csv_to_df(filepath):
     return(df)
 
 
+# Names of the time column of the covariate tables: the weather csv has 'timestamp', the GEE exports have 'date' (LAI,
+# albedo) or 'time' (atmospheric transmissivity)
+TIME_COLUMNS = ('timestamp', 'time', 'date')
+
+class CovariateIndex:
+
+    """
+
+    Time index over a table of covariates (weather data or the GEE LAI, albedo and atmospheric transmissivity exports).
+    The timestamp column is parsed and sorted once, after which the value of any column at any time is found with a
+    binary search (np.searchsorted) instead of a scan of the whole table. Lookups accept a single timestamp or an array
+    of timestamps (e.g. the capture times of every image) and are vectorized. The caller's DataFrame is not modified.
+
+    Args:
+    df (pandas df): Table with a timestamp column.
+    time_column (str): Name of the timestamp column. Defaults to the first of TIME_COLUMNS in the table.
+
+    """
+
+    def __init__(self, df, time_column = None):
+        if time_column is None:
+            time_column = next((column for column in TIME_COLUMNS if column in df.columns), None)
+            if time_column is None:
+                raise ValueError(f"No time column in the table (expected one of {', '.join(TIME_COLUMNS)})")
+        times = pd.to_datetime(df[time_column]).to_numpy(dtype = 'datetime64[ns]').view(np.int64)
+        order = np.argsort(times, kind = 'stable')
+        self.times = times[order]
+        self.columns = {column: df[column].to_numpy()[order] for column in df.columns if column != time_column}
+
+    def __len__(self):
+        return len(self.times)
+
+    @staticmethod
+    def _to_ns(datetimes):
+        return pd.to_datetime(np.atleast_1d(np.asarray(datetimes, dtype = object))).to_numpy(dtype = 'datetime64[ns]').view(np.int64)
+
+    def nearest_index(self, datetimes):
+
+        """
+        Returns the row (in time order) closest to each timestamp. Ties go to the earlier row.
+        """
+
+        t = self._to_ns(datetimes)
+        if len(self.times) == 1:
+            return np.zeros(len(t), dtype = np.intp)
+        # Compare the rows on either side of the insertion point
+        right = np.clip(np.searchsorted(self.times, t, side = 'left'), 1, len(self.times) - 1)
+        left = right - 1
+        use_right = np.abs(self.times[right] - t) < np.abs(t - self.times[left])
+        return np.where(use_right, right, left)
+
+    def nearest(self, column, datetimes):
+
+        """
+
+        Finds the value of a column at the row closest in time to each timestamp.
+
+        Args:
+        column (str): Column to look up (e.g. 'TA', 'RH', 'LAI', 'albedo', 'atmospheric_transmissivity').
+        datetimes (datetime or array of datetimes): Timestamps of the image captures.
+
+        Returns:
+        The value for a single timestamp, or a NumPy array with one value per timestamp.
+
+        """
+
+        values = self.columns[column][self.nearest_index(datetimes)]
+        return values if np.ndim(datetimes) > 0 else values[0]
+
+    def interpolate(self, column, datetimes):
+
+        """
+        Same as nearest, but linearly interpolates the column between the rows before and after each timestamp.
+        Timestamps outside of the table take the first or last value.
+        """
+
+        t = self._to_ns(datetimes)
+        values = np.interp(t.astype(np.float64), self.times.astype(np.float64), self.columns[column].astype(np.float64))
+        return values if np.ndim(datetimes) > 0 else values[0]
+
+def covariate_index(dat):
+
+    """
+    Returns 'dat' if it is already a CovariateIndex, otherwise indexes the DataFrame. Pass an index to the get_* functions
+    below when looking up many images, so the table is only parsed and sorted once.
+    """
+
+    if isinstance(dat, CovariateIndex):
+        return dat
+    return CovariateIndex(dat)
+
 def get_Ta(weather_dat, datetime):
     """
     Finds the air temperature at the time of image capture.
     
     Args:
-    weather_dat (pandas df): Pandas dataframe of weather data
-    datetime (datetime): Timestamp of the image capture
+    weather_dat (pandas df or CovariateIndex): Pandas dataframe of weather data, or a CovariateIndex of it
+    datetime (datetime or array of datetimes): Timestamp of the image capture
     
     Returns:
-    float: Air temperature at the time of image capture
+    float: Air temperature at the time of image capture (a NumPy array for an array of timestamps)
     """
-    given_time = pd.to_datetime(datetime)
-    weather_dat['timestamp'] = pd.to_datetime(weather_dat['timestamp'])
-    weather_dat['time_diff'] = (weather_dat['timestamp'] - given_time).abs()
-    closest_row = weather_dat.loc[weather_dat['time_diff'].idxmin()]
-    air_temp = closest_row['TA']
-    return air_temp
+    return covariate_index(weather_dat).nearest('TA', datetime)
 
 def get_RH(weather_dat, datetime):
     
@@ -109,104 +246,151 @@ def get_RH(weather_dat, datetime):
     Finds the humidity at the time of image capture.
     
     Args:
-    weather_dat (pandas df): Pandas dataframe of weather data
-    datetime (datetime): Timestamp of the image capture
+    weather_dat (pandas df or CovariateIndex): Pandas dataframe of weather data, or a CovariateIndex of it
+    datetime (datetime or array of datetimes): Timestamp of the image capture
     
     Returns:
-    float: Humidity at the time of image capture
+    float: Humidity at the time of image capture, as stored in the RH column: a 0-1 fraction, as raw_to_temp expects
+    (multiply by 100 for get_LW). A NumPy array for an array of timestamps.
     """
-    given_time = pd.to_datetime(datetime)
-    weather_dat['timestamp'] = pd.to_datetime(weather_dat['timestamp'])
-    weather_dat['time_diff'] = (weather_dat['timestamp'] - given_time).abs()
-    closest_row = weather_dat.loc[weather_dat['time_diff'].idxmin()]
-    hum = closest_row['RH']
-    return hum
+    return covariate_index(weather_dat).nearest('RH', datetime)
 
 # ========================= Estimate Solar Radiation ===================================
 
 def get_lai(lai_dat,datetime):
-	
-	"""
+    
+    """
     Finds the closest LAI at the time of image capture.
     
     Args:
-    lai_dat (pandas df): Pandas dataframe of lai timeseries (Generated via GEE script. See LAI_timeseries.js)
-    datetime (datetime): Timestamp of the image capture
+    lai_dat (pandas df or CovariateIndex): Pandas dataframe of lai timeseries (Generated via GEE script. See LAI_timeseries.js)
+    datetime (datetime or array of datetimes): Timestamp of the image capture
     
     Returns:
-    float: lai at the time of image capture
+    float: lai at the time of image capture (a NumPy array for an array of timestamps)
     """
-
-    given_time = pd.to_datetime(datetime)
-    lai_dat['timestamp'] = pd.to_datetime(lai_dat['timestamp'])
-    lai_dat['time_diff'] = (lai_dat['timestamp'] - given_time).abs()
-    closest_row = lai_dat.loc[lai_dat['time_diff'].idxmin()]
-    lai = closest_row['LAI']
-    return lai
+    return covariate_index(lai_dat).nearest('LAI', datetime)
 
 def get_atmospheric_trans(at_dat, datetime):
 
-	"""
+    """
     Finds the closest atmospheric transmissivity at the time of image capture.
     
     Args:
-    at_dat (pandas df): Pandas dataframe of atmospheric transmissivity timeseries (generated via GEE script. See atmospheric_transmissivity_timeseries.js)
-    datetime (datetime): Timestamp of the image capture
+    at_dat (pandas df or CovariateIndex): Pandas dataframe of atmospheric transmissivity timeseries (generated via GEE script. See atmospheric_transmissivity_timeseries.js)
+    datetime (datetime or array of datetimes): Timestamp of the image capture
     
     Returns:
-    float: atmospheric transmissivity at the time of image capture
+    float: atmospheric transmissivity at the time of image capture (a NumPy array for an array of timestamps), from the
+    'atmospheric_transmissivity' column, or the 'clear_sky_index' column of the GEE export
     
     """
-
-    given_time = pd.to_datetime(datetime)
-    at_dat['timestamp'] = pd.to_datetime(at_dat['timestamp'])
-    at_dat['time_diff'] = (at_dat['timestamp'] - given_time).abs()
-    closest_row = at_dat.loc[lai_dat['time_diff'].idxmin()]
-    a_trans = closest_row['atmospheric_transmissivity']
-    return a_trans
+    index = covariate_index(at_dat)
+    column = 'atmospheric_transmissivity' if 'atmospheric_transmissivity' in index.columns else 'clear_sky_index'
+    return index.nearest(column, datetime)
 
 def get_albedo(albedo_dat,datetime):
-	"""
+    """
     Finds the closest land surface albedo at the time of image capture.
     
     Args:
-    albedo_dat (pandas df): Pandas dataframe of an albedo timeseries (generated via GEE script. See albedo_timeseries.js)
-    datetime (datetime): Timestamp of the image capture
+    albedo_dat (pandas df or CovariateIndex): Pandas dataframe of an albedo timeseries (generated via GEE script. See albedo_timeseries.js)
+    datetime (datetime or array of datetimes): Timestamp of the image capture
     
     Returns:
-    float: albedo at the time of image capture
+    float: albedo at the time of image capture (a NumPy array for an array of timestamps)
     
     """
-
-    given_time = pd.to_datetime(datetime)
-    albedo_dat['timestamp'] = pd.to_datetime(albedo_dat['timestamp'])
-    albedo_dat['time_diff'] = (albedo_dat['timestamp'] - given_time).abs()
-    closest_row = albedo_dat.loc[lai_dat['time_diff'].idxmin()]
-    albedo = closest_row['albedo']
-    return albedo
+    return covariate_index(albedo_dat).nearest('albedo', datetime)
 
 # ========================= Longwave Radiation from the Surroundings ==================
 
-def get_LW():
+# Stefan-Boltzman Constant (W/m2/K4)
+SIGMA = 5.670374419e-8
+
+def vapour_pressure(air_temp, hum):
+
+    """
+    Water vapour pressure of the air (Pa) from the air temperature (Celcius) and the humidity in percent RH (0-100,
+    not the 0-1 fraction used by raw_to_temp and the 'rh' column of FRAME_PARAMETERS).
+    The saturation vapour pressure is from Buck (1981).
+    """
+
+    air_temp = np.asarray(air_temp, dtype = np.float64)
+    saturation = 611.21*np.exp((18.678 - air_temp/234.5)*(air_temp/(257.14 + air_temp)))
+    return(np.asarray(hum, dtype = np.float64)/100*saturation)
+
+def Ld(air_temp, hum, cc = 0):
+
+    """
+
+    Estimates the downward longwave radiation from the sky (W/m2) as e_sky*sigma*T^4.
+    The emissivity of the clear sky and its increase with cloud cover follow Konzelmann et al. (1994), Global and
+    Planetary Change 9, 143-164: e_clear = 0.23 + 0.484*(e/T)^(1/8), with the vapour pressure e in Pa and the air
+    temperature T in K, and e_sky = e_clear*(1 - cc^4) + 0.952*cc^4.
+
+    Args:
+    air_temp (float or numpy array): The temperature of the air in degress celcius
+    hum (float or numpy array): The humidity of the air in percent RH (0-100, not a 0-1 fraction)
+    cc (float or numpy array): Fractional cloud cover (0-1)
+
+    Returns:
+    float64 NumPy array of downward longwave radiation (W/m2)
+
+    """
+
+    t_air_K = np.asarray(air_temp, dtype = np.float64) + 273.15
+    cc = np.asarray(cc, dtype = np.float64)
+    e_clear = 0.23 + 0.484*(vapour_pressure(air_temp, hum)/t_air_K)**(1/8)
+    e_sky = e_clear*(1 - cc**4) + 0.952*cc**4
+    return(e_sky*SIGMA*t_air_K**4)
+
+def Lu(ground_temp, e_ground = 0.97):
+
+    """
+
+    Estimates the upward longwave radiation from the ground (W/m2) as grey-body emission, e_ground*sigma*T^4.
+
+    Args:
+    ground_temp (float or numpy array): The temperature of the ground surface in degrees celcius
+    e_ground (float or numpy array): The emissivity of the ground surface
+
+    Returns:
+    float64 NumPy array of upward longwave radiation (W/m2)
+
+    """
+
+    return(np.asarray(e_ground, dtype = np.float64)*SIGMA*(np.asarray(ground_temp, dtype = np.float64) + 273.15)**4)
+
+def get_LW(air_temp, hum, ground_temp = None, e_ground = 0.97, cc = 0, sky_view = 0.5):
 
     """
 
     This function is used to estimate the total longwave radiation of the surroundings (downward and upward facing).
 
-    This code for this function adapted from the functions Ld() and Lu() contained in the Thermimage R package:
-    https://cran.r-project.org/package=Thermimage
+    The sky is modelled as in Ld() (Konzelmann et al. 1994) and the ground as in Lu(). The surroundings are the sky (a fraction 'sky_view' of the view) and the ground (the rest), so the result is
+    sky_view*Ld + (1 - sky_view)*Lu. Every argument can be a single value or one value per frame, so the longwave
+    radiation of a whole time series is computed at once.
 
     Args:
     air_temp (float): The temperature of the air in degress celcius
-    hum (float): The humidity of the air in percent RH
-    ground_temp (float): The temperature of the ground surface in degrees celcius
+    hum (float): The humidity of the air in percent RH (0-100). The weather csv and the 'rh' column of
+    FRAME_PARAMETERS hold a 0-1 fraction, so pass 100*rh.
+    ground_temp (float): The temperature of the ground surface in degrees celcius. Defaults to the air temperature.
     e_ground (float): The emissivity of the ground surface
     cc (float): Fractional cloud cover
+    sky_view (float): Fraction of the surroundings that is sky (0.5 for a camera looking at the horizon). This is a
+    property of the site, set with the 'sky_view' of SITE for the table of frame parameters.
 
+    Returns:
+    float: Longwave radiation of the surroundings in W/m2 (a NumPy array if any argument is an array)
 
     """
 
-    return(200)
+    if ground_temp is None:
+        ground_temp = air_temp
+    LW = sky_view*Ld(air_temp, hum, cc) + (1 - sky_view)*Lu(ground_temp, e_ground)
+    return LW if LW.ndim > 0 else float(LW)
 
 # ========================= Convert from Raw FLIR Data to Temp =====================
 
@@ -302,6 +486,375 @@ def raw_to_temp(
     # Return result
     return(t_target)
 
+# ========================= Batch Conversion of Frame Stacks =======================
+
+def radiometric_coefficients(
+    rh,
+    t_air,
+    t_win,
+    LW,
+    e_refl = 0.95,
+    e_target = 0.95,
+    X = 1.9,
+    a1 = 0.01,
+    a2 = 0.01,
+    b1 = 0,
+    b2 = -0.01,
+    R1 = 17070.73,
+    R2 = 0.01160998,
+    B = 1437.2,
+    F = 1,
+    O = -7393,
+    trans_win = 1,
+    refl_win = 0,
+    dist = 1.415
+    ):
+
+    """
+
+    Computes the atmosphere, window and reflection terms of raw_to_temp for many frames at once and folds them into
+    one affine coefficient pair per frame. With these coefficients the conversion of raw counts reduces to
+
+        t_target = B / log(R1 / (gain * raw + offset)) - 273.15
+
+    which gives the same result as raw_to_temp. Arguments are the same as raw_to_temp; rh, t_air, t_win and LW
+    (and any of the other properties) can be scalars or one value per frame.
+
+    Returns:
+    tuple: (gain, offset) as float64 NumPy arrays with one value per frame.
+
+    """
+
+    rh, t_air, t_win, LW = np.broadcast_arrays(*[np.asarray(v, dtype = np.float64) for v in (rh, t_air, t_win, LW)])
+
+    # Stefan-Boltzman Constant
+    sigma = 5.670374419e-8
+
+    with np.errstate(over = 'ignore', divide = 'ignore'):
+
+        # air water vapor concentration
+        C_H2O = rh*np.exp(1.5587+6.939*(10**-2)*t_air-2.7816*(10**-4)*(t_air**2)+6.8455*(10**-7)*(t_air**3))
+
+        # transmissivity of air
+        trans_air = X*np.exp(-np.sqrt(dist)*(a1+b1*np.sqrt(C_H2O)))+(1-X)*np.exp(-np.sqrt(dist)*(a1+b2*np.sqrt(C_H2O)))
+
+        # Sky temperature
+        t_refl = (LW/sigma)**(0.25)
+
+        # Energy of window, air and reflected energy
+        phi_win = (R1/R2*(1/(np.exp(B/t_win)-F)))-O
+        phi_air = (R1/R2*(1/(np.exp(B/t_air)-F)))-O
+        phi_refl = (R1/R2*(1/(np.exp(B/t_refl)-F)))-O
+
+    # Energy of target is an affine function of the raw counts: phi_target = raw * scale + shift
+    scale = 1/e_target/trans_air/trans_win
+    shift = - (phi_refl*e_refl*(1-e_target)/e_target)-(phi_air*(1-trans_air)/e_target/trans_air)-(phi_win*(1-refl_win-trans_win)/e_target/trans_air/trans_win)
+
+    # Fold the Planck offsets into the affine pair: R2*(phi_target+O)+F = raw * gain + offset
+    gain = R2*scale
+    offset = R2*(shift+O)+F
+
+    return(gain, offset)
+
+def raw_to_temp_batch(raw_stack, rh, t_air, t_win, LW, out = None, R1 = 17070.73, B = 1437.2, **kwargs):
+
+    """
+
+    Converts a stack of raw FLIR frames to surface temperature in one vectorized pass. Equivalent to calling raw_to_temp
+    on every frame, but the per-frame atmosphere terms are computed once for the whole stack (see radiometric_coefficients)
+    and the Planck inversion is applied in place, so the only full-size array allocated is the float32 result.
+
+    Args:
+    raw_stack (numpy array): (N, H, W) array of raw counts (usually uint16). A single (H, W) frame is also accepted.
+    rh (float or numpy array): Relative humidity of the air (0-1), one value per frame or one for all frames.
+    t_air (float or numpy array): Temperature of the air (Celcius), one value per frame or one for all frames.
+    t_win (float or numpy array): Temperature of the enclosure window (Celcius), one value per frame or one for all frames.
+    LW (float or numpy array): Longwave radiation of the surroundings (W/m2), one value per frame or one for all frames.
+    out (numpy array): Optional float32 array with the shape of raw_stack to write the result into.
+    R1, B (float): Planck function coefficients (see raw_to_temp).
+    kwargs: Any other argument of raw_to_temp (e_target, X, R2, F, O, dist, ...).
+
+    Returns:
+    temp_stack: float32 NumPy array of temperature values (Celcius) with the shape of raw_stack.
+
+    """
+
+    gain, offset = radiometric_coefficients(rh, t_air, t_win, LW, R1 = R1, B = B, **kwargs)
+    return(apply_coefficients(raw_stack, gain, offset, out = out, R1 = R1, B = B))
+
+def apply_coefficients(raw_stack, gain, offset, out = None, R1 = 17070.73, B = 1437.2):
+
+    """
+
+    Converts a stack of raw FLIR frames to surface temperature with coefficients that were already computed by
+    radiometric_coefficients (e.g. read from a table of frame parameters, see frame_parameters).
+
+    Args:
+    raw_stack (numpy array): (N, H, W) array of raw counts (usually uint16). A single (H, W) frame is also accepted.
+    gain, offset (float or numpy array): Coefficients from radiometric_coefficients, one value per frame or one for all frames.
+    out (numpy array): Optional float32 array with the shape of raw_stack to write the result into.
+    R1, B (float or numpy array): Planck function coefficients (the same values passed to radiometric_coefficients,
+        e.g. the 'R1' and 'B' columns of the table of frame parameters), one value per frame or one for all frames.
+
+    Returns:
+    temp_stack: float32 NumPy array of temperature values (Celcius) with the shape of raw_stack.
+
+    """
+
+    raw_stack = np.asarray(raw_stack)
+    single = raw_stack.ndim == 2
+    if single:
+        raw_stack = raw_stack[np.newaxis]
+
+    gain = np.broadcast_to(gain, (raw_stack.shape[0],)).astype(np.float32)[:, np.newaxis, np.newaxis]
+    offset = np.broadcast_to(offset, (raw_stack.shape[0],)).astype(np.float32)[:, np.newaxis, np.newaxis]
+    R1 = np.broadcast_to(R1, (raw_stack.shape[0],)).astype(np.float32)[:, np.newaxis, np.newaxis]
+    B = np.broadcast_to(B, (raw_stack.shape[0],)).astype(np.float32)[:, np.newaxis, np.newaxis]
+
+    if out is None:
+        out = np.empty(raw_stack.shape, dtype = np.float32)
+    elif single:
+        out = out[np.newaxis]
+
+    # t_target = B / log(R1 / (gain * raw + offset)) - 273.15, evaluated in place
+    np.multiply(raw_stack, gain, out = out)
+    out += offset
+    np.divide(R1, out, out = out)
+    np.log(out, out = out)
+    np.divide(B, out, out = out)
+    out -= np.float32(273.15)
+
+    if single:
+        return(out[0])
+    return(out)
+
+# ========================= Lookup Table Conversion of Raw Counts ===================
+
+# Quantization steps of the parameters that key the lookup table cache. Parameters closer together than these steps share a table.
+# With these steps the tables agree with raw_to_temp to within 0.01 C for target temperatures between -40 and 80 C
+# (checked for rh 0.05-1, t_air -5 to 40 C, LW 150-500 W/m2 and emissivity 0.9-0.99, see benchmarks.py).
+LUT_STEPS = {'rh': 0.0001, 't_air': 0.001, 't_win': 0.001, 'LW': 0.1, 'e_target': 0.0001}
+
+# Number of tables kept in the cache. Each table holds 65,536 float32 values (256 kB).
+LUT_CACHE_SIZE = 64
+
+def quantize(value, step):
+
+    """
+    Rounds a parameter to an integer number of quantization steps so it can be used as a lookup table cache key.
+    """
+
+    return int(round(float(value) / step))
+
+@functools.lru_cache(maxsize = LUT_CACHE_SIZE)
+def _temperature_table(rh_q, t_air_q, t_win_q, LW_q, e_target_q, coefficients):
+    params = dict(coefficients)
+    gain, offset = radiometric_coefficients(
+        rh = rh_q * LUT_STEPS['rh'],
+        t_air = t_air_q * LUT_STEPS['t_air'],
+        t_win = t_win_q * LUT_STEPS['t_win'],
+        LW = LW_q * LUT_STEPS['LW'],
+        e_target = e_target_q * LUT_STEPS['e_target'],
+        **params)
+    R1 = params.get('R1', 17070.73)
+    B = params.get('B', 1437.2)
+    counts = np.arange(65536, dtype = np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        table = (B/np.log(R1/(gain*counts+offset)) - 273.15).astype(np.float32)
+    # Tables are shared by every caller of the cache, so make sure nobody modifies one
+    table.flags.writeable = False
+    return(table)
+
+def temperature_lut(rh, t_air, t_win, LW, e_target = 0.95, **kwargs):
+
+    """
+
+    Returns the 65,536-entry table of target temperatures (Celcius) for every possible uint16 raw count, for one set of
+    atmospheric parameters. Parameters are quantized (see LUT_STEPS) and the most recently used tables are cached
+    (see LUT_CACHE_SIZE), so frames captured under the same conditions share a table.
+
+    Args:
+    rh, t_air, t_win, LW, e_target (float): See raw_to_temp.
+    kwargs: Any other (scalar) argument of raw_to_temp (X, R1, R2, B, F, O, dist, ...).
+
+    Returns:
+    table: read-only float32 NumPy array where table[raw_count] is the temperature in Celcius.
+
+    """
+
+    return _temperature_table(
+        quantize(rh, LUT_STEPS['rh']),
+        quantize(t_air, LUT_STEPS['t_air']),
+        quantize(t_win, LUT_STEPS['t_win']),
+        quantize(LW, LUT_STEPS['LW']),
+        quantize(e_target, LUT_STEPS['e_target']),
+        tuple(sorted(kwargs.items())))
+
+def raw_to_temp_lut(raw_array, rh, t_air, t_win, LW, e_target = 0.95, out = None, **kwargs):
+
+    """
+
+    Converts a uint16 array of raw counts to surface temperature with a single table lookup (see temperature_lut).
+    Gives the same result as raw_to_temp to within 0.01 C, without evaluating a logarithm for every pixel.
+
+    Args:
+    raw_array (numpy array): uint16 array of raw counts (a single frame or a stack of frames sharing the same parameters).
+    rh, t_air, t_win, LW, e_target (float): See raw_to_temp.
+    out (numpy array): Optional float32 array with the shape of raw_array to write the result into.
+    kwargs: Any other (scalar) argument of raw_to_temp.
+
+    Returns:
+    temp_array: float32 NumPy array of temperature values (Celcius).
+
+    """
+
+    table = temperature_lut(rh, t_air, t_win, LW, e_target = e_target, **kwargs)
+    return(np.take(table, raw_array, out = out))
+
+# ========================= Per-frame Parameter Table ===============================
+
+# Location of the trap in Cembra, used for the solar radiation of each frame (same values as Solar_Radiation_Functions_for_Python.R),
+# and the fraction of the camera's surroundings that is sky, used for the longwave radiation of each frame (see get_LW).
+# sky_view shifts every converted temperature: 0.5 is a camera looking at the horizon over open ground; a camera under
+# the canopy or looking down at the ground sees less sky. Set it for each site.
+SITE = dict(lat = 46.130962, lon = 11.19001, slope = 1.017573714256287, slope_aspect = 92.496437072753906, hemisphere = "north", ELEV = 900.943969726562614,
+            sky_view = 0.5)
+
+# Columns of the table returned by frame_parameters. Covariates without an input file are NaN.
+FRAME_PARAMETERS = np.dtype([
+    ('frame', np.int64),              # index of the frame in the dataset
+    ('time', 'datetime64[ns]'),       # capture time
+    ('t_air', np.float64),            # air temperature (Celcius)
+    ('rh', np.float64),               # relative humidity (0-1 fraction, as the RH column of the weather csv; get_LW takes percent)
+    ('t_win', np.float64),            # temperature of the enclosure window (Celcius), the air temperature
+    ('LW', np.float64),               # longwave radiation of the surroundings (W/m2)
+    ('lai', np.float64),              # leaf area index
+    ('albedo', np.float64),           # land surface albedo (0-1)
+    ('transmissivity', np.float64),   # atmospheric transmissivity (0-1)
+    ('solar', np.float64),            # solar radiation above the canopy (W/m2)
+    ('gain', np.float64),             # radiometric coefficients of the frame (see radiometric_coefficients)
+    ('offset', np.float64),
+    ('R1', np.float64),               # Planck coefficients the gain and offset were computed with (see apply_coefficients)
+    ('B', np.float64),
+])
+
+# Changing how the table is computed changes this number, so tables cached by an older version are not reused
+FRAME_PARAMETERS_VERSION = 2
+
+def file_digest(filepath):
+
+    """
+    Returns the sha256 hex digest of the contents of a file (read in 1 MB blocks), or "none" if filepath is None.
+    """
+
+    if filepath is None:
+        return "none"
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _covariate_values(filepath, columns, times):
+
+    # Nearest value of the first column of 'columns' found in the csv at each time (NaN for every frame without a file)
+    if filepath is None:
+        return np.full(len(times), np.nan)
+    df = csv_to_df(filepath)
+    time_column = next((column for column in TIME_COLUMNS if column in df.columns), None)
+    if time_column is None:
+        raise ValueError(f"{filepath} has no time column (expected one of 'timestamp', 'time' or 'date')")
+    column = next((column for column in columns if column in df.columns), None)
+    if column is None:
+        raise ValueError(f"{filepath} has no {' or '.join(repr(column) for column in columns)} column")
+    return CovariateIndex(df, time_column = time_column).nearest(column, times).astype(np.float64)
+
+def frame_parameters(
+    timestamps,
+    weather_path,
+    lai_path = None,
+    albedo_path = None,
+    transmissivity_path = None,
+    site = SITE,
+    cache_dir = None,
+    **kwargs
+    ):
+
+    """
+
+    Looks up every covariate of every frame in one vectorized pass: air temperature and humidity (weather csv), LAI,
+    albedo and atmospheric transmissivity (GEE exports), solar radiation (see solar_radiation.py), longwave radiation
+    (see get_LW) and the radiometric coefficients of the conversion (see radiometric_coefficients). The conversion
+    then only reads the table (see apply_coefficients).
+    With a cache_dir the table is saved as a .npy file named after a hash of the input files, the timestamps and the
+    arguments, and is read back instead of recomputed as long as none of them change.
+
+    Args:
+    timestamps (array of datetimes): Capture time of every frame, in frame order.
+    weather_path (str): CSV of weather data with 'timestamp', 'TA' (Celcius) and 'RH' (0-1 fraction) columns.
+    lai_path (str): CSV of the LAI timeseries (see LAI_timeseries.js), or None.
+    albedo_path (str): CSV of the albedo timeseries (see albedo_timeseries.js), or None.
+    transmissivity_path (str): CSV of the atmospheric transmissivity timeseries (see atmospheric_transmissivity_timeseries.js), or None.
+    site (dict): Location of the trap (lat, lon, slope, slope_aspect, hemisphere and ELEV, see get_solar_radiation) and
+        sky_view, the fraction of the surroundings that is sky (see get_LW, 0.5 if missing).
+    cache_dir (str): Directory the table is cached in, or None to always compute it.
+    kwargs: Any other (scalar) argument of raw_to_temp (e_target, X, R1, R2, B, F, O, dist, ...).
+
+    Returns:
+    table: NumPy structured array with one row per frame (see FRAME_PARAMETERS).
+
+    """
+
+    times = pd.to_datetime(np.asarray(timestamps, dtype = object)).to_numpy(dtype = 'datetime64[ns]')
+
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha256()
+        key.update(str(FRAME_PARAMETERS_VERSION).encode())
+        for filepath in (weather_path, lai_path, albedo_path, transmissivity_path):
+            key.update(file_digest(filepath).encode())
+        key.update(times.view(np.int64).tobytes())
+        key.update(repr(sorted(site.items())).encode())
+        key.update(repr(sorted(kwargs.items())).encode())
+        cache_path = os.path.join(cache_dir, "frame-parameters-" + key.hexdigest()[:16] + ".npy")
+        if os.path.exists(cache_path):
+            return(np.load(cache_path))
+
+    table = np.zeros(len(times), dtype = FRAME_PARAMETERS)
+    table['frame'] = np.arange(len(times))
+    table['time'] = times
+
+    # Weather
+    weather = CovariateIndex(csv_to_df(weather_path))
+    table['t_air'] = get_Ta(weather_dat = weather, datetime = times)
+    table['rh'] = get_RH(weather_dat = weather, datetime = times)
+    table['t_win'] = table['t_air']
+
+    # GEE exports
+    table['lai'] = _covariate_values(lai_path, ('LAI',), times)
+    table['albedo'] = _covariate_values(albedo_path, ('albedo',), times)
+    table['transmissivity'] = _covariate_values(transmissivity_path, ('atmospheric_transmissivity', 'clear_sky_index'), times)
+
+    # Radiation (solar radiation is NaN without the transmissivity and albedo)
+    location = {name: value for name, value in site.items() if name != 'sky_view'}
+    if len(times) > 0:
+        table['solar'] = get_solar_radiation(times, ATMOSPHERIC_TRANSMISSIVITY = table['transmissivity'], ALBEDO = table['albedo'], **location)
+    # get_LW takes the humidity in percent, the table holds a 0-1 fraction
+    table['LW'] = get_LW(air_temp = table['t_air'], hum = 100*table['rh'], sky_view = site.get('sky_view', 0.5))
+    table['gain'], table['offset'] = radiometric_coefficients(table['rh'], table['t_air'], table['t_win'], table['LW'], **kwargs)
+    table['R1'] = kwargs.get('R1', 17070.73)
+    table['B'] = kwargs.get('B', 1437.2)
+
+    if cache_path is not None:
+        # Written to a temporary file first, so an interrupted run can't leave half a table in the cache
+        os.makedirs(cache_dir, exist_ok = True)
+        temporary = cache_path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.save(file, table)
+        os.replace(temporary, cache_path)
+
+    return(table)
+
 # ========================= Save Results =====================
 
 def save_np_as_tiff(np_array, outdir, filename):
@@ -353,54 +906,211 @@ def save_np_as_csv(np_array,outdir,filename):
     np.savetxt(filepath, np_array,  
               delimiter = ",")
 
-# ========================= Main Code =========================================
+# ========================= Parallel Batch Conversion ==============================
 
-def main():
+def result_filename(name, extension = ".csv"):
 
-    # Build a dictionary of numpy arrays from all of the tiff files in a directory
+    """
+    Builds the name of the file a converted frame is saved to from the name of the raw frame.
+    The capture time alone is not enough: the frames of a burst in older archives (file-YYYYMMDD-HHMMSS_burstN) share
+    the same second and would overwrite each other.
 
-    raw_arrays = tiffs_to_numpy_arrays("/Users/rhemitoth/Documents/PhD/Cembra/R/data_raw/cembra_0708")
+    Args:
+    name (str): Name of the raw frame (FrameDataset.names), with or without its extension.
+    extension (str): Extension of the result file.
 
-    # Load weather data
+    Returns:
+    str: The raw frame name with 'extension' in place of its own.
+    """
 
-    weather_df = csv_to_df("/Users/rhemitoth/Documents/PhD/Cembra/FLIR_A325sc_Controller/radiance2temp_test_data/weather.csv")
+    return os.path.splitext(name)[0] + extension
 
-    # Loop through the radiance arrays and convert from radiance to temperature
+# State of each worker process in the batch pool (set once per worker by _init_batch_worker)
+_worker = {}
+
+def _init_batch_worker(raw_path, shm_name, slots, chunk_size, frame_shape):
+    plt.ioff()
+    shm = shared_memory.SharedMemory(name = shm_name)
+    _worker['shm'] = shm
+    _worker['results'] = np.ndarray((slots, chunk_size) + tuple(frame_shape), dtype = np.float32, buffer = shm.buf)
+    _worker['frames'] = load_frames(raw_path)
+
+def _convert_chunk(slot, start, stop, gain, offset, R1, B):
+
+    # Read the frames of this chunk straight from disk (nothing is pickled) and convert them into the shared result slot
+    t0 = time.perf_counter()
+    frames = _worker['frames']
+    raw_stack = np.stack([frames[i] for i in range(start, stop)])
+    t1 = time.perf_counter()
+    apply_coefficients(raw_stack, gain, offset, out = _worker['results'][slot, :stop - start], R1 = R1, B = B)
+    t2 = time.perf_counter()
+    return(t1 - t0, t2 - t1)
+
+def convert_batch(raw_path, weather_path, outdir, workers = None, chunk_size = 16, writer = None,
+                  lai_path = None, albedo_path = None, transmissivity_path = None, cache_dir = None, write_threads = 4):
+
+    """
+
+    Converts every frame of a field season to temperature on all cores, without plotting.
+    The frames are split into chunks of consecutive frames that are converted by a pool of worker processes.
+    Workers read their frames directly from disk and write the temperatures into shared memory, so no image data is
+    pickled between processes. The frames of each converted chunk are written to 'outdir' by a pool of writer threads
+    while later chunks are still converting, and only 2 x workers chunks are held in memory at any time.
+
+    Args:
+    raw_path (str): Directory of raw TIFF files or a frame container (.frames) file.
+    weather_path (str): CSV of weather data with 'timestamp', 'TA' and 'RH' columns.
+    outdir (str): Directory where the results are saved (must end with a path separator, as for save_np_as_csv).
+    workers (int): Number of worker processes. Defaults to the number of CPUs.
+    chunk_size (int): Number of frames converted per task.
+    writer (function): Function called as writer(np_array = ..., outdir = ..., filename = ...) to save each result,
+        e.g. one of the writers of temperature_writers.py (default: float32 tiffs, TiffWriter()). The filenames end with
+        the writer's 'extension' (.csv for writers without one), and writer.close() is called at the end if it has one.
+    lai_path, albedo_path, transmissivity_path (str): CSVs of the GEE exports, or None (see frame_parameters).
+    cache_dir (str): Directory the table of frame parameters is cached in, or None (see frame_parameters).
+    write_threads (int): Number of threads writing results at the same time.
+
+    Returns:
+    dict: Time (seconds) spent in each stage: index, covariates, read, convert (summed over workers), write and total.
+
+    """
+
+    timings = {'index': 0.0, 'covariates': 0.0, 'read': 0.0, 'convert': 0.0, 'write': 0.0}
+    start_time = time.perf_counter()
+    workers = workers or os.cpu_count()
+    if writer is None:
+        writer = TiffWriter()
+    extension = getattr(writer, 'extension', ".csv")
+
+    # Index the frames
+    t0 = time.perf_counter()
+    frames = load_frames(raw_path)
+    num_frames = len(frames)
+    timings['index'] = time.perf_counter() - t0
+    if num_frames == 0:
+        timings['total'] = time.perf_counter() - start_time
+        return(timings)
+    frame_shape = frames[0].shape
+
+    # Look up the parameters of every frame
+    t0 = time.perf_counter()
+    timestamps = [frames.datetime(i) for i in range(num_frames)]
+    params = frame_parameters(timestamps, weather_path, lai_path = lai_path, albedo_path = albedo_path,
+                              transmissivity_path = transmissivity_path, cache_dir = cache_dir)
+    timings['covariates'] = time.perf_counter() - t0
+
+    # Shared memory holds the results of 2 chunks per worker, so workers never wait for the writer and memory stays bounded
+    slots = 2 * workers
+    slot_size = chunk_size * int(np.prod(frame_shape)) * np.dtype(np.float32).itemsize
+    shm = shared_memory.SharedMemory(create = True, size = slots * slot_size)
+    try:
+        results = np.ndarray((slots, chunk_size) + tuple(frame_shape), dtype = np.float32, buffer = shm.buf)
+        chunks = deque((start, min(start + chunk_size, num_frames)) for start in range(0, num_frames, chunk_size))
+        pending = deque()
+
+        with ProcessPoolExecutor(max_workers = workers, initializer = _init_batch_worker, initargs = (raw_path, shm.name, slots, chunk_size, frame_shape)) as pool, \
+             ThreadPoolExecutor(max_workers = write_threads) as write_pool:
+
+            def submit(slot):
+                start, stop = chunks.popleft()
+                future = pool.submit(_convert_chunk, slot, start, stop, params['gain'][start:stop], params['offset'][start:stop],
+                                     params['R1'][start:stop], params['B'][start:stop])
+                pending.append((slot, start, stop, future))
+
+            for slot in range(min(slots, len(chunks))):
+                submit(slot)
+
+            # Write the frames of each chunk in parallel as the chunks complete, and reuse the slot for the next chunk once
+            # its frames are written (the other slots keep converting in the meantime)
+            while pending:
+                slot, start, stop, future = pending.popleft()
+                read_time, convert_time = future.result()
+                timings['read'] += read_time
+                timings['convert'] += convert_time
+
+                t0 = time.perf_counter()
+                writes = [write_pool.submit(writer, np_array = results[slot, i - start], outdir = outdir, filename = result_filename(frames.names[i], extension))
+                          for i in range(start, stop)]
+                for write in wait(writes).done:
+                    write.result()
+                timings['write'] += time.perf_counter() - t0
+
+                if chunks:
+                    submit(slot)
+        del results
+    finally:
+        shm.close()
+        shm.unlink()
+        if hasattr(writer, 'close'):
+            writer.close()
+
+    timings['total'] = time.perf_counter() - start_time
+    return(timings)
+
+def batch_main(argv = None):
 
-    num_raw_arrays = len(raw_arrays)
+    """
+    Command line interface for convert_batch. Run "python RadianceToTemp.py --help" for the options.
+    """
 
-    temp_arrays = {}
+    parser = argparse.ArgumentParser(description = "Convert raw FLIR frames to temperature on all cores.")
+    parser.add_argument("raw_path", help = "directory of raw tiffs or a frame container (.frames)")
+    parser.add_argument("--weather", required = True, help = "CSV of weather data with timestamp, TA and RH columns")
+    parser.add_argument("--outdir", required = True, help = "directory where results are saved")
+    parser.add_argument("--workers", type = int, default = None, help = "number of worker processes (default: number of CPUs)")
+    parser.add_argument("--chunk-size", type = int, default = 16, help = "number of frames per task (default: 16)")
+    parser.add_argument("--lai", default = None, help = "CSV of the LAI timeseries exported from GEE")
+    parser.add_argument("--albedo", default = None, help = "CSV of the albedo timeseries exported from GEE")
+    parser.add_argument("--transmissivity", default = None, help = "CSV of the atmospheric transmissivity timeseries exported from GEE")
+    parser.add_argument("--cache-dir", default = None, help = "directory the table of frame parameters is cached in")
+    parser.add_argument("--format", choices = list(WRITERS), default = "tiff", help = "output format (default: float32 tiff, see temperature_writers.py)")
+    parser.add_argument("--write-threads", type = int, default = 4, help = "number of threads writing results (default: 4)")
+    args = parser.parse_args(argv)
+
+    outdir = os.path.join(args.outdir, "")
+    os.makedirs(outdir, exist_ok = True)
+    timings = convert_batch(args.raw_path, args.weather, outdir, workers = args.workers, chunk_size = args.chunk_size,
+                            writer = make_writer(args.format), write_threads = args.write_threads,
+                            lai_path = args.lai, albedo_path = args.albedo, transmissivity_path = args.transmissivity,
+                            cache_dir = args.cache_dir)
+
+    for stage, seconds in timings.items():
+        print(f"{stage:<12} {seconds:8.2f} s")
 
-    timestamps = []
+# ========================= Main Code =========================================
 
-    for key in raw_arrays:
+def main():
 
-    	print(key)
+    # Index the tiff files in a directory (or the frames in a frame container). Frames are read one at a time in the loop below.
 
-        # get the timestamp of the image
+    raw_frames = load_frames("/Users/rhemitoth/Documents/PhD/Cembra/R/data_raw/cembra_0708")
 
-        dt = raw_arrays[key][1] 
+    # Look up the weather, the GEE covariates, the radiation and the radiometric coefficients of every frame at once.
+    # The table is cached next to the results and only recomputed when an input file changes.
 
-        # get the air temperature at the time the image was taken
+    data_dir = "/Users/rhemitoth/Documents/PhD/Cembra/FLIR_A325sc_Controller/radiance2temp_test_data/"
 
-        air_temperature = get_Ta(weather_dat = weather_df, datetime = dt)
+    timestamps = [raw_frames.datetime(i) for i in range(len(raw_frames))]
 
-        # get the humidity at the time the image was taken 
+    params = frame_parameters(timestamps, weather_path = data_dir + "weather.csv", cache_dir = data_dir + "results/")
+
+    writer = TiffWriter()
+
+    # Loop through the radiance arrays and convert from radiance to temperature
 
-        humidity = get_RH(weather_dat = weather_df, datetime = dt)
+    for i, (key, raw_array, dt) in enumerate(raw_frames.items()):
 
-        # get the longwave radiation of the surroundings at the time of image capture
-        longwave = get_LW()
+        print(key)
 
         # Convert raw FLIR data to units of temperature
 
-        temp_array = raw_to_temp(raw_array = raw_arrays[key][0], rh = humidity, t_air = air_temperature, t_win = air_temperature, LW = longwave)
+        temp_array = apply_coefficients(raw_array, params['gain'][i], params['offset'][i], R1 = params['R1'][i], B = params['B'][i])
 
-        # Save results 
+        # Save results (float32 tiff, see temperature_writers.py for the other formats)
 
-        fname = "file-"+str(dt).replace(" ","_").replace("-","").replace(":","")+".csv"
+        fname = result_filename(key, writer.extension)
 
-        save_np_as_csv(np_array = temp_array, outdir = "/Users/rhemitoth/Documents/PhD/Cembra/FLIR_A325sc_Controller/radiance2temp_test_data/results/",filename = fname)
+        writer(np_array = temp_array, outdir = data_dir + "results/", filename = fname)
 
         # Plot results
 
@@ -412,7 +1122,11 @@ def main():
         #temp_arrays[key] = [temp_array,dt]
 
 if __name__ == '__main__':
-    main()
+    # With command line arguments run the parallel batch conversion, otherwise convert and plot the frames one by one
+    if len(sys.argv) > 1:
+        batch_main()
+    else:
+        main()
 
 
 
@@ -0,0 +1,1150 @@
+# ======================== Notes ===========================================
+
+## benchmarks.py measures the performance of the acquisition and processing code on a plain Linux box.
+## Hardware (camera, SD card, display, GPIO) is replaced by the simulated backends that ship with this repository (e.g. fake_pyspin.py).
+## Run all benchmarks with "python benchmarks.py" or a single one with e.g. "python benchmarks.py capture".
+
+# ======================== Import  Modules ==================================
+
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import fake_epd
+import fake_pyspin
+from controller_state_machine import STATE_MESSAGES, Controller, SimulatedHardware, State
+from camera_monitor import CameraMonitor
+from camera_session import CameraSession, burst_intervals
+from camera_telnet import CameraCommandClient, FakeCameraTelnetServer
+from capture_scheduler import CaptureScheduler, FakeClock
+from display_service import DisplayService
+from focus_cache import FocusCache, sharpness
+from frame_container import FrameContainerReader, FrameContainerWriter
+from frame_dataset import FrameDataset
+from frame_writer import FrameWriter, save_frame
+from motion_trigger import MotionTrigger, mock_devices, replay_trace
+from scene_change import AdaptiveCapture, ChangeDetector, replay
+from storage_manager import FRAME_BYTES, StorageManager, Volume
+from storage_monitor import StorageMonitor, find_card_mount, list_sd_disks, parse_mountinfo
+from thermal_trigger import HybridTrigger, evaluate
+
+# ======================== Helpers ==========================================
+# The function 'report' prints the summary statistics of a list of durations (in seconds)
+
+def report(label, durations):
+    durations = sorted(durations)
+    mean = sum(durations) / len(durations)
+    median = durations[len(durations) // 2]
+    print(f"{label:<40} n={len(durations):<6} mean={mean*1000:11.4f} ms  median={median*1000:11.4f} ms  max={durations[-1]*1000:11.4f} ms")
+
+# ======================== Capture latency ==================================
+# The function 'bench_capture' compares initializing the camera for every capture (the old save_image_spinnaker)
+# with a CameraSession that stays open for the whole data collection window.
+# Argument 'captures' is the number of bursts that are captured.
+# Argument 'burst_num' is the number of images in each burst.
+
+def bench_capture(captures = 10, burst_num = 3):
+    print("== Capture latency (fake PySpin backend) ==")
+    with tempfile.TemporaryDirectory() as directory:
+        directory = directory + "/"
+
+        fake_pyspin.reset()
+        per_capture = []
+        for i in range(captures):
+            start = time.perf_counter()
+            with CameraSession(pyspin = fake_pyspin) as session:
+                session.capture(directory = directory, filetype = "tiff", burst_num = burst_num)
+            per_capture.append(time.perf_counter() - start)
+        report("init per capture (old)", per_capture)
+
+        fake_pyspin.reset()
+        persistent = []
+        with CameraSession(pyspin = fake_pyspin) as session:
+            session.open()
+            for i in range(captures):
+                start = time.perf_counter()
+                session.capture(directory = directory, filetype = "tiff", burst_num = burst_num)
+                persistent.append(time.perf_counter() - start)
+        report("persistent session", persistent)
+
+# ======================== Camera presence check ============================
+# The function 'bench_presence' compares enumerating the cameras on every check (the old check_connection)
+# with reading the cached state of a CameraMonitor.
+# Argument 'checks' is the number of presence checks.
+
+def bench_presence(checks = 20):
+    print("== Camera presence check (fake PySpin backend) ==")
+    fake_pyspin.reset()
+    enumerate_each = []
+    for i in range(checks):
+        start = time.perf_counter()
+        system = fake_pyspin.System.GetInstance()
+        cam_list = system.GetCameras()
+        connected = cam_list.GetSize() > 0
+        cam_list.Clear()
+        system.ReleaseInstance()
+        enumerate_each.append(time.perf_counter() - start)
+    report("enumerate per check (old)", enumerate_each)
+
+    fake_pyspin.reset()
+    with CameraMonitor(pyspin = fake_pyspin) as monitor:
+        cached = []
+        for i in range(checks * 1000):
+            start = time.perf_counter()
+            connected = monitor.is_connected()
+            cached.append(time.perf_counter() - start)
+        report("cached monitor", cached)
+
+        # Removal and arrival events update the cached state without another scan
+        fake_pyspin.unplug_camera()
+        removed = monitor.is_connected() == False
+        fake_pyspin.plug_camera()
+        print(f"removal seen: {removed}  arrival seen: {monitor.is_connected()}  bus scans: {monitor.enumeration_count}")
+
+# ======================== Write-behind queue ===============================
+# The function 'throttled_save' returns a save function that behaves like a slow SD card:
+# the frame is written with save_frame and the call is stretched so the card never exceeds 'bandwidth' bytes per second.
+
+def throttled_save(bandwidth):
+    def save(filename, frame, metadata = None):
+        start = time.perf_counter()
+        save_frame(filename, frame)
+        remaining = frame.nbytes / bandwidth - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+    return save
+
+# The function 'bench_write_behind' grabs frames at the native frame rate of the fake camera and compares saving
+# each frame inline (the old save_image_spinnaker) with handing it to a FrameWriter.
+# Argument 'frames' is the number of frames grabbed.
+# Argument 'bandwidth' is the simulated write speed of the SD card (bytes per second).
+# Argument 'slots' is the size of the FrameWriter ring.
+
+def bench_write_behind(frames = 60, bandwidth = 2e6, slots = 16):
+    print(f"== Write-behind queue (fake PySpin backend, SD card throttled to {bandwidth/1e6:.1f} MB/s) ==")
+    fake_pyspin.reset()
+    save = throttled_save(bandwidth)
+    with tempfile.TemporaryDirectory() as directory:
+        with CameraSession(pyspin = fake_pyspin) as session:
+            session.open()
+
+            # Inline: every frame is encoded and written before the next frame is grabbed
+            gaps = []
+            last = time.perf_counter()
+            for i in range(frames):
+                image_result = session.grab()
+                save(f"{directory}/inline-{i}.tiff", image_result.GetNDArray())
+                image_result.Release()
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+            report("inline save, frame interval", gaps)
+
+            for policy in ('block', 'drop'):
+                gaps = []
+                with FrameWriter(slots = slots, policy = policy, save = save) as writer:
+                    last = time.perf_counter()
+                    for i in range(frames):
+                        writer.put_image(session.grab(), f"{directory}/{policy}-{i}.tiff")
+                        now = time.perf_counter()
+                        gaps.append(now - last)
+                        last = now
+                    writer.flush()
+                    stats = writer.stats()
+                report(f"write-behind ({policy}), frame interval", gaps)
+                print(f"    written={stats['written']} dropped={stats['dropped']} max_pending={stats['max_pending']} blocked={stats['blocked_time']:.2f} s")
+
+# ======================== Burst throughput =================================
+# The function 'bench_burst' pulls bursts from the fake camera and reports the frame interval measured with the device clock,
+# which should match the camera's native frame period (fake_pyspin.FRAME_PERIOD).
+# Argument 'bursts' is the number of bursts.
+# Argument 'burst_num' is the number of images in each burst.
+
+def bench_burst(bursts = 5, burst_num = 10):
+    print(f"== Burst throughput (fake PySpin backend, native frame period {fake_pyspin.FRAME_PERIOD*1000:.1f} ms) ==")
+    fake_pyspin.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        with FrameWriter() as writer, CameraSession(pyspin = fake_pyspin, writer = writer) as session:
+            intervals = []
+            filenames = set()
+            for i in range(bursts):
+                frames = session.burst(directory = directory + "/", filetype = "tiff", burst_num = burst_num)
+                intervals += burst_intervals(frames)
+                filenames.update(frame['filename'] for frame in frames)
+            report("device frame interval", intervals)
+            print(f"    unique filenames: {len(filenames)} of {bursts * burst_num}")
+
+# ======================== Frame container ==================================
+# The function 'bench_container' compares one tiff per frame with appending frames to a single frame container,
+# for writing a session and for reading every frame back (in order and at random).
+# Argument 'frames' is the number of 240 x 320 frames in the session.
+
+def bench_container(frames = 1000):
+    print(f"== Frame container vs. one tiff per frame ({frames} frames) ==")
+    rng = np.random.default_rng(0)
+    frame = rng.integers(15000, 25000, size = (240, 320), dtype = np.uint16)
+    order = rng.permutation(frames)
+    megabytes = frames * frame.nbytes / 1e6
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for i in range(frames):
+            save_frame(os.path.join(directory, f"file-{i:06d}.tiff"), frame)
+        elapsed = time.perf_counter() - start
+        print(f"{'tiff write':<40} {frames/elapsed:10.1f} frames/s  {megabytes/elapsed:8.1f} MB/s")
+
+        path = os.path.join(directory, "session.frames")
+        start = time.perf_counter()
+        with FrameContainerWriter(path) as writer:
+            for i in range(frames):
+                writer.append(frame, frame_id = i, device_timestamp = i)
+        elapsed = time.perf_counter() - start
+        print(f"{'container write':<40} {frames/elapsed:10.1f} frames/s  {megabytes/elapsed:8.1f} MB/s")
+
+        start = time.perf_counter()
+        total = 0
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".tiff"):
+                total += int(np.asarray(Image.open(os.path.join(directory, filename)))[0, 0])
+        elapsed = time.perf_counter() - start
+        print(f"{'tiff read (listdir + open each)':<40} {frames/elapsed:10.1f} frames/s  {megabytes/elapsed:8.1f} MB/s")
+
+        for label, indices in (("container read (sequential)", range(frames)), ("container read (random)", order)):
+            start = time.perf_counter()
+            reader = FrameContainerReader(path)
+            total = 0
+            for i in indices:
+                total += int(np.array(reader[i])[0, 0])
+            elapsed = time.perf_counter() - start
+            print(f"{label:<40} {frames/elapsed:10.1f} frames/s  {megabytes/elapsed:8.1f} MB/s")
+
+# ======================== Lazy frame loading ===============================
+# The function 'bench_lazy_loading' compares reading every tiff of a directory up front (tiffs_to_numpy_arrays)
+# with a FrameDataset that memory-maps frames as they are used. Reports the time until the first frame can be processed,
+# the time to touch every frame, and the peak memory allocated by python while doing so.
+# Argument 'frames' is the number of 240 x 320 tiffs in the directory.
+
+def bench_lazy_loading(frames = 2000):
+    from RadianceToTemp import tiffs_to_numpy_arrays
+    print(f"== Eager vs. lazy frame loading ({frames} tiffs) ==")
+    frame = np.random.default_rng(0).integers(15000, 25000, size = (240, 320), dtype = np.uint16)
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(frames):
+            save_frame(os.path.join(directory, f"file-20240711-{i // 3600 % 24:02d}{i // 60 % 60:02d}{i % 60:02d}.tiff"), frame)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        raw_arrays = tiffs_to_numpy_arrays(directory)
+        first = time.perf_counter() - start
+        total = sum(int(value[0].mean()) for value in raw_arrays.values())
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del raw_arrays
+        print(f"{'eager (tiffs_to_numpy_arrays)':<40} first frame {first*1000:9.1f} ms  all frames {elapsed:6.2f} s  peak {peak/1e6:8.1f} MB")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        dataset = FrameDataset(directory)
+        total = int(dataset[0].mean())
+        first = time.perf_counter() - start
+        total = sum(int(raw_array.mean()) for raw_array in dataset)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{'lazy (FrameDataset)':<40} first frame {first*1000:9.1f} ms  all frames {elapsed:6.2f} s  peak {peak/1e6:8.1f} MB")
+
+# ======================== Radiometric conversion ===========================
+# The function 'raw_stack' returns a reproducible stack of raw frames and per-frame weather for the conversion benchmarks
+
+def raw_stack(frames):
+    rng = np.random.default_rng(0)
+    stack = rng.integers(14000, 30000, size = (frames, 240, 320), dtype = np.uint16)
+    rh = rng.uniform(0.3, 0.9, frames)
+    t_air = rng.uniform(5, 30, frames)
+    LW = rng.uniform(250, 400, frames)
+    return stack, rh, t_air, LW
+
+# The function 'bench_batch_conversion' compares converting frames one at a time with raw_to_temp
+# against converting the whole stack with raw_to_temp_batch.
+# Argument 'frames' is the number of 240 x 320 frames in the stack.
+
+def bench_batch_conversion(frames = 200):
+    from RadianceToTemp import raw_to_temp, raw_to_temp_batch
+    print(f"== raw_to_temp loop vs. raw_to_temp_batch ({frames} frames) ==")
+    stack, rh, t_air, LW = raw_stack(frames)
+
+    start = time.perf_counter()
+    reference = [raw_to_temp(stack[i], rh = rh[i], t_air = t_air[i], t_win = t_air[i], LW = LW[i]) for i in range(frames)]
+    elapsed = time.perf_counter() - start
+    print(f"{'raw_to_temp loop':<40} {frames/elapsed:10.1f} frames/s")
+
+    start = time.perf_counter()
+    temp_stack = raw_to_temp_batch(stack, rh = rh, t_air = t_air, t_win = t_air, LW = LW)
+    elapsed = time.perf_counter() - start
+    print(f"{'raw_to_temp_batch':<40} {frames/elapsed:10.1f} frames/s")
+    print(f"    max difference: {np.max(np.abs(temp_stack - np.stack(reference))):.2e} C")
+
+# The function 'bench_lut_conversion' compares the analytic raw_to_temp with the lookup table conversion (raw_to_temp_lut).
+# Frames are grouped into runs that share the same weather, as they do within a capture session, so tables are reused from the cache.
+# Also checks the lookup tables against raw_to_temp for random parameters and reports the largest difference.
+# Argument 'frames' is the number of 240 x 320 frames.
+# Argument 'frames_per_table' is the number of consecutive frames captured under the same weather.
+
+def bench_lut_conversion(frames = 200, frames_per_table = 20):
+    import RadianceToTemp
+    from RadianceToTemp import raw_to_temp, raw_to_temp_lut
+    print(f"== raw_to_temp vs. raw_to_temp_lut ({frames} frames, {frames_per_table} frames per parameter set) ==")
+    stack, rh, t_air, LW = raw_stack(frames)
+    runs = np.arange(frames) // frames_per_table * frames_per_table
+    rh, t_air, LW = rh[runs], t_air[runs], LW[runs]
+
+    start = time.perf_counter()
+    for i in range(frames):
+        raw_to_temp(stack[i], rh = rh[i], t_air = t_air[i], t_win = t_air[i], LW = LW[i])
+    elapsed = time.perf_counter() - start
+    print(f"{'raw_to_temp':<40} {frames/elapsed:10.1f} frames/s")
+
+    RadianceToTemp._temperature_table.cache_clear()
+    out = np.empty((240, 320), dtype = np.float32)
+    start = time.perf_counter()
+    for i in range(frames):
+        raw_to_temp_lut(stack[i], rh = rh[i], t_air = t_air[i], t_win = t_air[i], LW = LW[i], out = out)
+    elapsed = time.perf_counter() - start
+    print(f"{'raw_to_temp_lut (incl. table builds)':<40} {frames/elapsed:10.1f} frames/s  {RadianceToTemp._temperature_table.cache_info()}")
+
+    # Accuracy over every raw count for random parameters, for target temperatures between -40 and 80 C
+    rng = np.random.default_rng(1)
+    counts = np.arange(65536, dtype = np.uint16)
+    worst = 0.0
+    with np.errstate(all = 'ignore'):
+        for i in range(100):
+            params = dict(rh = rng.uniform(0.05, 1), t_air = rng.uniform(-5, 40), LW = rng.uniform(150, 500), e_target = rng.uniform(0.9, 0.99))
+            params['t_win'] = params['t_air']
+            try:
+                reference = raw_to_temp(counts, **params)
+            except OverflowError:
+                continue
+            valid = np.isfinite(reference) & (reference > -40) & (reference < 80)
+            if valid.any():
+                worst = max(worst, float(np.max(np.abs(raw_to_temp_lut(counts, **params) - reference)[valid])))
+    print(f"    max difference from raw_to_temp: {worst:.4f} C")
+
+# ======================== Parallel batch conversion ========================
+# The function 'bench_parallel' runs convert_batch on a directory of tiffs with an increasing number of workers and
+# prints the per-stage timings. Results are discarded (no writer), so the numbers show the conversion pipeline itself.
+# Argument 'frames' is the number of 240 x 320 tiffs.
+# Argument 'chunk_size' is the number of frames per task.
+
+def bench_parallel(frames = 400, chunk_size = 16):
+    import pandas as pd
+    from RadianceToTemp import convert_batch
+    print(f"== Parallel batch conversion ({frames} frames, chunk size {chunk_size}) ==")
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        raw_dir = os.path.join(directory, "raw")
+        os.mkdir(raw_dir)
+        timestamps = pd.date_range(pd.Timestamp.now() - pd.Timedelta(days = 1), periods = 300, freq = "10min")
+        for i in range(frames):
+            capture_time = timestamps[0] + pd.Timedelta(seconds = 5 * i)
+            save_frame(os.path.join(raw_dir, f"file-{i:06d}.tiff"), rng.integers(15000, 25000, size = (240, 320), dtype = np.uint16),
+                       {'frame_id': i, 'device_timestamp': 5000000000 * i, 'capture_time': capture_time.to_pydatetime()})
+        weather_path = os.path.join(directory, "weather.csv")
+        pd.DataFrame({'timestamp': timestamps, 'TA': rng.uniform(5, 25, len(timestamps)), 'RH': rng.uniform(0.3, 0.9, len(timestamps))}).to_csv(weather_path, index = False)
+
+        def discard(np_array, outdir, filename):
+            pass
+
+        for workers in sorted({1, 2, os.cpu_count() or 1}):
+            timings = convert_batch(raw_dir, weather_path, directory + "/", workers = workers, chunk_size = chunk_size, writer = discard)
+            stages = "  ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items())
+            print(f"workers={workers:<3} {frames/timings['total']:8.1f} frames/s  {stages}")
+
+# ======================== Covariate lookups ================================
+# The function 'bench_covariates' compares the old nearest-time lookup (parse the timestamp column and scan the whole table
+# for every image) with a CovariateIndex that is built once and looked up for all images at once.
+# Argument 'rows' is a list of table sizes.
+# Argument 'images' is the number of image timestamps looked up with the index.
+# Argument 'scan_images' is the number of image timestamps looked up with the old scan (it is too slow to run for all of them).
+
+def bench_covariates(rows = (100000, 1000000), images = 10000, scan_images = 5):
+    import pandas as pd
+    from RadianceToTemp import CovariateIndex, get_Ta
+    print("== Nearest-time covariate lookups ==")
+    rng = np.random.default_rng(0)
+    for n in rows:
+        timestamps = pd.date_range("2024-01-01", periods = n, freq = "1min")
+        df = pd.DataFrame({'timestamp': timestamps.strftime("%Y-%m-%d %H:%M:%S"), 'TA': rng.normal(10, 5, n), 'RH': rng.uniform(0, 1, n)})
+        queries = list(timestamps[0] + pd.to_timedelta(rng.uniform(0, n * 60, images), unit = "s"))
+
+        start = time.perf_counter()
+        for dt in queries[:scan_images]:
+            given_time = pd.to_datetime(dt)
+            parsed = pd.to_datetime(df['timestamp'])
+            air_temp = df.loc[(parsed - given_time).abs().idxmin()]['TA']
+        per_image = (time.perf_counter() - start) / scan_images
+        print(f"rows={n:<8} {'scan per image (old)':<28} {per_image*1000:10.2f} ms/image")
+
+        start = time.perf_counter()
+        index = CovariateIndex(df)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        air_temp = get_Ta(index, queries)
+        humidity = index.nearest('RH', queries)
+        lookup = time.perf_counter() - start
+        print(f"rows={n:<8} {'CovariateIndex':<28} {lookup/images*1000:10.4f} ms/image  (build {build:.2f} s, {images} images x 2 variables in {lookup*1000:.1f} ms)")
+
+# ======================== SD card detection ================================
+# The function 'bench_sd_detection' compares the per-capture SD card checks: running lsblk and df (the old is_sd_card_connected
+# and find_sd_card_mount_point), reading /sys/block and /proc/self/mountinfo directly, and the cached StorageMonitor state.
+# Argument 'checks' is the number of checks.
+
+def bench_sd_detection(checks = 50):
+    print("== SD card detection ==")
+    subprocess_checks = []
+    try:
+        for i in range(checks):
+            start = time.perf_counter()
+            subprocess.run(['lsblk', '-o', 'NAME,TYPE'], capture_output = True, text = True)
+            subprocess.check_output(['df', '-h'])
+            subprocess_checks.append(time.perf_counter() - start)
+        report("lsblk + df (old)", subprocess_checks)
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        print(f"{'lsblk + df (old)':<40} not available here ({e})")
+
+    native = []
+    for i in range(checks):
+        start = time.perf_counter()
+        disks = list_sd_disks()
+        with open('/proc/self/mountinfo') as f:
+            mount = find_card_mount(parse_mountinfo(f.read()))
+        native.append(time.perf_counter() - start)
+    report("/sys/block + mountinfo", native)
+
+    with StorageMonitor() as sd_monitor:
+        cached = []
+        for i in range(checks * 100):
+            start = time.perf_counter()
+            connected = sd_monitor.is_connected()
+            mount_point = sd_monitor.mount_point
+            cached.append(time.perf_counter() - start)
+        report("StorageMonitor (cached)", cached)
+
+# ======================== Storage spillover ================================
+# Two directories with small quotas stand in for a nearly full SD card and the spillover directory on the internal disk.
+
+def bench_spillover(bursts = 40, burst_num = 3):
+    print("== Storage spillover ==")
+    frame = np.full((240, 320), 20000, dtype = np.uint16)
+    burst_bytes = burst_num * FRAME_BYTES
+    with tempfile.TemporaryDirectory() as card, tempfile.TemporaryDirectory() as internal:
+        manager = StorageManager([
+            Volume(card, name = "SD card", quota_bytes = 10 * burst_bytes),
+            Volume(internal, name = "internal disk", quota_bytes = 20 * burst_bytes),
+        ], reserve_bytes = 0)
+        checks = []
+        placed = {"SD card": 0, "internal disk": 0, "refused": 0}
+        with FrameWriter(save = manager.tracked(save_frame)) as writer:
+            for i in range(bursts):
+                start = time.perf_counter()
+                directory = manager.directory_for(burst_bytes)
+                checks.append(time.perf_counter() - start)
+                if directory is None:
+                    placed["refused"] += 1
+                    continue
+                placed[manager.volume_of(directory).name] += 1
+                queued = 0
+                for j in range(burst_num):
+                    queued += writer.put(frame, os.path.join(directory, f"burst{i:03d}_{j}.tiff"))
+                manager.release_frames(directory, burst_num - queued)
+            writer.flush()
+        report("directory_for", checks)
+        print(f"Bursts on SD card: {placed['SD card']}  internal disk: {placed['internal disk']}  refused: {placed['refused']}")
+        for volume in manager.status(rate = burst_bytes / 5):
+            throughput = volume['throughput']
+            throughput = "n/a" if throughput is None else f"{throughput / 1e6:.1f} MB/s"
+            print(f"{volume['name']:<15} written {volume['bytes_written'] / 1e6:.2f} MB  free {volume['free_bytes'] / 1e6:.2f} MB  throughput {throughput}")
+
+# ======================== Motion to relay latency ==========================
+# A PIR trace (motion pulses of 1.5 s, 1 s apart) is replayed onto a mock pin. The old controllers polled the sensor
+# every second; the trigger switches the relay on from the edge interrupt.
+
+def pir_trace(pulses, on_time = 1.5, off_time = 1.0):
+    trace = []
+    t = 0.2
+    for i in range(pulses):
+        trace.append((t, 1))
+        trace.append((t + on_time, 0))
+        t += on_time + off_time
+    return trace
+
+def bench_motion_trigger(pulses = 5, poll_period = 1.0):
+    print("== Motion to relay latency ==")
+    trace = pir_trace(pulses)
+
+    # Old: poll the sensor every 'poll_period' seconds
+    factory, pir, relay = mock_devices()
+    polled = []
+    done = threading.Event()
+    def poll_loop():
+        while not done.is_set():
+            if pir.is_active and not relay.is_active:
+                relay.on()
+                polled.append(pir.active_time)
+            elif not pir.is_active and relay.is_active:
+                relay.off()
+            time.sleep(poll_period)
+    poller = threading.Thread(target = poll_loop, daemon = True)
+    poller.start()
+    replay_trace(trace, factory.pin(20))
+    done.set()
+    poller.join()
+    report(f"polling every {poll_period:g} s (old)", polled)
+    pir.close()
+    relay.close()
+
+    # New: edge interrupt
+    factory, pir, relay = mock_devices()
+    with MotionTrigger(pir, relay, min_off_time = 0, on_no_motion = relay.off) as trigger:
+        replay_trace(trace, factory.pin(20))
+        report("edge interrupt", trigger.latencies)
+    pir.close()
+    relay.close()
+
+# ======================== Controller state machine =========================
+# One trigger is run through the state machine with simulated hardware (timings scaled down about 20x).
+# The blocking controller did the same steps one after the other, so the display refreshes added to the time to the first image.
+
+def bench_state_machine():
+    print("== Controller state machine ==")
+    hardware = SimulatedHardware(boot_time = 1.0, focus_time = 0.25, capture_time = 0.05, display_time = 0.4)
+    controller = Controller(hardware, duration = 1.5, frequency = 0.25, restart_off_time = 0.5, connect_poll = 0.05, telemetry_period = 0.5, storage_period = 0.5)
+
+    async def scenario():
+        runner = asyncio.create_task(controller.run())
+        await asyncio.sleep(0.2)
+        start = time.monotonic()
+        hardware.set_motion(True)
+        await asyncio.sleep(2.0)
+        hardware.set_motion(False)
+        while controller.state is not State.IDLE:
+            await asyncio.sleep(0.05)
+        controller.stop()
+        await runner
+        return start
+
+    start = asyncio.run(scenario())
+    first_capture = hardware.captured[0][0] - start
+    serialized = 3 * hardware.display_time + hardware.boot_time + hardware.focus_time + hardware.capture_time
+    print(f"{'motion to first image (state machine)':<40} {1000 * first_capture:.1f} ms")
+    print(f"{'motion to first image (serialized)':<40} {1000 * serialized:.1f} ms")
+    print(f"Captures: {controller.captures}  display refreshes: {controller.display_refreshes}  telemetry records: {len(controller.telemetry_log)}")
+    for state, seconds in controller.time_in_states().items():
+        print(f"  {state:<12} {1000 * seconds:9.1f} ms  ({controller.state_counts[State[state]]} visits)")
+
+# ======================== Capture scheduling ===============================
+# Five minutes of bursts every 5 seconds, with captures (plus SD check) taking 0.5-2.5 s and an occasional 8 s stall,
+# on a fake clock. The old loop slept 'frequency' seconds after each capture.
+
+def bench_scheduler(duration = 300, frequency = 5, seed = 1):
+    print("== Capture scheduling ==")
+    def capture_time(rng):
+        return 8.0 if rng.random() < 0.03 else rng.uniform(0.5, 2.5)
+
+    rng = random.Random(seed)
+    clock = FakeClock()
+    starts = []
+    while clock.monotonic() < duration:
+        starts.append(clock.monotonic())
+        clock.advance(capture_time(rng))
+        clock.sleep(frequency)
+    periods = np.diff(starts)
+    print(f"{'sleep after capture (old)':<40} bursts={len(starts):<4} mean period={periods.mean():.2f} s  drift after {len(starts)} bursts={starts[-1] - frequency * (len(starts) - 1):.1f} s")
+
+    rng = random.Random(seed)
+    clock = FakeClock()
+    scheduler = CaptureScheduler(frequency, duration = duration, clock = clock)
+    starts = []
+    for slot in scheduler:
+        starts.append(slot.fired)
+        clock.advance(capture_time(rng))
+    periods = np.diff(starts)
+    stats = scheduler.stats()
+    print(f"{'deadline scheduler':<40} bursts={len(starts):<4} mean period={periods.mean():.2f} s  late={stats['late']}  missed={stats['missed']}  max lateness={stats['max_lateness']:.2f} s")
+
+    # Lateness of the deadlines on the real clock (20 ms period, 5 ms of work per slot)
+    scheduler = CaptureScheduler(0.02, duration = 2)
+    for slot in scheduler:
+        time.sleep(0.005)
+    report("deadline lateness (system clock)", scheduler.lateness)
+
+# ======================== Adaptive capture rate ============================
+# Stored sequences (one frame per second) are replayed through the scene change detector on a fake clock and compared
+# with the fixed rate (a burst every 5 s for 60 s). In "passing animal" a warm target walks across the scene from 40 s to
+# 100 s after the trigger; in "false trigger" nothing moves.
+
+SCENE_Y, SCENE_X = np.mgrid[0:240, 0:320]
+SCENE_BACKGROUND = 20000.0 + 2 * SCENE_X + SCENE_Y
+SCENE_NOISE = np.random.default_rng(1).normal(0, 5, size = (16,) + SCENE_BACKGROUND.shape)
+
+# The function 'scene_frame' returns the synthetic raw frame at time 't': a static background with sensor noise, and a warm
+# target walking across the scene during each (start, end) in 'visits'
+def scene_frame(t, visits, rng):
+    frame = SCENE_BACKGROUND + SCENE_NOISE[rng.integers(len(SCENE_NOISE))]
+    for start, end in visits:
+        if start <= t < end:
+            cx = 20 + 280 * (t - start) / (end - start)
+            frame += 800 * np.exp(-((SCENE_X - cx) ** 2 + (SCENE_Y - 150) ** 2) / (2 * 12 ** 2))
+    return frame.astype(np.uint16)
+
+def scene_sequence(path, seconds = 300, moving = None, seed = 0):
+    rng = np.random.default_rng(seed)
+    visits = [] if moving is None else [moving]
+    with FrameContainerWriter(path) as writer:
+        for t in range(seconds):
+            writer.append(scene_frame(t, visits, rng), frame_id = t, device_timestamp = t * 10 ** 9, capture_time = float(t))
+
+def bench_adaptive_capture():
+    print("== Adaptive capture rate ==")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, moving in (("passing animal", (40, 100)), ("false trigger", None)):
+            path = os.path.join(directory, label.replace(" ", "_") + ".frames")
+            scene_sequence(path, moving = moving)
+            frames = FrameDataset(path)
+            fixed = list(range(0, 60, 5))
+            adaptive = AdaptiveCapture(fast_period = 2, slow_period = 15, extend = 30, max_duration = 300, log = None)
+            captured = replay(frames, 1.0, adaptive, duration = 60)
+            if moving is None:
+                coverage = ""
+            else:
+                during = lambda indices: sum(1 for i in indices if moving[0] <= i < moving[1])
+                coverage = f"  bursts while moving: fixed {during(fixed)}, adaptive {during(captured)}"
+            print(f"{label:<16} bursts: fixed {len(fixed)}, adaptive {len(captured)}  session: fixed 60 s, adaptive {captured[-1] if captured else 0} s{coverage}")
+            actions = [d['action'] for d in adaptive.decisions]
+            print(f"{'':<16} decisions: " + ", ".join(f"{a} x{actions.count(a)}" for a in ("learn", "active", "extend", "static", "end") if a in actions))
+
+        detector = ChangeDetector()
+        frame = np.asarray(frames[0])
+        detector.update(frame)
+        durations = []
+        for i in range(200):
+            start = time.perf_counter()
+            detector.update(frame)
+            durations.append(time.perf_counter() - start)
+        report("detector update (240 x 320)", durations)
+
+# ======================== Thermal trigger ==================================
+# First, recorded preview frames (10 minutes, a target walking through twice) and PIR events (2 real, 4 from wind) are
+# replayed through the hybrid trigger. Then a day with 8 animal visits and 3 gusty spells (60 false PIR events) is
+# simulated at one preview frame per second, counting cold boots with the PIR alone and with the hybrid trigger.
+
+def bench_thermal_trigger(seed = 0):
+    print("== Thermal trigger ==")
+    rng = np.random.default_rng(seed)
+    visits = [(100, 160), (400, 430)]
+    pir = {100: True, 401: True, 30: False, 250: False, 252: False, 500: False}
+    frames = [scene_frame(t, visits, rng) for t in range(600)]
+    decisions = evaluate(frames, list(range(600)), sorted(pir), HybridTrigger(confirm_window = 5))
+    correct = sum(1 for t, decision in decisions if (decision == 'confirmed') == pir[t])
+    print(f"Recorded sequence: {correct} of {len(decisions)} PIR events classified correctly: " + ", ".join(f"{t} s {decision}" for t, decision in decisions))
+
+    boot_time, session_time, warm_time = 35, 60, 600
+    day_visits = sorted((start, start + 120) for start in rng.uniform(0, 86000, size = 8))
+    true_events = [t for start, end in day_visits for t in range(int(start), int(end), 30)]
+    false_events = [float(t) for spell in rng.uniform(0, 84000, size = 3) for t in spell + np.sort(rng.uniform(0, 1800, size = 20))]
+    events = sorted(true_events + false_events)
+
+    # PIR alone: every event while the camera is off boots it for one capture window
+    boots = 0
+    on_until = -1
+    for t in events:
+        if t >= on_until:
+            boots += 1
+            on_until = t + boot_time + session_time
+    print(f"{'PIR only':<16} cold boots: {boots}")
+
+    # Hybrid: after a capture window the camera stays warm and confirms events with preview frames
+    trigger = HybridTrigger(warm_time = warm_time, confirm_window = 5)
+    boots = 0
+    sessions = 0
+    state = 'off'
+    until = 0
+    pending = iter(events)
+    next_event = next(pending, None)
+    visited = set()
+    for t in range(86400):
+        arrived = False
+        while next_event is not None and next_event <= t:
+            arrived = True
+            next_event = next(pending, None)
+        if state == 'warm' and t >= until:
+            state = 'off'
+        if arrived and state == 'off':
+            boots += 1
+            sessions += 1
+            state = 'capturing'
+            until = t + boot_time + session_time
+        elif state == 'capturing' and t >= until:
+            state = 'warm'
+            until = t + warm_time
+            trigger.reset()
+        if state == 'capturing':
+            visited.update(i for i, (start, end) in enumerate(day_visits) if start <= t < end)
+        if state == 'warm':
+            if arrived:
+                trigger.pir_event(t)
+            if trigger.update(scene_frame(t, day_visits, rng), t) == 'confirmed':
+                sessions += 1
+                state = 'capturing'
+                until = t + session_time
+    print(f"{'hybrid':<16} cold boots: {boots}  capture windows: {sessions}  rejected events: {trigger.rejected}  visits captured: {len(visited)} of {len(day_visits)}")
+
+# ======================== Telnet commands ==================================
+# The camera shell is replaced by a FakeCameraTelnetServer on localhost (2 ms per command, 10 ms network round trip,
+# 0.3 s to the first prompt, autofocus of 1 s). The old controller opened a new telnet connection for every focus and
+# slept for a fixed time after sending the command (5 s on the trap, scaled to 2.5 s here).
+
+def bench_telnet(commands = 50, focuses = 3, old_sleep = 2.5):
+    print("== Telnet commands (fake camera shell) ==")
+    nodes = ['.system.focus.autofull', '.system.focus.position', '.image.sysimg.basicImgData.objectParams.emissivity']
+    with FakeCameraTelnetServer(latency = 0.002, round_trip = 0.01, connect_delay = 0.3, focus_time = 1.0) as server:
+        per_connection = []
+        for i in range(commands // 10):
+            start = time.perf_counter()
+            with CameraCommandClient(server.host, server.port) as camera:
+                camera.get(nodes[i % len(nodes)])
+            per_connection.append(time.perf_counter() - start)
+        report("new connection per command (old)", per_connection)
+
+        with CameraCommandClient(server.host, server.port) as camera:
+            persistent = []
+            for i in range(commands):
+                start = time.perf_counter()
+                camera.get(nodes[i % len(nodes)])
+                persistent.append(time.perf_counter() - start)
+            report("persistent connection", persistent)
+
+            pipelined = []
+            for i in range(commands // len(nodes)):
+                start = time.perf_counter()
+                camera.pipeline([f"rls {node}" for node in nodes])
+                pipelined.append((time.perf_counter() - start) / len(nodes))
+            report("pipelined (per command)", pipelined)
+
+        old = []
+        for i in range(focuses):
+            start = time.perf_counter()
+            camera = CameraCommandClient(server.host, server.port)
+            camera.connect()
+            camera.sock.sendall(b'rset .system.focus.autofull true\n')
+            time.sleep(old_sleep)
+            old.append(time.perf_counter() - start)
+            camera.close()
+        report(f"connect + focus + sleep({old_sleep:g}) (old)", old)
+
+        new = []
+        with CameraCommandClient(server.host, server.port) as camera:
+            for i in range(focuses):
+                start = time.perf_counter()
+                camera.autofocus()
+                new.append(time.perf_counter() - start)
+        report("focus until status reads done", new)
+        print(f"Connections opened: {server.connections}  commands: {server.commands}")
+
+# ======================== Focus cache ======================================
+# A fixed-mount camera is booted 8 times in front of the same scene (fake camera shell, autofocus scaled to 1 s).
+# Before the 6th boot the camera is knocked, so the saved focus position is off. A frame is blurred in proportion
+# to the distance between the focus motor and the best position for the scene.
+
+def box_blur(frame, radius):
+    if radius < 1:
+        return frame
+    size = 2 * radius + 1
+    padded = np.pad(frame, radius, mode = 'edge')
+    sums = np.cumsum(np.cumsum(padded, axis = 0), axis = 1)
+    sums = np.pad(sums, ((1, 0), (1, 0)))
+    return (sums[size:, size:] - sums[:-size, size:] - sums[size:, :-size] + sums[:-size, :-size]) / (size * size)
+
+def focus_scene(seed = 0):
+    rng = np.random.default_rng(seed)
+    scene = np.full((240, 320), 20000.0)
+    for i in range(30):
+        y, x = rng.integers(0, 240), rng.integers(0, 320)
+        scene[max(y - 10, 0):y + 10, max(x - 15, 0):x + 15] += rng.uniform(-800, 800)
+    return scene
+
+def bench_focus_cache(boots = 8, knocked_at = 5):
+    print("== Focus cache (fake camera shell) ==")
+    scene = focus_scene()
+    with tempfile.TemporaryDirectory() as directory:
+        for label, cache in (("full autofocus every boot (old)", None),
+                             ("focus cache", FocusCache(os.path.join(directory, "focus.json"), log = None))):
+            with FakeCameraTelnetServer(focus_time = 1.0, connect_delay = 0.05) as server:
+                first_frame = []
+                scores = []
+                for boot in range(boots):
+                    server.focused_position = 1750 if boot < knocked_at else 1900
+                    start = time.perf_counter()
+                    # The camera was power cycled: a new telnet session on every boot
+                    with CameraCommandClient(server.host, server.port) as camera:
+                        if cache is None:
+                            camera.autofocus()
+                        else:
+                            cache.focus(camera)
+                        def grab():
+                            radius = abs(camera.focus_position() - server.focused_position) // 25
+                            return box_blur(scene, radius)
+                        frame = grab()
+                        first_frame.append(time.perf_counter() - start)
+                        if cache is not None and cache.needs_check():
+                            cache.check(frame, camera)
+                            if cache.needs_check():
+                                cache.check(grab(), camera)
+                        scores.append(sharpness(grab()))
+                report(label, first_frame)
+                if cache is not None:
+                    print(f"  restored: {cache.restores}  autofocus runs: {cache.autofocuses}  refocused after a blurred first burst: {cache.refocuses}")
+                print(f"  sharpness after focusing: min {min(scores):.3f}  max {max(scores):.3f}")
+
+# ======================== E-ink display ====================================
+# The display driver is replaced by fake_epd (refresh times scaled down 10x). The old print_to_display created and
+# cleared the panel, decoded the background and opened the font for every message, then waited for a fast full refresh.
+# A capture loop posts a status message every 50 ms; the time the loop is held up by the display is measured.
+
+def old_print_to_display(message, background_path, font_size = 18):
+    epd = fake_epd.EPD()
+    epd.init()
+    epd.Clear()
+    canvas = Image.new('1', (epd.width, epd.height), 255)
+    draw = ImageDraw.Draw(canvas)
+    canvas.paste(Image.open(background_path).convert('1'), (0, 0))
+    draw.text((20, 60), message, font = ImageFont.load_default(font_size), fill = 0)
+    epd.display_Fast(epd.getbuffer(canvas))
+    return epd
+
+def bench_display(messages = 20, period = 0.05, scale = 0.1):
+    print("== E-ink display (fake EPD, refresh times scaled by 0.1) ==")
+    delays = {name: getattr(fake_epd, name) for name in ('INIT_DELAY', 'CLEAR_DELAY', 'FULL_DELAY', 'FAST_DELAY', 'PARTIAL_DELAY')}
+    for name, delay in delays.items():
+        setattr(fake_epd, name, delay * scale)
+    sequence = [list(STATE_MESSAGES.values())[i % len(STATE_MESSAGES)] for i in range(messages)]
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            background_path = os.path.join(directory, "background.bmp")
+            background = Image.new('1', (fake_epd.EPD_WIDTH, fake_epd.EPD_HEIGHT), 255)
+            ImageDraw.Draw(background).ellipse((10, 10, 160, 120), outline = 0, width = 3)
+            background.save(background_path)
+
+            blocked = []
+            start = time.perf_counter()
+            for message in sequence:
+                begin = time.perf_counter()
+                old_print_to_display(message, background_path)
+                blocked.append(time.perf_counter() - begin)
+                time.sleep(period)
+            report("print_to_display per message (old)", blocked)
+            print(f"  total {time.perf_counter() - start:.2f} s, {messages} full refreshes, {messages} panel inits and clears")
+
+            epd = fake_epd.EPD()
+            with DisplayService(epd, background_path = background_path, messages = [(m, 18) for m in STATE_MESSAGES.values()]) as display:
+                blocked = []
+                start = time.perf_counter()
+                for message in sequence:
+                    begin = time.perf_counter()
+                    display.post(message)
+                    blocked.append(time.perf_counter() - begin)
+                    time.sleep(period)
+                display.flush()
+                report("DisplayService.post per message", blocked)
+                stats = display.stats()
+                print(f"  total {time.perf_counter() - start:.2f} s, full refreshes: {stats['full_refreshes']}  partial: {stats['partial_refreshes']}  "
+                      f"coalesced: {stats['coalesced']}  panel inits: {epd.calls['init']}")
+                final = display.render(sequence[-1])
+            print(f"  panel shows the last message: {final.tobytes() == epd.panel.tobytes()}")
+    finally:
+        for name, delay in delays.items():
+            setattr(fake_epd, name, delay)
+
+# ======================== Solar radiation ==================================
+# A year of minute-resolution timestamps at the Cembra site. The R script computed one timestamp per call (sapply over
+# get_solar_radiation); the per-timestamp loop below does the same in python, on a sample, and is extrapolated.
+# The R script itself is only run (on the week of hourly timestamps of its example) where R, TrenchR and rpy2 are installed.
+
+SITE = dict(lat = 46.130962, lon = 11.19001, slope = 1.017573714256287, slope_aspect = 92.496437072753906, hemisphere = "north", ELEV = 900.943969726562614)
+
+def bench_solar_radiation(sample = 2000):
+    from solar_radiation import get_solar_radiation, get_timestamps, r_reference
+    print("== Solar radiation (one year, every minute) ==")
+    year = get_timestamps("2024-01-01 00:00:00", "2024-12-31 23:59:00", freq = "min")
+    rng = np.random.default_rng(0)
+    tau = rng.uniform(0.4, 0.8, len(year))
+    albedo = rng.uniform(0.1, 0.3, len(year))
+
+    start = time.perf_counter()
+    solrad = get_solar_radiation(year, ATMOSPHERIC_TRANSMISSIVITY = tau, ALBEDO = albedo, **SITE)
+    vectorized = time.perf_counter() - start
+
+    picks = rng.choice(len(year), sample, replace = False)
+    start = time.perf_counter()
+    looped = [get_solar_radiation(str(year[i]), ATMOSPHERIC_TRANSMISSIVITY = tau[i], ALBEDO = albedo[i], **SITE) for i in picks]
+    per_timestamp = (time.perf_counter() - start) / sample
+    print(f"{'per timestamp (old structure)':<40} {per_timestamp * len(year):8.1f} s  (extrapolated from {sample} timestamps)")
+    print(f"{'vectorized':<40} {vectorized:8.2f} s  ({len(year)} timestamps)")
+    print(f"Max difference vectorized vs per timestamp: {np.max(np.abs(solrad[picks] - np.array(looped))):.2e} W/m2")
+
+    week = get_timestamps("2024-07-10 00:00:00", "2024-07-16 00:00:00")
+    try:
+        reference = r_reference(week, ATMOSPHERIC_TRANSMISSIVITY = 0.7, ALBEDO = 0.2, **SITE)
+    except ImportError:
+        print("R reference skipped (rpy2 is not installed)")
+        return
+    ported = get_solar_radiation(week, ATMOSPHERIC_TRANSMISSIVITY = 0.7, ALBEDO = 0.2, **SITE)
+    print(f"Max difference from the R script over {len(week)} hourly timestamps: {np.nanmax(np.abs(ported - reference)):.2e} W/m2")
+
+# ======================== Longwave radiation ===============================
+# The longwave radiation of the surroundings (sky and ground, see get_LW) is computed for the weather at every frame
+# of a season at once and compared with a per-frame loop. The model is checked against its limits: a fully clouded sky
+# has an emissivity of 0.952 and a perfectly dry clear sky 0.23 (Konzelmann et al. 1994).
+
+def bench_longwave(frames = 1000000, sample = 20000):
+    from RadianceToTemp import SIGMA, Ld, get_LW, raw_to_temp_batch
+    print("== Longwave radiation of the surroundings ==")
+    rng = np.random.default_rng(0)
+    t_air = rng.uniform(-5, 35, frames)
+    rh = rng.uniform(0.1, 1, frames)
+    cc = rng.uniform(0, 1, frames)
+
+    start = time.perf_counter()
+    LW = get_LW(air_temp = t_air, hum = 100*rh, cc = cc)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    looped = [get_LW(air_temp = t_air[i], hum = 100*rh[i], cc = cc[i]) for i in range(sample)]
+    per_frame = (time.perf_counter() - start) / sample
+    print(f"{'per frame loop':<40} {per_frame * frames:8.2f} s  (extrapolated from {sample} frames)")
+    print(f"{'vectorized':<40} {vectorized:8.3f} s  ({frames} frames)")
+    print(f"Max difference vectorized vs per frame: {np.max(np.abs(LW[:sample] - np.array(looped))):.2e} W/m2")
+
+    t_K = t_air[:5] + 273.15
+    print(f"Sky emissivity, overcast: {np.max(np.abs(Ld(t_air[:5], 100*rh[:5], 1) / (SIGMA*t_K**4) - 0.952)):.1e} from 0.952  "
+          f"dry and clear: {np.max(np.abs(Ld(t_air[:5], 0, 0) / (SIGMA*t_K**4) - 0.23)):.1e} from 0.23")
+    print(f"LW range: {LW.min():.0f} - {LW.max():.0f} W/m2 (the old get_LW returned 200)")
+    raw = np.full((1, 1, 1), 15000, dtype = np.uint16)
+    old = raw_to_temp_batch(raw, 0.5, 20, 20, 200)[0, 0, 0]
+    new = raw_to_temp_batch(raw, 0.5, 20, 20, get_LW(20, 50))[0, 0, 0]
+    print(f"Raw count 15000 at 20 C and 50% RH: {old:.2f} C with LW = 200, {new:.2f} C with LW = {get_LW(20, 50):.0f} W/m2")
+
+# ======================== Frame parameters =================================
+# The function 'bench_parameters' compares looking up the covariates of every frame one frame at a time (as the old
+# main() of RadianceToTemp.py did) with the table of frame parameters, computed in one pass and then read from the cache.
+# Argument 'frames' is the number of frames in the season (one every 5 minutes).
+# Argument 'sample' is the number of frames looked up one at a time (the per-frame time is extrapolated to all frames).
+
+def bench_parameters(frames = 100000, sample = 500):
+    import pandas as pd
+    from RadianceToTemp import SITE, CovariateIndex, csv_to_df, frame_parameters, get_LW, get_RH, get_Ta, radiometric_coefficients
+    from solar_radiation import get_solar_radiation
+    print(f"== Per-frame parameters ({frames} frames) ==")
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        season = pd.date_range("2024-05-01", periods = frames, freq = "5min")
+        weather_times = pd.date_range(season[0], season[-1], freq = "10min")
+        days = pd.date_range(season[0].normalize(), season[-1], freq = "D")
+        hours = pd.date_range(season[0], season[-1], freq = "h")
+        paths = {name: os.path.join(directory, name + ".csv") for name in ("weather", "lai", "albedo", "transmissivity")}
+        pd.DataFrame({'timestamp': weather_times, 'TA': rng.uniform(5, 25, len(weather_times)), 'RH': rng.uniform(0.3, 0.9, len(weather_times))}).to_csv(paths['weather'], index = False)
+        pd.DataFrame({'date': days.strftime("%Y-%m-%d"), 'LAI': rng.uniform(1, 5, len(days))}).to_csv(paths['lai'], index = False)
+        pd.DataFrame({'date': days.strftime("%Y-%m-%d"), 'albedo': rng.uniform(0.1, 0.3, len(days))}).to_csv(paths['albedo'], index = False)
+        pd.DataFrame({'time': hours.strftime("%Y-%m-%d %H:%M"), 'clear_sky_index': rng.uniform(0.3, 0.9, len(hours))}).to_csv(paths['transmissivity'], index = False)
+        timestamps = list(season.to_pydatetime())
+
+        # One frame at a time, with the tables indexed once
+        weather = CovariateIndex(csv_to_df(paths['weather']))
+        lai = CovariateIndex(csv_to_df(paths['lai']), time_column = 'date')
+        albedo = CovariateIndex(csv_to_df(paths['albedo']), time_column = 'date')
+        transmissivity = CovariateIndex(csv_to_df(paths['transmissivity']), time_column = 'time')
+        location = {name: value for name, value in SITE.items() if name != 'sky_view'}
+        looped = []
+        start = time.perf_counter()
+        for dt in timestamps[:sample]:
+            t_air = get_Ta(weather, dt)
+            rh = get_RH(weather, dt)
+            leaf_area = lai.nearest('LAI', dt)
+            tau = transmissivity.nearest('clear_sky_index', dt)
+            rho = albedo.nearest('albedo', dt)
+            solar = get_solar_radiation(dt, ATMOSPHERIC_TRANSMISSIVITY = tau, ALBEDO = rho, **location)
+            LW = get_LW(air_temp = t_air, hum = 100*rh, sky_view = SITE['sky_view'])
+            gain, offset = radiometric_coefficients(rh, t_air, t_air, LW)
+            looped.append((solar, gain[()], offset[()]))
+        per_frame = (time.perf_counter() - start) / sample
+        print(f"{'per frame lookups':<40} {per_frame * frames:8.2f} s  (extrapolated from {sample} frames)")
+
+        kwargs = dict(weather_path = paths['weather'], lai_path = paths['lai'], albedo_path = paths['albedo'],
+                      transmissivity_path = paths['transmissivity'], cache_dir = os.path.join(directory, "cache"))
+        start = time.perf_counter()
+        table = frame_parameters(timestamps, **kwargs)
+        computed = time.perf_counter() - start
+        print(f"{'frame_parameters (computed and cached)':<40} {computed:8.2f} s")
+        start = time.perf_counter()
+        cached = frame_parameters(timestamps, **kwargs)
+        print(f"{'frame_parameters (read from the cache)':<40} {time.perf_counter() - start:8.2f} s  (mostly hashing the timestamps and the input files)")
+
+        looped = np.array(looped)
+        print(f"Max difference table vs per frame: solar {np.max(np.abs(table['solar'][:sample] - looped[:, 0])):.1e} W/m2  "
+              f"gain {np.max(np.abs(table['gain'][:sample] - looped[:, 1])):.1e}  offset {np.max(np.abs(table['offset'][:sample] - looped[:, 2])):.1e}")
+        print(f"Cached table identical: {np.array_equal(table, cached)}  ({table.nbytes / 1e6:.1f} MB, {len(table.dtype.names)} columns)")
+
+# ======================== Capture timestamps ===============================
+# The function 'bench_timestamps' reads the capture time of every tiff in a directory of 'files' frames saved by
+# frame_writer.py, with the old file creation time (st_ctime, the time the file was written here rather than the time
+# the frame was captured) and with each source of frame_metadata.py. Frames are small (24 x 32), because only the
+# header and tags are read; decoding the pixels is timed on a sample for comparison.
+# Argument 'files' is the number of tiffs in the directory.
+# Argument 'sample' is the number of tiffs decoded with imageio.
+
+def bench_timestamps(files = 100000, sample = 2000):
+    import datetime
+    import imageio.v2 as imageio
+    from RadianceToTemp import load_frames
+    from camera_session import frame_filename
+    from frame_metadata import append_sidecar, metadata_from_filename, metadata_from_tags, read_sidecar
+    print(f"== Capture timestamps ({files} files) ==")
+    rng = np.random.default_rng(0)
+    frame = rng.integers(15000, 25000, size = (24, 32), dtype = np.uint16)
+    season = datetime.datetime(2024, 7, 11, 5, 0)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = os.path.join(directory, "")
+        frames = []
+        start = time.perf_counter()
+        for i in range(files):
+            capture_time = season + datetime.timedelta(seconds = 5 * i, microseconds = int(rng.integers(0, 1000000)))
+            metadata = {'filename': frame_filename(directory, capture_time, i, "tiff"), 'frame_id': i, 'device_timestamp': 5000000000 * i, 'capture_time': capture_time}
+            save_frame(metadata['filename'], frame, metadata)
+            frames.append(metadata)
+        print(f"Saved {files} tiffs with tags in {time.perf_counter() - start:.1f} s")
+        truth = {os.path.basename(f['filename']): f['capture_time'] for f in frames}
+        paths = [f['filename'] for f in frames]
+
+        def run(label, lookup, paths = paths):
+            start = time.perf_counter()
+            found = [lookup(path) for path in paths]
+            elapsed = time.perf_counter() - start
+            correct = sum(dt == truth[os.path.basename(path)] for path, dt in zip(paths, found))
+            print(f"{label:<40} {elapsed:8.2f} s  {elapsed/len(paths)*1e6:8.1f} us/file  correct {correct}/{len(paths)}")
+
+        run("st_ctime (old get_image_datetime)", lambda path: datetime.datetime.fromtimestamp(os.stat(path).st_ctime))
+        run("imageio decode (sample)", lambda path: imageio.imread(path) is not None and metadata_from_tags(path)['capture_time'], paths[:sample])
+        run("tags", lambda path: metadata_from_tags(path)['capture_time'])
+        run("filename", lambda path: metadata_from_filename(path)['capture_time'])
+        append_sidecar(directory, frames)
+        run("sidecar index", lambda path: read_sidecar(os.path.dirname(path))[os.path.basename(path)]['capture_time'])
+        os.remove(directory + "frames.csv")
+
+        start = time.perf_counter()
+        dataset = load_frames(directory)
+        times = [dataset.datetime(i) for i in range(len(dataset))]
+        elapsed = time.perf_counter() - start
+        correct = sum(dt == truth[name] for name, dt in zip(dataset.names, times))
+        print(f"{'load_frames + datetime (tags)':<40} {elapsed:8.2f} s  {elapsed/files*1e6:8.1f} us/file  correct {correct}/{files}")
+
+# ======================== Output formats ===================================
+# The function 'bench_writers' saves the same temperature frames with every writer of temperature_writers.py and with
+# the old save_np_as_csv, from one thread and from a pool of threads, and reports the bytes on disk, the write and read
+# throughput, and the largest difference between the frames read back and the frames written.
+# Argument 'frames' is the number of 240 x 320 frames (a warm animal moving over a smooth background, with sensor noise).
+# Argument 'threads' is the number of writer threads.
+
+def bench_writers(frames = 200, threads = 4):
+    from concurrent.futures import ThreadPoolExecutor
+    from RadianceToTemp import raw_to_temp_batch, save_np_as_csv
+    from temperature_writers import WRITERS, TemperatureStoreReader, make_writer, read_temperature
+    print(f"== Output formats ({frames} frames, {threads} writer threads) ==")
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:240, 0:320]
+    background = 17000 + 8 * y + 3 * x
+    raw = np.empty((frames, 240, 320), dtype = np.uint16)
+    for i in range(frames):
+        animal = 2500 * np.exp(-((x - 40 - i % 240) ** 2 + (y - 120) ** 2) / 800)
+        raw[i] = background + animal + rng.normal(0, 15, (240, 320))
+    temperatures = raw_to_temp_batch(raw, rh = 0.6, t_air = 18, t_win = 18, LW = 330)
+    megabytes = temperatures.nbytes / 1e6
+
+    def csv_writer(np_array, outdir, filename):
+        save_np_as_csv(np_array = np_array, outdir = outdir, filename = filename)
+    csv_writer.extension = ".csv"
+
+    formats = {'csv (old)': lambda: csv_writer}
+    formats.update({name: WRITERS[name] for name in WRITERS})
+    with tempfile.TemporaryDirectory() as directory:
+        for label, factory in formats.items():
+            results = []
+            for pool_size in (1, threads):
+                outdir = os.path.join(directory, f"{label.split()[0]}-{pool_size}", "")
+                os.mkdir(outdir)
+                writer = factory()
+                names = [f"file-{i:06d}{writer.extension}" for i in range(frames)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers = pool_size) as pool:
+                    for write in [pool.submit(writer, np_array = temperatures[i], outdir = outdir, filename = names[i]) for i in range(frames)]:
+                        write.result()
+                if hasattr(writer, 'close'):
+                    writer.close()
+                results.append(time.perf_counter() - start)
+            size = sum(entry.stat().st_size for entry in os.scandir(outdir))
+
+            start = time.perf_counter()
+            if hasattr(writer, 'store_path'):
+                reader = TemperatureStoreReader(writer.store_path(outdir))
+                back = [np.array(reader.read(name)) for name in names]
+            else:
+                back = [np.array(read_temperature(outdir + name)) for name in names]
+            read = time.perf_counter() - start
+            error = max(float(np.max(np.abs(a - b))) for a, b in zip(temperatures, back))
+            print(f"{label:<10} {size/frames/1e3:8.1f} kB/frame  write {megabytes/results[0]:7.1f} MB/s (x{threads} threads {megabytes/results[1]:7.1f} MB/s)  "
+                  f"read {megabytes/read:7.1f} MB/s  max error {error:.3f} C")
+
+# ======================== Main Code ========================================
+
+BENCHMARKS = {
+    "capture": bench_capture,
+    "presence": bench_presence,
+    "write": bench_write_behind,
+    "burst": bench_burst,
+    "container": bench_container,
+    "lazy": bench_lazy_loading,
+    "batch": bench_batch_conversion,
+    "lut": bench_lut_conversion,
+    "parallel": bench_parallel,
+    "covariates": bench_covariates,
+    "sd": bench_sd_detection,
+    "spillover": bench_spillover,
+    "motion": bench_motion_trigger,
+    "statemachine": bench_state_machine,
+    "schedule": bench_scheduler,
+    "adaptive": bench_adaptive_capture,
+    "hybrid": bench_thermal_trigger,
+    "telnet": bench_telnet,
+    "focus": bench_focus_cache,
+    "display": bench_display,
+    "solar": bench_solar_radiation,
+    "longwave": bench_longwave,
+    "parameters": bench_parameters,
+    "timestamps": bench_timestamps,
+    "writers": bench_writers,
+}
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
+
+if __name__ == '__main__':
+    main()
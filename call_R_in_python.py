@@ -1,14 +1,13 @@
-import rpy2.robjects as robjects
-from rpy2.robjects.packages import SignatureTranslatedAnonymousPackage
-
-# Import the R script into Python
-robjects.r.source("/Users/rhemitoth/Documents/PhD/Cembra/FLIR_A325sc_Controller/Solar_Radiation_Functions_for_Python.R")
-
-# Access the function
-get_solrad = robjects.r['get_solar_radiation']
-
-# Call the R function
-result = get_solrad(dt = "2024-07-11 12:11:00", lat = 46, lon = 11, slope = 40, slope_aspect =  90, hemisphere = "north", ATMOSPHERIC_TRANSMISSIVITY = 0.8)
-print(result)  # Output: [7]
-
-
+from solar_radiation import get_solar_radiation, r_reference
+
+# Solar radiation is computed in python (see solar_radiation.py, a NumPy port of Solar_Radiation_Functions_for_Python.R)
+result = get_solar_radiation(dt = "2024-07-11 12:11:00", lat = 46, lon = 11, slope = 40, slope_aspect = 90, hemisphere = "north", ATMOSPHERIC_TRANSMISSIVITY = 0.8, ELEV = 900, ALBEDO = 0.2)
+print(result)
+
+# Check the result against the original R script (needs R with TrenchR, tidyverse and lubridate, and rpy2)
+try:
+    reference = r_reference(["2024-07-11 12:11:00"], lat = 46, lon = 11, slope = 40, slope_aspect = 90, hemisphere = "north", ATMOSPHERIC_TRANSMISSIVITY = 0.8, ELEV = 900, ALBEDO = 0.2,
+                            script_path = "/Users/rhemitoth/Documents/PhD/Cembra/FLIR_A325sc_Controller/Solar_Radiation_Functions_for_Python.R")
+    print(f"R: {reference[0]}  difference: {result - reference[0]:.3g} W/m2")
+except ImportError:
+    print("rpy2 is not installed: R reference skipped")
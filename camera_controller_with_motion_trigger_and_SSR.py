@@ -1,9 +1,11 @@
 #### Import libraries ####
-import telnetlib # for establishing telnet connection to focus camera
+from camera_telnet import AutofocusTimeout, CameraCommandClient # for establishing telnet connection to focus camera
 import datetime # for creating image filenames with datetime of image capture
 import PySpin # FLIR spinnaker SDK
+from camera_session import CameraSession # keeps the camera initialized between captures
 from gpiozero import LED # for controlling indicator light
-from gpiozero import MotionSensor # for controlling motion trigger
+from gpiozero import DigitalInputDevice # for reading the motion trigger
+from motion_trigger import MotionTrigger # switches the relay on from PIR edges
 from gpiozero import Button # for controlling button to focus camera
 import gpiozero # for controlling relay
 from time import sleep # for pausing code
@@ -15,43 +17,17 @@ import os # for checking if directory for image export exists (avoids errors whi
 # Function uses the PySpin library/FLIR Spinnaker SDK
 # to connect to the camera and grab an image
 
-def save_image_spinnaker(directory, filetype):
+def save_image_spinnaker(directory, filetype, session = None):
 	# Argument 'directory' specifies directory where image will be saved
 	# Argument 'filetype' specifies filetype of image to be saves ('png', 'jpg', 'tiff', etc)
+	# Argument 'session' is an open CameraSession (see camera_session.py) that keeps the camera streaming between captures
 	
-	# Initalize the system
-	system = PySpin.System.GetInstance()
-
-	# Get the camera
-	cam = system.GetCameras()[0]
-	
-	try:
-		# Initialize the camera
-		cam.Init()
-
-		# Start aquisition
-		cam.BeginAcquisition()
-
-		# Grab image
-		image_result = cam.GetNextImage()
-	
-		# Save image
-		filename = directory + 'file-' + str(datetime.datetime.now().strftime('%Y%m%d-%H%M%S')) + "." + filetype
-		if os.path.exists(directory):
-			image_result.Save(filename)
+	if session is not None:
+		return session.capture(directory = directory, filetype = filetype, burst = False)
 
-		# Release image
-		image_result.Release()
-
-		# Stop Acquisition
-		cam.EndAcquisition()
-
-		# Deinitalize camera
-		cam.DeInit()
-
-	finally:
-		# Release system instance
-		system.ReleaseInstance()
+	# Initialize the system and camera for a single capture
+	with CameraSession(pyspin = PySpin) as one_shot_session:
+		return one_shot_session.capture(directory = directory, filetype = filetype, burst = False)
 
 
 #### Check for camera connection ####
@@ -77,14 +53,19 @@ def check_connection():
 
 #### Establishing Telnet Connection ####
 def establish_telnet_connection(cam_ip):
-	telnet_connection = telnetlib.Telnet(cam_ip)
+	telnet_connection = CameraCommandClient(cam_ip)
+	telnet_connection.connect()
 	return telnet_connection
 
 #### Focusing the camera via telnet ####
-def focus(telnet_connection):
-	telnet_connection.read_until(b'>')
-	telnet_connection.write(b'rset .system.focus.autofull true\n') # telnet command to focus the camera
-	sleep(5)
+# Returns as soon as the camera reports that the autofocus has finished (at most 'timeout' seconds)
+# Returns None if it did not finish in time, so the camera captures unfocused rather than not at all
+def focus(telnet_connection, timeout = 10):
+	try:
+		return telnet_connection.autofocus(timeout = timeout) # telnet command to focus the camera
+	except AutofocusTimeout as error:
+		print(error)
+		return None
 
 #### Main Code ####
 
@@ -92,95 +73,92 @@ def main():
 
 	# Define LED and PIR sensor GPIO pins on Raspberry Pi
 	led = LED(23) # comment this line out if you aren't using an indicator light
-	pir = MotionSensor(24)
+	pir = DigitalInputDevice(24, pull_up = False) # read with edge interrupts instead of polling
 	relay = gpiozero.OutputDevice(21, active_high = True, initial_value = False)
+	# The relay is switched on from the PIR interrupt (see motion_trigger.py).
+	# The camera stays off for at least 3 seconds, to prevent it from freezing up from turning off/on too quickly
+	trigger = MotionTrigger(pir, relay, min_off_time = 3, on_motion = led.on)
 
 
 	# Main code 
 	
-	# Initialize previous  motion state
-	previous_motion = False
-	
 	while True:
-		# Check if motion is detected
-		
-		current_motion = pir.motion_detected
-		
-		if previous_motion == True and current_motion == False:
-			sleep(10) # prevents camera from freezing up from turning off/on too quickly
-		
-		if current_motion == True:
+		if not trigger.is_motion():
+			# Turn of indicator light and relay if no motion is detected
+			led.off()
+			trigger.power_off()
+			print("No motion detected. Camera off.")
 
-			# Turn on indicator light if motion is detected
-			led.on()
+			# Sleep until the PIR output rises
+			edges = len(trigger.latencies)
+			trigger.wait_for_motion()
+			if len(trigger.latencies) > edges:
+				print(f"Motion to relay: {trigger.latencies_ms()[-1]:.2f} ms")
 
-			# Turn on camera
-			print("Motion detected. Turning on camera")
-			relay.on()
-			
-			# Pause code until camera is connected
-			print("Connecting to camera . . .")
-			not_connected = True
-			start_time = time()
-			while not_connected == True:
-				connection_status = check_connection()
-				if connection_status == True:
-					not_connected = False
-				else:
-					current_time = time()
-					if current_time - start_time > 60:
-						print("Camera frozen. Restarting . . . ")
-						relay.off()
-						sleep(60)
-						relay.on()
-						print("Connecting to camera . . .")
-						sleep(1)
-						start_time = time()
-					else:
-						sleep(1)
-			print("Camera connected.")
+		# Turn on indicator light if motion is detected
+		led.on()
 
-		# Focus the camera
-			if check_connection() == True:
-				flir_ip = '169.254.0.2' 
-				tn = establish_telnet_connection(flir_ip)
-				print("Focusing camera . . .")
-				focus(tn)
-				print("Camera is focused.")
-
-			# while motion is still detected, collect an image every 10 seconds
-			still_moving = current_motion
-			while still_moving == True:
-				fpath = "/media/moorcroftlab/9016-4EF8/"
-				if os.path.exists(fpath) and check_connection() == True:
-					print("Capturing image . . .")
-					save_image_spinnaker(directory = fpath, filetype = "tiff")
-					print ("Image saved.")
-					# blink LED after saving an image
-					led.off()
+		# Turn on camera
+		print("Motion detected. Turning on camera")
+		trigger.power_on()
+		
+		# Pause code until camera is connected
+		print("Connecting to camera . . .")
+		not_connected = True
+		start_time = time()
+		while not_connected == True:
+			connection_status = check_connection()
+			if connection_status == True:
+				not_connected = False
+			else:
+				current_time = time()
+				if current_time - start_time > 60:
+					print("Camera frozen. Restarting . . . ")
+					trigger.power_off(hold = 60) # motion must not switch the camera back on during the restart
+					sleep(60)
+					trigger.power_on()
+					print("Connecting to camera . . .")
 					sleep(1)
-					led.on()
-					# wait 5 seconds before taking the next picture
-					sleep(5)
-				elif os.path.exists(fpath) == False:
-					print("WARNING: SD Card missing.")
+					start_time = time()
+				else:
 					sleep(1)
+		print("Camera connected.")
 
-				# check to see if motion is still detected before taking another picture
-				# Exit while loop if motion is no longer detected
-				still_moving = pir.motion_detected
-
-		if current_motion == False:
-			# Turn of indicator light if no motion is detected
-			led.off()
-			sleep(1)
-			
-			# Turn relay off
-			relay.off()
-			print("No motion detected. Camera off.")
-			sleep(2)
-		
-		previous_motion = current_motion
+		# Focus the camera
+		tn = None
+		if check_connection() == True:
+			flir_ip = '169.254.0.2' 
+			tn = establish_telnet_connection(flir_ip)
+			print("Focusing camera . . .")
+			focus(tn)
+			print("Camera is focused.")
+
+		# while motion is still detected, collect an image every 5 seconds
+		session = CameraSession(pyspin = PySpin)
+		while trigger.is_motion():
+			fpath = "/media/moorcroftlab/9016-4EF8/"
+			if os.path.exists(fpath) and check_connection() == True:
+				print("Capturing image . . .")
+				save_image_spinnaker(directory = fpath, filetype = "tiff", session = session)
+				print ("Image saved.")
+				# blink LED after saving an image
+				led.off()
+				sleep(1)
+				led.on()
+				# wait 5 seconds before taking the next picture
+				sleep(5)
+			elif os.path.exists(fpath) == False:
+				print("WARNING: SD Card missing.")
+				sleep(1)
+
+			# Keep the camera on for 10 seconds after motion stops, in case the motion resumes
+			if not trigger.is_motion():
+				trigger.wait_for_motion(timeout = 10)
+
+		# Release the camera and the telnet connection before the relay powers it off
+		session.close()
+		if tn is not None:
+			tn.close()
 			
 			
 			
@@ -0,0 +1,140 @@
+# ======================== Notes ===========================================
+
+## camera_monitor.py tracks whether the FLIR camera is plugged in without re-enumerating the GigE bus on every check.
+## A 'CameraMonitor' holds one PySpin system instance for the lifetime of the controller. When the Spinnaker SDK supports
+## device arrival/removal events, the cached state is updated from those callbacks. Otherwise a background heartbeat thread
+## refreshes the camera list every few seconds. Either way, is_connected() only reads the cached state.
+## Pass pyspin = fake_pyspin to run without the Spinnaker SDK and simulate cameras with fake_pyspin.plug_camera()/unplug_camera().
+
+# ======================== Import  Modules ==================================
+
+import threading
+import time
+
+# ======================== Camera Monitor ===================================
+# The class 'CameraMonitor' caches the set of connected camera serial numbers.
+# Argument 'pyspin' is the PySpin module to use. The default (None) imports the FLIR Spinnaker SDK.
+# Argument 'heartbeat' is the time (in seconds) between camera list refreshes when the SDK has no arrival/removal events.
+# Argument 'use_events' can be set to False to force the heartbeat thread even if events are available.
+
+class CameraMonitor:
+
+    def __init__(self, pyspin = None, heartbeat = 5, use_events = True):
+        if pyspin is None:
+            import PySpin as pyspin # FLIR spinnaker SDK
+        self.PySpin = pyspin
+        self.heartbeat = heartbeat
+        self.lock = threading.Lock()
+        self.serials = set()
+        self.last_change = time.monotonic()
+        self.enumeration_count = 0
+        self.handlers = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # Hold one system instance for as long as the monitor is running
+        self.system = self.PySpin.System.GetInstance()
+
+        # Register for events before the initial scan so no arrival/removal is missed in between
+        if use_events and hasattr(self.PySpin, 'DeviceArrivalEventHandler') and hasattr(self.system, 'RegisterEventHandler'):
+            self._register_events()
+            self.refresh()
+        else:
+            self.refresh()
+            self.thread = threading.Thread(target = self._heartbeat_loop, daemon = True)
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Returns True if at least one camera is connected. Reads the cached state only.
+    def is_connected(self):
+        return len(self.serials) > 0
+
+    # Returns the number of connected cameras. Reads the cached state only.
+    def camera_count(self):
+        return len(self.serials)
+
+    # Block until a camera is connected or 'timeout' seconds have passed. Returns is_connected().
+    def wait_for_camera(self, timeout = None, poll = 0.05):
+        start = time.monotonic()
+        while not self.is_connected():
+            if timeout is not None and time.monotonic() - start > timeout:
+                break
+            time.sleep(poll)
+        return self.is_connected()
+
+    # Re-enumerate the cameras and update the cached state. This is the only place the bus is scanned.
+    def refresh(self):
+        cam_list = self.system.GetCameras()
+        try:
+            serials = set()
+            for i in range(cam_list.GetSize()):
+                cam = cam_list[i]
+                serials.add(str(cam.TLDevice.DeviceSerialNumber.GetValue()))
+                del cam
+        finally:
+            cam_list.Clear()
+        self.enumeration_count += 1
+        self._set_serials(serials)
+
+    # Unregister the event handlers, stop the heartbeat thread and release the system instance.
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.system is not None:
+            for handler in self.handlers:
+                self.system.UnregisterEventHandler(handler)
+            self.handlers = []
+            self.system.ReleaseInstance()
+            self.system = None
+
+    def _set_serials(self, serials):
+        with self.lock:
+            if serials != self.serials:
+                self.last_change = time.monotonic()
+            self.serials = serials
+
+    def _on_arrival(self, serial):
+        with self.lock:
+            self.serials = self.serials | {str(serial)}
+            self.last_change = time.monotonic()
+
+    def _on_removal(self, serial):
+        with self.lock:
+            self.serials = self.serials - {str(serial)}
+            self.last_change = time.monotonic()
+
+    def _register_events(self):
+        monitor = self
+
+        class ArrivalHandler(self.PySpin.DeviceArrivalEventHandler):
+            def __init__(self):
+                super().__init__()
+
+            def OnDeviceArrival(self, serial_number):
+                monitor._on_arrival(serial_number)
+
+        class RemovalHandler(self.PySpin.DeviceRemovalEventHandler):
+            def __init__(self):
+                super().__init__()
+
+            def OnDeviceRemoval(self, serial_number):
+                monitor._on_removal(serial_number)
+
+        self.handlers = [ArrivalHandler(), RemovalHandler()]
+        for handler in self.handlers:
+            self.system.RegisterEventHandler(handler)
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(self.heartbeat):
+            try:
+                self.refresh()
+            except self.PySpin.SpinnakerException as e:
+                print(f"Error refreshing camera list: {e}")
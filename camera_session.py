@@ -0,0 +1,211 @@
+# ======================== Notes ===========================================
+
+## camera_session.py keeps the FLIR Spinnaker system, camera and acquisition stream open across captures.
+## Calling PySpin.System.GetInstance(), cam.Init() and cam.BeginAcquisition() for every image dominates the time of a burst on the raspberry pi,
+## so a 'CameraSession' is opened once per data collection window and only torn down and reconnected when the SDK reports a failure.
+## Pass pyspin = fake_pyspin to run without the Spinnaker SDK (see fake_pyspin.py and benchmarks.py).
+
+# ======================== Import  Modules ==================================
+
+import datetime # for creating image filenames with datetime of image capture
+import os # for checking if directory for image export exists
+
+from frame_metadata import append_sidecar # records the capture time of frames saved by the SDK
+
+# ======================== Camera Session ===================================
+# The class 'CameraSession' owns one PySpin system instance and one initialized, streaming camera.
+# Argument 'pyspin' is the PySpin module to use. The default (None) imports the FLIR Spinnaker SDK.
+# Argument 'timeout' is the time (in milliseconds) to wait for a frame before the session is considered broken.
+# Argument 'retries' is the number of times a failed capture is retried after reconnecting to the camera.
+# Argument 'writer' is an optional FrameWriter (see frame_writer.py). If given, frames are copied out and saved in the background instead of inline.
+# Argument 'on_frame' is an optional function called as on_frame(pixels, frame) for every frame grabbed, before the buffer is released
+# (e.g. to feed a scene change detector). 'pixels' is only valid during the call: copy it to keep it.
+# The session opens lazily on the first capture and can be used as a context manager:
+#     with CameraSession() as session:
+#         session.capture(directory = fpath, filetype = "tiff")
+
+class CameraSession:
+
+    def __init__(self, pyspin = None, timeout = 2000, retries = 1, writer = None, on_frame = None):
+        if pyspin is None:
+            import PySpin as pyspin # FLIR spinnaker SDK
+        self.PySpin = pyspin
+        self.timeout = timeout
+        self.retries = retries
+        self.writer = writer
+        self.on_frame = on_frame
+        self.system = None
+        self.cam_list = None
+        self.cam = None
+        self.reconnect_count = 0
+        self.last_burst = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Returns True if the camera is initialized and streaming
+    def is_open(self):
+        return self.cam is not None and self.cam.IsStreaming()
+
+    # Initialize the system, grab the first camera and start acquisition. Does nothing if the session is already open.
+    def open(self):
+        if self.is_open():
+            return
+        self.close()
+        self.system = self.PySpin.System.GetInstance()
+        self.cam_list = self.system.GetCameras()
+        if self.cam_list.GetSize() == 0:
+            self.close()
+            raise self.PySpin.SpinnakerException("No camera detected")
+        self.cam = self.cam_list[0]
+        self.cam.Init()
+        self.configure_acquisition()
+        self.cam.BeginAcquisition()
+
+    # Stop acquisition, deinitialize the camera and release the system. Safe to call on a broken or closed session.
+    def close(self):
+        if self.cam is not None:
+            try:
+                if self.cam.IsStreaming():
+                    self.cam.EndAcquisition()
+                if self.cam.IsInitialized():
+                    self.cam.DeInit()
+            except self.PySpin.SpinnakerException as e:
+                print(f"Error closing camera: {e}")
+            # The camera reference must be dropped before the system instance is released
+            self.cam = None
+        if self.cam_list is not None:
+            self.cam_list.Clear()
+            self.cam_list = None
+        if self.system is not None:
+            self.system.ReleaseInstance()
+            self.system = None
+
+    # Tear the session down and open it again. Used after the SDK reports an error (e.g. the camera was power cycled).
+    def reconnect(self):
+        self.close()
+        self.reconnect_count += 1
+        self.open()
+
+    # Grab the next image from the acquisition stream. The caller is responsible for calling Release() on the result.
+    def grab(self):
+        self.open()
+        image_result = self.cam.GetNextImage(self.timeout)
+        if image_result.IsIncomplete():
+            image_result.Release()
+            raise self.PySpin.SpinnakerException("Image incomplete")
+        return image_result
+
+    # Put the camera in continuous acquisition and keep only the newest buffer, so each GetNextImage() returns the next
+    # frame at the camera's native rate instead of a frame that has been sitting in the buffer since the last burst.
+    def configure_acquisition(self):
+        try:
+            self.cam.AcquisitionMode.SetValue(self.PySpin.AcquisitionMode_Continuous)
+            self.cam.TLStream.StreamBufferHandlingMode.SetValue(self.PySpin.StreamBufferHandlingMode_NewestOnly)
+        except self.PySpin.SpinnakerException as e:
+            print(f"Could not configure acquisition mode: {e}")
+
+    # The function 'capture' saves a single image or a burst of images to 'directory', reconnecting to the camera on failure.
+    # Arguments match save_image_spinnaker in FLIR_A325sc_Controller_Complete.py.
+    # A retry only grabs the frames the failed attempt didn't get to, so frames that were already saved are not saved again.
+    # Returns the list of filenames that were written (or queued for writing), across all attempts. If every attempt fails,
+    # the exception is raised and the frames saved before the failure are in 'last_burst'.
+    def capture(self, directory, filetype, burst = True, burst_num = 3):
+        if burst == False:
+            burst_num = 1
+        attempt = 0
+        frames = []
+        while True:
+            try:
+                self.burst(directory, filetype, burst_num, frames = frames)
+                return [frame['filename'] for frame in frames if frame['saved']]
+            except self.PySpin.SpinnakerException as e:
+                if attempt >= self.retries:
+                    self.close()
+                    raise
+                attempt += 1
+                print(f"Capture failed ({e}). Reconnecting to camera . . .")
+                self.reconnect()
+
+    # The function 'burst' pulls 'burst_num' consecutive frames from the acquisition stream and saves them to 'directory'.
+    # Each frame is stamped with the camera's frame ID and device timestamp. The capture time of every frame is the
+    # host clock at the first frame plus the device clock offset, so frames within a burst keep sub-second spacing.
+    # Frames saved by the writer carry this metadata in their tags, frames saved inline are listed in a sidecar index (see frame_metadata.py).
+    # Argument 'frames' is the list of frames grabbed by an earlier, failed attempt at the same burst: only the remaining
+    # frames are grabbed and they are appended to it (the frames of each attempt are timed from that attempt's first frame).
+    # Returns a list of dictionaries (filename, frame_id, device_timestamp, capture_time, saved), which is also kept in 'last_burst'
+    # (also when the burst fails partway).
+    def burst(self, directory, filetype, burst_num = 3, frames = None):
+        if frames is None:
+            frames = []
+        self.last_burst = frames
+        inline = []
+        try:
+            self._grab_frames(directory, filetype, burst_num - len(frames), frames, inline)
+        finally:
+            # The SDK can't add tags to the files it saves, so their metadata goes to the sidecar index of the directory
+            if inline:
+                append_sidecar(directory, inline)
+        return frames
+
+    def _grab_frames(self, directory, filetype, count, frames, inline):
+        host_start = None
+        device_start = None
+        for i in range(0, count):
+
+            # Grab image
+            image_result = self.grab()
+
+            try:
+                frame_id = image_result.GetFrameID()
+                device_timestamp = image_result.GetTimeStamp()
+                if host_start is None:
+                    host_start = datetime.datetime.now()
+                    device_start = device_timestamp
+                capture_time = host_start + datetime.timedelta(microseconds = (device_timestamp - device_start) / 1000)
+
+                frame = {
+                    'filename': frame_filename(directory, capture_time, frame_id, filetype),
+                    'frame_id': frame_id,
+                    'device_timestamp': device_timestamp,
+                    'capture_time': capture_time,
+                    'saved': False,
+                }
+
+                pixels = None
+                if self.writer is not None or self.on_frame is not None:
+                    pixels = image_result.GetNDArray()
+                if self.on_frame is not None:
+                    self.on_frame(pixels, frame)
+
+                # Save image
+                if os.path.exists(directory):
+                    if self.writer is not None:
+                        # Copy the frame into the write-behind queue; the buffer is released right after
+                        frame['saved'] = self.writer.put(pixels, frame['filename'], frame)
+                    else:
+                        image_result.Save(frame['filename'])
+                        frame['saved'] = True
+                        inline.append(frame)
+                frames.append(frame)
+            finally:
+                # Release image back to the acquisition stream
+                image_result.Release()
+
+# ======================== Frame filenames ==================================
+# The function 'frame_filename' builds a collision-free filename from the capture time (to the microsecond) and the camera frame ID.
+# Filenames keep the "file-YYYYMMDD-HHMMSS" prefix used by RadianceToTemp.py, e.g. file-20240711-121100-123456_f000042.tiff
+
+def frame_filename(directory, capture_time, frame_id, filetype):
+    return directory + "file-" + capture_time.strftime('%Y%m%d-%H%M%S-%f') + "_f" + str(frame_id).zfill(6) + "." + filetype
+
+# ======================== Burst timing =====================================
+# The function 'burst_intervals' returns the intervals (in seconds) between consecutive frames of a burst, measured with the device clock.
+# Argument 'frames' is the list returned by CameraSession.burst().
+
+def burst_intervals(frames):
+    return [(b['device_timestamp'] - a['device_timestamp']) / 1e9 for a, b in zip(frames, frames[1:])]
@@ -0,0 +1,385 @@
+# ======================== Notes ===========================================
+
+## camera_telnet.py talks to the command shell of a FLIR A3xx camera over telnet (port 23).
+## The shell prints a '>' prompt, and resource nodes are read with 'rls <node>' and written with 'rset <node> <value>'.
+## A 'CameraCommandClient' keeps one connection open for as long as the camera is powered, with explicit timeouts on the
+## connection and on every reply, so a frozen camera can't hang the controller. Several commands can be sent in one go
+## ('pipeline'), which saves a network round trip per command. If the connection drops (e.g. the camera was power cycled)
+## it is opened again on the next command.
+## Autofocus polls the focus node until the camera reports that it has finished, instead of sleeping for a fixed time.
+## It is a plain socket client rather than telnetlib, which is deprecated and removed in python 3.13.
+## 'FakeCameraTelnetServer' is a local stand-in for the camera shell, for trying the client and measuring latency without a camera.
+
+# ======================== Import  Modules ==================================
+
+import socket
+import threading
+import time
+
+# ======================== Telnet protocol bytes ============================
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# ======================== Exceptions =======================================
+
+class CameraCommandError(Exception):
+    pass
+
+# Raised when the camera doesn't report the end of an autofocus in time (see CameraCommandClient.autofocus)
+class AutofocusTimeout(CameraCommandError):
+    pass
+
+# ======================== Camera Command Client ============================
+# The class 'CameraCommandClient' sends commands to the camera shell over one persistent telnet connection.
+# Argument 'host' is the ip address of the camera and 'port' the telnet port.
+# Argument 'timeout' is the longest time (in seconds) to wait for the reply to a command.
+# Argument 'connect_timeout' is the longest time (in seconds) to wait for the connection and the first prompt.
+# Argument 'prompt' is the prompt the shell prints when it is ready for the next command.
+# Usage:
+#     with CameraCommandClient('169.254.0.2') as camera:
+#         camera.autofocus()
+#         camera.rset('.system.focus.autofull', 'true')
+#         position = camera.focus_position()
+# Errors (no connection, no reply within 'timeout', an error printed by the shell, or an autofocus that doesn't finish) raise CameraCommandError.
+
+class CameraCommandClient:
+
+    # Node written to start an autofocus, and read back until it shows 'focus_done'.
+    # That the node falls back to 'false' when the autofocus has finished is an assumption that has not been confirmed on a
+    # real A325sc yet (FakeCameraTelnetServer was written to match it). Change 'focus_done' (or 'focus_node') if the camera differs.
+    focus_node = '.system.focus.autofull'
+    focus_done = 'false'
+    # Node holding the position of the focus motor.
+    # That reading it gives the motor position, and writing a value read earlier moves the motor back there, is also an
+    # assumption that has not been confirmed on a real A325sc (FakeCameraTelnetServer stores it like any other node).
+    # Change 'position_node' if the camera differs.
+    position_node = '.system.focus.position'
+
+    def __init__(self, host, port = 23, timeout = 5.0, connect_timeout = 3.0, prompt = b'>'):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.prompt = prompt
+        self.sock = None
+        self.buffer = b''
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.commands = 0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_connected(self):
+        return self.sock is not None
+
+    # Open the connection and wait for the first prompt. Does nothing if it is already open.
+    def connect(self):
+        if self.sock is not None:
+            return
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout = self.connect_timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.buffer = b''
+            self._read_until_prompt(self.connect_timeout)
+        except OSError as error:
+            self.close()
+            raise CameraCommandError(f"Could not connect to {self.host}:{self.port}: {error}") from error
+        except CameraCommandError:
+            self.close()
+            raise
+        self.connects += 1
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.buffer = b''
+
+    # Send one command line and return its reply (the text printed before the next prompt)
+    def command(self, line, timeout = None):
+        return self.pipeline([line], timeout = timeout)[0]
+
+    # Send several command lines at once and return their replies, in order.
+    # A dropped connection is opened again and the commands are sent once more.
+    def pipeline(self, lines, timeout = None):
+        timeout = self.timeout if timeout is None else timeout
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    self.connect()
+                    self.sock.sendall(b''.join(line.encode('ascii') + b'\n' for line in lines))
+                    replies = [self._reply(line, self._read_until_prompt(timeout)) for line in lines]
+                    break
+                except OSError as error:
+                    # The camera was likely power cycled; try once more on a new connection
+                    self.close()
+                    if attempt == 1:
+                        raise CameraCommandError(f"Lost the connection to {self.host}: {error}") from error
+                except CameraCommandError:
+                    # A reply that didn't arrive in time leaves the connection out of step with the commands
+                    self.close()
+                    raise
+        self.commands += len(lines)
+        for line, reply in zip(lines, replies):
+            if reply.lower().startswith('error'):
+                raise CameraCommandError(f"'{line}' failed: {reply}")
+        return replies
+
+    # Write 'value' to the resource node 'node'
+    def rset(self, node, value):
+        return self.command(f"rset {node} {value}")
+
+    # List the resource node 'node'. Returns a dictionary of the names and values it prints
+    # (one entry, named after the node, for a leaf).
+    def rls(self, node):
+        values = {}
+        for line in self.command(f"rls {node}").splitlines():
+            parts = line.split(None, 1)
+            if len(parts) == 2:
+                values[parts[0].rsplit('.', 1)[-1]] = parts[1].strip().strip('"')
+            elif len(parts) == 1:
+                values[node.rsplit('.', 1)[-1]] = parts[0].strip('"')
+        return values
+
+    # Returns the value of the leaf node 'node' as a string
+    def get(self, node):
+        values = self.rls(node)
+        if len(values) == 0:
+            raise CameraCommandError(f"No value for {node}")
+        return values.get(node.rsplit('.', 1)[-1], list(values.values())[-1])
+
+    # Run a full autofocus and wait for the camera to finish it.
+    # The autofocus is taken to be finished once 'focus_node' reads 'focus_done' again. This completion signal is an
+    # assumption until it is confirmed on a real A325sc: if the camera never resets the node, every autofocus times out,
+    # and if it resets it before the motor stops, this returns early.
+    # Argument 'timeout' is the longest time (in seconds) to wait and 'poll' the time between status reads.
+    # Returns the time (in seconds) the autofocus took. Raises AutofocusTimeout if it hadn't finished after 'timeout'.
+    def autofocus(self, timeout = 10, poll = 0.1):
+        start = time.monotonic()
+        self.rset(self.focus_node, 'true')
+        value = None
+        while time.monotonic() - start < timeout:
+            value = self.get(self.focus_node)
+            if value.lower() == self.focus_done:
+                return time.monotonic() - start
+            time.sleep(poll)
+        raise AutofocusTimeout(f"Autofocus did not finish within {timeout} s: {self.focus_node} still reads {value!r}, expected {self.focus_done!r}")
+
+    # Returns the position of the focus motor, read from 'position_node' (unconfirmed on a real A325sc, see above)
+    def focus_position(self):
+        return int(float(self.get(self.position_node)))
+
+    # Move the focus motor to 'position' (e.g. one recorded after an earlier autofocus) by writing 'position_node'.
+    # Whether the real camera moves the motor when the node is written is an assumption, like the autofocus completion signal.
+    def set_focus_position(self, position):
+        self.rset(self.position_node, int(position))
+
+    # ---------------- Reading replies ----------------
+
+    # Read up to and including the next prompt and return what came before it
+    def _read_until_prompt(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            index = self.buffer.find(self.prompt)
+            if index >= 0:
+                data = self.buffer[:index]
+                self.buffer = self.buffer[index + len(self.prompt):]
+                return data
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CameraCommandError(f"No reply from {self.host} within {timeout} s")
+            self.sock.settimeout(remaining)
+            try:
+                chunk = self.sock.recv(4096)
+            except socket.timeout:
+                continue
+            if not chunk:
+                raise ConnectionError("connection closed by the camera")
+            self.buffer += self._strip_negotiation(chunk)
+
+    # Remove telnet option negotiation from 'data' and refuse every option, so the shell talks plain text
+    def _strip_negotiation(self, data):
+        if IAC not in data:
+            return data
+        text = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC or i + 1 >= len(data):
+                text.append(byte)
+                i += 1
+                continue
+            option = data[i + 1]
+            if option in (DO, DONT, WILL, WONT) and i + 2 < len(data):
+                if option == DO:
+                    self.sock.sendall(bytes([IAC, WONT, data[i + 2]]))
+                elif option == WILL:
+                    self.sock.sendall(bytes([IAC, DONT, data[i + 2]]))
+                i += 3
+            elif option == SB:
+                end = data.find(bytes([IAC, SE]), i)
+                i = len(data) if end < 0 else end + 2
+            elif option == IAC:
+                text.append(IAC)
+                i += 2
+            else:
+                i += 2
+        return bytes(text)
+
+    # Clean up the text printed for 'line': drop the echoed command, the prompt's backslash and blank lines
+    def _reply(self, line, data):
+        text = data.decode('ascii', errors = 'replace').replace('\r', '')
+        lines = [part.rstrip() for part in text.split('\n')]
+        if lines and lines[-1].strip() == '\\':
+            lines.pop()
+        elif lines and lines[-1].endswith('\\'):
+            lines[-1] = lines[-1][:-1]
+        lines = [part for part in lines if part.strip()]
+        if lines and lines[0].strip() == line.strip():
+            lines = lines[1:]
+        return '\n'.join(part.strip() for part in lines)
+
+# ======================== Fake Camera Telnet Server ========================
+# The class 'FakeCameraTelnetServer' runs a small imitation of the camera shell on localhost.
+# Argument 'nodes' is a dictionary of resource nodes and their values (defaults below).
+# Argument 'latency' is the time (in seconds) the shell takes to answer each command.
+# Argument 'round_trip' is the network round trip time (in seconds), paid once for every packet of commands received.
+# Argument 'focus_time' is the time (in seconds) an autofocus keeps the focus node at 'true' (None: it never finishes).
+# The fake resets the focus node to 'false' when an autofocus finishes because that is the completion signal the client
+# assumes (see CameraCommandClient.autofocus); it doesn't show that the real camera behaves this way.
+# Argument 'connect_delay' is the time (in seconds) before the shell prints its first prompt.
+# 'port' holds the port it listens on. 'connections' and 'commands' count what it received.
+
+FAKE_NODES = {
+    '.system.focus.autofull': 'false',
+    '.system.focus.position': '1700',
+    '.image.sysimg.basicImgData.objectParams.emissivity': '0.95',
+}
+
+class FakeCameraTelnetServer:
+
+    def __init__(self, nodes = None, latency = 0.002, round_trip = 0.0, focus_time = 2.0, connect_delay = 0.05, focused_position = 1750):
+        self.nodes = dict(FAKE_NODES if nodes is None else nodes)
+        self.latency = latency
+        self.round_trip = round_trip
+        self.focus_time = focus_time
+        self.connect_delay = connect_delay
+        self.focused_position = focused_position
+        self.focus_until = 0
+        self.connections = 0
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.host, self.port = self.listener.getsockname()
+        self.running = True
+        self.thread = threading.Thread(target = self._serve, daemon = True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.running = False
+        try:
+            # shutdown() wakes the accept() in _serve, close() alone doesn't on Linux
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.listener.close()
+        except OSError:
+            pass
+        self.thread.join(timeout = 1)
+
+    def _serve(self):
+        while self.running:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target = self._session, args = (conn,), daemon = True).start()
+
+    def _session(self, conn):
+        with conn:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            time.sleep(self.connect_delay)
+            # Ask the client to suppress go-ahead, like a real telnet server would
+            conn.sendall(bytes([IAC, WILL, 3]) + b'Welcome to the camera shell\r\n\\>')
+            buffer = b''
+            while self.running:
+                try:
+                    chunk = conn.recv(4096)
+                except OSError:
+                    return
+                if not chunk:
+                    return
+                time.sleep(self.round_trip)
+                buffer += chunk
+                # Drop the client's replies to option negotiation (IAC, command, option)
+                while IAC in buffer:
+                    index = buffer.index(IAC)
+                    if len(buffer) < index + 3:
+                        break
+                    buffer = buffer[:index] + buffer[index + 3:]
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    time.sleep(self.latency)
+                    reply = self._execute(line.decode('ascii').strip())
+                    try:
+                        conn.sendall(reply.encode('ascii') + b'\\>')
+                    except OSError:
+                        return
+
+    # Returns the text the shell prints for 'line'
+    def _execute(self, line):
+        self.commands += 1
+        parts = line.split()
+        if len(parts) == 0:
+            return ''
+        with self.lock:
+            self._update_focus()
+            if parts[0] == 'rls' and len(parts) == 2:
+                node = parts[1]
+                if node in self.nodes:
+                    return f"   {self.nodes[node]}\r\n"
+                children = sorted(name for name in self.nodes if name.startswith(node + '.'))
+                if len(children) == 0:
+                    return f"Error: no such node {node}\r\n"
+                return ''.join(f"   {name[len(node) + 1:]}  {self.nodes[name]}\r\n" for name in children)
+            if parts[0] == 'rset' and len(parts) == 3:
+                node, value = parts[1], parts[2]
+                if node not in self.nodes:
+                    return f"Error: no such node {node}\r\n"
+                self.nodes[node] = value
+                if node == '.system.focus.autofull' and value == 'true':
+                    self.focus_until = float('inf') if self.focus_time is None else time.monotonic() + self.focus_time
+                return ''
+            return f"Error: unknown command {parts[0]}\r\n"
+
+    # Finish a running autofocus once 'focus_time' has passed
+    def _update_focus(self):
+        if self.focus_until and time.monotonic() >= self.focus_until:
+            self.focus_until = 0
+            self.nodes['.system.focus.autofull'] = 'false'
+            self.nodes['.system.focus.position'] = str(self.focused_position)
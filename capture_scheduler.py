@@ -0,0 +1,403 @@
+# ======================== Notes ===========================================
+
+## capture_scheduler.py fires captures on absolute deadlines instead of sleeping a fixed time after each capture.
+## The old loop (capture, then sleep(frequency)) ran every frequency + capture time + SD check seconds, so "every 5 seconds"
+## drifted to 7-8 seconds under load. Here slot k is due at start + k * period on the monotonic clock: the time a capture
+## takes is absorbed by the next wait, and a slot that can't be served in time is reported as late or missed instead of
+## pushing every later slot back. The end of the session is a deadline too, so a session never overruns 'duration'.
+## Besides a fixed period, the deadlines can follow a cron-like expression, a window relative to sunrise/sunset, or a
+## period that is changed while the session runs (adaptive capture).
+## Every clock read and sleep goes through a clock object, so the timing can be checked with 'FakeClock' in no time.
+
+# ======================== Import  Modules ==================================
+
+import asyncio
+import collections
+import datetime
+import math
+import time
+
+# ======================== Clocks ===========================================
+# A clock has monotonic() (seconds, for deadlines), time() (POSIX seconds, for wall-clock schedules),
+# sleep(seconds) and the coroutine asleep(seconds).
+
+class SystemClock:
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def asleep(self, seconds):
+        await asyncio.sleep(max(seconds, 0))
+
+# The class 'FakeClock' only moves when it is told to: sleep() and asleep() advance it instantly, and so does advance().
+# Argument 'wall_time' is the POSIX time the clock starts at (for cron and sunrise/sunset schedules).
+
+class FakeClock:
+
+    def __init__(self, wall_time = 0.0):
+        self.now = 0.0
+        self.wall_offset = wall_time
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall_offset + self.now
+
+    def advance(self, seconds):
+        self.now += max(seconds, 0)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    async def asleep(self, seconds):
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+SYSTEM_CLOCK = SystemClock()
+
+# Convert between the monotonic clock (deadlines) and POSIX time (wall-clock schedules)
+def to_wall(clock, monotonic_time):
+    return monotonic_time + clock.time() - clock.monotonic()
+
+def to_monotonic(clock, wall_time):
+    return wall_time - clock.time() + clock.monotonic()
+
+# ======================== Schedules ========================================
+# A schedule gives the deadlines of the capture slots on the monotonic clock:
+# first(start, clock) is the first deadline at or after 'start', next(previous, clock) the one after 'previous'.
+# Either returns None when there are no more slots.
+
+# The class 'FixedPeriod' fires a slot every 'period' seconds, starting right away
+
+class FixedPeriod:
+
+    def __init__(self, period):
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.period = period
+
+    def first(self, start, clock):
+        return start
+
+    def next(self, previous, clock):
+        return previous + self.period
+
+# The class 'AdaptivePeriod' is a FixedPeriod whose period can be changed while the session runs (see set_period()).
+# Arguments 'min_period' and 'max_period' bound the period.
+
+class AdaptivePeriod(FixedPeriod):
+
+    def __init__(self, period, min_period = None, max_period = None):
+        super().__init__(period)
+        self.min_period = min_period if min_period is not None else period
+        self.max_period = max_period if max_period is not None else period
+        self.set_period(period)
+
+    # Change the period (clamped to [min_period, max_period]). Takes effect from the next slot. Returns the new period.
+    def set_period(self, period):
+        self.period = min(max(period, self.min_period), self.max_period)
+        return self.period
+
+# The class 'CronSchedule' fires at wall-clock times given by a cron expression in local time:
+# "minute hour day month weekday", optionally preceded by a seconds field (6 fields).
+# Each field is '*', a number, a range 'a-b', a step '*/n' or 'a-b/n', or a comma separated list of these.
+# Weekday 0 (or 7) is Sunday. E.g. "*/10 6-20 * * *" fires every 10 minutes from 6:00 to 20:50.
+
+CRON_FIELDS = (('second', 0, 59), ('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+            if step <= 0:
+                raise ValueError(f"Bad cron step: {field}")
+        if part == '*':
+            first, last = low, high
+        elif '-' in part:
+            first, last = (int(x) for x in part.split('-'))
+        else:
+            first = int(part)
+            last = high if step > 1 else first
+        if first < low or last > high or first > last:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(first, last + 1, step))
+    return sorted(values)
+
+class CronSchedule:
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) == 5:
+            fields = ['0'] + fields
+        if len(fields) != 6:
+            raise ValueError(f"Cron expression needs 5 or 6 fields: {expression}")
+        parsed = {name: parse_cron_field(field, low, high) for field, (name, low, high) in zip(fields, CRON_FIELDS)}
+        self.seconds = parsed['second']
+        self.minutes = parsed['minute']
+        self.hours = parsed['hour']
+        self.days = set(parsed['day'])
+        self.months = set(parsed['month'])
+        self.weekdays = {day % 7 for day in parsed['weekday']}
+        # Like cron, a restricted day and weekday match if either matches
+        self.any_day = fields[3] == '*'
+        self.any_weekday = fields[5] == '*'
+
+    def _day_matches(self, date):
+        if date.month not in self.months:
+            return False
+        day = date.day in self.days
+        weekday = (date.isoweekday() % 7) in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    # Returns the first matching local datetime strictly after 'after' (None if there is none within ~4 years)
+    def next_datetime(self, after):
+        after = after.replace(microsecond = 0) + datetime.timedelta(seconds = 1)
+        date = after.date()
+        for i in range(4 * 366 + 1):
+            if self._day_matches(date):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        for second in self.seconds:
+                            candidate = datetime.datetime.combine(date, datetime.time(hour, minute, second))
+                            if candidate >= after:
+                                return candidate
+            date += datetime.timedelta(days = 1)
+        return None
+
+    def _after(self, wall_seconds, clock):
+        candidate = self.next_datetime(datetime.datetime.fromtimestamp(wall_seconds))
+        if candidate is None:
+            return None
+        return to_monotonic(clock, candidate.timestamp())
+
+    def first(self, start, clock):
+        return self._after(math.ceil(to_wall(clock, start)) - 1, clock)
+
+    # Cron times fall on whole seconds, so 'previous' is rounded to absorb the rounding error of the clock conversion
+    def next(self, previous, clock):
+        return self._after(round(to_wall(clock, previous)), clock)
+
+# The function 'sun_times' returns the sunrise and sunset (POSIX seconds) on 'date' at 'latitude' and 'longitude' (degrees, east positive),
+# using the NOAA approximation (about a minute of accuracy). Returns (None, None) during polar day or night.
+
+def sun_times(date, latitude, longitude):
+    day_of_year = date.timetuple().tm_yday
+    gamma = 2 * math.pi / 365 * (day_of_year - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma) - 0.006758 * math.cos(2 * gamma)
+            + 0.000907 * math.sin(2 * gamma) - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    lat = math.radians(latitude)
+    cos_hour_angle = math.cos(math.radians(90.833)) / (math.cos(lat) * math.cos(decl)) - math.tan(lat) * math.tan(decl)
+    if abs(cos_hour_angle) > 1:
+        return None, None
+    hour_angle = math.degrees(math.acos(cos_hour_angle))
+    midnight = datetime.datetime(date.year, date.month, date.day, tzinfo = datetime.timezone.utc).timestamp()
+    sunrise = midnight + 60 * (720 - 4 * (longitude + hour_angle) - eqtime)
+    sunset = midnight + 60 * (720 - 4 * (longitude - hour_angle) - eqtime)
+    return sunrise, sunset
+
+# The class 'SolarSchedule' fires a slot every 'period' seconds between sunrise + 'start_offset' and sunset + 'end_offset'
+# (offsets in seconds, negative for before). Outside the window, the next slot is at the start of the next window.
+# Use start = 'sunset' and end = 'sunrise' to capture at night instead.
+
+class SolarSchedule:
+
+    def __init__(self, latitude, longitude, period, start = 'sunrise', end = 'sunset', start_offset = 0, end_offset = 0):
+        if start not in ('sunrise', 'sunset') or end not in ('sunrise', 'sunset'):
+            raise ValueError("start and end must be 'sunrise' or 'sunset'")
+        self.latitude = latitude
+        self.longitude = longitude
+        self.period = period
+        self.start = start
+        self.end = end
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+
+    # Returns the (start, end) POSIX times of the capture windows around 'wall_time', in order
+    def windows(self, wall_time):
+        date = datetime.datetime.fromtimestamp(wall_time, datetime.timezone.utc).date()
+        windows = []
+        for days in range(-1, 3):
+            day = date + datetime.timedelta(days = days)
+            times = dict(zip(('sunrise', 'sunset'), sun_times(day, self.latitude, self.longitude)))
+            if times['sunrise'] is None:
+                continue
+            start = times[self.start] + self.start_offset
+            end = times[self.end] + self.end_offset
+            if end <= start:
+                following = dict(zip(('sunrise', 'sunset'), sun_times(day + datetime.timedelta(days = 1), self.latitude, self.longitude)))
+                if following['sunrise'] is None:
+                    continue
+                end = following[self.end] + self.end_offset
+            windows.append((start, end))
+        return windows
+
+    # Returns the first slot (POSIX seconds) at or after 'wall_time'
+    def _slot_at_or_after(self, wall_time):
+        for start, end in self.windows(wall_time):
+            if wall_time < start:
+                return start
+            if wall_time < end:
+                return wall_time
+        return None
+
+    def first(self, start, clock):
+        slot = self._slot_at_or_after(to_wall(clock, start))
+        return None if slot is None else to_monotonic(clock, slot)
+
+    def next(self, previous, clock):
+        slot = self._slot_at_or_after(to_wall(clock, previous) + self.period)
+        return None if slot is None else to_monotonic(clock, slot)
+
+# ======================== Capture Scheduler ================================
+# The class 'CaptureScheduler' waits for the deadlines of a schedule and keeps track of how well they were met.
+# Argument 'schedule' is one of the schedules above (or a number, for a FixedPeriod of that many seconds).
+# Argument 'duration' ends the session after that many seconds (None runs until the schedule ends or stop() is called).
+# Argument 'late_tolerance' is the lateness (in seconds) above which a slot is counted as late.
+# Argument 'miss_after' is the lateness (in seconds) above which a slot is skipped and counted as missed, instead of being fired late.
+# Argument 'clock' is the clock to use (SystemClock by default, FakeClock for tests).
+# Each slot is a Slot(index, deadline, fired, lateness, missed) where 'missed' is the number of slots skipped just before it.
+# Usage:
+#     scheduler = CaptureScheduler(5, duration = 60)
+#     for slot in scheduler:            # or: async for slot in scheduler
+#         capture()
+
+Slot = collections.namedtuple('Slot', ['index', 'deadline', 'fired', 'lateness', 'missed'])
+
+class CaptureScheduler:
+
+    def __init__(self, schedule, duration = None, late_tolerance = 0.05, miss_after = 1.0, clock = None):
+        if isinstance(schedule, (int, float)):
+            schedule = FixedPeriod(schedule)
+        self.schedule = schedule
+        self.duration = duration
+        self.late_tolerance = late_tolerance
+        self.miss_after = miss_after
+        self.clock = SYSTEM_CLOCK if clock is None else clock
+
+        self.start_time = None
+        self.end_time = None
+        self.next_deadline = None
+        self.last_deadline = None
+        self.stopped = False
+        self.index = 0
+        self.fired = 0
+        self.missed = 0
+        self.late = 0
+        self.lateness = []
+
+    # Start the session now. Called by the first wait() if it wasn't called before.
+    def start(self):
+        self.start_time = self.clock.monotonic()
+        self.end_time = None if self.duration is None else self.start_time + self.duration
+        self.next_deadline = self.schedule.first(self.start_time, self.clock)
+
+    # End the session: the next wait() returns None
+    def stop(self):
+        self.stopped = True
+
+    # Move the end of the session 'seconds' later (or earlier, if negative)
+    def extend(self, seconds):
+        if self.end_time is None:
+            self.end_time = self.clock.monotonic() + max(seconds, 0)
+        else:
+            self.end_time += seconds
+
+    # Recompute the next deadline from the last slot, e.g. after the period of an AdaptivePeriod was changed
+    def reschedule(self):
+        if self.index > 0 and self.last_deadline is not None:
+            self.next_deadline = self.schedule.next(self.last_deadline, self.clock)
+
+    # Returns the time (in seconds) left in the session, or None if it has no end
+    def remaining(self):
+        if self.end_time is None:
+            return None
+        return max(self.end_time - self.clock.monotonic(), 0)
+
+    # Skip the slots that are already too late to serve and return the deadline of the next slot, or None if the session is over
+    def _due(self):
+        if self.start_time is None:
+            self.start()
+        now = self.clock.monotonic()
+        skipped = 0
+        deadline = self.next_deadline
+        while deadline is not None and now - deadline > self.miss_after:
+            if self.end_time is None or deadline < self.end_time:
+                skipped += 1
+            deadline = self.schedule.next(deadline, self.clock)
+        self.next_deadline = deadline
+        self.missed += skipped
+        if self.stopped or deadline is None or (self.end_time is not None and deadline >= self.end_time):
+            return None, skipped
+        return deadline, skipped
+
+    def _fire(self, deadline, skipped):
+        fired = self.clock.monotonic()
+        lateness = max(fired - deadline, 0)
+        slot = Slot(self.index, deadline, fired, lateness, skipped)
+        self.index += 1
+        self.fired += 1
+        self.lateness.append(lateness)
+        if lateness > self.late_tolerance:
+            self.late += 1
+        self.last_deadline = deadline
+        self.next_deadline = self.schedule.next(deadline, self.clock)
+        return slot
+
+    # Block until the next slot is due and return it, or return None when the session is over
+    def wait(self):
+        deadline, skipped = self._due()
+        if deadline is None:
+            return None
+        self.clock.sleep(deadline - self.clock.monotonic())
+        return self._fire(deadline, skipped)
+
+    # Coroutine version of wait()
+    async def await_slot(self):
+        deadline, skipped = self._due()
+        if deadline is None:
+            return None
+        await self.clock.asleep(deadline - self.clock.monotonic())
+        return self._fire(deadline, skipped)
+
+    def __iter__(self):
+        while True:
+            slot = self.wait()
+            if slot is None:
+                return
+            yield slot
+
+    async def __aiter__(self):
+        while True:
+            slot = await self.await_slot()
+            if slot is None:
+                return
+            yield slot
+
+    # Returns a dictionary describing how well the deadlines were met
+    def stats(self):
+        return {
+            'fired': self.fired,
+            'missed': self.missed,
+            'late': self.late,
+            'mean_lateness': sum(self.lateness) / len(self.lateness) if self.lateness else 0.0,
+            'max_lateness': max(self.lateness) if self.lateness else 0.0,
+        }
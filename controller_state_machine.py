@@ -0,0 +1,501 @@
+# ======================== Notes ===========================================
+
+## controller_state_machine.py runs the camera trap as an explicit state machine on an asyncio event loop:
+##     IDLE -> POWERING -> CONNECTING -> FOCUSING -> CAPTURING -> COOLDOWN -> (IDLE or CONNECTING)
+## With a HybridTrigger (see thermal_trigger.py), COOLDOWN goes to PREVIEW instead of IDLE: the camera stays powered (with
+## its capture session open) and PIR events are confirmed by a warm blob in the preview frames (PREVIEW -> CAPTURING) or
+## rejected, until it is powered off (PREVIEW -> IDLE). A rejected event only counts as motion again after the PIR falls and rises.
+## The state machine, the e-ink display, the storage check and the telemetry log are separate asyncio tasks, so e.g. the
+## display refreshes while the camera boots instead of after it. Blocking hardware calls run in worker threads: every
+## camera call on one thread (the Spinnaker camera is not shared between threads), display refreshes on another, so a slow
+## e-ink refresh never delays a capture. The time spent in each state is measured with the event loop's monotonic clock.
+## The hardware is reached through a small interface (see 'SimulatedHardware' below for the methods it needs), so the
+## whole controller can be run without a camera, relay, PIR or display.
+
+# ======================== Import  Modules ==================================
+
+import asyncio
+import concurrent.futures
+import enum
+import threading
+import time
+
+import numpy as np
+
+from capture_scheduler import CaptureScheduler, FixedPeriod
+from storage_manager import FRAME_BYTES
+
+# ======================== States ===========================================
+
+class State(enum.Enum):
+    IDLE = "idle"              # camera off, waiting for motion
+    POWERING = "powering"      # switching the relay on
+    CONNECTING = "connecting"  # waiting for the camera to boot and show up on the bus
+    FOCUSING = "focusing"      # autofocus over telnet
+    CAPTURING = "capturing"    # grabbing bursts every 'frequency' seconds for 'duration' seconds
+    COOLDOWN = "cooldown"      # releasing the camera; powering it off if the motion has stopped
+    PREVIEW = "preview"        # camera kept warm, confirming PIR events with preview frames
+
+# Messages shown on the e-ink display when a state is entered
+STATE_MESSAGES = {
+    State.IDLE: "No motion\ndetected.\nCamera off.",
+    State.CONNECTING: "Connecting\nto camera.",
+    State.FOCUSING: "Focusing\ncamera.",
+    State.CAPTURING: "Capturing \nimages.",
+    State.PREVIEW: "Camera on.\nWatching.",
+}
+
+# ======================== Controller =======================================
+# The class 'Controller' drives the hardware through the states above.
+# Argument 'hardware' is the object that talks to the relay, camera, storage and display (see SimulatedHardware for the interface).
+# Argument 'duration' is the time (in seconds) images are captured for after each trigger.
+# Argument 'frequency' is the time (in seconds) between bursts. Bursts are due on absolute deadlines (see capture_scheduler.py).
+# Argument 'schedule' is a function that returns the schedule of each capture window (default: FixedPeriod(frequency)),
+# e.g. lambda: SolarSchedule(46.2, 11.2, period = 5) to only capture in daylight.
+# Argument 'clock' is the clock used by the capture scheduler (default: the system clock).
+# Argument 'adaptive' is an optional AdaptiveCapture (see scene_change.py). If given, it replaces 'frequency' and 'schedule':
+# the last frame of every burst (hardware.last_frame()) is scored for scene change, and the period and the end of the
+# capture window follow the scores. The decisions are logged and kept in adaptive.decisions.
+# Argument 'hybrid' is an optional HybridTrigger (see thermal_trigger.py). If given, the camera stays in preview after each
+# capture window and PIR events are confirmed with preview frames (hardware.preview_frame()) instead of booting the camera.
+# Argument 'connect_timeout' is the time (in seconds) after which a camera that has not connected is considered frozen
+# and is power cycled with 'restart_off_time' seconds off.
+# Argument 'burst_bytes' is the space one burst needs on the storage. It is reserved with hardware.storage_directory before
+# every burst; hardware.capture settles the reservation (frames that were not saved give their space back at once).
+# Argument 'telemetry_period' and 'storage_period' are the times (in seconds) between telemetry records and storage checks.
+# Usage:
+#     controller = Controller(hardware)
+#     asyncio.run(controller.run())
+
+class Controller:
+
+    def __init__(self, hardware, duration = 60, frequency = 5, connect_timeout = 60, restart_off_time = 60,
+                 burst_bytes = 3 * FRAME_BYTES, telemetry_period = 60, storage_period = 5, connect_poll = 0.5,
+                 schedule = None, clock = None, adaptive = None, hybrid = None):
+        self.hardware = hardware
+        self.duration = duration
+        self.frequency = frequency
+        self.schedule = schedule if schedule is not None else (lambda: FixedPeriod(self.frequency))
+        self.clock = clock
+        self.adaptive = adaptive
+        self.hybrid = hybrid
+        self.scheduler = None
+        self.connect_timeout = connect_timeout
+        self.restart_off_time = restart_off_time
+        self.burst_bytes = burst_bytes
+        self.telemetry_period = telemetry_period
+        self.storage_period = storage_period
+        self.connect_poll = connect_poll
+
+        self.state = State.IDLE
+        self.state_times = {state: 0.0 for state in State}
+        self.state_counts = {state: 0 for state in State}
+        self.transitions = []
+        self.telemetry_log = []
+        self.captures = 0
+        self.failed_captures = 0
+        self.refused_bursts = 0
+        self.restarts = 0
+        self.display_refreshes = 0
+        self.late_slots = 0
+        self.pir_events = 0
+        self.cold_boots = 0
+        self.missed_slots = 0
+        self.first_frame_times = []
+        self.triggered_at = None
+
+        self.loop = None
+        self.motion = None
+        self.stopping = None
+        self.display_wakeup = None
+        self.display_message = None
+        self.state_entered = None
+        # One thread for every camera call, one for the display
+        self.camera_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "camera")
+        self.display_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "display")
+
+    # Run the controller until stop() is called (or forever)
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.motion = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.display_wakeup = asyncio.Event()
+        self.state_entered = self.loop.time()
+        self.state_counts[self.state] += 1
+        self.show(STATE_MESSAGES[self.state])
+        if self.hardware.is_motion():
+            self.motion.set()
+        self.hardware.set_motion_listener(self.motion_changed)
+
+        tasks = [
+            asyncio.create_task(self._state_machine(), name = "state machine"),
+            asyncio.create_task(self._display_task(), name = "display"),
+            asyncio.create_task(self._storage_task(), name = "storage"),
+            asyncio.create_task(self._telemetry_task(), name = "telemetry"),
+        ]
+        try:
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            self._enter(self.state)
+            self.hardware.set_motion_listener(None)
+            self.camera_executor.shutdown(wait = True)
+            self.display_executor.shutdown(wait = True)
+
+    # Stop the controller. Safe to call from any thread.
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    # Called by the hardware (from any thread, e.g. a gpiozero interrupt) when the motion state changes
+    def motion_changed(self, active):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._motion_changed, active)
+
+    def _motion_changed(self, active):
+        if active:
+            self.pir_events += 1
+            self.motion.set()
+            if self.hybrid is not None and self.state is State.PREVIEW:
+                self.hybrid.pir_event(self.loop.time())
+        else:
+            self.motion.clear()
+
+    # Show 'message' on the display. Only the latest message is drawn if several arrive during one refresh.
+    def show(self, message):
+        self.display_message = message
+        if self.display_wakeup is not None:
+            self.display_wakeup.set()
+
+    # Returns the time (in seconds) spent in each state so far, including the current one
+    def time_in_states(self):
+        times = {state.name: seconds for state, seconds in self.state_times.items()}
+        if self.loop is not None and self.state_entered is not None:
+            times[self.state.name] += self.loop.time() - self.state_entered
+        return times
+
+    # ---------------- State machine ----------------
+
+    async def _state_machine(self):
+        handlers = {
+            State.IDLE: self._idle,
+            State.POWERING: self._powering,
+            State.CONNECTING: self._connecting,
+            State.FOCUSING: self._focusing,
+            State.CAPTURING: self._capturing,
+            State.COOLDOWN: self._cooldown,
+            State.PREVIEW: self._preview,
+        }
+        while True:
+            next_state = await handlers[self.state]()
+            self._enter(next_state)
+
+    # Record the time spent in the current state and switch to 'state'
+    def _enter(self, state):
+        now = self.loop.time()
+        self.state_times[self.state] += now - self.state_entered
+        if state is not self.state:
+            print(f"State: {self.state.name} -> {state.name}")
+            self.transitions.append((self.state, state, now))
+            self.state_counts[state] += 1
+        self.state = state
+        self.state_entered = now
+        if state in STATE_MESSAGES:
+            self.show(STATE_MESSAGES[state])
+
+    async def _camera(self, function, *args):
+        return await self.loop.run_in_executor(self.camera_executor, function, *args)
+
+    async def _idle(self):
+        await asyncio.to_thread(self.hardware.power_off)
+        # Sleep until the PIR sees motion
+        await self.motion.wait()
+        return State.POWERING
+
+    async def _powering(self):
+        self.cold_boots += 1
+        self.triggered_at = self.loop.time()
+        await asyncio.to_thread(self.hardware.power_on)
+        return State.CONNECTING
+
+    async def _connecting(self):
+        start = self.loop.time()
+        while not await self._camera(self.hardware.camera_connected):
+            if self.loop.time() - start > self.connect_timeout:
+                # The camera is likely frozen: turn it off for a while and try again
+                self.restarts += 1
+                self.show("No cam\ndetected.\nRestarting\nsystem.")
+                # Hold the relay off so motion during the restart doesn't switch the camera back on early
+                await asyncio.to_thread(self.hardware.power_off, self.restart_off_time)
+                await asyncio.sleep(self.restart_off_time)
+                return State.POWERING
+            await asyncio.sleep(self.connect_poll)
+        return State.FOCUSING
+
+    async def _focusing(self):
+        await self._camera(self.hardware.focus)
+        return State.CAPTURING
+
+    async def _capturing(self):
+        await self._camera(self.hardware.start_capture)
+        if self.adaptive is not None:
+            self.scheduler = self.adaptive.start_session(self.duration, clock = self.clock)
+        else:
+            self.scheduler = CaptureScheduler(self.schedule(), duration = self.duration, clock = self.clock)
+        try:
+            while True:
+                slot = await self.scheduler.await_slot()
+                if slot is None:
+                    return State.COOLDOWN
+                if slot.missed > 0:
+                    print(f"Missed {slot.missed} capture slot(s)")
+                directory = self.hardware.storage_directory(self.burst_bytes)
+                if directory is None:
+                    # No room for the burst anywhere: don't start it
+                    self.refused_bursts += 1
+                    continue
+                if not await self._camera(self.hardware.camera_connected):
+                    self.hardware.release_storage(directory, self.burst_bytes)
+                    await self._camera(self.hardware.stop_capture)
+                    return State.CONNECTING
+                try:
+                    await self._camera(self.hardware.capture, directory)
+                    self.captures += 1
+                    if self.triggered_at is not None:
+                        # Time from the trigger (motion or a confirmed PIR event) to the first saved burst
+                        self.first_frame_times.append(self.loop.time() - self.triggered_at)
+                        self.triggered_at = None
+                        print(f"Time to first frame: {self.first_frame_times[-1]:.1f} s")
+                    if self.adaptive is not None:
+                        frame = self.hardware.last_frame()
+                        if frame is not None:
+                            self.adaptive.update(frame)
+                except Exception as e:
+                    # hardware.capture has already released the space of the frames it didn't save
+                    self.failed_captures += 1
+                    print(f"Capture failed: {e}")
+        finally:
+            stats = self.scheduler.stats()
+            self.late_slots += stats['late']
+            self.missed_slots += stats['missed']
+
+    async def _cooldown(self):
+        if self.hybrid is not None and not self.motion.is_set():
+            # The preview keeps using the camera: only finish the files of this capture window
+            await self._camera(self.hardware.end_window)
+            return State.PREVIEW
+        # Release the camera before the relay powers it off
+        await self._camera(self.hardware.stop_capture)
+        if self.motion.is_set():
+            return State.CONNECTING
+        return State.IDLE
+
+    async def _preview(self):
+        self.hybrid.reset()
+        warm_until = self.loop.time() + self.hybrid.warm_time
+        next_frame = self.loop.time()
+        while self.loop.time() < warm_until:
+            try:
+                frame = await self._camera(self.hardware.preview_frame)
+            except Exception as e:
+                print(f"Preview failed: {e}")
+                break
+            pir_time = self.hybrid.pending_since
+            decision = self.hybrid.update(frame, self.loop.time())
+            if decision == 'confirmed':
+                self.triggered_at = pir_time
+                print(f"PIR event confirmed by a warm blob ({self.hybrid.last_blobs[0]['area']} px)")
+                return State.CAPTURING
+            if decision == 'rejected':
+                print("PIR event rejected: no warm blob in the preview")
+                # The PIR may stay high for a while: only a new rising edge counts as motion again, so IDLE doesn't boot the camera for it
+                self.motion.clear()
+            next_frame += self.hybrid.preview_period
+            await asyncio.sleep(max(next_frame - self.loop.time(), 0))
+        await self._camera(self.hardware.stop_capture)
+        return State.IDLE
+
+    # ---------------- Concurrent tasks ----------------
+
+    async def _display_task(self):
+        shown = None
+        while True:
+            await self.display_wakeup.wait()
+            self.display_wakeup.clear()
+            message = self.display_message
+            if message is None or message == shown:
+                continue
+            try:
+                await self.loop.run_in_executor(self.display_executor, self.hardware.display, message)
+                shown = message
+                self.display_refreshes += 1
+            except Exception as e:
+                print(f"Display error: {e}")
+
+    async def _storage_task(self):
+        while True:
+            warning = await asyncio.to_thread(self.hardware.storage_warning)
+            if warning is not None:
+                self.show(warning)
+            await asyncio.sleep(self.storage_period)
+
+    async def _telemetry_task(self):
+        while True:
+            await asyncio.sleep(self.telemetry_period)
+            record = {
+                'time': time.time(),
+                'state': self.state.name,
+                'captures': self.captures,
+                'failed_captures': self.failed_captures,
+                'refused_bursts': self.refused_bursts,
+                'restarts': self.restarts,
+                'pir_events': self.pir_events,
+                'cold_boots': self.cold_boots,
+                'late_slots': self.late_slots,
+                'missed_slots': self.missed_slots,
+                'time_to_first_frame': self.first_frame_times[-1] if len(self.first_frame_times) > 0 else None,
+                'capture_period': self.adaptive.schedule.period if self.adaptive is not None else self.frequency,
+                'confirmed_events': self.hybrid.confirmed if self.hybrid is not None else None,
+                'rejected_events': self.hybrid.rejected if self.hybrid is not None else None,
+                'time_in_states': self.time_in_states(),
+            }
+            record.update(self.hardware.telemetry())
+            self.telemetry_log.append(record)
+            print(f"[{record['state']}] captures: {self.captures}  failed: {self.failed_captures}  refused: {self.refused_bursts}")
+
+# ======================== Simulated hardware ===============================
+# The class 'SimulatedHardware' implements the hardware interface used by 'Controller' with blocking sleeps in place of
+# the relay, camera, telnet focus, storage and e-ink display. The timings are in seconds.
+# Call set_motion(True/False) (from any thread) to simulate the PIR.
+# Argument 'frames' is an optional sequence of frames returned by last_frame(), one per capture.
+# Argument 'scene' is an optional function returning the frame the camera sees at a time (in seconds since the hardware was created),
+# used for preview frames.
+
+class SimulatedHardware:
+
+    def __init__(self, boot_time = 20, focus_time = 5, capture_time = 0.2, display_time = 2, frozen_boots = 0, free_bursts = None, frames = None, scene = None):
+        self.boot_time = boot_time
+        self.focus_time = focus_time
+        self.capture_time = capture_time
+        self.display_time = display_time
+        self.frozen_boots = frozen_boots
+        self.free_bursts = free_bursts
+        self.frames = frames
+        self.scene = scene
+        self.created = time.monotonic()
+        self.preview_frames = 0
+        self.session_open = False
+        self.sessions = 0
+        self.lock = threading.Lock()
+        self.motion = False
+        self.listener = None
+        self.powered = False
+        self.power_on_time = None
+        self.hold_until = None
+        self.boots = 0
+        self.captured = []
+        self.displayed = []
+        self.power_cycles = 0
+
+    def set_motion(self, active):
+        self.motion = active
+        if active:
+            # Like MotionTrigger, motion switches the relay on from the interrupt unless it is held off
+            with self.lock:
+                held = self.hold_until is not None and time.monotonic() < self.hold_until
+            if not held:
+                self._switch_on()
+        listener = self.listener
+        if listener is not None:
+            listener(active)
+
+    # ---- Interface used by Controller ----
+
+    def is_motion(self):
+        return self.motion
+
+    def set_motion_listener(self, function):
+        self.listener = function
+
+    def power_on(self):
+        with self.lock:
+            self.hold_until = None
+        self._switch_on()
+
+    def _switch_on(self):
+        with self.lock:
+            if not self.powered:
+                self.powered = True
+                self.power_on_time = time.monotonic()
+                self.boots += 1
+                self.power_cycles += 1
+
+    # Argument 'hold' is the time (in seconds) motion can't switch the relay back on (see MotionTrigger.power_off)
+    def power_off(self, hold = None):
+        with self.lock:
+            self.powered = False
+            self.hold_until = None if hold is None else time.monotonic() + hold
+
+    def camera_connected(self):
+        with self.lock:
+            if not self.powered or self.boots <= self.frozen_boots:
+                return False
+            return time.monotonic() - self.power_on_time >= self.boot_time
+
+    def focus(self):
+        time.sleep(self.focus_time)
+
+    def start_capture(self):
+        if not self.session_open:
+            self.session_open = True
+            self.sessions += 1
+
+    def capture(self, directory):
+        time.sleep(self.capture_time)
+        self.captured.append((time.monotonic(), directory))
+        return [directory]
+
+    # Returns the next frame of 'frames' (one per capture), or None
+    def last_frame(self):
+        if self.frames is None or len(self.captured) == 0:
+            return None
+        return self.frames[min(len(self.captured), len(self.frames)) - 1]
+
+    def end_window(self):
+        pass
+
+    def stop_capture(self):
+        self.session_open = False
+
+    def preview_frame(self):
+        self.start_capture()
+        time.sleep(0.01)
+        self.preview_frames += 1
+        if self.scene is None:
+            return np.full((240, 320), 20000, dtype = np.uint16)
+        return self.scene(time.monotonic() - self.created)
+
+    def storage_directory(self, nbytes):
+        if self.free_bursts is not None:
+            if self.free_bursts <= 0:
+                return None
+            self.free_bursts -= 1
+        return "/simulated/"
+
+    def release_storage(self, directory, nbytes):
+        if self.free_bursts is not None:
+            self.free_bursts += 1
+
+    def storage_warning(self):
+        if self.free_bursts is not None and self.free_bursts <= 0:
+            return "WARNING.\nStorage\nfull."
+        return None
+
+    def display(self, message):
+        time.sleep(self.display_time)
+        self.displayed.append((time.monotonic(), message))
+
+    def telemetry(self):
+        return {'powered': self.powered}
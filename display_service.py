@@ -0,0 +1,238 @@
+# ======================== Notes ===========================================
+
+## display_service.py draws status messages on the waveshare 2.7 inch e-ink display HAT without holding up the caller.
+## The panel is initialized and cleared once. The background bitmap is decoded once and the fonts are opened once per size,
+## and the messages the trap shows over and over (e.g. the state messages of the controller) are rendered in advance.
+## After the first full refresh, a new message only refreshes the rows and columns that changed (partial refresh), with a
+## full refresh every 'full_refresh_every' updates to clear the ghosting partial refreshes leave behind.
+## post() hands the message to a worker thread and returns at once. If several messages arrive while the panel is
+## refreshing, only the latest is drawn.
+## Drivers without display_Partial fall back to display_Fast. fake_epd.py is a stand-in for the driver without a display.
+
+# ======================== Import  Modules ==================================
+
+import threading
+import time
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+# ======================== Display Service ==================================
+# The class 'DisplayService' owns the e-ink display.
+# Argument 'epd' is the display driver object (e.g. epd2in7_V2.EPD() or fake_epd.EPD()).
+# Argument 'background_path' is the bitmap drawn behind the text (e.g. the cartoon deer). None draws on white.
+# Argument 'font_path' is the font of the messages (see "fc-list" for the fonts installed on the pi). The default PIL
+# font is used if it can't be opened.
+# Argument 'text_position' is the (x, y) position of the text.
+# Argument 'messages' is a list of (message, font size) pairs to render in advance.
+# Argument 'full_refresh_every' is the number of partial refreshes between full refreshes.
+# Usage:
+#     display = DisplayService(epd2in7_V2.EPD(), background_path = "deer.bmp")
+#     display.start()
+#     display.post("Capturing \nimages.")   # returns at once
+#     display.show("Camera off.")           # waits for the refresh
+#     display.close()
+
+class DisplayService:
+
+    def __init__(self, epd, background_path = None, font_path = None, text_position = (20, 60), messages = (),
+                 full_refresh_every = 20):
+        self.epd = epd
+        self.background_path = background_path
+        self.font_path = font_path
+        self.text_position = text_position
+        self.messages = list(messages)
+        self.full_refresh_every = full_refresh_every
+        self.background = None
+        self.fonts = {}
+        self.rendered = {}
+        self.shown = None
+        self.shown_key = None
+        self.partial_since_full = 0
+        self.lock = threading.Lock() # one refresh at a time
+        self.initialized = False
+
+        self.pending = None
+        self.wakeup = threading.Condition()
+        self.running = False
+        self.busy = False
+        self.thread = None
+
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Start the worker thread. The panel is initialized and the messages are rendered on the worker thread.
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self._worker, name = "display", daemon = True)
+        self.thread.start()
+
+    # Draw 'message' in the background. Returns at once; a message still waiting to be drawn is replaced.
+    def post(self, message, font_size = 18):
+        self.start()
+        with self.wakeup:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (message, font_size)
+            self.wakeup.notify()
+
+    # Draw 'message' now and return when the panel has been refreshed
+    def show(self, message, font_size = 18):
+        with self.lock:
+            self._setup()
+            self._refresh(self.render(message, font_size), (message, font_size))
+
+    # Clear the panel to white
+    def clear(self):
+        with self.lock:
+            self._setup()
+            self.epd.Clear()
+            self.shown = None
+            self.shown_key = None
+            self.full_refreshes += 1
+
+    # Wait until every posted message has been drawn (at most 'timeout' seconds). Returns True if it was.
+    def flush(self, timeout = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.wakeup:
+            while self.pending is not None or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.wakeup.wait(remaining)
+        return True
+
+    # Stop the worker after drawing the last posted message and put the panel to sleep
+    def close(self):
+        if self.thread is not None:
+            with self.wakeup:
+                self.running = False
+                self.wakeup.notify_all()
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            if self.initialized:
+                self.epd.sleep()
+                self.initialized = False
+
+    def stats(self):
+        return {
+            'full_refreshes': self.full_refreshes,
+            'partial_refreshes': self.partial_refreshes,
+            'skipped': self.skipped,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+        }
+
+    # ---------------- Rendering ----------------
+
+    # Returns the image of 'message' in 'font_size' (rendered once, then reused)
+    def render(self, message, font_size = 18):
+        key = (message, font_size)
+        image = self.rendered.get(key)
+        if image is None:
+            if self.background is not None:
+                image = self.background.copy()
+            else:
+                image = Image.new('1', (self.epd.width, self.epd.height), 255)
+            draw = ImageDraw.Draw(image)
+            draw.text(self.text_position, message, font = self._font(font_size), fill = 0)
+            self.rendered[key] = image
+        return image
+
+    def _font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            try:
+                font = ImageFont.truetype(self.font_path, size)
+            except (OSError, AttributeError, TypeError):
+                font = ImageFont.load_default(size)
+            self.fonts[size] = font
+        return font
+
+    # Initialize and clear the panel, decode the background and render the messages (once)
+    def _setup(self):
+        if self.initialized:
+            return
+        self.epd.init()
+        self.epd.Clear()
+        self.initialized = True
+        self.full_refreshes += 1
+        if self.background_path is not None and self.background is None:
+            canvas = Image.new('1', (self.epd.width, self.epd.height), 255)
+            try:
+                with Image.open(self.background_path) as bitmap:
+                    canvas.paste(bitmap.convert('1'), (0, 0))
+                self.background = canvas
+            except OSError as e:
+                print(f"Display background not loaded: {e}")
+        for message, font_size in self.messages:
+            self.render(message, font_size)
+
+    # ---------------- Refreshing ----------------
+
+    def _refresh(self, image, key):
+        if key == self.shown_key:
+            self.skipped += 1
+            return
+        partial = hasattr(self.epd, 'display_Partial')
+        if self.shown is None or not partial or self.partial_since_full >= self.full_refresh_every:
+            if partial:
+                # display_Base is a full refresh that also sets the base image of the partial refreshes
+                self.epd.display_Base(self.epd.getbuffer(image))
+            else:
+                self.epd.display_Fast(self.epd.getbuffer(image))
+            self.partial_since_full = 0
+            self.full_refreshes += 1
+        else:
+            box = ImageChops.difference(image.convert('L'), self.shown.convert('L')).getbbox()
+            if box is None:
+                self.skipped += 1
+                self.shown_key = key
+                return
+            # The panel is written in whole bytes, so the region starts and ends on a multiple of 8 columns.
+            # display_Partial takes the buffer of the whole frame (as from getbuffer) and only sends the bytes of the region.
+            left = box[0] // 8 * 8
+            right = min(-(-box[2] // 8) * 8, self.epd.width)
+            self.epd.display_Partial(self.epd.getbuffer(image), left, box[1], right, box[3])
+            self.partial_since_full += 1
+            self.partial_refreshes += 1
+        self.shown = image
+        self.shown_key = key
+
+    def _worker(self):
+        try:
+            with self.lock:
+                self._setup()
+        except Exception as e:
+            self.errors += 1
+            print(f"Display error: {e}")
+        while True:
+            with self.wakeup:
+                while self.pending is None and self.running:
+                    self.wakeup.wait()
+                if self.pending is None:
+                    return
+                message, font_size = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                self.show(message, font_size)
+            except Exception as e:
+                self.errors += 1
+                print(f"Display error: {e}")
+            finally:
+                with self.wakeup:
+                    self.busy = False
+                    self.wakeup.notify_all()
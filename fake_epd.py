@@ -0,0 +1,102 @@
+# ======================== Notes ===========================================
+
+## fake_epd.py is a stand-in for the waveshare epd2in7_V2 driver (2.7 inch e-paper HAT) that runs without the display attached.
+## It implements the part of the driver used by this project (EPD with init, Clear, display, display_Fast, display_Base,
+## display_Partial, getbuffer and sleep), keeps the image that would be on the panel, and simulates the time each refresh
+## takes, so display code can be tested and benchmarked away from the raspberry pi.
+## The delays below are rough numbers for the 2.7 inch V2 panel and can be changed before running a benchmark.
+## Usage: import fake_epd as epd2in7_V2, or pass fake_epd.EPD() to DisplayService(epd = ...).
+
+# ======================== Import  Modules ==================================
+
+import time
+
+from PIL import Image
+
+# ======================== Simulated panel timings (seconds) ================
+
+INIT_DELAY = 0.1          # epd.init() (reset and load the waveform)
+CLEAR_DELAY = 2.0         # epd.Clear() (full refresh to white)
+FULL_DELAY = 2.0          # epd.display() and epd.display_Base() (full refresh)
+FAST_DELAY = 1.5          # epd.display_Fast() (fast full refresh)
+PARTIAL_DELAY = 0.4       # epd.display_Partial() (partial refresh of a region)
+SLEEP_DELAY = 0.01        # epd.sleep()
+
+# Panel size in portrait orientation
+EPD_WIDTH = 176
+EPD_HEIGHT = 264
+
+# ======================== EPD ==============================================
+# The class 'EPD' mimics epd2in7_V2.EPD. The image on the panel is kept in 'panel' (a PIL image in mode '1').
+# 'calls' counts the calls of each method.
+
+class EPD:
+
+    def __init__(self):
+        self.width = EPD_WIDTH
+        self.height = EPD_HEIGHT
+        self.panel = Image.new('1', (self.width, self.height), 255)
+        self.initialized = False
+        self.calls = {}
+
+    def _call(self, name, delay):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        time.sleep(delay)
+
+    def init(self):
+        self._call('init', INIT_DELAY)
+        self.initialized = True
+        return 0
+
+    def init_Fast(self):
+        return self.init()
+
+    def Clear(self):
+        self._require_init()
+        self._call('Clear', CLEAR_DELAY)
+        self.panel = Image.new('1', (self.width, self.height), 255)
+
+    def getbuffer(self, image):
+        if image.size != (self.width, self.height):
+            raise ValueError(f"Wrong image dimensions: must be {self.width}x{self.height}")
+        return bytearray(image.convert('1').tobytes('raw'))
+
+    def display(self, buffer):
+        self._show(buffer, 'display', FULL_DELAY)
+
+    def display_Fast(self, buffer):
+        self._show(buffer, 'display_Fast', FAST_DELAY)
+
+    # Full refresh that also sets the base image for partial refreshes
+    def display_Base(self, buffer):
+        self._show(buffer, 'display_Base', FULL_DELAY)
+
+    # Refresh the region Xstart <= x < Xend, Ystart <= y < Yend from 'buffer'. As in the real driver, 'buffer' holds the
+    # whole frame (as returned by getbuffer, one bit per pixel, rows padded to whole bytes), the driver sends the bytes
+    # of the region only (byte i + j * row_bytes for the rows and byte columns of the region), and the region is widened
+    # to whole bytes.
+    def display_Partial(self, buffer, Xstart, Ystart, Xend, Yend):
+        self._require_init()
+        row_bytes = -(-self.width // 8)
+        if len(buffer) != row_bytes * self.height:
+            raise ValueError(f"Wrong buffer size: {len(buffer)} bytes, the driver expects the whole frame ({row_bytes * self.height} bytes)")
+        if not (0 <= Xstart < Xend <= self.width and 0 <= Ystart < Yend <= self.height):
+            raise ValueError(f"Region ({Xstart}, {Ystart}) - ({Xend}, {Yend}) is outside of the panel")
+        self._call('display_Partial', PARTIAL_DELAY)
+        frame = Image.frombytes('1', (self.width, self.height), bytes(buffer))
+        left = Xstart // 8 * 8
+        right = min(-(-Xend // 8) * 8, self.width)
+        self.panel.paste(frame.crop((left, Ystart, right, Yend)), (left, Ystart))
+
+    def sleep(self):
+        self._call('sleep', SLEEP_DELAY)
+        self.initialized = False
+
+    def _show(self, buffer, name, delay):
+        self._require_init()
+        self._call(name, delay)
+        self.panel = Image.frombytes('1', (self.width, self.height), bytes(buffer))
+
+    def _require_init(self):
+        if not self.initialized:
+            raise RuntimeError("EPD is not initialized (call init() first)")
@@ -0,0 +1,287 @@
+# ======================== Notes ===========================================
+
+## fake_pyspin.py is a stand-in for the FLIR Spinnaker SDK (PySpin) that runs on any Linux box without a camera attached.
+## It implements the small part of the PySpin API used by this project (System, CameraList, Camera, ImagePtr) and
+## simulates the time the real SDK spends on each call, so capture latency can be benchmarked away from the raspberry pi.
+## The delays below are assumed values (not measured on the raspberry pi or the A325sc) and can be changed before running a benchmark.
+## Usage: import fake_pyspin as PySpin, or pass the module to CameraSession(pyspin = fake_pyspin).
+
+# ======================== Import  Modules ==================================
+
+import time
+
+# ======================== Simulated SDK timings (seconds) ==================
+
+SYSTEM_DELAY = 0.05       # PySpin.System.GetInstance()
+ENUMERATE_DELAY = 0.2     # system.GetCameras() (GigE device discovery)
+INIT_DELAY = 0.8          # cam.Init()
+BEGIN_DELAY = 0.1         # cam.BeginAcquisition()
+END_DELAY = 0.05          # cam.EndAcquisition()
+DEINIT_DELAY = 0.1        # cam.DeInit()
+FRAME_PERIOD = 1.0 / 60   # native frame rate of the A325sc
+
+# Simulated sensor size and the number of cameras that are "plugged in"
+WIDTH = 320
+HEIGHT = 240
+connected_cameras = 1
+
+# ======================== Exceptions and constants =========================
+
+class SpinnakerException(Exception):
+    pass
+
+AcquisitionMode_Continuous = 0
+AcquisitionMode_SingleFrame = 1
+AcquisitionMode_MultiFrame = 2
+
+StreamBufferHandlingMode_OldestFirst = 0
+StreamBufferHandlingMode_OldestFirstOverwrite = 1
+StreamBufferHandlingMode_NewestOnly = 2
+StreamBufferHandlingMode_NewestFirst = 3
+
+# ======================== Device events ====================================
+# Subclass these and register them with system.RegisterEventHandler() to be notified when cameras are plugged in or removed
+
+class DeviceArrivalEventHandler:
+    def OnDeviceArrival(self, serial_number):
+        pass
+
+class DeviceRemovalEventHandler:
+    def OnDeviceRemoval(self, serial_number):
+        pass
+
+# ======================== Images ===========================================
+# The class 'ImagePtr' mimics the image object returned by cam.GetNextImage()
+
+class ImagePtr:
+    def __init__(self, frame_id, timestamp_ns, width = WIDTH, height = HEIGHT):
+        self.frame_id = frame_id
+        self.timestamp_ns = timestamp_ns
+        self.width = width
+        self.height = height
+        self.released = False
+
+    def IsIncomplete(self):
+        return False
+
+    def GetFrameID(self):
+        return self.frame_id
+
+    def GetTimeStamp(self):
+        return self.timestamp_ns
+
+    def GetWidth(self):
+        return self.width
+
+    def GetHeight(self):
+        return self.height
+
+    def GetNDArray(self):
+        import numpy as np
+        # Raw counts slowly ramp with the frame id so consecutive frames differ
+        return np.full((self.height, self.width), 20000 + self.frame_id % 1000, dtype = np.uint16)
+
+    def GetData(self):
+        return self.GetNDArray().ravel()
+
+    def Save(self, filename):
+        if self.released:
+            raise SpinnakerException("Image has already been released")
+        with open(filename, 'wb') as f:
+            f.write(b'\0' * (self.width * self.height * 2))
+
+    def Release(self):
+        self.released = True
+
+# ======================== Node maps ========================================
+# The classes below mimic the QuickSpin nodes used by this project (cam.TLDevice, cam.TLStream and cam.AcquisitionMode)
+
+class StringNode:
+    def __init__(self, value):
+        self.value = value
+
+    def GetValue(self):
+        return self.value
+
+class EnumNode:
+    def __init__(self, value):
+        self.value = value
+
+    def GetValue(self):
+        return self.value
+
+    def SetValue(self, value):
+        self.value = value
+
+class TLDeviceNodeMap:
+    def __init__(self, serial):
+        self.DeviceSerialNumber = StringNode(serial)
+
+class TLStreamNodeMap:
+    def __init__(self):
+        self.StreamBufferHandlingMode = EnumNode(StreamBufferHandlingMode_OldestFirst)
+
+# ======================== Cameras ==========================================
+# The class 'Camera' mimics a PySpin CameraPtr
+
+class Camera:
+    def __init__(self, serial = "10000001"):
+        self.serial = serial
+        self.TLDevice = TLDeviceNodeMap(serial)
+        self.TLStream = TLStreamNodeMap()
+        self.AcquisitionMode = EnumNode(AcquisitionMode_Continuous)
+        self.initialized = False
+        self.streaming = False
+        self.frame_id = 0
+        self.last_frame_time = 0.0
+
+    def Init(self):
+        if connected_cameras == 0:
+            raise SpinnakerException("Camera is not connected")
+        time.sleep(INIT_DELAY)
+        self.initialized = True
+
+    def IsInitialized(self):
+        return self.initialized
+
+    def DeInit(self):
+        time.sleep(DEINIT_DELAY)
+        self.initialized = False
+
+    def IsValid(self):
+        return connected_cameras > 0
+
+    def BeginAcquisition(self):
+        if not self.initialized:
+            raise SpinnakerException("Camera is not initialized")
+        time.sleep(BEGIN_DELAY)
+        self.streaming = True
+        self.last_frame_time = time.monotonic()
+
+    def IsStreaming(self):
+        return self.streaming
+
+    def EndAcquisition(self):
+        time.sleep(END_DELAY)
+        self.streaming = False
+
+    def GetNextImage(self, timeout = 1000):
+        if not self.streaming:
+            raise SpinnakerException("Camera is not streaming")
+        if connected_cameras == 0:
+            raise SpinnakerException("Failed waiting for EventData on NEW_BUFFER_DATA event")
+        # Frames arrive at the native frame rate, so only wait for whatever is left of the frame period
+        wait = self.last_frame_time + FRAME_PERIOD - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_frame_time = time.monotonic()
+        self.frame_id += 1
+        return ImagePtr(self.frame_id, time.monotonic_ns())
+
+    def GetUniqueID(self):
+        return self.serial
+
+# ======================== Camera list ======================================
+# The class 'CameraList' mimics the list returned by system.GetCameras()
+
+class CameraList:
+    def __init__(self, cameras):
+        self.cameras = list(cameras)
+
+    def GetSize(self):
+        return len(self.cameras)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __getitem__(self, index):
+        return self.cameras[index]
+
+    def GetByIndex(self, index):
+        return self.cameras[index]
+
+    def Clear(self):
+        self.cameras = []
+
+# ======================== System ===========================================
+# The class 'System' mimics the PySpin.System singleton
+
+class System:
+    _instance = None
+    _cameras = {}
+    _handlers = []
+
+    @classmethod
+    def GetInstance(cls):
+        time.sleep(SYSTEM_DELAY)
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def GetCameras(self):
+        time.sleep(ENUMERATE_DELAY)
+        cameras = []
+        for i in range(connected_cameras):
+            serial = str(10000001 + i)
+            if serial not in System._cameras:
+                System._cameras[serial] = Camera(serial)
+            cameras.append(System._cameras[serial])
+        return CameraList(cameras)
+
+    def RegisterEventHandler(self, handler):
+        System._handlers.append(handler)
+
+    def UnregisterEventHandler(self, handler):
+        System._handlers.remove(handler)
+
+    def ReleaseInstance(self):
+        System._instance = None
+
+    def IsInUse(self):
+        return System._instance is not None
+
+# ======================== Helpers ==========================================
+# The function 'reset' restores the default simulated state between benchmarks
+
+def reset():
+    global connected_cameras
+    connected_cameras = 1
+    System._instance = None
+    System._cameras = {}
+    System._handlers = []
+
+# The functions 'plug_camera' and 'unplug_camera' change the simulated device list and fire the registered device events
+
+def plug_camera():
+    global connected_cameras
+    connected_cameras += 1
+    serial = int(10000000 + connected_cameras)
+    for handler in list(System._handlers):
+        if isinstance(handler, DeviceArrivalEventHandler):
+            handler.OnDeviceArrival(serial)
+
+def unplug_camera():
+    global connected_cameras
+    if connected_cameras == 0:
+        return
+    serial = int(10000000 + connected_cameras)
+    connected_cameras -= 1
+    for handler in list(System._handlers):
+        if isinstance(handler, DeviceRemovalEventHandler):
+            handler.OnDeviceRemoval(serial)
+
+# The function 'no_delays' zeroes every simulated SDK delay (useful for functional checks)
+
+def no_delays():
+    global SYSTEM_DELAY, ENUMERATE_DELAY, INIT_DELAY, BEGIN_DELAY, END_DELAY, DEINIT_DELAY, FRAME_PERIOD
+    SYSTEM_DELAY = ENUMERATE_DELAY = INIT_DELAY = BEGIN_DELAY = END_DELAY = DEINIT_DELAY = FRAME_PERIOD = 0.0
+
+if __name__ == '__main__':
+    cam = System.GetInstance().GetCameras()[0]
+    cam.Init()
+    cam.BeginAcquisition()
+    image = cam.GetNextImage()
+    print("Fake frame", image.GetFrameID(), image.GetWidth(), "x", image.GetHeight())
+    image.Release()
+    cam.EndAcquisition()
+    cam.DeInit()
@@ -0,0 +1,148 @@
+# ======================== Notes ===========================================
+
+## focus_cache.py skips the full autofocus on most boots of a fixed-mount trap.
+## After a successful autofocus, the position of the focus motor is read over telnet and saved to a small json file,
+## together with the sharpness of a frame taken at that position. On the next boot the motor is moved straight
+## to the saved position, which takes one telnet command instead of a 5+ second autofocus, so the first burst is saved
+## right away. The sharpness of the last frame of that burst is then compared with the saved one: if it has dropped below
+## 'threshold' times the saved sharpness (the camera was moved, or the scene changed), a full autofocus is run and the cache is updated.
+## Reading and writing the focus motor position (.system.focus.position, see CameraCommandClient.focus_position) is an
+## assumption that has not been confirmed on a real A325sc, like the autofocus completion signal.
+## Sharpness is the energy of the Laplacian of the frame divided by the variance of the frame, so it doesn't depend on
+## the overall contrast of the scene. Frames with too little contrast to judge (e.g. a uniform night scene) are not checked.
+
+# ======================== Import  Modules ==================================
+
+import json
+import os
+import time
+
+import numpy as np
+
+from camera_telnet import AutofocusTimeout
+
+# ======================== Sharpness ========================================
+# The function 'sharpness' returns the normalized Laplacian energy of a frame (higher is sharper).
+# Argument 'min_contrast' is the smallest standard deviation (in raw counts) the frame must have to be judged.
+# Returns None if the frame has less contrast than that.
+
+def sharpness(frame, min_contrast = 25.0):
+    pixels = np.asarray(frame, dtype = np.float32)
+    variance = float(pixels.var())
+    if variance < min_contrast ** 2:
+        return None
+    laplacian = (4 * pixels[1:-1, 1:-1] - pixels[:-2, 1:-1] - pixels[2:, 1:-1] - pixels[1:-1, :-2] - pixels[1:-1, 2:])
+    return float(np.mean(laplacian * laplacian)) / variance
+
+# ======================== Focus Cache ======================================
+# The class 'FocusCache' decides between restoring the saved focus position and running a full autofocus.
+# Argument 'path' is the json file the focus position is saved to.
+# Argument 'threshold' is the fraction of the saved sharpness below which the checked frame triggers a full autofocus.
+# Argument 'max_age' is the time (in seconds) after which a saved position is not trusted anymore (None: always trusted).
+# Argument 'min_contrast' is passed to 'sharpness'.
+# Argument 'log' is called with a message for every decision (default: print, None for no messages).
+# The 'camera' arguments are CameraCommandClient objects (see camera_telnet.py).
+# Usage (on every boot):
+#     cache.focus(camera)                    # before the first capture
+#     if cache.needs_check():
+#         cache.check(frame, camera)         # with the last frame of the first burst after focus()
+
+class FocusCache:
+
+    def __init__(self, path, threshold = 0.5, max_age = None, min_contrast = 25.0, log = print):
+        self.path = path
+        self.threshold = threshold
+        self.max_age = max_age
+        self.min_contrast = min_contrast
+        self.log = log
+        self.position = None
+        self.reference = None
+        self.focused_at = None
+        self.check_pending = False
+        self.reference_pending = False
+        self.autofocuses = 0
+        self.restores = 0
+        self.refocuses = 0
+        self.load()
+
+    # Read the saved focus position, if there is one
+    def load(self):
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.position = saved.get('position')
+        self.reference = saved.get('sharpness')
+        self.focused_at = saved.get('focused_at')
+
+    # Write the focus position (to a temporary file first, so a power cut can't leave half a file)
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({'position': self.position, 'sharpness': self.reference, 'focused_at': self.focused_at}, file)
+        os.replace(temporary, self.path)
+
+    # Returns True if the saved position can be restored
+    def valid(self):
+        if self.position is None:
+            return False
+        return self.max_age is None or self.focused_at is None or time.time() - self.focused_at < self.max_age
+
+    # Focus the camera after a boot. Returns 'restored', 'autofocus' or 'failed' (the autofocus didn't finish).
+    def focus(self, camera, timeout = 10):
+        self.check_pending = False
+        if self.valid():
+            camera.set_focus_position(self.position)
+            self.restores += 1
+            self.check_pending = True
+            # A position saved without a sharpness (e.g. focused at night) gets one from this boot's first checked frame
+            self.reference_pending = self.reference is None
+            self._log(f"Focus restored to position {self.position}")
+            return 'restored'
+        return self._autofocus(camera, timeout)
+
+    # Returns True if the next frame should be passed to check()
+    def needs_check(self):
+        return self.check_pending or self.reference_pending
+
+    # Judge a frame taken after focus() (the controller passes the last frame of the first burst). Returns 'reference' (its sharpness was saved), 'kept', 'refocused',
+    # or None if the frame has too little contrast to judge (the next frame is checked instead).
+    def check(self, frame, camera, timeout = 10):
+        score = sharpness(frame, self.min_contrast)
+        if score is None:
+            return None
+        if self.check_pending and self.reference is not None:
+            self.check_pending = False
+            if score < self.threshold * self.reference:
+                self._log(f"Sharpness {score:.3f} is below {self.threshold:g} x {self.reference:.3f}: running a full autofocus")
+                self.refocuses += 1
+                self._autofocus(camera, timeout)
+                return 'refocused'
+            return 'kept'
+        self.check_pending = False
+        self.reference_pending = False
+        self.reference = score
+        self.save()
+        return 'reference'
+
+    def _log(self, message):
+        if self.log is not None:
+            self.log(message)
+
+    def _autofocus(self, camera, timeout):
+        self.autofocuses += 1
+        try:
+            seconds = camera.autofocus(timeout = timeout)
+        except AutofocusTimeout as error:
+            self._log(f"{error}; focus position not saved")
+            self.reference_pending = False
+            return 'failed'
+        self.position = camera.focus_position()
+        self.focused_at = time.time()
+        self.reference = None
+        # The sharpness at the new position comes from the next checked frame
+        self.reference_pending = True
+        self.save()
+        self._log(f"Autofocus took {seconds:.1f} s, focus position {self.position} saved")
+        return 'autofocus'
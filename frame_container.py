@@ -0,0 +1,240 @@
+# ======================== Notes ===========================================
+
+## frame_container.py stores a whole capture session of raw uint16 frames in a single append-only file.
+## Thousands of small TIFFs on a FAT formatted SD card slow down directory operations and make loading a season of data slow,
+## so the acquisition path can append frames to one container per session instead, and RadianceToTemp.py reads frames back at random.
+##
+## File layout (little endian):
+##     header:  magic b'FLIRRAW1' | version (uint16) | height (uint32) | width (uint32) | 14 bytes padding   = 32 bytes
+##     records: frame_id (uint64) | device_timestamp (uint64, ns) | capture_time (float64, POSIX seconds) | height x width uint16 pixels
+## Every record has the same size, so record i starts at 32 + i * record_size and no separate index is needed.
+## The reader memory-maps the records, so frames and metadata are read without copying and a record that was only
+## partially written (e.g. the card was pulled or the pi lost power) is simply ignored.
+
+# ======================== Import  Modules ==================================
+
+import datetime
+import os
+import struct
+import threading
+
+import numpy as np
+
+# ======================== File format ======================================
+
+MAGIC = b'FLIRRAW1'
+VERSION = 1
+HEADER = struct.Struct('<8sHII14x')
+RECORD_HEADER = struct.Struct('<QQd')
+EXTENSION = '.frames'
+
+# The function 'record_dtype' returns the numpy structured dtype of one record for frames of the given shape
+
+def record_dtype(height, width):
+    return np.dtype([
+        ('frame_id', '<u8'),
+        ('device_timestamp', '<u8'),
+        ('capture_time', '<f8'),
+        ('pixels', '<u2', (height, width)),
+    ])
+
+# The function 'read_header' returns the (height, width) stored in the header of a container file
+
+def read_header(f):
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("File is too short to be a frame container")
+    magic, version, height, width = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("Not a frame container (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported frame container version: {version}")
+    return height, width
+
+# ======================== Writer ===========================================
+# The class 'FrameContainerWriter' appends frames to a container file. An existing container is appended to.
+# Argument 'path' is the container file.
+# Argument 'shape' is the (height, width) of the frames. The FLIR A325sc produces 240 x 320 frames.
+# Argument 'sync' calls os.fsync after every frame so a pulled card loses at most the frame being written (slower).
+
+class FrameContainerWriter:
+
+    def __init__(self, path, shape = (240, 320), sync = False):
+        self.path = path
+        self.shape = tuple(shape)
+        self.sync = sync
+        self.frame_count = 0
+
+        record_size = record_dtype(*self.shape).itemsize
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                existing_shape = read_header(f)
+            if existing_shape != self.shape:
+                raise ValueError(f"Container {path} holds {existing_shape} frames, not {self.shape}")
+            # Drop a partially written record left behind by an interrupted write before appending
+            size = os.path.getsize(path)
+            self.frame_count = (size - HEADER.size) // record_size
+            self.file = open(path, 'r+b')
+            self.file.truncate(HEADER.size + self.frame_count * record_size)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION, self.shape[0], self.shape[1]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Append one frame and its metadata. 'capture_time' is a datetime or POSIX seconds (default: now).
+    def append(self, frame, frame_id = 0, device_timestamp = 0, capture_time = None):
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match container shape {self.shape}")
+        if capture_time is None:
+            capture_time = datetime.datetime.now()
+        if isinstance(capture_time, datetime.datetime):
+            capture_time = capture_time.timestamp()
+        self.file.write(RECORD_HEADER.pack(int(frame_id), int(device_timestamp), float(capture_time)))
+        self.file.write(np.ascontiguousarray(frame, dtype = '<u2').tobytes())
+        if self.sync:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.frame_count += 1
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+# ======================== Reader ===========================================
+# The class 'FrameContainerReader' gives random access to the frames of a container file without loading them into memory.
+# reader[i] returns frame i as a read-only uint16 array backed by the file. len(reader) is the number of complete frames.
+# The per-frame metadata is available as arrays: reader.frame_ids, reader.device_timestamps and reader.capture_times (POSIX seconds).
+
+class FrameContainerReader:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.shape = read_header(f)
+        dtype = record_dtype(*self.shape)
+        count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype = dtype, mode = 'r', offset = HEADER.size, shape = (count,))
+        else:
+            self.records = np.zeros(0, dtype = dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records['pixels'][index]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def frame_ids(self):
+        return self.records['frame_id']
+
+    @property
+    def device_timestamps(self):
+        return self.records['device_timestamp']
+
+    @property
+    def capture_times(self):
+        return self.records['capture_time']
+
+    # Returns the capture time of frame 'index' as a datetime
+    def capture_datetime(self, index):
+        return datetime.datetime.fromtimestamp(float(self.records['capture_time'][index]))
+
+# ======================== Acquisition sink =================================
+# The class 'ContainerSink' plugs frame containers into the FrameWriter (see frame_writer.py): FrameWriter(save = sink.save).
+# Frames are appended to one container per capture session in the directory of the filename they were queued with,
+# so a swapped SD card (a new mount point) simply starts a new container.
+# Call new_session() at the end of each capture window: the next frame starts a new set of containers.
+# Argument 'session_name' names the container files of the first session (default: session-YYYYMMDD-HHMMSS from the
+# capture time of the first frame of the session).
+# A container that fails to write (e.g. the card was remounted and the open file is stale) is dropped, so the next frame opens it again.
+
+class ContainerSink:
+
+    def __init__(self, shape = (240, 320), session_name = None, sync = False):
+        self.shape = tuple(shape)
+        self.session_name = session_name
+        self.sync = sync
+        self.writers = {}
+        self.sessions = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Returns the container path used for frames saved to 'directory' (None before the first frame of a session)
+    def container_path(self, directory):
+        if self.session_name is None:
+            return None
+        return os.path.join(directory, self.session_name + EXTENSION)
+
+    # Close the containers of the current session. The next frame saved starts a new session named after its capture time.
+    def new_session(self, session_name = None):
+        with self.lock:
+            self._close_writers()
+            self.session_name = session_name
+
+    def save(self, filename, frame, metadata = None):
+        if metadata is None:
+            metadata = {}
+        capture_time = metadata.get('capture_time')
+        directory = os.path.dirname(filename)
+        with self.lock:
+            if self.session_name is None:
+                self.session_name = session_name_at(capture_time)
+                self.sessions += 1
+            writer = self.writers.get(directory)
+            if writer is None:
+                writer = FrameContainerWriter(self.container_path(directory), shape = self.shape, sync = self.sync)
+                self.writers[directory] = writer
+            try:
+                writer.append(frame, frame_id = metadata.get('frame_id', 0), device_timestamp = metadata.get('device_timestamp', 0), capture_time = capture_time)
+            except OSError:
+                # Don't keep writing to a file on a card that was removed or remounted
+                del self.writers[directory]
+                self._close_writer(writer)
+                raise
+
+    def close(self):
+        with self.lock:
+            self._close_writers()
+
+    def _close_writers(self):
+        for writer in self.writers.values():
+            self._close_writer(writer)
+        self.writers = {}
+
+    def _close_writer(self, writer):
+        try:
+            writer.close()
+        except OSError as e:
+            print(f"Error closing {writer.path}: {e}")
+
+# The function 'session_name_at' returns the name of a session starting at 'capture_time' (a datetime, POSIX seconds or None for now)
+
+def session_name_at(capture_time = None):
+    if capture_time is None:
+        capture_time = datetime.datetime.now()
+    elif not isinstance(capture_time, datetime.datetime):
+        capture_time = datetime.datetime.fromtimestamp(capture_time)
+    return "session-" + capture_time.strftime('%Y%m%d-%H%M%S')
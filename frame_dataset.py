@@ -0,0 +1,182 @@
+# ======================== Notes ===========================================
+
+## frame_dataset.py gives lazy, random access to a season of raw frames for RadianceToTemp.py.
+## A 'FrameDataset' indexes a directory of tiffs (or a frame container, see frame_container.py) once, and reads a frame
+## only when it is asked for. Uncompressed tiffs (the format saved by the Spinnaker SDK and by frame_writer.py) are
+## memory-mapped straight from their pixel strips, so no copy is made and resident memory stays bounded
+## no matter how many frames there are. Compressed or unusual tiffs fall back to imageio.
+
+# ======================== Import  Modules ==================================
+
+import datetime
+import os
+import re
+import struct
+
+import imageio.v2 as imageio
+import numpy as np
+
+from frame_container import FrameContainerReader, EXTENSION as CONTAINER_EXTENSION
+
+# ======================== TIFF strip layout ================================
+
+TIFF_EXTENSIONS = ('.tiff', '.tif')
+
+# Tags and field types needed to locate the pixel data of a baseline tiff
+TAG_WIDTH = 256
+TAG_HEIGHT = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_SAMPLE_FORMAT = 339
+FIELD_ASCII = 2
+FIELD_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 16: 8}
+FIELD_FORMATS = {1: 'B', 3: 'H', 4: 'I', 16: 'Q'}
+
+# The function 'read_tiff_tags' reads the tags of the first image in a tiff without touching the pixel data.
+# Returns a dictionary of tag -> tuple of values (integer tags, and text tags as a tuple of one string), and the byte order ('<' or '>').
+
+def read_tiff_tags(f):
+    header = f.read(8)
+    if header[:4] == b'II*\0':
+        order = '<'
+    elif header[:4] == b'MM\0*':
+        order = '>'
+    else:
+        raise ValueError("Not a classic tiff")
+    ifd_offset = struct.unpack(order + 'I', header[4:8])[0]
+    f.seek(ifd_offset)
+    count = struct.unpack(order + 'H', f.read(2))[0]
+    entries = f.read(12 * count)
+    tags = {}
+    for i in range(count):
+        tag, field, n, value = struct.unpack(order + 'HHI4s', entries[12 * i:12 * i + 12])
+        if field not in FIELD_SIZES:
+            continue
+        size = FIELD_SIZES[field] * n
+        if size <= 4:
+            data = value[:size]
+        else:
+            position = f.tell()
+            f.seek(struct.unpack(order + 'I', value)[0])
+            data = f.read(size)
+            f.seek(position)
+        if field == FIELD_ASCII:
+            tags[tag] = (data.split(b'\0', 1)[0].decode('latin-1'),)
+        else:
+            tags[tag] = struct.unpack(order + FIELD_FORMATS[field] * n, data)
+    return tags, order
+
+# The function 'tiff_layout' returns (offset, shape, dtype) of the pixel data of an uncompressed single-channel tiff
+# whose strips are stored back to back, or None if the tiff can't be memory-mapped.
+
+def tiff_layout(file_path):
+    with open(file_path, 'rb') as f:
+        try:
+            tags, order = read_tiff_tags(f)
+        except (ValueError, struct.error):
+            return None
+    if tags.get(TAG_COMPRESSION, (1,))[0] != 1 or tags.get(TAG_SAMPLES_PER_PIXEL, (1,))[0] != 1:
+        return None
+    if TAG_STRIP_OFFSETS not in tags or TAG_STRIP_BYTE_COUNTS not in tags:
+        return None
+    width = tags[TAG_WIDTH][0]
+    height = tags[TAG_HEIGHT][0]
+    bits = tags.get(TAG_BITS_PER_SAMPLE, (1,))[0]
+    kind = {1: 'u', 2: 'i', 3: 'f'}.get(tags.get(TAG_SAMPLE_FORMAT, (1,))[0])
+    if kind is None or bits % 8 != 0:
+        return None
+    dtype = np.dtype(order + kind + str(bits // 8))
+
+    # The strips must be contiguous and hold exactly one image
+    offsets = tags[TAG_STRIP_OFFSETS]
+    counts = tags[TAG_STRIP_BYTE_COUNTS]
+    for i in range(1, len(offsets)):
+        if offsets[i] != offsets[i - 1] + counts[i - 1]:
+            return None
+    if sum(counts) != width * height * dtype.itemsize:
+        return None
+    return offsets[0], (height, width), dtype
+
+# The function 'read_tiff' returns the pixels of a tiff, memory-mapped if possible and decoded with imageio otherwise
+
+def read_tiff(file_path):
+    layout = tiff_layout(file_path)
+    if layout is None:
+        return np.array(imageio.imread(file_path))
+    offset, shape, dtype = layout
+    return np.memmap(file_path, dtype = dtype, mode = 'r', offset = offset, shape = shape)
+
+# ======================== Modification times ==============================
+# The function 'mtime_datetime' returns the modification time of a file as a datetime. It is only a stand-in for the
+# capture time: files copied off the SD card get the time they were copied. A warning is printed once per directory.
+
+MTIME_WARNED = set()
+
+def mtime_datetime(file_path):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    if directory not in MTIME_WARNED:
+        MTIME_WARNED.add(directory)
+        print(f"WARNING: using file modification times as capture times for the frames in {directory}")
+    return datetime.datetime.fromtimestamp(os.stat(file_path).st_mtime)
+
+# ======================== Frame order ======================================
+# The function 'frame_sort_key' orders filenames by the numbers in them rather than digit by digit, so the frames of a
+# burst saved as file-YYYYMMDD-HHMMSS_burstN stay in order past _burst9. Names with fixed-width numbers (everything
+# frame_writer.py saves) sort the same way as before.
+
+def frame_sort_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+# ======================== Frame Dataset ====================================
+# The class 'FrameDataset' indexes the frames in a directory of tiffs or in a frame container.
+# Argument 'path' is a directory of tiffs or a .frames container file.
+# Argument 'get_datetime' is a function that returns the capture datetime of a tiff from its path
+# (e.g. frame_metadata.capture_datetime). Frames in a container carry their own capture time, so 'get_datetime' is only
+# used for tiffs; without it, datetime() raises ValueError for tiffs. Pass get_datetime = mtime_datetime to accept
+# file modification times instead (a warning is printed, see mtime_datetime).
+# dataset[i] returns frame i, iterating over the dataset yields the frames in order, and dataset.items() yields (name, frame, datetime).
+
+class FrameDataset:
+
+    def __init__(self, path, get_datetime = None):
+        self.path = path
+        self.get_datetime = get_datetime
+        self.container = None
+        if path.endswith(CONTAINER_EXTENSION):
+            self.container = FrameContainerReader(path)
+            self.names = []
+            for i in range(len(self.container)):
+                dt = self.container.capture_datetime(i)
+                self.names.append("file-" + dt.strftime('%Y%m%d-%H%M%S-%f') + "_f" + str(int(self.container.frame_ids[i])).zfill(6))
+        else:
+            # Index the directory once. Names start with the capture time, so sorting them puts the frames in order.
+            self.names = sorted((entry.name for entry in os.scandir(path) if entry.is_file() and entry.name.lower().endswith(TIFF_EXTENSIONS)), key = frame_sort_key)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if self.container is not None:
+            return self.container[index]
+        return read_tiff(os.path.join(self.path, self.names[index]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # Returns the capture datetime of frame 'index'
+    def datetime(self, index):
+        if self.container is not None:
+            return self.container.capture_datetime(index)
+        file_path = os.path.join(self.path, self.names[index])
+        if self.get_datetime is None:
+            raise ValueError(f"No get_datetime to find the capture time of {file_path} (pass get_datetime = mtime_datetime to use the file modification time)")
+        return self.get_datetime(file_path)
+
+    # Yields (name, frame, datetime) for every frame in order
+    def items(self):
+        for i in range(len(self)):
+            yield self.names[i], self[i], self.datetime(i)
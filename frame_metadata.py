@@ -0,0 +1,170 @@
+# ======================== Notes ===========================================
+
+## frame_metadata.py stores the capture time, device timestamp and frame ID of every raw frame with the frame itself,
+## and reads them back for RadianceToTemp.py without decoding any pixels.
+## The creation time of a file on the SD card is the time it was copied (or nothing at all on FAT cards), so it can't be
+## used to match frames with the weather data. Instead:
+##   - tiffs saved by frame_writer.py carry the metadata in their tags: ImageDescription holds a small json record
+##     (frame_id, device_timestamp, capture_time to the microsecond) and DateTime the capture time to the second,
+##     so other tiff readers show it too.
+##   - frames saved by the Spinnaker SDK (image_result.Save, which can't add tags) are listed in a sidecar index,
+##     frames.csv, in the same directory (see append_sidecar).
+##   - older archives only have the capture time in the filename (file-YYYYMMDD-HHMMSS...), which is used last.
+##     The frames of a burst in these archives share the same second and are told apart by their ordinal
+##     (file-YYYYMMDD-HHMMSS_burstN), which is returned as 'burst_index'.
+## read_frame_metadata tries the sidecar index, then the tags, then the filename, and raises ValueError if none of them has a capture time.
+
+# ======================== Import  Modules ==================================
+
+import csv
+import datetime
+import functools
+import json
+import os
+import re
+import struct
+
+from frame_dataset import read_tiff_tags
+
+# ======================== Tags =============================================
+
+TAG_IMAGE_DESCRIPTION = 270
+TAG_DATETIME = 306
+
+# The ImageDescription of a frame starts with this, so descriptions written by other software are not mistaken for metadata
+DESCRIPTION_PREFIX = "flir-frame "
+
+SIDECAR_NAME = "frames.csv"
+SIDECAR_FIELDS = ['name', 'frame_id', 'device_timestamp', 'capture_time']
+
+# Filenames written by the controllers: file-YYYYMMDD-HHMMSS, optionally followed by -microseconds and _f<frame ID>,
+# or by _burst<N> (the ordinal of the frame in its burst, in archives saved by save_image_spinnaker)
+FILENAME_PATTERN = re.compile(r'file-(\d{8})[-_](\d{6})(?:-(\d{6}))?(?:_f(\d+))?(?:_burst(\d+))?')
+
+# The function 'frame_tags' returns the tiff tags that hold 'metadata' (the dictionary queued with a frame, see
+# frame_writer.py), as a dictionary of tag -> value that can be passed to PIL as tiffinfo.
+
+def frame_tags(metadata):
+    capture_time = metadata.get('capture_time')
+    record = {
+        'frame_id': metadata.get('frame_id'),
+        'device_timestamp': metadata.get('device_timestamp'),
+        'capture_time': capture_time.isoformat() if isinstance(capture_time, datetime.datetime) else capture_time,
+    }
+    tags = {TAG_IMAGE_DESCRIPTION: DESCRIPTION_PREFIX + json.dumps(record)}
+    if isinstance(capture_time, datetime.datetime):
+        tags[TAG_DATETIME] = capture_time.strftime('%Y:%m:%d %H:%M:%S')
+    return tags
+
+# The function 'metadata_from_tags' reads the metadata from the tags of a tiff (only the header and the tag directory
+# are read). Returns a dictionary (frame_id, device_timestamp, capture_time) or None if the tiff has no metadata.
+
+def metadata_from_tags(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            tags, order = read_tiff_tags(f)
+    except (OSError, ValueError, struct.error):
+        # Not a tiff, or a truncated one (e.g. still being written)
+        return None
+    description = tags.get(TAG_IMAGE_DESCRIPTION, ("",))[0]
+    if isinstance(description, str) and description.startswith(DESCRIPTION_PREFIX):
+        try:
+            record = json.loads(description[len(DESCRIPTION_PREFIX):])
+            return _metadata(record.get('frame_id'), record.get('device_timestamp'), record.get('capture_time'))
+        except (ValueError, TypeError, AttributeError):
+            # Not valid json, or not a metadata record
+            pass
+    stamp = tags.get(TAG_DATETIME, (None,))[0]
+    if isinstance(stamp, str):
+        try:
+            return _metadata(None, None, datetime.datetime.strptime(stamp.strip(), '%Y:%m:%d %H:%M:%S'))
+        except ValueError:
+            pass
+    return None
+
+# The function 'metadata_from_filename' parses the capture time (and frame ID or burst ordinal, if present) from a
+# filename such as file-20240711-121100.tiff, file-20240711-121100_burst2.tiff or file-20240711-121100-123456_f000042.tiff.
+# Returns None if the name doesn't match.
+
+def metadata_from_filename(file_path):
+    match = FILENAME_PATTERN.search(os.path.basename(file_path))
+    if match is None:
+        return None
+    date, clock, microseconds, frame_id, burst_index = match.groups()
+    try:
+        capture_time = datetime.datetime.strptime(date + clock, '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+    if microseconds is not None:
+        capture_time = capture_time.replace(microsecond = int(microseconds))
+    return _metadata(frame_id, None, capture_time, burst_index)
+
+def _metadata(frame_id, device_timestamp, capture_time, burst_index = None):
+    if isinstance(capture_time, str):
+        capture_time = datetime.datetime.fromisoformat(capture_time)
+    if capture_time is None:
+        raise ValueError("No capture time")
+    return {
+        'frame_id': None if frame_id is None else int(frame_id),
+        'device_timestamp': None if device_timestamp is None else int(device_timestamp),
+        'capture_time': capture_time,
+        'burst_index': None if burst_index is None else int(burst_index),
+    }
+
+# ======================== Sidecar index ====================================
+# The function 'append_sidecar' adds the frames of a burst (the dictionaries returned by CameraSession.burst) to the
+# sidecar index of 'directory'. The header is written when the index is created.
+
+def append_sidecar(directory, frames):
+    path = os.path.join(directory, SIDECAR_NAME)
+    new = not os.path.exists(path)
+    with open(path, 'a', newline = '') as file:
+        writer = csv.writer(file)
+        if new:
+            writer.writerow(SIDECAR_FIELDS)
+        for frame in frames:
+            writer.writerow([os.path.basename(frame['filename']), frame['frame_id'], frame['device_timestamp'], frame['capture_time'].isoformat()])
+
+# The function 'read_sidecar' returns the sidecar index of 'directory' as a dictionary of filename -> metadata
+# (empty if there is no index). The index is read once and kept until the file changes.
+
+def read_sidecar(directory):
+    try:
+        stat = os.stat(os.path.join(directory, SIDECAR_NAME))
+    except OSError:
+        return {}
+    return _read_sidecar(directory, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize = 8)
+def _read_sidecar(directory, mtime_ns, size):
+    index = {}
+    with open(os.path.join(directory, SIDECAR_NAME), newline = '') as file:
+        for row in csv.DictReader(file):
+            try:
+                index[row['name']] = _metadata(row['frame_id'] or None, row['device_timestamp'] or None, row['capture_time'])
+            except (KeyError, ValueError):
+                continue
+    return index
+
+# ======================== Read metadata ====================================
+# The function 'read_frame_metadata' returns the metadata of a raw frame: a dictionary of frame_id, device_timestamp
+# (None if unknown), capture_time (a datetime), burst_index (the _burstN ordinal of older archives, otherwise None)
+# and source ('sidecar', 'tags' or 'filename').
+# Raises ValueError if the capture time can't be found.
+
+def read_frame_metadata(file_path):
+    metadata = read_sidecar(os.path.dirname(file_path)).get(os.path.basename(file_path))
+    if metadata is not None:
+        return dict(metadata, source = 'sidecar')
+    metadata = metadata_from_tags(file_path)
+    if metadata is not None:
+        return dict(metadata, source = 'tags')
+    metadata = metadata_from_filename(file_path)
+    if metadata is not None:
+        return dict(metadata, source = 'filename')
+    raise ValueError(f"No capture time in the sidecar index, tags or filename of {file_path}")
+
+# The function 'capture_datetime' returns the capture time of a raw frame (see read_frame_metadata)
+
+def capture_datetime(file_path):
+    return read_frame_metadata(file_path)['capture_time']
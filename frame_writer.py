@@ -0,0 +1,157 @@
+# ======================== Notes ===========================================
+
+## frame_writer.py moves image encoding and SD card writes out of the acquisition loop.
+## Frames are copied out of the Spinnaker buffer into a preallocated ring of numpy arrays, the buffer is handed back
+## to the camera right away, and a background writer thread saves the frames to disk in the order they were captured.
+## When the SD card can't keep up and the ring is full, the writer either blocks the capture loop (backpressure)
+## or drops the new frame, and counts how often each happened.
+
+# ======================== Import  Modules ==================================
+
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from frame_dataset import TIFF_EXTENSIONS
+from frame_metadata import frame_tags
+
+# ======================== Save a frame =====================================
+# The function 'save_frame' saves a raw uint16 frame with PIL. The file format is taken from the filename extension (e.g. tiff).
+# Argument 'metadata' is the dictionary queued with the frame (frame_id, device_timestamp, capture_time). Tiffs carry it
+# in their tags (see frame_metadata.py); other formats don't store it.
+
+def save_frame(filename, frame, metadata = None):
+    if metadata is not None and filename.lower().endswith(TIFF_EXTENSIONS):
+        Image.fromarray(frame).save(filename, tiffinfo = frame_tags(metadata))
+    else:
+        Image.fromarray(frame).save(filename)
+
+# ======================== Frame Writer =====================================
+# The class 'FrameWriter' is a bounded producer/consumer queue between the capture loop and the SD card.
+# Argument 'shape' is the (height, width) of the frames. The FLIR A325sc produces 240 x 320 frames.
+# Argument 'slots' is the number of frames the ring can hold before backpressure kicks in.
+# Argument 'policy' is 'block' (wait for a free slot) or 'drop' (discard the new frame) when the ring is full.
+# Argument 'block_timeout' is the longest time (in seconds) put() waits for a free slot before dropping the frame. None waits forever.
+# Argument 'save' is the function used to persist a frame, called as save(filename, frame, metadata). The default is save_frame.
+# Use save = ContainerSink().save (see frame_container.py) to append frames to one container file per session instead.
+# Usage:
+#     with FrameWriter() as writer:
+#         writer.put_image(image_result, filename)
+
+class FrameWriter:
+
+    def __init__(self, shape = (240, 320), dtype = np.uint16, slots = 16, policy = 'block', block_timeout = None, save = save_frame):
+        if policy not in ('block', 'drop'):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.shape = tuple(shape)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.save = save
+
+        # Preallocated ring of frame buffers and the queues of free and filled slots
+        self.ring = np.empty((slots,) + self.shape, dtype = dtype)
+        self.free_slots = queue.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        self.pending = queue.Queue()
+
+        # Counters
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.blocked_time = 0.0
+        self.max_pending = 0
+        self.write_time = 0.0
+
+        self.thread = threading.Thread(target = self._writer_loop, daemon = True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Copy 'frame' into the ring and queue it to be saved as 'filename' along with the 'metadata' dictionary. Returns False if the frame was dropped.
+    def put(self, frame, filename, metadata = None):
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match writer shape {self.shape}")
+        slot = self._acquire_slot()
+        if slot is None:
+            self.dropped += 1
+            return False
+        np.copyto(self.ring[slot], frame, casting = 'unsafe')
+        self.pending.put((slot, filename, metadata))
+        self.queued += 1
+        self.max_pending = max(self.max_pending, self.pending.qsize())
+        return True
+
+    # Copy a PySpin image into the ring, release it back to the camera and queue it to be saved. Returns False if the frame was dropped.
+    def put_image(self, image_result, filename, metadata = None):
+        try:
+            return self.put(image_result.GetNDArray(), filename, metadata)
+        finally:
+            image_result.Release()
+
+    # Block until every queued frame has been written
+    def flush(self):
+        self.pending.join()
+
+    # Write the remaining frames and stop the writer thread
+    def close(self):
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+
+    # Returns a dictionary of counters describing how the writer kept up with the camera
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'pending': self.pending.qsize(),
+            'max_pending': self.max_pending,
+            'blocked_time': self.blocked_time,
+            'write_time': self.write_time,
+        }
+
+    def _acquire_slot(self):
+        try:
+            return self.free_slots.get_nowait()
+        except queue.Empty:
+            if self.policy == 'drop':
+                return None
+        # Backpressure: wait for the writer to free a slot
+        start = time.perf_counter()
+        try:
+            return self.free_slots.get(timeout = self.block_timeout)
+        except queue.Empty:
+            return None
+        finally:
+            self.blocked_time += time.perf_counter() - start
+
+    def _writer_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                return
+            slot, filename, metadata = item
+            start = time.perf_counter()
+            try:
+                self.save(filename, self.ring[slot], metadata)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Error saving {filename}: {e}")
+            finally:
+                self.write_time += time.perf_counter() - start
+                self.free_slots.put(slot)
+                self.pending.task_done()
@@ -0,0 +1,197 @@
+# ======================== Notes ===========================================
+
+## motion_trigger.py powers the camera from PIR edges instead of polling the sensor once a second.
+## gpiozero calls the trigger from its interrupt thread as soon as the PIR output rises, the relay is switched on in that
+## callback, and the time from the edge to the relay (in milliseconds) is recorded. The controller's main loop sleeps on
+## an event until an edge arrives, so nothing wakes the CPU while there is no motion.
+## gpiozero's MotionSensor samples the pin at 10 Hz in a background thread, so the PIR is read with a DigitalInputDevice,
+## which is driven by edge interrupts (when_activated/when_deactivated are MotionSensor's when_motion/when_no_motion).
+## Recorded PIR traces can be replayed onto a gpiozero mock pin to exercise the controller without the hardware.
+
+# ======================== Import  Modules ==================================
+
+import threading
+import time
+
+# ======================== Motion Trigger ===================================
+# The class 'MotionTrigger' switches the relay on when the PIR sees motion and keeps track of the motion state.
+# Argument 'pir' is a gpiozero input device for the PIR (e.g. DigitalInputDevice(20) or MotionSensor(20)).
+# Argument 'relay' is the gpiozero OutputDevice that powers the camera.
+# Argument 'min_off_time' is the shortest time (in seconds) the camera stays off, so it does not freeze from being turned off/on too quickly.
+# Motion that arrives sooner does not switch the relay on; power_on() waits out the rest of the time instead.
+# power_off(hold) keeps the relay off for 'hold' seconds whatever the PIR does (e.g. while a frozen camera is power cycled);
+# only an explicit power_on() switches it on before then. The interrupt never switches the relay on during a hold.
+# Arguments 'on_motion' and 'on_no_motion' are optional functions called (without arguments) on each edge.
+# The relay is never switched off from the interrupt thread: the controller calls power_off() once the camera is released.
+# Usage:
+#     trigger = MotionTrigger(DigitalInputDevice(20), gpiozero.OutputDevice(21))
+#     trigger.wait_for_motion()     # sleeps until the PIR output rises
+
+class MotionTrigger:
+
+    def __init__(self, pir, relay, min_off_time = 1, on_motion = None, on_no_motion = None):
+        self.pir = pir
+        self.relay = relay
+        self.min_off_time = min_off_time
+        self.on_motion = on_motion
+        self.on_no_motion = on_no_motion
+        self.motion_event = threading.Event()
+        self.no_motion_event = threading.Event()
+        self.latencies = []
+        self.motion_count = 0
+        self.off_time = None
+        self.hold_until = None
+
+        if pir.is_active:
+            self.motion_event.set()
+        else:
+            self.no_motion_event.set()
+        pir.when_activated = self._motion
+        pir.when_deactivated = self._no_motion
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Returns True while the PIR sees motion
+    def is_motion(self):
+        return self.motion_event.is_set()
+
+    # Block until the PIR sees motion or 'timeout' seconds have passed. Returns is_motion().
+    def wait_for_motion(self, timeout = None):
+        self.motion_event.wait(timeout)
+        return self.is_motion()
+
+    # Block until the PIR stops seeing motion or 'timeout' seconds have passed. Returns True if there is no motion.
+    def wait_for_no_motion(self, timeout = None):
+        self.no_motion_event.wait(timeout)
+        return not self.is_motion()
+
+    # Switch the camera on, waiting out the rest of 'min_off_time' if it was switched off moments ago. Ends any hold.
+    def power_on(self):
+        self.hold_until = None
+        if not self.relay.is_active:
+            remaining = self._remaining_off_time()
+            if remaining > 0:
+                time.sleep(remaining)
+            self.relay.on()
+
+    # Switch the camera off. If 'hold' is given, motion does not switch it back on for 'hold' seconds.
+    def power_off(self, hold = None):
+        self.hold_until = None if hold is None else time.monotonic() + hold
+        if self.relay.is_active:
+            self.relay.off()
+            self.off_time = time.monotonic()
+
+    # Returns True while the relay is held off (see power_off)
+    def is_held(self):
+        hold_until = self.hold_until
+        return hold_until is not None and time.monotonic() < hold_until
+
+    # Returns the edge-to-relay latencies (in milliseconds) recorded so far
+    def latencies_ms(self):
+        return [1000 * latency for latency in self.latencies]
+
+    def close(self):
+        self.pir.when_activated = None
+        self.pir.when_deactivated = None
+
+    def _remaining_off_time(self):
+        if self.off_time is None:
+            return 0
+        return self.min_off_time - (time.monotonic() - self.off_time)
+
+    # Called by gpiozero when the PIR output rises
+    def _motion(self):
+        if not self.relay.is_active and self._remaining_off_time() <= 0 and not self.is_held():
+            self.relay.on()
+            # active_time is measured from the tick of the edge, so this is the edge-to-relay latency
+            latency = self.pir.active_time
+            if latency is not None:
+                self.latencies.append(latency)
+        self.motion_count += 1
+        self.no_motion_event.clear()
+        self.motion_event.set()
+        if self.on_motion is not None:
+            self.on_motion()
+
+    # Called by gpiozero when the PIR output falls
+    def _no_motion(self):
+        self.motion_event.clear()
+        self.no_motion_event.set()
+        if self.on_no_motion is not None:
+            self.on_no_motion()
+
+# ======================== PIR traces =======================================
+# A PIR trace is a list of (seconds, state) pairs: the time of each edge since the start of the recording and the new output state.
+# Traces are stored as csv files with one "seconds,state" line per edge.
+
+# The class 'TraceRecorder' records the edges of a PIR input device into a trace
+
+class TraceRecorder:
+
+    def __init__(self, pir):
+        self.pir = pir
+        self.start = time.monotonic()
+        self.trace = []
+        pir.when_activated = lambda: self.trace.append((time.monotonic() - self.start, 1))
+        pir.when_deactivated = lambda: self.trace.append((time.monotonic() - self.start, 0))
+
+    def save(self, path):
+        save_trace(self.trace, path)
+
+    def close(self):
+        self.pir.when_activated = None
+        self.pir.when_deactivated = None
+
+# The function 'save_trace' writes a trace to a csv file
+
+def save_trace(trace, path):
+    with open(path, 'w') as f:
+        for seconds, state in trace:
+            f.write(f"{seconds:.6f},{int(state)}\n")
+
+# The function 'load_trace' reads a trace from a csv file
+
+def load_trace(path):
+    trace = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith('#'):
+                continue
+            seconds, state = line.split(',')
+            trace.append((float(seconds), int(state)))
+    return trace
+
+# The function 'replay_trace' drives a gpiozero mock pin (e.g. MockFactory().pin(20)) through a trace in real time.
+# Argument 'speed' scales the playback (2 replays the trace twice as fast).
+# Returns the monotonic time at which each edge was driven.
+
+def replay_trace(trace, pin, speed = 1.0):
+    start = time.monotonic()
+    driven = []
+    for seconds, state in trace:
+        delay = start + seconds / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        driven.append(time.monotonic())
+        if state:
+            pin.drive_high()
+        else:
+            pin.drive_low()
+    return driven
+
+# The function 'mock_devices' returns a gpiozero mock pin factory with a PIR input and a relay output on the given pins,
+# as (factory, pir, relay). factory.pin(pir_pin) is the mock pin to replay traces onto.
+
+def mock_devices(pir_pin = 20, relay_pin = 21):
+    from gpiozero import DigitalInputDevice, OutputDevice
+    from gpiozero.pins.mock import MockFactory
+    factory = MockFactory()
+    pir = DigitalInputDevice(pir_pin, pull_up = False, pin_factory = factory)
+    relay = OutputDevice(relay_pin, active_high = True, initial_value = False, pin_factory = factory)
+    return factory, pir, relay
@@ -0,0 +1,177 @@
+# ======================== Notes ===========================================
+
+## scene_change.py decides how often to capture from what the camera sees.
+## After a PIR trigger, most frames of a fixed-rate session are near-identical. A 'ChangeDetector' keeps a running
+## background (mean and variance per pixel) of a block-averaged raw frame (240 x 320 -> 60 x 80), and scores each new
+## frame by the fraction of pixels that are clearly warmer than the background. An 'AdaptiveCapture' turns the scores into
+## decisions: capture at the fastest rate and extend the session while a warm target is moving, back off while the scene
+## is static, and end the session early once nothing has changed for a while. Every decision is logged.
+## Raw counts rise with radiance, so "warmer" is a positive difference in raw counts; no conversion to temperature is needed.
+
+# ======================== Import  Modules ==================================
+
+import numpy as np
+
+from capture_scheduler import AdaptivePeriod, CaptureScheduler, FakeClock
+
+# ======================== Downsampling =====================================
+# The function 'downsample' averages 'factor' x 'factor' blocks of a frame into a float32 array.
+# Rows and columns that don't fill a whole block are dropped.
+
+def downsample(frame, factor = 4):
+    height = frame.shape[0] // factor * factor
+    width = frame.shape[1] // factor * factor
+    blocks = frame[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return blocks.mean(axis = (1, 3), dtype = np.float32)
+
+# ======================== Change Detector ==================================
+# The class 'ChangeDetector' scores how much of the scene has changed since the background was learned.
+# Argument 'factor' is the downsampling factor.
+# Argument 'alpha' is the learning rate of the running background (per frame). Changed pixels are learned 10x slower,
+# so a target that stops moving fades into the background instead of staying "changed" forever.
+# Argument 'k' is the number of standard deviations of the background noise a pixel must rise by to count as changed.
+# Argument 'min_delta' is the smallest rise (in raw counts) that counts as changed, whatever the noise.
+# Argument 'warm_only' only counts pixels that got warmer (an animal against a cooler background). Set to False to count any change.
+# update(frame) returns the score of the frame: the fraction of (downsampled) pixels that changed.
+# The first frame after reset() only starts the background and returns None.
+
+class ChangeDetector:
+
+    def __init__(self, factor = 4, alpha = 0.1, k = 4.0, min_delta = 40, warm_only = True):
+        self.factor = factor
+        self.alpha = alpha
+        self.k = k
+        self.min_delta = min_delta
+        self.warm_only = warm_only
+        self.background = None
+        self.variance = None
+        self.changed = None
+        self.last_diff = None
+
+    def reset(self):
+        self.background = None
+        self.variance = None
+        self.changed = None
+        self.last_diff = None
+
+    def update(self, frame):
+        small = downsample(frame, self.factor)
+        if self.background is None:
+            self.background = small
+            self.variance = np.full_like(small, (self.min_delta / self.k) ** 2)
+            self.changed = np.zeros(small.shape, dtype = bool)
+            return None
+        diff = small - self.background
+        # Remove shifts of the whole frame (e.g. ambient drift or a flat field correction)
+        diff -= np.median(diff)
+        threshold = np.maximum(self.k * np.sqrt(self.variance), self.min_delta)
+        if self.warm_only:
+            changed = diff > threshold
+        else:
+            changed = np.abs(diff) > threshold
+        rate = np.where(changed, self.alpha * 0.1, self.alpha).astype(np.float32)
+        self.background += rate * diff
+        self.variance += rate * (np.where(changed, self.variance, diff * diff) - self.variance)
+        self.changed = changed
+        self.last_diff = diff
+        return float(changed.mean())
+
+# ======================== Adaptive Capture =================================
+# The class 'AdaptiveCapture' adjusts the capture period and the end of the session from the change scores.
+# Argument 'fast_period' and 'slow_period' are the shortest and longest time (in seconds) between bursts.
+# Argument 'active_score' is the score above which a target is considered to be moving in the scene.
+# Argument 'backoff' multiplies the period after every static burst (up to 'slow_period').
+# Argument 'extend' is the time (in seconds) the session is kept running after the last movement.
+# Argument 'max_duration' caps the length of a session (in seconds) however long the target keeps moving.
+# Argument 'static_to_end' ends the session after that many static bursts in a row (None never ends it early).
+# Argument 'detector' is the ChangeDetector to use (a new one by default).
+# Argument 'log' is called with a message for every decision (default: print). The decisions are also kept in 'decisions'.
+# Usage:
+#     adaptive = AdaptiveCapture()
+#     scheduler = adaptive.start_session(duration = 60)
+#     for slot in scheduler:
+#         capture()
+#         adaptive.update(frame)
+
+class AdaptiveCapture:
+
+    def __init__(self, fast_period = 2, slow_period = 15, active_score = 0.005, backoff = 1.5, extend = 30,
+                 max_duration = 300, static_to_end = 6, detector = None, log = print):
+        self.schedule = AdaptivePeriod(fast_period, min_period = fast_period, max_period = slow_period)
+        self.active_score = active_score
+        self.backoff = backoff
+        self.extend = extend
+        self.max_duration = max_duration
+        self.static_to_end = static_to_end
+        self.detector = ChangeDetector() if detector is None else detector
+        self.log = log
+        self.scheduler = None
+        self.static_count = 0
+        self.decisions = []
+
+    # Start a new session of 'duration' seconds at the fastest rate (the PIR just saw something) and return its scheduler
+    def start_session(self, duration, clock = None, **kwargs):
+        self.schedule.set_period(self.schedule.min_period)
+        self.static_count = 0
+        self.detector.reset()
+        self.scheduler = CaptureScheduler(self.schedule, duration = duration, clock = clock, **kwargs)
+        return self.scheduler
+
+    # Score 'frame' and adjust the period and the end of the session. Returns the decision as a dictionary.
+    def update(self, frame):
+        scheduler = self.scheduler
+        score = self.detector.update(frame)
+        remaining = scheduler.remaining()
+        if score is None:
+            action = "learn"
+        elif score >= self.active_score:
+            self.static_count = 0
+            action = "active"
+            self.schedule.set_period(self.schedule.min_period)
+            # Keep capturing for at least 'extend' more seconds, within 'max_duration'
+            if remaining is not None and remaining < self.extend:
+                elapsed = scheduler.clock.monotonic() - scheduler.start_time
+                extension = min(self.extend - remaining, self.max_duration - elapsed - remaining)
+                if extension > 0:
+                    scheduler.extend(extension)
+                    action = "extend"
+        else:
+            self.static_count += 1
+            action = "static"
+            self.schedule.set_period(self.schedule.period * self.backoff)
+            if self.static_to_end is not None and self.static_count >= self.static_to_end:
+                scheduler.stop()
+                action = "end"
+        scheduler.reschedule()
+
+        decision = {
+            'time': scheduler.clock.monotonic() - scheduler.start_time,
+            'score': score,
+            'action': action,
+            'period': self.schedule.period,
+            'remaining': scheduler.remaining(),
+        }
+        self.decisions.append(decision)
+        if self.log is not None:
+            remaining = "-" if decision['remaining'] is None else f"{decision['remaining']:.0f} s"
+            score = "-" if score is None else f"{score:.4f}"
+            self.log(f"Scene change {score}: {action}, next burst in {decision['period']:.1f} s, {remaining} left")
+        return decision
+
+# ======================== Replay ===========================================
+# The function 'replay' runs an AdaptiveCapture over a stored sequence of frames (e.g. a FrameDataset) on a fake clock.
+# Argument 'frames' is the sequence and 'frame_period' the time (in seconds) between its frames.
+# Argument 'duration' is the initial length of the session (in seconds).
+# Returns the indices of the frames that would have been captured.
+
+def replay(frames, frame_period, adaptive, duration):
+    clock = FakeClock()
+    scheduler = adaptive.start_session(duration, clock = clock)
+    captured = []
+    for slot in scheduler:
+        index = int(round(clock.monotonic() / frame_period))
+        if index >= len(frames):
+            break
+        captured.append(index)
+        adaptive.update(np.asarray(frames[index]))
+    return captured
@@ -0,0 +1,275 @@
+# ================== Summary =======================
+
+## solar_radiation.py is a NumPy port of Solar_Radiation_Functions_for_Python.R and of the two TrenchR functions it uses
+## (zenith_angle and solar_radiation), so solar radiation can be computed without R or rpy2.
+## Every function accepts a single timestamp or an array of timestamps (and arrays of transmissivity and albedo), and
+## computes the whole time series in one vectorized pass instead of one R call per timestamp.
+## Timestamps are local standard time, as in the R script. 'r_reference' runs the R script through rpy2 (where R, TrenchR
+## and rpy2 are installed) to check this port against it.
+## Deliberate differences from the R script:
+##   - get_solar_radiation uses its 'hemisphere' argument. The R version always calls get_zenith with HEMISPHERE = "north",
+##     so for southern sites the two differ (they agree for northern sites such as Cembra).
+##   - The southern branch of get_zenith uses the zenith angle where the R script has an undefined 'z'.
+##   - The cosine of the sun azimuth is clipped to [-1, 1] where R returns NaN (see get_zenith).
+
+# ================================ Modules ===================================
+
+import numpy as np
+import pandas as pd
+
+# ============================== Timestamps =============================
+
+def to_datetime64(timestamps):
+
+    """
+    Converts a timestamp, a string ("YYYY-MM-DD hh:mm:ss") or an array of either to a datetime64[ns] NumPy array.
+    """
+
+    timestamps = np.atleast_1d(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[ns]')
+    return pd.to_datetime(timestamps.astype(object)).to_numpy(dtype = 'datetime64[ns]')
+
+def get_timestamps(start_ts, end_ts, freq = "h"):
+
+    """
+    Generates a series of timestamps between a start and end time (both included), as get_timestamps in the R script.
+
+    Args:
+    start_ts (string): The start point of the time-series ("YYYY-MM-DD hh:mm:ss")
+    end_ts (string): The end point of the time-series ("YYYY-MM-DD hh:mm:ss")
+    freq (string): Time between timestamps as a pandas frequency (default: hourly, as in the R script; "min" for every minute).
+
+    Returns:
+    ts: datetime64[ns] NumPy array
+    """
+
+    return pd.date_range(start = start_ts, end = end_ts, freq = freq).to_numpy(dtype = 'datetime64[ns]')
+
+def get_doy(timestamps):
+
+    """
+    Returns the day of the year (1-366) of each timestamp as a float64 NumPy array.
+    """
+
+    ts = to_datetime64(timestamps)
+    return((ts.astype('datetime64[D]') - ts.astype('datetime64[Y]')).astype(np.int64) + 1.0)
+
+def get_hour(timestamps, whole_hours = True):
+
+    """
+    Returns the hour of the day (0-24) of each timestamp as a float64 NumPy array.
+    With 'whole_hours' the minutes are dropped, as lubridate's hour() does in the R script. Set it to False to use the
+    fraction of the hour as well (e.g. for minute resolution time series).
+    """
+
+    ts = to_datetime64(timestamps)
+    hours = (ts - ts.astype('datetime64[D]')).astype('timedelta64[ns]').astype(np.int64) / 3.6e12
+    if whole_hours:
+        hours = np.floor(hours)
+    return(hours)
+
+# ============================== TrenchR functions =============================
+
+def zenith_angle(doy, lat, lon, hour):
+
+    """
+    Zenith angle of the sun (degrees), as zenith_angle in TrenchR (Campbell & Norman 1998). Night time angles are capped at 90.
+
+    Args:
+    doy (float or array): Day of the year
+    lat (float): Latitude (degrees)
+    lon (float): Longitude (degrees)
+    hour (float or array): Hour of the day (local standard time)
+
+    Returns:
+    zenith: float64 NumPy array of zenith angles in degrees
+    """
+
+    doy = np.asarray(doy, dtype = np.float64)
+    hour = np.asarray(hour, dtype = np.float64)
+    lat = np.radians(lat)
+
+    # Revolution angle and declination of the sun
+    rev_ang = 0.21631 + 2 * np.arctan(0.967 * np.tan(0.0086 * (-186 + doy)))
+    dec_ang = np.arcsin(0.39795 * np.cos(rev_ang))
+
+    # Equation of time (hours)
+    f = np.radians(279.575 + 0.9856 * doy)
+    ET = (-104.7 * np.sin(f) + 596.2 * np.sin(2 * f) + 4.3 * np.sin(3 * f) - 12.7 * np.sin(4 * f)
+          - 429.3 * np.cos(f) - 2.0 * np.cos(2 * f) + 19.3 * np.cos(3 * f)) / 3600
+
+    # Longitude correction within the time zone (hours)
+    lon = np.where(lon < 0, 360 + lon, lon)
+    LC = 1 / 15 * np.mod(lon, 15)
+    LC = np.where(LC > 0.5, LC - 1, LC)
+
+    # Time of solar noon
+    t_0 = 12 - LC - ET
+
+    cos_zenith = np.sin(dec_ang) * np.sin(lat) + np.cos(dec_ang) * np.cos(lat) * np.cos(np.pi / 12 * (hour - t_0))
+    zenith = np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+    return(np.minimum(zenith, 90))
+
+def solar_radiation(doy, psi, tau, elev, rho = 0.7, S_p0 = 1360):
+
+    """
+    Direct, diffuse and reflected solar radiation (W/m2) on a horizontal surface, as solar_radiation in TrenchR
+    (Campbell & Norman 1998, chapter 11).
+
+    Args:
+    doy (float or array): Day of the year (kept for the same signature as TrenchR)
+    psi (float or array): Zenith angle of the sun (radians)
+    tau (float or array): Atmospheric transmissivity (0-1)
+    elev (float): Elevation (m)
+    rho (float or array): Albedo of the ground surface (0-1)
+    S_p0 (float): Extraterrestrial flux density (W/m2)
+
+    Returns:
+    tuple: (direct, diffuse, reflected) float64 NumPy arrays
+    """
+
+    psi = np.asarray(psi, dtype = np.float64)
+    tau = np.asarray(tau, dtype = np.float64)
+
+    # Optical air mass, fixed at 5.66 when the sun is within 10 degrees of the horizon
+    p_a = 101.3 * np.exp(-elev / 8200)
+    with np.errstate(divide = 'ignore'):
+        m_a = np.where(psi > np.radians(80), 5.66, p_a / (101.3 * np.cos(psi)))
+
+    transmitted = tau ** m_a
+    S_b = S_p0 * transmitted * np.cos(psi)
+    S_d = 0.3 * (1 - transmitted) * S_p0 * np.cos(psi)
+    S_r = rho * (S_b + S_d)
+    return(S_b, S_d, S_r)
+
+# ============================== Zenith Angle =============================
+
+def get_zenith(datetime, LAT, LON, SLOPE, SLOPE_ASPECT, HEMISPHERE = "north", whole_hours = True):
+
+    """
+    Zenith angle of the sun, corrected for the slope of the ground with the equations of the NicheMapR microclimate model
+    (Kearney & Porter 2024), as get_zenith in the R script.
+
+    Args:
+    datetime (timestamp or array of timestamps): Date and time (local standard time)
+    LAT (float): Latitude (degrees)
+    LON (float): Longitude (degrees)
+    SLOPE (float): Slope of the ground surface (degrees)
+    SLOPE_ASPECT (float): Aspect of the slope (degrees)
+    HEMISPHERE (string): Hemisphere of the location ("north" or "south")
+    whole_hours (bool): See get_hour.
+
+    Returns:
+    dict: 'ZENITH_ORIG' (zenith angle), 'ZENITH_UPDATED' (zenith angle relative to the slope) and 'SUN_AZIMUTH',
+    as float64 NumPy arrays in radians.
+    """
+
+    DOY = get_doy(datetime)
+    HOUR = get_hour(datetime, whole_hours = whole_hours)
+
+    zenith = np.radians(zenith_angle(doy = DOY, lat = LAT, lon = LON, hour = HOUR))
+    slope = np.radians(SLOPE)
+    lat = np.radians(LAT)
+    slope_aspect = np.radians(SLOPE_ASPECT)
+
+    # Ecliptic longitude of the earth's orbit and declination of the sun
+    e = 0.01675 # eccentricity of Earth's orbit
+    w = 2 * np.pi / 365
+    ecliptic_longitude = w * (DOY - 80) + 2 * e * (np.sin(w * DOY) - np.sin(w * 80))
+    solar_declination = np.arcsin(0.39784993 * np.sin(ecliptic_longitude))
+
+    # Azimuth of the sun (from south, without telling morning from afternoon, as in R).
+    # The zenith and the declination come from slightly different formulas, so near solar noon the cosine can leave [-1, 1]
+    # by a hair; it is clipped here, where R returns NaN.
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        if HEMISPHERE == "north":
+            cos_azimuth = (np.sin(lat) * np.cos(zenith) - np.sin(solar_declination)) / (np.cos(lat) * np.sin(zenith))
+        else:
+            # The R script uses an undefined 'z' here; it is the zenith angle
+            cos_azimuth = (np.sin(solar_declination) - np.sin(lat) * np.cos(zenith)) / (np.cos(lat) * np.sin(zenith))
+        sun_azimuth = np.arccos(np.clip(cos_azimuth, -1, 1))
+
+        if SLOPE != 0:
+            zenith_updated = np.arccos(np.cos(zenith) * np.cos(slope) + np.sin(zenith) * np.sin(slope) * np.cos(sun_azimuth - slope_aspect))
+        else:
+            zenith_updated = zenith
+
+    return {'ZENITH_ORIG': zenith, 'ZENITH_UPDATED': zenith_updated, 'SUN_AZIMUTH': sun_azimuth}
+
+# ============================== Solar Radiation =============================
+
+def get_solar_radiation(dt, lat, lon, slope, slope_aspect, hemisphere, ATMOSPHERIC_TRANSMISSIVITY, ELEV, ALBEDO, whole_hours = True):
+
+    """
+    Total solar radiation (direct + diffuse + reflected, W/m2) reaching a point on the Earth's surface, accounting for
+    atmospheric transmissivity but not for shading by vegetation (apply Beer's law for that), as get_solar_radiation in the R script.
+    Unlike the R script, which always computes the zenith for the northern hemisphere, 'hemisphere' is passed on to get_zenith.
+
+    Args:
+    dt (timestamp or array of timestamps): Date and time (local standard time)
+    lat, lon (float): Latitude and longitude (degrees)
+    slope, slope_aspect (float): Slope and aspect of the ground surface (degrees)
+    hemisphere (string): "north" or "south"
+    ATMOSPHERIC_TRANSMISSIVITY (float or array): Ratio of the global solar radiation at the surface to the radiation at the top of the atmosphere (0-1), one value per timestamp or one for all
+    ELEV (float): Elevation (m)
+    ALBEDO (float or array): Albedo of the ground surface (0-1), one value per timestamp or one for all
+    whole_hours (bool): See get_hour.
+
+    Returns:
+    solrad: Solar radiation (W/m2), a float for a single timestamp or a float64 NumPy array with one value per timestamp
+    """
+
+    dt_array = to_datetime64(dt)
+    zenith = get_zenith(datetime = dt_array, LAT = lat, LON = lon, SLOPE = slope, SLOPE_ASPECT = slope_aspect, HEMISPHERE = hemisphere, whole_hours = whole_hours)['ZENITH_UPDATED']
+    doy = get_doy(dt_array)
+    solrad = sum(solar_radiation(doy = doy, psi = zenith, tau = ATMOSPHERIC_TRANSMISSIVITY, elev = ELEV, rho = ALBEDO))
+    return solrad if np.ndim(dt) > 0 else float(solrad[0])
+
+def solarad_timeseries(timestamps, LAT, LON, SLOPE, SLOPE_ASPECT, HEMISPHERE, atmospheric_transmissivity, elev, albedo, whole_hours = True):
+
+    """
+    Solar radiation time series, as solarad_timeseries in the R script.
+
+    Returns:
+    pandas df: Columns 'ts' (the timestamps) and 'solar_radiation' (W/m2).
+    """
+
+    solrads = get_solar_radiation(dt = to_datetime64(timestamps), lat = LAT, lon = LON, slope = SLOPE, slope_aspect = SLOPE_ASPECT,
+                                  hemisphere = HEMISPHERE, ATMOSPHERIC_TRANSMISSIVITY = atmospheric_transmissivity,
+                                  ELEV = elev, ALBEDO = albedo, whole_hours = whole_hours)
+    return pd.DataFrame({'ts': to_datetime64(timestamps), 'solar_radiation': solrads})
+
+# ============================== Reference values from R =============================
+
+def r_reference(timestamps, lat, lon, slope, slope_aspect, hemisphere, ATMOSPHERIC_TRANSMISSIVITY, ELEV, ALBEDO,
+                script_path = "Solar_Radiation_Functions_for_Python.R"):
+
+    """
+    Computes the solar radiation of each timestamp with the original R script (through rpy2), to check this port against it.
+    Only the function definitions of the script are run (not the example at the end, which reads local files).
+    Needs R with the TrenchR, tidyverse and lubridate packages, and rpy2.
+    The R script ignores 'hemisphere' (it always uses "north"), so only northern sites can be compared.
+
+    Returns:
+    float64 NumPy array with one value per timestamp
+    """
+
+    import rpy2.robjects as robjects
+
+    with open(script_path) as f:
+        script = f.read()
+    robjects.r(script.split("# Generate Solar Radiation Time Series")[0])
+    get_solrad = robjects.r['get_solar_radiation']
+    ymd_hms = robjects.r['ymd_hms']
+
+    timestamps = pd.to_datetime(to_datetime64(timestamps))
+    tau = np.broadcast_to(np.asarray(ATMOSPHERIC_TRANSMISSIVITY, dtype = np.float64), (len(timestamps),))
+    albedo = np.broadcast_to(np.asarray(ALBEDO, dtype = np.float64), (len(timestamps),))
+    values = []
+    for i, ts in enumerate(timestamps):
+        result = get_solrad(dt = ymd_hms(ts.strftime("%Y-%m-%d %H:%M:%S")), lat = lat, lon = lon, slope = slope,
+                            slope_aspect = slope_aspect, hemisphere = hemisphere,
+                            ATMOSPHERIC_TRANSMISSIVITY = float(tau[i]), ELEV = ELEV, ALBEDO = float(albedo[i]))
+        values.append(result[0])
+    return(np.array(values, dtype = np.float64))
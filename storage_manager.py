@@ -0,0 +1,222 @@
+# ======================== Notes ===========================================
+
+## storage_manager.py decides where the next burst of images is saved.
+## It knows a list of volumes in order of preference (e.g. the SD card, then a folder on the pi's internal disk),
+## tracks the free space and the measured write throughput of each one, and predicts how long each will last at the
+## current capture rate. A burst is only started on a volume that can hold it (plus a safety reserve): when the SD card
+## fills up, images spill over to the next volume, and when every volume is full the burst is refused instead of
+## failing silently halfway through.
+
+# ======================== Import  Modules ==================================
+
+import collections
+import os
+import threading
+import time
+
+# Space reserved for one frame: the pixels of a 240 x 320 uint16 frame plus room for the tiff/container headers.
+# The same amount is reserved before a frame is saved and given back once it is written (or won't be).
+FRAME_BYTES = 240 * 320 * 2 + 4096
+
+# The function 'directory_usage' returns the total size (in bytes) of the files under 'path'
+
+def directory_usage(path):
+    total = 0
+    for root, directories, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+# ======================== Volume ===========================================
+# The class 'Volume' is one place images can be saved.
+# Argument 'path' is a directory, or a function returning the directory (or None while it is unavailable, e.g. StorageMonitor.directory).
+# Argument 'name' is used in log messages.
+# Argument 'quota_bytes' caps the size of the directory (e.g. to leave room on the internal disk). The quota counts
+# what is actually on disk in the directory, including files from earlier runs.
+# Argument 'usage_refresh' is the time (in seconds) between scans of the directory for the quota. Between scans the
+# bytes written by this process are added to the last scan.
+
+class Volume:
+
+    def __init__(self, path, name = None, quota_bytes = None, usage_refresh = 600):
+        self.path = path
+        self.name = name or str(path)
+        self.quota_bytes = quota_bytes
+        self.usage_refresh = usage_refresh
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self.pending_bytes = 0
+        self.usage = None
+        self.usage_directory = None
+        self.usage_time = 0.0
+        self.bytes_since_scan = 0
+
+    # Returns the directory of the volume, or None if it is not available
+    def directory(self):
+        path = self.path() if callable(self.path) else self.path
+        if path is None or not os.path.isdir(path):
+            return None
+        return os.path.join(path, '')
+
+    # Returns the bytes that can still be written to the volume (free space, limited by the quota), minus writes still queued
+    def free_bytes(self):
+        directory = self.directory()
+        if directory is None:
+            return 0
+        try:
+            stats = os.statvfs(directory)
+        except OSError:
+            return 0
+        free = stats.f_bavail * stats.f_frsize
+        if self.quota_bytes is not None:
+            free = min(free, self.quota_bytes - self.used_bytes())
+        return max(free - self.pending_bytes, 0)
+
+    # Returns the bytes used by the files in the directory (scanned every 'usage_refresh' seconds, or when the directory changes)
+    def used_bytes(self):
+        directory = self.directory()
+        if directory is None:
+            return 0
+        now = time.monotonic()
+        if self.usage is None or directory != self.usage_directory or now - self.usage_time > self.usage_refresh:
+            self.usage = directory_usage(directory)
+            self.usage_directory = directory
+            self.usage_time = now
+            self.bytes_since_scan = 0
+        return self.usage + self.bytes_since_scan
+
+    # Returns the measured write throughput (bytes per second), or None before the first write
+    def throughput(self):
+        if self.write_time <= 0:
+            return None
+        return self.bytes_written / self.write_time
+
+# ======================== Storage Manager ==================================
+# The class 'StorageManager' picks the volume for each burst and keeps track of how fast the volumes are filling up.
+# Argument 'volumes' is a list of Volume objects (or directories) in order of preference.
+# Argument 'reserve_bytes' is the space kept free on every volume (so the filesystem never fills completely).
+# Argument 'rate_window' is the time (in seconds) over which the capture rate is measured.
+# Argument 'frame_bytes' is the space reserved per frame. Bursts reserve a whole number of frames, and every frame gives its
+# reservation back exactly once: when the writer has saved it (see tracked()), or through release_frames() if it wasn't
+# queued for writing (not grabbed, or dropped by the FrameWriter).
+# Usage:
+#     manager = StorageManager([Volume(sd_monitor.directory, name = "SD card"), Volume(SPILLOVER_DIRECTORY, quota_bytes = 2e9)])
+#     directory = manager.directory_for(burst_num * manager.frame_bytes)      # None if the burst does not fit anywhere
+#     writer = FrameWriter(save = manager.tracked(save_frame))
+#     ... capture the burst ...
+#     manager.release_frames(directory, burst_num - frames_queued)
+
+class StorageManager:
+
+    def __init__(self, volumes, reserve_bytes = 50e6, rate_window = 300, frame_bytes = FRAME_BYTES):
+        self.volumes = [v if isinstance(v, Volume) else Volume(v) for v in volumes]
+        self.reserve_bytes = reserve_bytes
+        self.rate_window = rate_window
+        self.frame_bytes = frame_bytes
+        self.lock = threading.Lock()
+        self.reservations = collections.deque()
+        self.current = None
+        self.refused = 0
+
+    # Returns the directory to save a burst of 'nbytes' to, or None if no volume can hold it.
+    # The bytes are counted as pending on that volume until they are written (see tracked()).
+    def directory_for(self, nbytes):
+        with self.lock:
+            for volume in self.volumes:
+                directory = volume.directory()
+                if directory is not None and volume.free_bytes() - self.reserve_bytes >= nbytes:
+                    if self.current is not None and volume is not self.current:
+                        print(f"Saving images to {volume.name} ({directory})")
+                    self.current = volume
+                    volume.pending_bytes += nbytes
+                    self.reservations.append((time.monotonic(), nbytes))
+                    return directory
+            self.refused += 1
+            return None
+
+    # Give back 'nbytes' reserved by directory_for() that will not be written (e.g. the capture failed)
+    def release(self, directory, nbytes):
+        volume = self.volume_of(directory)
+        if volume is None:
+            return
+        with self.lock:
+            volume.pending_bytes = max(volume.pending_bytes - nbytes, 0)
+
+    # Give back the reservation of 'count' frames that will not be written
+    def release_frames(self, directory, count):
+        if count > 0:
+            self.release(directory, count * self.frame_bytes)
+
+    # Returns the volume that 'filename' is saved on, or None
+    def volume_of(self, filename):
+        for volume in self.volumes:
+            directory = volume.directory()
+            if directory is not None and filename.startswith(directory):
+                return volume
+        return None
+
+    # Record that the frame queued for 'filename' ('nbytes' of pixels) was written in 'seconds' (or failed, if 'written' is False).
+    # The reservation of the frame is given back either way.
+    def record_write(self, filename, nbytes, seconds, written = True):
+        volume = self.volume_of(filename)
+        if volume is None:
+            return
+        with self.lock:
+            if written:
+                volume.bytes_written += nbytes
+                volume.write_time += seconds
+                volume.bytes_since_scan += self.frame_bytes
+            volume.pending_bytes = max(volume.pending_bytes - self.frame_bytes, 0)
+
+    # Wrap a FrameWriter save function so every write is timed and counted against the volume it went to
+    def tracked(self, save):
+        def tracked_save(filename, frame, metadata = None):
+            start = time.perf_counter()
+            written = False
+            try:
+                save(filename, frame, metadata)
+                written = True
+            finally:
+                self.record_write(filename, frame.nbytes, time.perf_counter() - start, written)
+        return tracked_save
+
+    # Returns the capture rate (bytes per second) over the last 'rate_window' seconds
+    def capture_rate(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.reservations and now - self.reservations[0][0] > self.rate_window:
+                self.reservations.popleft()
+            if len(self.reservations) < 2:
+                return 0.0
+            elapsed = max(now - self.reservations[0][0], 1.0)
+            return sum(nbytes for t, nbytes in self.reservations) / elapsed
+
+    # Returns the predicted time (in seconds) until every volume is full at 'rate' bytes per second
+    # (default: the measured capture rate). Returns None if nothing is being captured.
+    def time_to_full(self, rate = None):
+        if rate is None:
+            rate = self.capture_rate()
+        if rate <= 0:
+            return None
+        usable = sum(max(volume.free_bytes() - self.reserve_bytes, 0) for volume in self.volumes)
+        return usable / rate
+
+    # Returns one dictionary per volume with its directory, free bytes, bytes written, throughput and time to full
+    def status(self, rate = None):
+        if rate is None:
+            rate = self.capture_rate()
+        report = []
+        for volume in self.volumes:
+            free = max(volume.free_bytes() - self.reserve_bytes, 0)
+            report.append({
+                'name': volume.name,
+                'directory': volume.directory(),
+                'free_bytes': free,
+                'bytes_written': volume.bytes_written,
+                'throughput': volume.throughput(),
+                'time_to_full': free / rate if rate > 0 else None,
+            })
+        return report
@@ -0,0 +1,206 @@
+# ======================== Notes ===========================================
+
+## storage_monitor.py keeps track of the SD card (connected through a USB card reader) without running lsblk or df.
+## Block devices are read from /sys/block and mounts from /proc/self/mountinfo. The kernel flags /proc/self/mountinfo
+## (POLLPRI) whenever the mount table changes, so a background thread sleeps in poll() until a card is mounted or removed,
+## updates the cached mount point and free space, and notifies any listeners (e.g. the capture loop).
+## The paths can point at fixture files, so the parsing can be exercised on any machine.
+
+# ======================== Import  Modules ==================================
+
+import os
+import re
+import select
+import threading
+import time
+
+# ======================== Parse mounts and block devices ===================
+
+MOUNTINFO_PATH = '/proc/self/mountinfo'
+SYS_BLOCK_PATH = '/sys/block'
+MOUNT_PREFIXES = ('/media', '/mnt')
+
+# The function 'unescape' decodes the octal escapes (e.g. \040 for a space) used in /proc/self/mountinfo
+
+def unescape(field):
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), field)
+
+# The function 'parse_mountinfo' parses the text of /proc/self/mountinfo into a list of dictionaries
+# with the keys 'mount_point', 'source', 'fstype' and 'options'
+
+def parse_mountinfo(text):
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        if '-' not in fields:
+            continue
+        separator = fields.index('-')
+        if separator < 6 or len(fields) < separator + 3:
+            continue
+        mounts.append({
+            'mount_point': unescape(fields[4]),
+            'options': fields[5],
+            'fstype': fields[separator + 1],
+            'source': unescape(fields[separator + 2]),
+        })
+    return mounts
+
+# The function 'find_card_mount' returns the mount of the SD card from a list of mounts, or None.
+# Like find_sd_card_mount_point in FLIR_A325sc_Controller_Complete.py, the card is the first mount under /media or /mnt.
+# Mounts of a USB disk (/dev/sdX) are preferred over anything else mounted there.
+
+def find_card_mount(mounts, prefixes = MOUNT_PREFIXES):
+    candidates = [m for m in mounts if m['mount_point'].startswith(prefixes)]
+    for mount in candidates:
+        if os.path.basename(mount['source']).startswith('sd'):
+            return mount
+    if candidates:
+        return candidates[0]
+    return None
+
+# The function 'list_sd_disks' lists the USB disks (sda, sdb, ...) in /sys/block. The USB SD card reader shows up as one of these.
+
+def list_sd_disks(sys_block_path = SYS_BLOCK_PATH):
+    try:
+        return sorted(name for name in os.listdir(sys_block_path) if name.startswith('sd'))
+    except OSError:
+        return []
+
+# ======================== Storage Monitor ==================================
+# The class 'StorageMonitor' caches whether an SD card is connected, where it is mounted and how much space is free.
+# Argument 'mountinfo_path' and 'sys_block_path' default to the live kernel files and can point at fixtures.
+# Argument 'watch' starts a background thread that waits for mount table changes. Without it, call refresh() to update.
+# Argument 'heartbeat' is the time (in seconds) between refreshes of the cached free space while watching.
+# Listeners added with add_listener(function) are called as function(event, mount_point), with event 'inserted' or 'removed'.
+
+class StorageMonitor:
+
+    def __init__(self, mountinfo_path = MOUNTINFO_PATH, sys_block_path = SYS_BLOCK_PATH, watch = True, heartbeat = 5, prefixes = MOUNT_PREFIXES):
+        self.mountinfo_path = mountinfo_path
+        self.sys_block_path = sys_block_path
+        self.heartbeat = heartbeat
+        self.prefixes = prefixes
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.card_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.mount = None
+        self.disks = []
+        self.free_bytes = 0
+        self.total_bytes = 0
+        self.refresh_count = 0
+        self.thread = None
+
+        self.refresh()
+
+        if watch:
+            self.thread = threading.Thread(target = self._watch_loop, daemon = True)
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Returns True if an SD card is mounted. Reads the cached state only.
+    def is_connected(self):
+        return self.mount is not None
+
+    # Returns the mount point of the SD card (or None). Reads the cached state only.
+    @property
+    def mount_point(self):
+        mount = self.mount
+        return None if mount is None else mount['mount_point']
+
+    # Returns the directory images should be saved to (the mount point with a trailing separator), or None
+    def directory(self):
+        mount_point = self.mount_point
+        return None if mount_point is None else os.path.join(mount_point, '')
+
+    def add_listener(self, function):
+        self.listeners.append(function)
+
+    # Block until an SD card is mounted or 'timeout' seconds have passed. Returns is_connected().
+    def wait_for_card(self, timeout = None):
+        self.card_event.wait(timeout)
+        return self.is_connected()
+
+    # Re-read the mount table and block devices and update the cached state. Notifies listeners if the card changed.
+    def refresh(self):
+        with open(self.mountinfo_path) as f:
+            mounts = parse_mountinfo(f.read())
+        disks = list_sd_disks(self.sys_block_path)
+        mount = find_card_mount(mounts, self.prefixes)
+
+        with self.lock:
+            previous = self.mount_point
+            self.mount = mount
+            self.disks = disks
+            self.refresh_count += 1
+        self.update_free_space()
+
+        if mount is None:
+            self.card_event.clear()
+        else:
+            self.card_event.set()
+
+        current = self.mount_point
+        if previous != current:
+            if previous is not None:
+                self._notify('removed', previous)
+            if current is not None:
+                self._notify('inserted', current)
+
+    # Update the cached free and total space of the card (one statvfs call, no subprocess)
+    def update_free_space(self):
+        mount_point = self.mount_point
+        if mount_point is None:
+            self.free_bytes = 0
+            self.total_bytes = 0
+            return
+        try:
+            stats = os.statvfs(mount_point)
+            self.free_bytes = stats.f_bavail * stats.f_frsize
+            self.total_bytes = stats.f_blocks * stats.f_frsize
+        except OSError:
+            self.free_bytes = 0
+            self.total_bytes = 0
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _notify(self, event, mount_point):
+        for function in list(self.listeners):
+            try:
+                function(event, mount_point)
+            except Exception as e:
+                print(f"Error in storage listener: {e}")
+
+    def _watch_loop(self):
+        f = open(self.mountinfo_path)
+        poller = select.poll()
+        poller.register(f, select.POLLPRI | select.POLLERR)
+        last_update = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                # Wake up when the mount table changes (or once a second to check whether the monitor was closed)
+                events = poller.poll(1000)
+                if self.stop_event.is_set():
+                    break
+                if events:
+                    f.seek(0)
+                    f.read()
+                    # Give the desktop automounter a moment to finish mounting every partition
+                    time.sleep(0.1)
+                    self.refresh()
+                    last_update = time.monotonic()
+                elif time.monotonic() - last_update >= self.heartbeat:
+                    self.update_free_space()
+                    last_update = time.monotonic()
+        finally:
+            f.close()
@@ -0,0 +1,376 @@
+# ======================== Notes ===========================================
+
+## temperature_writers.py saves the temperature frames computed by RadianceToTemp.py.
+## A text csv of a 240 x 320 frame takes about 2 MB and a long time to write and parse back, so the results are saved in
+## binary formats instead. Every writer is called as writer(np_array = ..., outdir = ..., filename = ...), like
+## save_np_as_csv, and has an 'extension' used to name the files:
+##   - TiffWriter()             float32 tiff (exact)
+##   - TiffWriter(scale = 100)  int16 tiff in centi-degrees (0.01 C steps, -327.67 to 327.67 C, half the size)
+##   - NpyWriter()              float32 .npy (exact)
+##   - NpzWriter()              zlib compressed float32 .npz (exact)
+##   - TemperatureStore()       one compressed file per session, chunks of frames in centi-degrees (see below)
+## Writers can be called from several threads at once (convert_batch writes the frames of a chunk in parallel).
+## Tiffs and .npy files are uncompressed and can be memory-mapped (see frame_dataset.read_tiff); read_temperature
+## reads any of the per-frame formats back as float32 Celcius. NaN (no valid temperature) is kept by every format.
+##
+## Session store layout (little endian):
+##     header:  magic b'FLIRTMP1' | version (uint16) | height (uint32) | width (uint32) | encoding (uint8, 0 float32, 1 int16) | scale (float64) | 5 bytes padding   = 32 bytes
+##     chunks:  frame count (uint32) | names length (uint32) | data length (uint64) | names (json list) | zlib data
+## The frames of a chunk are stacked and byte-shuffled (the high bytes of all pixels first, then the low bytes) before
+## compression, which compresses smooth thermal images much better than the interleaved bytes. As in frame_container.py,
+## a chunk that was only partially written is ignored by the reader and dropped when the store is appended to.
+
+# ======================== Import  Modules ==================================
+
+import datetime
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from frame_dataset import TAG_SAMPLE_FORMAT, read_tiff, read_tiff_tags
+
+# ======================== Scaled integers ==================================
+
+TAG_IMAGE_DESCRIPTION = 270
+
+# The ImageDescription of a temperature tiff starts with this, followed by a json record of the encoding
+DESCRIPTION_PREFIX = "flir-temperature "
+
+# Scaled integer that stands for NaN
+NAN_CODE = -32768
+
+# The function 'to_scaled' returns 'frame' (Celcius) as int16 multiples of 1 / scale (e.g. centi-degrees for scale 100).
+# NaN is stored as NAN_CODE and temperatures out of range are clipped.
+
+def to_scaled(frame, scale = 100):
+    frame = np.asarray(frame, dtype = np.float32)
+    codes = np.rint(frame * np.float32(scale))
+    nan = np.isnan(codes)
+    np.clip(codes, NAN_CODE + 1, 32767, out = codes)
+    codes[nan] = NAN_CODE
+    return codes.astype('<i2')
+
+# The function 'from_scaled' is the inverse of to_scaled and returns float32 Celcius
+
+def from_scaled(codes, scale = 100):
+    frame = np.asarray(codes).astype(np.float32) / np.float32(scale)
+    frame[np.asarray(codes) == NAN_CODE] = np.nan
+    return frame
+
+# ======================== Per-frame writers ================================
+# The class 'TiffWriter' saves each frame as an uncompressed tiff.
+# Argument 'scale' is None for float32 pixels, or the number of steps per degree of int16 pixels (100: centi-degrees).
+
+class TiffWriter:
+
+    extension = ".tiff"
+
+    def __init__(self, scale = None):
+        self.scale = scale
+
+    def __call__(self, np_array, outdir, filename):
+        if self.scale is None:
+            image = Image.fromarray(np.asarray(np_array, dtype = np.float32))
+            record = {'units': 'C', 'scale': 1}
+            tags = {}
+        else:
+            # PIL has no signed 16 bit mode, so the pixels are written as 16 bit and marked as signed with the SampleFormat tag
+            codes = to_scaled(np_array, self.scale)
+            image = Image.frombytes('I;16', (codes.shape[1], codes.shape[0]), codes.tobytes())
+            record = {'units': 'C', 'scale': self.scale, 'nan': NAN_CODE}
+            tags = {TAG_SAMPLE_FORMAT: 2}
+        tags[TAG_IMAGE_DESCRIPTION] = DESCRIPTION_PREFIX + json.dumps(record)
+        image.save(outdir + filename, tiffinfo = tags)
+
+# The class 'NpyWriter' saves each frame as a float32 .npy file
+
+class NpyWriter:
+
+    extension = ".npy"
+
+    def __call__(self, np_array, outdir, filename):
+        np.save(outdir + filename, np.asarray(np_array, dtype = np.float32))
+
+# The class 'NpzWriter' saves each frame as a float32 .npz file (array 'temperature').
+# Argument 'compressed' compresses the file with zlib.
+
+class NpzWriter:
+
+    extension = ".npz"
+
+    def __init__(self, compressed = True):
+        self.compressed = compressed
+
+    def __call__(self, np_array, outdir, filename):
+        save = np.savez_compressed if self.compressed else np.savez
+        save(outdir + filename, temperature = np.asarray(np_array, dtype = np.float32))
+
+# The function 'read_temperature' reads a frame saved by any of the per-frame writers (or save_np_as_csv) and returns
+# it as float32 Celcius. Uncompressed float32 tiffs and .npy files are memory-mapped.
+
+def read_temperature(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ('.tiff', '.tif'):
+        with open(file_path, 'rb') as f:
+            tags, order = read_tiff_tags(f)
+        description = tags.get(TAG_IMAGE_DESCRIPTION, ("",))[0]
+        scale = 1
+        if isinstance(description, str) and description.startswith(DESCRIPTION_PREFIX):
+            scale = json.loads(description[len(DESCRIPTION_PREFIX):]).get('scale', 1)
+        frame = read_tiff(file_path)
+        if frame.dtype == np.int16:
+            return from_scaled(frame, scale)
+        return frame
+    if extension == '.npy':
+        return np.load(file_path, mmap_mode = 'r')
+    if extension == '.npz':
+        with np.load(file_path) as npz:
+            return npz['temperature']
+    if extension == '.csv':
+        return np.loadtxt(file_path, delimiter = ",", dtype = np.float32)
+    raise ValueError(f"Unknown temperature file format: {file_path}")
+
+# ======================== Session store ====================================
+
+MAGIC = b'FLIRTMP1'
+VERSION = 1
+HEADER = struct.Struct('<8sHIIBd5x')
+CHUNK_HEADER = struct.Struct('<IIQ')
+EXTENSION = '.temps'
+ENCODING_FLOAT32 = 0
+ENCODING_INT16 = 1
+
+# The function 'read_store_header' returns (height, width, encoding, scale) from the header of a session store
+
+def read_store_header(f):
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("File is too short to be a temperature store")
+    magic, version, height, width, encoding, scale = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("Not a temperature store (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported temperature store version: {version}")
+    return height, width, encoding, scale
+
+# The function 'scan_chunks' returns a list of (data offset, data length, names) for every complete chunk of a store,
+# and the offset where the complete chunks end
+
+def scan_chunks(f, size):
+    chunks = []
+    position = HEADER.size
+    while position + CHUNK_HEADER.size <= size:
+        f.seek(position)
+        count, names_length, data_length = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        end = position + CHUNK_HEADER.size + names_length + data_length
+        if end > size:
+            break
+        names = json.loads(f.read(names_length).decode('utf-8'))
+        if len(names) != count:
+            break
+        chunks.append((position + CHUNK_HEADER.size + names_length, data_length, names))
+        position = end
+    return chunks, position
+
+def _shuffle(stack):
+    # Byte planes of the whole stack: all first bytes, then all second bytes, ...
+    return np.ascontiguousarray(stack.view(np.uint8).reshape(-1, stack.dtype.itemsize).T).tobytes()
+
+def _unshuffle(data, dtype, shape):
+    planes = np.frombuffer(data, dtype = np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+
+# The class 'TemperatureStoreWriter' appends temperature frames to a session store. An existing store is appended to.
+# Argument 'path' is the store file.
+# Argument 'shape' is the (height, width) of the frames.
+# Argument 'chunk_frames' is the number of frames compressed together.
+# Argument 'scale' is the number of int16 steps per degree (100: centi-degrees), or None to store float32.
+# Argument 'level' is the zlib compression level (1 fastest - 9 smallest).
+# append() can be called from several threads: frames are compressed in the calling threads and only the file write is serialized.
+
+class TemperatureStoreWriter:
+
+    def __init__(self, path, shape = (240, 320), chunk_frames = 16, scale = 100, level = 6):
+        self.path = path
+        self.shape = tuple(shape)
+        self.chunk_frames = chunk_frames
+        self.scale = scale
+        self.level = level
+        self.encoding = ENCODING_FLOAT32 if scale is None else ENCODING_INT16
+        self.dtype = np.dtype('<f4' if scale is None else '<i2')
+        self.buffer = []
+        self.buffer_lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        self.frame_count = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                height, width, encoding, stored_scale = read_store_header(f)
+                if (height, width) != self.shape or encoding != self.encoding or (scale is not None and stored_scale != scale):
+                    raise ValueError(f"Store {path} holds frames of a different shape or encoding")
+                chunks, end = scan_chunks(f, os.path.getsize(path))
+            # Drop a partially written chunk left behind by an interrupted write before appending
+            self.frame_count = sum(len(names) for offset, length, names in chunks)
+            self.file = open(path, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION, self.shape[0], self.shape[1], self.encoding, float(scale or 1)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Add one frame (Celcius) under 'name'
+    def append(self, name, frame):
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match store shape {self.shape}")
+        # The frame is copied, so the caller can reuse its buffer as soon as append returns
+        frame = np.array(frame, dtype = self.dtype) if self.scale is None else to_scaled(frame, self.scale)
+        batch = None
+        with self.buffer_lock:
+            self.buffer.append((name, frame))
+            if len(self.buffer) >= self.chunk_frames:
+                batch, self.buffer = self.buffer, []
+        if batch is not None:
+            self._write_chunk(batch)
+
+    def _write_chunk(self, batch):
+        names = json.dumps([name for name, frame in batch]).encode('utf-8')
+        data = zlib.compress(_shuffle(np.stack([frame for name, frame in batch])), self.level)
+        with self.file_lock:
+            self.file.write(CHUNK_HEADER.pack(len(batch), len(names), len(data)))
+            self.file.write(names)
+            self.file.write(data)
+            self.frame_count += len(batch)
+
+    # Write the frames that don't fill a chunk yet
+    def flush(self):
+        with self.buffer_lock:
+            batch, self.buffer = self.buffer, []
+        if batch:
+            self._write_chunk(batch)
+        with self.file_lock:
+            self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+# The class 'TemperatureStoreReader' gives random access to the frames of a session store.
+# reader[i] returns frame i as float32 Celcius, reader.read(name) the frame saved under 'name', and reader.names lists the names in order.
+# Frames are stored in the order they were appended, which is not the capture order when several threads write at once.
+# The most recently read chunk is kept decompressed, so reading the frames in order decompresses every chunk once.
+
+class TemperatureStoreReader:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            height, width, encoding, scale = read_store_header(f)
+            self.chunks, end = scan_chunks(f, os.path.getsize(path))
+        self.shape = (height, width)
+        self.scale = None if encoding == ENCODING_FLOAT32 else scale
+        self.dtype = np.dtype('<f4' if encoding == ENCODING_FLOAT32 else '<i2')
+        self.names = [name for offset, length, names in self.chunks for name in names]
+        self.locations = []
+        for chunk, (offset, length, names) in enumerate(self.chunks):
+            self.locations.extend((chunk, i) for i in range(len(names)))
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.cached = (None, None)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        chunk, position = self.locations[index]
+        return self._chunk(chunk)[position]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def read(self, name):
+        return self[self.index[name]]
+
+    def _chunk(self, chunk):
+        if self.cached[0] != chunk:
+            offset, length, names = self.chunks[chunk]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = zlib.decompress(f.read(length))
+            stack = _unshuffle(data, self.dtype, (len(names),) + self.shape)
+            stack = stack.astype(np.float32) if self.scale is None else from_scaled(stack, self.scale)
+            self.cached = (chunk, stack)
+        return self.cached[1]
+
+# The class 'TemperatureStore' is the pluggable writer for session stores: frames are appended to one store per session
+# in each output directory, under their filename.
+# Argument 'session_name' names the store files (default: session-YYYYMMDD-HHMMSS from the time the writer is created).
+# The other arguments are passed to TemperatureStoreWriter (the shape is that of the first frame). close() writes the
+# last chunk and must be called at the end.
+
+class TemperatureStore:
+
+    extension = ""
+
+    def __init__(self, session_name = None, chunk_frames = 16, scale = 100, level = 6):
+        if session_name is None:
+            session_name = "session-" + datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.session_name = session_name
+        self.options = dict(chunk_frames = chunk_frames, scale = scale, level = level)
+        self.writers = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Returns the store path used for frames saved to 'outdir'
+    def store_path(self, outdir):
+        return outdir + self.session_name + EXTENSION
+
+    def __call__(self, np_array, outdir, filename):
+        with self.lock:
+            writer = self.writers.get(outdir)
+            if writer is None:
+                writer = TemperatureStoreWriter(self.store_path(outdir), shape = np.shape(np_array), **self.options)
+                self.writers[outdir] = writer
+        writer.append(filename, np_array)
+
+    def close(self):
+        with self.lock:
+            writers, self.writers = self.writers, {}
+        for writer in writers.values():
+            writer.close()
+
+# ======================== Writer names =====================================
+# Writers by name (e.g. for the --format option of RadianceToTemp.py). Each entry is a function returning a new writer.
+
+WRITERS = {
+    'tiff': lambda: TiffWriter(),
+    'tiff16': lambda: TiffWriter(scale = 100),
+    'npy': lambda: NpyWriter(),
+    'npz': lambda: NpzWriter(),
+    'store': lambda: TemperatureStore(),
+}
+
+# The function 'make_writer' returns a new writer by name (see WRITERS)
+
+def make_writer(name):
+    if name not in WRITERS:
+        raise ValueError(f"Unknown output format: {name} (choose from {', '.join(WRITERS)})")
+    return WRITERS[name]()
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import fake_pyspin
+from camera_monitor import CameraMonitor
+
+
+@pytest.fixture(autouse = True)
+def instant_sdk(monkeypatch):
+    for name in ('SYSTEM_DELAY', 'ENUMERATE_DELAY'):
+        monkeypatch.setattr(fake_pyspin, name, 0)
+    monkeypatch.setattr(fake_pyspin, 'connected_cameras', 1)
+    monkeypatch.setattr(fake_pyspin.System, '_instance', None)
+    monkeypatch.setattr(fake_pyspin.System, '_cameras', {})
+    monkeypatch.setattr(fake_pyspin.System, '_handlers', [])
+
+
+def test_events_update_the_cached_state_without_scanning():
+    with CameraMonitor(pyspin = fake_pyspin) as monitor:
+        assert monitor.is_connected()
+        assert monitor.enumeration_count == 1
+        fake_pyspin.unplug_camera()
+        assert not monitor.is_connected()
+        fake_pyspin.plug_camera()
+        assert monitor.camera_count() == 1
+        assert monitor.enumeration_count == 1
+    assert fake_pyspin.System._handlers == []
+
+
+def test_heartbeat_refreshes_without_events():
+    with CameraMonitor(pyspin = fake_pyspin, heartbeat = 0.01, use_events = False) as monitor:
+        assert monitor.is_connected()
+        fake_pyspin.unplug_camera()
+        scans = monitor.enumeration_count + 2
+        while monitor.enumeration_count < scans:
+            time.sleep(0.01)
+        assert not monitor.is_connected()
+        fake_pyspin.plug_camera()
+        assert monitor.wait_for_camera(timeout = 2)
+    assert monitor.thread is None
+
+
+def test_wait_for_camera_times_out():
+    fake_pyspin.connected_cameras = 0
+    with CameraMonitor(pyspin = fake_pyspin) as monitor:
+        assert not monitor.wait_for_camera(timeout = 0.05, poll = 0.01)
+
+
+def test_close_releases_the_system_instance():
+    monitor = CameraMonitor(pyspin = fake_pyspin)
+    assert fake_pyspin.System._instance is not None
+    monitor.close()
+    assert fake_pyspin.System._instance is None
+    assert monitor.system is None
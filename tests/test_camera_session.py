@@ -0,0 +1,99 @@
+import datetime
+import os
+
+import pytest
+
+import fake_pyspin
+from camera_session import CameraSession, burst_intervals, frame_filename
+from frame_metadata import metadata_from_filename, read_frame_metadata
+from frame_writer import FrameWriter
+
+
+@pytest.fixture(autouse = True)
+def instant_sdk(monkeypatch):
+    for name in ('SYSTEM_DELAY', 'ENUMERATE_DELAY', 'INIT_DELAY', 'BEGIN_DELAY', 'END_DELAY', 'DEINIT_DELAY'):
+        monkeypatch.setattr(fake_pyspin, name, 0)
+    monkeypatch.setattr(fake_pyspin, 'FRAME_PERIOD', 0.001)
+    monkeypatch.setattr(fake_pyspin, 'connected_cameras', 1)
+    monkeypatch.setattr(fake_pyspin.System, '_cameras', {})
+
+
+# Make the camera fail the frame grabs listed in 'failures' (counted from 1 over the whole test)
+def fail_grabs(monkeypatch, failures):
+    grab = fake_pyspin.Camera.GetNextImage
+    calls = [0]
+
+    def flaky(camera, timeout = 1000):
+        calls[0] += 1
+        if calls[0] in failures:
+            raise fake_pyspin.SpinnakerException("Failed waiting for EventData on NEW_BUFFER_DATA event")
+        return grab(camera, timeout)
+
+    monkeypatch.setattr(fake_pyspin.Camera, 'GetNextImage', flaky)
+    return calls
+
+
+def test_burst_saves_every_frame(tmp_path):
+    directory = str(tmp_path) + os.sep
+    with CameraSession(pyspin = fake_pyspin) as session:
+        filenames = session.capture(directory, "tiff", burst_num = 3)
+    assert len(filenames) == 3
+    assert sorted(os.path.basename(f) for f in filenames) == sorted(name for name in os.listdir(tmp_path) if name.endswith(".tiff"))
+
+
+def test_retry_only_grabs_the_remaining_frames(tmp_path, monkeypatch):
+    calls = fail_grabs(monkeypatch, {3})
+    directory = str(tmp_path) + os.sep
+    with FrameWriter() as writer, CameraSession(pyspin = fake_pyspin, writer = writer) as session:
+        filenames = session.capture(directory, "tiff", burst_num = 3)
+        writer.flush()
+        assert writer.stats()['queued'] == 3
+    assert session.reconnect_count == 1
+    assert calls[0] == 4 # 2 frames, the failure, then the last frame
+    assert len(filenames) == 3
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_failed_capture_keeps_the_saved_frames(tmp_path, monkeypatch):
+    fail_grabs(monkeypatch, {2, 3})
+    directory = str(tmp_path) + os.sep
+    session = CameraSession(pyspin = fake_pyspin, retries = 1)
+    with pytest.raises(fake_pyspin.SpinnakerException):
+        session.capture(directory, "tiff", burst_num = 3)
+    assert [frame['saved'] for frame in session.last_burst] == [True]
+    # The frame saved inline before the failure is in the sidecar index
+    assert os.path.basename(session.last_burst[0]['filename']) in open(tmp_path / "frames.csv").read()
+
+
+def test_frame_filenames_carry_the_capture_time_and_frame_id():
+    capture_time = datetime.datetime(2024, 7, 11, 12, 11, 0, 123456)
+    filename = frame_filename("/data/", capture_time, 42, "tiff")
+    assert filename == "/data/file-20240711-121100-123456_f000042.tiff"
+    metadata = metadata_from_filename(filename)
+    assert metadata['capture_time'] == capture_time
+    assert metadata['frame_id'] == 42
+
+
+@pytest.mark.parametrize('use_writer, source', [(True, 'tags'), (False, 'sidecar')])
+def test_burst_frames_are_stamped_with_the_device_clock(tmp_path, use_writer, source):
+    directory = str(tmp_path) + os.sep
+    writer = FrameWriter() if use_writer else None
+    with CameraSession(pyspin = fake_pyspin, writer = writer) as session:
+        frames = session.burst(directory, "tiff", burst_num = 4)
+    if writer is not None:
+        writer.close()
+    ids = [frame['frame_id'] for frame in frames]
+    assert ids == list(range(ids[0], ids[0] + 4))
+    intervals = burst_intervals(frames)
+    assert all(interval > 0 for interval in intervals)
+    for previous, frame, interval in zip(frames, frames[1:], intervals):
+        # The capture times follow the device clock, to the microsecond
+        spacing = (frame['capture_time'] - previous['capture_time']).total_seconds()
+        assert spacing == pytest.approx(interval, abs = 2e-6)
+        assert spacing < 1
+    for frame in frames:
+        assert frame['saved']
+        assert os.path.basename(frame['filename']).endswith("_f" + str(frame['frame_id']).zfill(6) + ".tiff")
+        metadata = read_frame_metadata(frame['filename'])
+        assert metadata['source'] == source
+        assert (metadata['frame_id'], metadata['device_timestamp'], metadata['capture_time']) == (frame['frame_id'], frame['device_timestamp'], frame['capture_time'])
@@ -0,0 +1,60 @@
+import pytest
+
+from camera_telnet import AutofocusTimeout, CameraCommandClient, CameraCommandError, FakeCameraTelnetServer
+
+
+@pytest.fixture
+def server():
+    with FakeCameraTelnetServer(latency = 0, focus_time = 0.2, connect_delay = 0) as server:
+        yield server
+
+
+def test_rls_and_rset_round_trip(server):
+    with CameraCommandClient(server.host, server.port) as camera:
+        assert camera.get('.image.sysimg.basicImgData.objectParams.emissivity') == '0.95'
+        camera.rset('.image.sysimg.basicImgData.objectParams.emissivity', '0.98')
+        assert camera.get('.image.sysimg.basicImgData.objectParams.emissivity') == '0.98'
+        assert camera.rls('.system.focus') == {'autofull': 'false', 'position': '1700'}
+    assert server.connections == 1
+
+
+def test_pipeline_returns_one_reply_per_command(server):
+    with CameraCommandClient(server.host, server.port) as camera:
+        replies = camera.pipeline(['rls .system.focus.position', 'rset .system.focus.position 1800', 'rls .system.focus.position'])
+    assert replies == ['1700', '', '1800']
+
+
+def test_shell_errors_raise(server):
+    with CameraCommandClient(server.host, server.port) as camera:
+        with pytest.raises(CameraCommandError):
+            camera.get('.no.such.node')
+
+
+def test_autofocus_returns_once_the_focus_node_reads_false(server):
+    with CameraCommandClient(server.host, server.port) as camera:
+        seconds = camera.autofocus(timeout = 5, poll = 0.01)
+        assert 0.2 <= seconds < 1
+        assert camera.focus_position() == server.focused_position
+
+
+def test_autofocus_that_never_finishes_times_out(server):
+    server.focus_time = None
+    with CameraCommandClient(server.host, server.port) as camera:
+        with pytest.raises(AutofocusTimeout, match = "did not finish within 0.2 s"):
+            camera.autofocus(timeout = 0.2, poll = 0.01)
+
+
+def test_a_dropped_connection_is_opened_again(server):
+    with CameraCommandClient(server.host, server.port) as camera:
+        camera.get('.system.focus.position')
+        camera.sock.close()
+        assert camera.get('.system.focus.position') == '1700'
+    assert server.connections == 2
+
+
+def test_no_camera_raises_instead_of_hanging():
+    with FakeCameraTelnetServer() as server:
+        port = server.port
+    camera = CameraCommandClient('127.0.0.1', port, timeout = 0.2, connect_timeout = 0.2)
+    with pytest.raises(CameraCommandError):
+        camera.get('.system.focus.position')
@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+
+import pytest
+
+from capture_scheduler import AdaptivePeriod, CaptureScheduler, CronSchedule, FakeClock, SolarSchedule, parse_cron_field
+
+
+def test_slots_stay_on_their_deadlines_however_long_captures_take():
+    clock = FakeClock()
+    scheduler = CaptureScheduler(5, duration = 60, clock = clock)
+    deadlines = []
+    for slot in scheduler:
+        deadlines.append(slot.deadline)
+        clock.advance(2.5) # the capture
+    assert deadlines == [5.0 * i for i in range(12)]
+    assert scheduler.stats()['late'] == 0
+    assert scheduler.stats()['missed'] == 0
+
+
+def test_a_stall_misses_slots_instead_of_pushing_them_back():
+    clock = FakeClock()
+    scheduler = CaptureScheduler(5, duration = 60, clock = clock)
+    slots = []
+    for slot in scheduler:
+        slots.append(slot)
+        clock.advance(17 if slot.index == 2 else 0.5)
+    # Slots at 15, 20 and 25 were missed during the stall at 10-27 (25 by more than miss_after); the next one fires on its deadline
+    assert [slot.deadline for slot in slots] == [0, 5, 10, 30, 35, 40, 45, 50, 55]
+    assert slots[3].missed == 3
+    assert scheduler.stats()['missed'] == 3
+
+
+def test_a_slot_within_miss_after_fires_late():
+    clock = FakeClock()
+    scheduler = CaptureScheduler(5, duration = 20, miss_after = 1.0, clock = clock)
+    slots = []
+    for slot in scheduler:
+        slots.append(slot)
+        clock.advance(5.5 if slot.index == 0 else 0.1)
+    assert slots[1].deadline == 5
+    assert slots[1].lateness == pytest.approx(0.5)
+    assert scheduler.stats()['late'] == 1
+    assert scheduler.stats()['missed'] == 0
+
+
+def test_the_session_never_runs_past_its_duration():
+    clock = FakeClock()
+    scheduler = CaptureScheduler(5, duration = 12, clock = clock)
+    fired = [slot.fired for slot in scheduler]
+    assert fired == [0, 5, 10]
+    assert clock.monotonic() == 10
+
+
+def test_adaptive_period_takes_effect_from_the_next_slot():
+    clock = FakeClock()
+    schedule = AdaptivePeriod(10, min_period = 2, max_period = 10)
+    scheduler = CaptureScheduler(schedule, duration = 30, clock = clock)
+    deadlines = []
+    for slot in scheduler:
+        deadlines.append(slot.deadline)
+        if slot.index == 1:
+            schedule.set_period(1) # clamped to min_period
+            scheduler.reschedule()
+    assert deadlines[:4] == [0, 10, 12, 14]
+    assert schedule.period == 2
+
+
+def test_async_slots_use_the_same_deadlines():
+    clock = FakeClock()
+    scheduler = CaptureScheduler(5, duration = 20, clock = clock)
+    async def collect():
+        return [slot.deadline async for slot in scheduler]
+    assert asyncio.run(collect()) == [0, 5, 10, 15]
+
+
+def test_cron_fields():
+    assert parse_cron_field("*/15", 0, 59) == [0, 15, 30, 45]
+    assert parse_cron_field("6-8,20", 0, 23) == [6, 7, 8, 20]
+    with pytest.raises(ValueError):
+        parse_cron_field("25", 0, 23)
+
+
+def test_cron_schedule_fires_on_wall_clock_times():
+    start = datetime.datetime(2024, 7, 11, 5, 58, 30)
+    clock = FakeClock(wall_time = start.timestamp())
+    scheduler = CaptureScheduler(CronSchedule("*/10 6-7 * * *"), clock = clock)
+    times = []
+    for slot in scheduler:
+        times.append(datetime.datetime.fromtimestamp(clock.time()).replace(microsecond = 0))
+        if len(times) == 3:
+            break
+    assert times == [datetime.datetime(2024, 7, 11, 6, 0), datetime.datetime(2024, 7, 11, 6, 10), datetime.datetime(2024, 7, 11, 6, 20)]
+
+
+def test_solar_schedule_waits_for_sunrise():
+    # Midnight UTC at the Greenwich meridian: the first slot is at sunrise, around 4:00 UTC in July
+    midnight = datetime.datetime(2024, 7, 11, tzinfo = datetime.timezone.utc).timestamp()
+    clock = FakeClock(wall_time = midnight)
+    schedule = SolarSchedule(51.5, 0.0, period = 60)
+    scheduler = CaptureScheduler(schedule, clock = clock)
+    first = scheduler.wait()
+    second = scheduler.wait()
+    sunrise = datetime.datetime.fromtimestamp(clock.time() - 60, datetime.timezone.utc)
+    assert 3 <= sunrise.hour <= 5
+    assert second.deadline - first.deadline == pytest.approx(60)
@@ -0,0 +1,129 @@
+import asyncio
+
+from controller_state_machine import Controller, SimulatedHardware, State
+from thermal_trigger import HybridTrigger
+
+
+def fast_hardware(**kwargs):
+    timings = dict(boot_time = 0.1, focus_time = 0.02, capture_time = 0.01, display_time = 0.01)
+    timings.update(kwargs)
+    return SimulatedHardware(**timings)
+
+
+def fast_controller(hardware, **kwargs):
+    settings = dict(duration = 0.3, frequency = 0.05, connect_timeout = 1, restart_off_time = 0.3, connect_poll = 0.01,
+                    telemetry_period = 0.5, storage_period = 0.5)
+    settings.update(kwargs)
+    return Controller(hardware, **settings)
+
+
+# Run 'controller' through 'scenario' (an async function of the controller), then until it is back in IDLE
+def run(controller, scenario, timeout = 5):
+    async def main():
+        runner = asyncio.create_task(controller.run())
+        await asyncio.sleep(0.05)
+        await scenario(controller)
+        deadline = controller.loop.time() + timeout
+        while controller.state is not State.IDLE and controller.loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        controller.stop()
+        await runner
+    asyncio.run(main())
+
+
+async def one_trigger(controller):
+    controller.hardware.set_motion(True)
+    await asyncio.sleep(0.1)
+    controller.hardware.set_motion(False)
+
+
+def visited(controller):
+    return [state for previous, state, time in controller.transitions]
+
+
+def test_motion_runs_one_capture_window():
+    hardware = fast_hardware()
+    controller = fast_controller(hardware)
+    run(controller, one_trigger)
+    assert visited(controller) == [State.POWERING, State.CONNECTING, State.FOCUSING, State.CAPTURING, State.COOLDOWN, State.IDLE]
+    assert controller.captures >= 3
+    assert controller.captures == len(hardware.captured)
+    assert controller.failed_captures == 0
+    assert len(controller.first_frame_times) == 1
+    assert not hardware.powered
+
+
+def test_frozen_camera_is_power_cycled():
+    hardware = fast_hardware(frozen_boots = 1)
+    controller = fast_controller(hardware, connect_timeout = 0.2)
+    run(controller, one_trigger)
+    assert controller.restarts == 1
+    assert hardware.boots == 2
+    assert controller.captures > 0
+
+
+def test_motion_during_the_power_cycle_does_not_switch_the_camera_on():
+    hardware = fast_hardware(frozen_boots = 1)
+    controller = fast_controller(hardware, connect_timeout = 0.2, restart_off_time = 0.5)
+    powered = []
+    async def scenario(controller):
+        hardware.set_motion(True)
+        while controller.restarts == 0:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        # More motion half way through the restart pause
+        hardware.set_motion(False)
+        hardware.set_motion(True)
+        powered.append(hardware.powered)
+        hardware.set_motion(False)
+    run(controller, scenario)
+    assert powered == [False]
+    assert hardware.boots == 2
+
+
+def test_bursts_are_refused_when_the_storage_is_full():
+    hardware = fast_hardware(free_bursts = 2)
+    controller = fast_controller(hardware)
+    run(controller, one_trigger)
+    assert controller.captures == 2
+    assert controller.refused_bursts > 0
+    assert hardware.storage_warning() is not None
+
+
+def test_failed_captures_are_counted_and_the_window_goes_on():
+    class FlakyHardware(SimulatedHardware):
+        def capture(self, directory):
+            if len(self.captured) == 0 and not getattr(self, 'failed', False):
+                self.failed = True
+                raise RuntimeError("camera disconnected")
+            return super().capture(directory)
+    hardware = FlakyHardware(boot_time = 0.1, focus_time = 0.02, capture_time = 0.01, display_time = 0.01)
+    controller = fast_controller(hardware)
+    run(controller, one_trigger)
+    assert controller.failed_captures == 1
+    assert controller.captures > 0
+
+
+def test_a_rejected_pir_event_held_high_does_not_boot_the_camera():
+    hardware = fast_hardware()
+    controller = fast_controller(hardware, hybrid = HybridTrigger(warm_time = 0.4, preview_period = 0.02, confirm_window = 0.1))
+    async def scenario(controller):
+        await one_trigger(controller)
+        while controller.state is not State.PREVIEW:
+            await asyncio.sleep(0.01)
+        # Something cold moves in front of the PIR, which stays high until the preview is over
+        hardware.set_motion(True)
+        deadline = controller.loop.time() + 2
+        while State.IDLE not in visited(controller)[1:] and controller.loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)
+        hardware.set_motion(False)
+    run(controller, scenario)
+    assert visited(controller)[-3:] == [State.COOLDOWN, State.PREVIEW, State.IDLE]
+    assert controller.hybrid.rejected == 1
+    assert controller.cold_boots == 1
+    assert hardware.boots == 1
+    assert not hardware.powered
+    # The preview used the session of the capture window instead of opening a new one
+    assert hardware.sessions == 1
+    assert not hardware.session_open
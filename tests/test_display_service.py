@@ -0,0 +1,67 @@
+import pytest
+from PIL import ImageChops
+
+import fake_epd
+from display_service import DisplayService
+
+
+@pytest.fixture(autouse = True)
+def instant_panel(monkeypatch):
+    for name in ('INIT_DELAY', 'CLEAR_DELAY', 'FULL_DELAY', 'FAST_DELAY', 'PARTIAL_DELAY', 'SLEEP_DELAY'):
+        monkeypatch.setattr(fake_epd, name, 0)
+
+
+def same_image(a, b):
+    return ImageChops.difference(a.convert('L'), b.convert('L')).getbbox() is None
+
+
+def test_partial_refresh_draws_the_new_message():
+    epd = fake_epd.EPD()
+    display = DisplayService(epd)
+    display.show("Camera on.")
+    display.show("Capturing \nimages.")
+    assert display.stats()['full_refreshes'] == 2 # Clear + display_Base
+    assert display.stats()['partial_refreshes'] == 1
+    assert same_image(epd.panel, display.render("Capturing \nimages."))
+
+
+def test_fake_rejects_a_region_sized_buffer():
+    epd = fake_epd.EPD()
+    epd.init()
+    with pytest.raises(ValueError):
+        epd.display_Partial(bytearray(8 * 10), 0, 0, 64, 10)
+
+
+def test_full_refresh_every_n_updates():
+    epd = fake_epd.EPD()
+    display = DisplayService(epd, full_refresh_every = 2)
+    for i in range(6):
+        display.show(f"Message {i}")
+    assert epd.calls['display_Base'] == 2
+    assert epd.calls['display_Partial'] == 4
+    assert same_image(epd.panel, display.render("Message 5"))
+
+
+def test_repeated_message_is_skipped():
+    epd = fake_epd.EPD()
+    display = DisplayService(epd)
+    display.show("Camera off.")
+    display.show("Camera off.")
+    assert display.stats()['skipped'] == 1
+    assert 'display_Partial' not in epd.calls
+
+
+def test_post_draws_only_the_latest_message(monkeypatch):
+    monkeypatch.setattr(fake_epd, 'PARTIAL_DELAY', 0.05)
+    monkeypatch.setattr(fake_epd, 'FULL_DELAY', 0.05)
+    epd = fake_epd.EPD()
+    display = DisplayService(epd)
+    display.start()
+    for i in range(10):
+        display.post(f"Message {i}")
+    assert display.flush(timeout = 5)
+    assert same_image(epd.panel, display.render("Message 9"))
+    assert display.stats()['coalesced'] > 0
+    assert display.stats()['errors'] == 0
+    display.close()
+    assert epd.initialized is False
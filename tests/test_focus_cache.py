@@ -0,0 +1,127 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from camera_telnet import AutofocusTimeout
+from focus_cache import FocusCache, sharpness
+
+
+# Stands in for CameraCommandClient: an autofocus moves the motor to 'focused_position'
+class FakeCamera:
+
+    def __init__(self, position = 1700, focused_position = 1750, finishes = True):
+        self.position = position
+        self.focused_position = focused_position
+        self.finishes = finishes
+        self.calls = []
+
+    def autofocus(self, timeout = 10):
+        self.calls.append('autofocus')
+        if not self.finishes:
+            raise AutofocusTimeout("Autofocus did not finish")
+        self.position = self.focused_position
+        return 5.0
+
+    def focus_position(self):
+        return self.position
+
+    def set_focus_position(self, position):
+        self.calls.append(('set_focus_position', position))
+        self.position = position
+
+
+def sharp():
+    return np.random.default_rng(0).normal(7000, 200, (240, 320))
+
+
+def blurred():
+    # The same contrast spread smoothly over the frame
+    return np.tile(np.linspace(6650, 7350, 320), (240, 1))
+
+
+def cache(tmp_path, **kwargs):
+    return FocusCache(str(tmp_path / "focus_position.json"), log = None, **kwargs)
+
+
+def saved(tmp_path):
+    with open(tmp_path / "focus_position.json") as file:
+        return json.load(file)
+
+
+def test_sharpness_ranks_sharp_above_blurred_and_skips_flat_frames():
+    assert sharpness(sharp()) > 10 * sharpness(blurred())
+    assert sharpness(np.full((240, 320), 7000.0)) is None
+
+
+def test_the_first_boot_runs_an_autofocus_and_saves_the_reference(tmp_path):
+    camera = FakeCamera()
+    focus = cache(tmp_path)
+    assert focus.focus(camera) == 'autofocus'
+    assert saved(tmp_path)['position'] == 1750
+    assert focus.needs_check()
+    assert focus.check(sharp(), camera) == 'reference'
+    assert not focus.needs_check()
+    assert saved(tmp_path)['sharpness'] == pytest.approx(sharpness(sharp()))
+
+
+def test_a_sharp_frame_keeps_the_restored_position(tmp_path):
+    first = cache(tmp_path)
+    first.focus(FakeCamera())
+    first.check(sharp(), FakeCamera())
+
+    camera = FakeCamera(position = 0)
+    focus = cache(tmp_path)
+    assert focus.focus(camera) == 'restored'
+    assert camera.calls == [('set_focus_position', 1750)]
+    assert focus.needs_check()
+    assert focus.check(sharp(), camera) == 'kept'
+    assert not focus.needs_check()
+    assert (focus.restores, focus.autofocuses, focus.refocuses) == (1, 0, 0)
+
+
+def test_a_blurred_frame_after_a_restore_refocuses(tmp_path):
+    first = cache(tmp_path)
+    first.focus(FakeCamera())
+    first.check(sharp(), FakeCamera())
+
+    # The trap was knocked: the old position no longer gives a sharp image
+    camera = FakeCamera(focused_position = 1820)
+    focus = cache(tmp_path)
+    assert focus.focus(camera) == 'restored'
+    assert focus.check(blurred(), camera) == 'refocused'
+    assert camera.calls == [('set_focus_position', 1750), 'autofocus']
+    assert saved(tmp_path)['position'] == 1820
+    assert saved(tmp_path)['sharpness'] is None
+    # The sharpness at the new position comes from the next frame
+    assert focus.needs_check()
+    assert focus.check(sharp(), camera) == 'reference'
+    assert focus.refocuses == 1
+
+
+def test_frames_without_contrast_are_not_judged(tmp_path):
+    first = cache(tmp_path)
+    first.focus(FakeCamera())
+    first.check(sharp(), FakeCamera())
+
+    camera = FakeCamera()
+    focus = cache(tmp_path)
+    focus.focus(camera)
+    assert focus.check(np.full((240, 320), 7000.0), camera) is None
+    assert focus.needs_check()
+    assert focus.check(sharp(), camera) == 'kept'
+
+
+def test_an_old_position_or_a_failed_autofocus_is_not_trusted(tmp_path):
+    first = cache(tmp_path)
+    first.focus(FakeCamera())
+    first.focused_at = time.time() - 3600
+    first.save()
+    assert cache(tmp_path, max_age = 600).focus(FakeCamera()) == 'autofocus'
+
+    (tmp_path / "focus_position.json").unlink()
+    focus = cache(tmp_path)
+    assert focus.focus(FakeCamera(finishes = False)) == 'failed'
+    assert not focus.needs_check()
+    assert not (tmp_path / "focus_position.json").exists()
@@ -0,0 +1,81 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from frame_container import ContainerSink, FrameContainerReader, FrameContainerWriter
+
+
+def frame(value):
+    return np.full((240, 320), value, dtype = np.uint16)
+
+
+def metadata(frame_id, capture_time):
+    return {'frame_id': frame_id, 'device_timestamp': 1000 * frame_id, 'capture_time': capture_time}
+
+
+def test_frames_round_trip(tmp_path):
+    path = str(tmp_path / "session.frames")
+    with FrameContainerWriter(path) as writer:
+        for i in range(3):
+            writer.append(frame(i), frame_id = i, device_timestamp = 1000 * i, capture_time = 1720692660.0 + i)
+    reader = FrameContainerReader(path)
+    assert len(reader) == 3
+    assert reader[2][0, 0] == 2
+    assert list(reader.frame_ids) == [0, 1, 2]
+    assert reader.capture_times[1] == 1720692661.0
+
+
+def test_a_partial_record_is_dropped_before_appending(tmp_path):
+    path = str(tmp_path / "session.frames")
+    with FrameContainerWriter(path) as writer:
+        writer.append(frame(1))
+    with open(path, 'ab') as f:
+        f.write(b'\0' * 100) # the pi lost power in the middle of a record
+    assert len(FrameContainerReader(path)) == 1
+    with FrameContainerWriter(path) as writer:
+        writer.append(frame(2))
+    assert [int(pixels[0, 0]) for pixels in FrameContainerReader(path)] == [1, 2]
+
+
+def test_each_capture_window_gets_its_own_container(tmp_path):
+    directory = str(tmp_path)
+    first = datetime.datetime(2024, 7, 11, 12, 11, 0)
+    second = datetime.datetime(2024, 7, 11, 14, 30, 5)
+    with ContainerSink() as sink:
+        for i in range(2):
+            sink.save(os.path.join(directory, f"a{i}.tiff"), frame(i), metadata(i, first))
+        sink.new_session()
+        sink.save(os.path.join(directory, "b.tiff"), frame(7), metadata(7, second))
+    assert sorted(os.listdir(directory)) == ["session-20240711-121100.frames", "session-20240711-143005.frames"]
+    assert len(FrameContainerReader(os.path.join(directory, "session-20240711-121100.frames"))) == 2
+    assert sink.sessions == 2
+
+
+class BrokenFile:
+    closed = False
+
+    def write(self, data):
+        raise OSError(5, "Input/output error")
+
+    def flush(self):
+        raise OSError(5, "Input/output error")
+
+    def close(self):
+        self.closed = True
+
+
+def test_a_failed_write_drops_the_cached_container(tmp_path):
+    directory = str(tmp_path)
+    time = datetime.datetime(2024, 7, 11, 12, 11, 0)
+    with ContainerSink() as sink:
+        sink.save(os.path.join(directory, "a0.tiff"), frame(0), metadata(0, time))
+        # The card was remounted: the open file now fails
+        sink.writers[directory].file = BrokenFile()
+        with pytest.raises(OSError):
+            sink.save(os.path.join(directory, "a1.tiff"), frame(1), metadata(1, time))
+        assert directory not in sink.writers
+        sink.save(os.path.join(directory, "a2.tiff"), frame(2), metadata(2, time))
+    reader = FrameContainerReader(os.path.join(directory, "session-20240711-121100.frames"))
+    assert list(reader.frame_ids) == [0, 2]
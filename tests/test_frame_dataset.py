@@ -0,0 +1,86 @@
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from frame_dataset import read_tiff, tiff_layout
+
+
+def frame(value = 0):
+    return (np.arange(24 * 32, dtype = np.uint16).reshape(24, 32) + value).astype(np.uint16)
+
+
+# Writes a little-endian 16-bit tiff by hand with 'strip_rows' rows per strip and 'gap' bytes between the strips
+def handmade_tiff(path, pixels, strip_rows, gap = 0):
+    height, width = pixels.shape
+    strips = [pixels[row:row + strip_rows].astype('<u2').tobytes() for row in range(0, height, strip_rows)]
+    offsets = []
+    data = b''
+    for strip in strips:
+        offsets.append(8 + len(data))
+        data += strip + b'\0' * gap
+    arrays = struct.pack('<' + 'I' * len(strips), *offsets) + struct.pack('<' + 'I' * len(strips), *map(len, strips))
+    ifd_offset = 8 + len(data) + len(arrays)
+    entries = [
+        (256, 4, 1, struct.pack('<I', width)),
+        (257, 4, 1, struct.pack('<I', height)),
+        (258, 3, 1, struct.pack('<HH', 16, 0)),
+        (259, 3, 1, struct.pack('<HH', 1, 0)),
+        (262, 3, 1, struct.pack('<HH', 1, 0)),
+        (273, 4, len(strips), struct.pack('<I', 8 + len(data))),
+        (277, 3, 1, struct.pack('<HH', 1, 0)),
+        (278, 4, 1, struct.pack('<I', strip_rows)),
+        (279, 4, len(strips), struct.pack('<I', 8 + len(data) + 4 * len(strips))),
+    ]
+    with open(path, 'wb') as f:
+        f.write(b'II*\0' + struct.pack('<I', ifd_offset) + data + arrays)
+        f.write(struct.pack('<H', len(entries)))
+        for tag, field, count, value in entries:
+            f.write(struct.pack('<HHI', tag, field, count) + value)
+        f.write(struct.pack('<I', 0))
+
+
+def test_uncompressed_tiffs_are_memory_mapped(tmp_path):
+    path = str(tmp_path / "file-20240711-121100.tiff")
+    Image.fromarray(frame()).save(path)
+    offset, shape, dtype = tiff_layout(path)
+    assert (shape, dtype) == ((24, 32), np.dtype('<u2'))
+    pixels = read_tiff(path)
+    assert isinstance(pixels, np.memmap)
+    np.testing.assert_array_equal(pixels, frame())
+
+
+def test_contiguous_strips_are_memory_mapped(tmp_path):
+    path = str(tmp_path / "strips.tiff")
+    handmade_tiff(path, frame(), strip_rows = 5)
+    assert tiff_layout(path) is not None
+    pixels = read_tiff(path)
+    assert isinstance(pixels, np.memmap)
+    np.testing.assert_array_equal(pixels, frame())
+
+
+def test_non_contiguous_strips_fall_back_to_imageio(tmp_path):
+    path = str(tmp_path / "gaps.tiff")
+    handmade_tiff(path, frame(), strip_rows = 5, gap = 6)
+    assert tiff_layout(path) is None
+    pixels = read_tiff(path)
+    assert not isinstance(pixels, np.memmap)
+    np.testing.assert_array_equal(pixels, frame())
+
+
+@pytest.mark.parametrize('compression', ['tiff_deflate', 'tiff_lzw', 'packbits'])
+def test_compressed_tiffs_fall_back_to_imageio(tmp_path, compression):
+    path = str(tmp_path / "compressed.tiff")
+    Image.fromarray(frame()).save(path, compression = compression)
+    assert tiff_layout(path) is None
+    pixels = read_tiff(path)
+    assert not isinstance(pixels, np.memmap)
+    np.testing.assert_array_equal(pixels, frame())
+
+
+def test_files_that_are_not_tiffs_have_no_layout(tmp_path):
+    path = tmp_path / "not.tiff"
+    path.write_bytes(b'not a tiff at all')
+    assert tiff_layout(str(path)) is None
+
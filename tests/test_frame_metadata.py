@@ -0,0 +1,67 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from frame_dataset import FrameDataset, mtime_datetime
+from frame_metadata import append_sidecar, metadata_from_tags, read_frame_metadata
+from frame_writer import save_frame
+
+
+FRAME = np.full((240, 320), 20000, dtype = np.uint16)
+CAPTURE_TIME = datetime.datetime(2024, 7, 11, 12, 11, 0, 123456)
+
+
+def test_tags_carry_the_capture_time(tmp_path):
+    path = str(tmp_path / "frame.tiff")
+    save_frame(path, FRAME, {'frame_id': 42, 'device_timestamp': 1000, 'capture_time': CAPTURE_TIME})
+    metadata = read_frame_metadata(path)
+    assert metadata == {'frame_id': 42, 'device_timestamp': 1000, 'capture_time': CAPTURE_TIME, 'burst_index': None, 'source': 'tags'}
+
+
+def test_sidecar_index_is_read_first(tmp_path):
+    path = str(tmp_path / "frame.tiff")
+    save_frame(path, FRAME)
+    append_sidecar(str(tmp_path), [{'filename': path, 'frame_id': 7, 'device_timestamp': 99, 'capture_time': CAPTURE_TIME}])
+    metadata = read_frame_metadata(path)
+    assert metadata['source'] == 'sidecar'
+    assert metadata['capture_time'] == CAPTURE_TIME
+
+
+@pytest.mark.parametrize('keep', [6, 12, 40])
+def test_truncated_tiffs_have_no_tag_metadata(tmp_path, keep):
+    path = str(tmp_path / "frame.tiff")
+    save_frame(path, FRAME, {'frame_id': 1, 'device_timestamp': 1, 'capture_time': CAPTURE_TIME})
+    with open(path, 'rb') as f:
+        header = f.read()
+    # Keep the start of the file and point the tag directory past its end
+    truncated = tmp_path / "file-20240711-121100_f000001.tiff"
+    truncated.write_bytes(header[:keep] if keep < 8 else header[:4] + (1000).to_bytes(4, 'little') + header[8:keep])
+    assert metadata_from_tags(str(truncated)) is None
+    # The filename still has the capture time
+    assert read_frame_metadata(str(truncated))['source'] == 'filename'
+
+
+def test_no_capture_time_anywhere_raises(tmp_path):
+    path = str(tmp_path / "frame.tiff")
+    save_frame(path, FRAME)
+    with pytest.raises(ValueError):
+        read_frame_metadata(path)
+
+
+def test_dataset_without_get_datetime_refuses_to_guess(tmp_path):
+    save_frame(str(tmp_path / "frame.tiff"), FRAME)
+    dataset = FrameDataset(str(tmp_path))
+    with pytest.raises(ValueError, match = "mtime_datetime"):
+        dataset.datetime(0)
+
+
+def test_modification_times_are_explicit_and_logged(tmp_path, capsys):
+    for name in ("a.tiff", "b.tiff"):
+        save_frame(str(tmp_path / name), FRAME)
+    os.utime(tmp_path / "a.tiff", (CAPTURE_TIME.timestamp(), CAPTURE_TIME.timestamp()))
+    dataset = FrameDataset(str(tmp_path), get_datetime = mtime_datetime)
+    assert dataset.datetime(0) == CAPTURE_TIME
+    dataset.datetime(1)
+    assert capsys.readouterr().out.count("WARNING") == 1
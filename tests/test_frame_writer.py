@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+import pytest
+
+from frame_writer import FrameWriter
+
+
+# A save function that holds the writer thread until release() is called, like an SD card that has stalled
+class StalledCard:
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.saved = {}
+
+    def save(self, filename, frame, metadata):
+        self.gate.wait()
+        self.saved[filename] = frame.copy()
+
+    def release(self):
+        self.gate.set()
+
+
+def frame(value):
+    return np.full((4, 6), value, dtype = np.uint16)
+
+
+def test_a_full_ring_drops_frames_without_waiting():
+    card = StalledCard()
+    with FrameWriter(shape = (4, 6), slots = 2, policy = 'drop', save = card.save) as writer:
+        assert writer.put(frame(1), "a")
+        assert writer.put(frame(2), "b")
+        assert not writer.put(frame(3), "c")
+        stats = writer.stats()
+        assert stats['dropped'] == 1
+        assert stats['blocked_time'] == 0
+        card.release()
+    assert writer.stats()['written'] == 2
+    assert sorted(card.saved) == ["a", "b"]
+
+
+def test_a_full_ring_blocks_until_the_timeout():
+    card = StalledCard()
+    with FrameWriter(shape = (4, 6), slots = 2, policy = 'block', block_timeout = 0.05, save = card.save) as writer:
+        writer.put(frame(1), "a")
+        writer.put(frame(2), "b")
+        assert not writer.put(frame(3), "c")
+        assert writer.stats()['dropped'] == 1
+        assert writer.stats()['blocked_time'] >= 0.05
+        card.release()
+        # Once the card catches up there is room again
+        assert writer.put(frame(4), "d")
+    assert writer.stats()['written'] == 3
+    assert writer.stats()['queued'] == 3
+
+
+def test_a_blocked_frame_is_written_once_a_slot_frees_up():
+    card = StalledCard()
+    with FrameWriter(shape = (4, 6), slots = 1, policy = 'block', save = card.save) as writer:
+        writer.put(frame(1), "a")
+        threading.Timer(0.05, card.release).start()
+        assert writer.put(frame(2), "b")
+        assert writer.stats()['blocked_time'] >= 0.04
+    assert writer.stats()['dropped'] == 0
+    assert card.saved["b"][0, 0] == 2
+
+
+def test_frames_are_copied_into_the_ring():
+    card = StalledCard()
+    pixels = frame(7)
+    with FrameWriter(shape = (4, 6), slots = 2, save = card.save) as writer:
+        writer.put(pixels, "a", {'frame_id': 1})
+        pixels[:] = 0 # the camera reuses its buffer
+        card.release()
+    assert card.saved["a"][0, 0] == 7
+
+
+def test_frames_of_the_wrong_shape_and_unknown_policies_are_refused():
+    with FrameWriter(shape = (4, 6), slots = 1) as writer:
+        with pytest.raises(ValueError):
+            writer.put(np.zeros((240, 320), dtype = np.uint16), "a")
+    with pytest.raises(ValueError):
+        FrameWriter(policy = 'overwrite')
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+pytest.importorskip("gpiozero")
+
+from motion_trigger import MotionTrigger, load_trace, mock_devices, replay_trace, save_trace
+
+
+@pytest.fixture
+def devices():
+    factory, pir, relay = mock_devices()
+    yield factory, pir, relay
+    pir.close()
+    relay.close()
+
+
+def test_motion_switches_the_relay_on_from_the_interrupt(devices):
+    factory, pir, relay = devices
+    with MotionTrigger(pir, relay, min_off_time = 0) as trigger:
+        replay_trace([(0.0, 1), (0.05, 0)], factory.pin(20))
+        assert relay.is_active
+        assert trigger.motion_count == 1
+        assert len(trigger.latencies) == 1
+        assert not trigger.is_motion()
+
+
+def test_motion_right_after_power_off_waits_for_min_off_time(devices):
+    factory, pir, relay = devices
+    with MotionTrigger(pir, relay, min_off_time = 10) as trigger:
+        relay.on()
+        trigger.power_off()
+        replay_trace([(0.0, 1)], factory.pin(20))
+        assert not relay.is_active
+        assert trigger.is_motion()
+
+
+def test_motion_does_not_end_a_power_cycle_hold(devices):
+    factory, pir, relay = devices
+    with MotionTrigger(pir, relay, min_off_time = 0) as trigger:
+        relay.on()
+        trigger.power_off(hold = 0.3)
+        # Motion pulses during the hold, like an animal walking past while a frozen camera is restarted
+        replay_trace([(0.0, 1), (0.05, 0), (0.1, 1), (0.15, 0)], factory.pin(20))
+        assert not relay.is_active
+        time.sleep(0.3)
+        replay_trace([(0.0, 1)], factory.pin(20))
+        assert relay.is_active
+
+
+def test_power_on_ends_the_hold(devices):
+    factory, pir, relay = devices
+    with MotionTrigger(pir, relay, min_off_time = 0) as trigger:
+        relay.on()
+        trigger.power_off(hold = 60)
+        assert trigger.is_held()
+        trigger.power_on()
+        assert relay.is_active
+        assert not trigger.is_held()
+
+
+def test_traces_round_trip_through_csv(tmp_path):
+    trace = [(0.2, 1), (1.7, 0), (2.7, 1)]
+    path = str(tmp_path / "pir.csv")
+    save_trace(trace, path)
+    assert load_trace(path) == trace
@@ -0,0 +1,296 @@
+import datetime
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from frame_container import FrameContainerWriter
+from frame_metadata import read_frame_metadata
+from frame_writer import save_frame
+from RadianceToTemp import (SIGMA, SITE, CovariateIndex, Ld, apply_coefficients, convert_batch, frame_parameters, get_LW, get_RH, get_Ta,
+                            get_albedo, get_atmospheric_trans, get_lai, load_frames, raw_to_temp, raw_to_temp_batch, raw_to_temp_lut,
+                            vapour_pressure)
+from temperature_writers import NpyWriter, read_temperature
+
+
+def write_weather(path):
+    path.write_text("timestamp,TA,RH\n2024-07-11 12:00:00,18.0,0.6\n2024-07-11 13:00:00,20.0,0.5\n")
+    return str(path)
+
+
+@pytest.fixture
+def legacy_bursts(tmp_path):
+    # Older archives: every frame of a burst has the same second in its name and is told apart by _burstN
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    for second in ("121100", "121105"):
+        for n in range(1, 12):
+            save_frame(str(raw / f"file-20240711-{second}_burst{n}.tiff"), np.full((24, 32), 20000 + n, dtype = np.uint16))
+    return raw
+
+
+def test_burst_ordinals_are_parsed_from_legacy_names(legacy_bursts):
+    metadata = read_frame_metadata(str(legacy_bursts / "file-20240711-121100_burst10.tiff"))
+    assert metadata['burst_index'] == 10
+    assert metadata['source'] == 'filename'
+    # _burst10 comes after _burst9, not after _burst1
+    names = load_frames(str(legacy_bursts)).names
+    assert names[:11] == [f"file-20240711-121100_burst{n}.tiff" for n in range(1, 12)]
+
+
+def test_every_frame_of_a_legacy_burst_gets_its_own_result(tmp_path, legacy_bursts):
+    outdir = tmp_path / "results"
+    outdir.mkdir()
+    convert_batch(str(legacy_bursts), write_weather(tmp_path / "weather.csv"), os.path.join(str(outdir), ""), workers = 2, chunk_size = 4)
+    results = sorted(os.listdir(outdir))
+    assert len(results) == 22
+    assert results == sorted(os.listdir(legacy_bursts))
+    # Brighter frames are warmer, so no frame was overwritten by another one of its burst
+    temperatures = [float(read_temperature(str(outdir / f"file-20240711-121100_burst{n}.tiff"))[0, 0]) for n in range(1, 12)]
+    assert temperatures == sorted(temperatures)
+    assert len(set(temperatures)) == 11
+
+
+TIMES = [datetime.datetime(2024, 7, 11, 12, 11, 0), datetime.datetime(2024, 7, 11, 12, 50, 0)]
+
+
+def test_parameter_table_keeps_the_planck_coefficients(tmp_path):
+    weather = write_weather(tmp_path / "weather.csv")
+    table = frame_parameters(TIMES, weather, R1 = 16000.0, B = 1400.0)
+    assert list(table['R1']) == [16000.0, 16000.0]
+    assert list(table['B']) == [1400.0, 1400.0]
+    raw = np.full((2, 4, 4), 20000, dtype = np.uint16)
+    expected = raw_to_temp(20000, table['rh'][1], table['t_air'][1], table['t_win'][1], table['LW'][1], R1 = 16000.0, B = 1400.0)
+    converted = apply_coefficients(raw, table['gain'], table['offset'], R1 = table['R1'], B = table['B'])
+    assert converted[1, 0, 0] == pytest.approx(expected, abs = 1e-3)
+
+
+def test_parameter_table_is_cached_until_an_input_changes(tmp_path):
+    weather = tmp_path / "weather.csv"
+    write_weather(weather)
+    cache = tmp_path / "cache"
+    first = frame_parameters(TIMES, str(weather), cache_dir = str(cache))
+    assert len(os.listdir(cache)) == 1
+    assert frame_parameters(TIMES, str(weather), cache_dir = str(cache)).tobytes() == first.tobytes()
+    weather.write_text("timestamp,TA,RH\n2024-07-11 12:00:00,25.0,0.6\n2024-07-11 13:00:00,26.0,0.5\n")
+    second = frame_parameters(TIMES, str(weather), cache_dir = str(cache))
+    assert len(os.listdir(cache)) == 2
+    assert list(second['t_air']) == [25.0, 26.0]
+    assert not np.array_equal(second['gain'], first['gain'])
+
+
+@pytest.mark.parametrize('header, message', [("when,LAI", "no time column"), ("date,NDVI", "no 'LAI' column")])
+def test_covariate_files_without_the_expected_columns_raise(tmp_path, header, message):
+    lai = tmp_path / "lai.csv"
+    lai.write_text(header + "\n2024-07-11,3.5\n")
+    with pytest.raises(ValueError, match = message) as error:
+        frame_parameters(TIMES, write_weather(tmp_path / "weather.csv"), lai_path = str(lai))
+    assert str(lai) in str(error.value)
+
+
+AIR = np.array([-10.0, 0.5, 12.0, 25.0, 35.0])
+
+
+def emissivity(radiation, air_temp):
+    return radiation / (SIGMA * (air_temp + 273.15)**4)
+
+
+def test_overcast_sky_is_a_grey_body():
+    assert emissivity(Ld(AIR, 70, cc = 1), AIR) == pytest.approx(0.952)
+
+
+def test_dry_clear_sky_has_the_konzelmann_floor():
+    assert emissivity(Ld(AIR, 0, cc = 0), AIR) == pytest.approx(0.23)
+
+
+@pytest.mark.parametrize('air_temp, saturation', [(-10, 286.5), (0, 611.21), (20, 2338.8), (30, 4246.0)])
+def test_buck_saturation_vapour_pressure(air_temp, saturation):
+    # Values of Buck (1981) over water, in Pa
+    assert vapour_pressure(air_temp, 100) == pytest.approx(saturation, rel = 1e-3)
+    assert vapour_pressure(air_temp, 40) == pytest.approx(0.4 * saturation, rel = 1e-3)
+
+
+def test_vectorized_longwave_matches_a_per_frame_loop():
+    rng = np.random.default_rng(0)
+    air, rh, cc = rng.uniform(-5, 35, 200), rng.uniform(10, 100, 200), rng.uniform(0, 1, 200)
+    vectorized = get_LW(air_temp = air, hum = rh, cc = cc, sky_view = 0.3)
+    looped = [get_LW(air_temp = air[i], hum = rh[i], cc = cc[i], sky_view = 0.3) for i in range(200)]
+    assert isinstance(looped[0], float)
+    np.testing.assert_allclose(vectorized, looped, rtol = 1e-12)
+
+
+def test_sky_view_is_a_site_parameter(tmp_path):
+    weather = write_weather(tmp_path / "weather.csv")
+    cache = str(tmp_path / "cache")
+    table = frame_parameters(TIMES, weather, cache_dir = cache)
+    shaded = frame_parameters(TIMES, weather, site = dict(SITE, sky_view = 0.2), cache_dir = cache)
+    assert len(os.listdir(cache)) == 2
+    assert table['LW'][0] == pytest.approx(get_LW(18.0, 60, sky_view = SITE['sky_view']))
+    assert shaded['LW'][0] == pytest.approx(get_LW(18.0, 60, sky_view = 0.2))
+    assert not np.array_equal(shaded['offset'], table['offset'])
+
+
+COUNTS = np.arange(65536, dtype = np.uint16)
+
+
+def reference_temperatures(params):
+    # raw_to_temp takes the air and window temperatures straight into math.exp(B/t), which overflows below about 2 C;
+    # raw_to_temp_batch evaluates the same expressions with NumPy, where the overflow gives the limiting value instead
+    try:
+        return raw_to_temp(COUNTS, **params)
+    except OverflowError:
+        return raw_to_temp_batch(COUNTS.reshape(1, 256, 256), **params).astype(np.float64).ravel()
+
+
+@pytest.mark.parametrize('t_air_range', [(2.5, 40), (0.01, 2.5)])
+def test_lookup_tables_are_within_a_hundredth_of_a_degree(t_air_range):
+    rng = np.random.default_rng(1)
+    for i in range(20):
+        params = dict(rh = rng.uniform(0.05, 1), t_air = rng.uniform(*t_air_range), LW = rng.uniform(150, 500), e_target = rng.uniform(0.9, 0.99))
+        params['t_win'] = params['t_air']
+        with np.errstate(all = 'ignore'):
+            reference = reference_temperatures(params)
+            converted = raw_to_temp_lut(COUNTS, **params)
+        valid = np.isfinite(reference) & (reference > -40) & (reference < 80)
+        assert valid.sum() > 1000
+        assert np.max(np.abs(converted[valid] - reference[valid])) < 0.01, params
+
+
+def random_stack(frames = 6):
+    rng = np.random.default_rng(0)
+    stack = rng.integers(12000, 30000, (frames, 24, 32)).astype(np.uint16)
+    return stack, rng.uniform(0.2, 1, frames), rng.uniform(5, 35, frames), rng.uniform(250, 450, frames)
+
+
+def test_batch_conversion_matches_raw_to_temp():
+    stack, rh, t_air, LW = random_stack()
+    converted = raw_to_temp_batch(stack, rh, t_air, t_air, LW)
+    assert converted.dtype == np.float32
+    for i in range(len(stack)):
+        expected = raw_to_temp(stack[i], rh = rh[i], t_air = t_air[i], t_win = t_air[i], LW = LW[i])
+        np.testing.assert_allclose(converted[i], expected, rtol = 0, atol = 1e-4)
+
+
+def test_batch_conversion_in_place_allocates_no_frames():
+    stack, rh, t_air, LW = random_stack()
+    stack = np.tile(stack, (1, 10, 10)) # 240 x 320 frames
+    out = np.empty(stack.shape, dtype = np.float32)
+    raw_to_temp_batch(stack, rh, t_air, t_air, LW, out = out)
+    tracemalloc.start()
+    try:
+        result = raw_to_temp_batch(stack, rh, t_air, t_air, LW, out = out)
+        in_place = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        allocated = raw_to_temp_batch(stack, rh, t_air, t_air, LW)
+        new = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert result is out
+    # Only the per-frame coefficients and NumPy's small iteration buffers, not even one frame (300 kB)
+    assert in_place < 100000
+    # Without 'out' the float32 result is the only large allocation
+    assert new < out.nbytes + 100000
+    np.testing.assert_array_equal(allocated, out)
+
+
+START = datetime.datetime(2024, 7, 11, 12, 11, 0)
+
+
+def season_frames(count = 11):
+    rng = np.random.default_rng(2)
+    return [rng.integers(15000, 25000, (24, 32)).astype(np.uint16) for i in range(count)]
+
+
+class RecordingWriter(NpyWriter):
+
+    def __init__(self):
+        self.names = []
+
+    def __call__(self, np_array, outdir, filename):
+        self.names.append(filename)
+        super().__call__(np_array, outdir, filename)
+
+
+# Converts 'raw_path' with two worker processes and chunks of two frames, so the four shared memory slots are reused,
+# and checks every result against a serial conversion of the same frames
+def check_parallel_conversion(tmp_path, raw_path, frames):
+    outdir = tmp_path / "results"
+    outdir.mkdir()
+    weather = write_weather(tmp_path / "weather.csv")
+    writer = RecordingWriter()
+    timings = convert_batch(str(raw_path), weather, os.path.join(str(outdir), ""), workers = 2, chunk_size = 2, writer = writer, write_threads = 1)
+    assert set(timings) == {'index', 'covariates', 'read', 'convert', 'write', 'total'}
+
+    dataset = load_frames(str(raw_path))
+    # One thread writes the results, in frame order
+    assert writer.names == [os.path.splitext(name)[0] + ".npy" for name in dataset.names]
+    params = frame_parameters([dataset.datetime(i) for i in range(len(dataset))], weather)
+    for i, name in enumerate(writer.names):
+        expected = apply_coefficients(frames[i], params['gain'][i], params['offset'][i])
+        np.testing.assert_array_equal(read_temperature(str(outdir / name)), expected)
+
+
+def test_parallel_conversion_of_tagged_tiffs(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    frames = season_frames()
+    for i, frame in enumerate(frames):
+        capture_time = START + datetime.timedelta(minutes = 5 * i)
+        save_frame(str(raw / f"frame{i:02d}.tiff"), frame, {'frame_id': i, 'device_timestamp': 0, 'capture_time': capture_time})
+    check_parallel_conversion(tmp_path, raw, frames)
+
+
+def test_parallel_conversion_of_a_container(tmp_path):
+    path = tmp_path / "session.frames"
+    frames = season_frames()
+    with FrameContainerWriter(str(path), shape = (24, 32)) as writer:
+        for i, frame in enumerate(frames):
+            writer.append(frame, frame_id = i, capture_time = START + datetime.timedelta(minutes = 5 * i))
+    check_parallel_conversion(tmp_path, path, frames)
+
+
+def weather_table():
+    # Rows out of time order, as after concatenating two downloads
+    return pd.DataFrame({'timestamp': ["2024-07-11 13:00:00", "2024-07-11 12:00:00", "2024-07-11 12:30:00"],
+                         'TA': [20.0, 18.0, 19.0], 'RH': [0.5, 0.6, 0.55]})
+
+
+def test_ties_go_to_the_earlier_row():
+    index = CovariateIndex(weather_table())
+    assert index.nearest('TA', datetime.datetime(2024, 7, 11, 12, 15)) == 18.0
+    assert index.nearest('TA', datetime.datetime(2024, 7, 11, 12, 45)) == 19.0
+    assert index.nearest('TA', datetime.datetime(2024, 7, 11, 12, 46)) == 20.0
+
+
+def test_timestamps_outside_the_table_take_the_first_or_last_row():
+    index = CovariateIndex(weather_table())
+    times = [datetime.datetime(2024, 7, 10), datetime.datetime(2024, 7, 11, 12, 20), datetime.datetime(2024, 7, 12)]
+    assert list(index.nearest('TA', times)) == [18.0, 19.0, 20.0]
+    assert list(index.interpolate('TA', times)) == pytest.approx([18.0, 18.0 + 20 / 30, 20.0])
+    single = CovariateIndex(weather_table().iloc[:1])
+    assert list(single.nearest('RH', times)) == [0.5, 0.5, 0.5]
+
+
+def test_get_functions_accept_a_table_or_an_index_and_leave_the_table_alone():
+    table = weather_table()
+    before = table.copy()
+    times = np.array(["2024-07-11T12:10", "2024-07-11T12:50"], dtype = 'datetime64[ns]')
+    for weather in (table, CovariateIndex(table)):
+        assert list(get_Ta(weather, times)) == [18.0, 20.0]
+        assert get_RH(weather, datetime.datetime(2024, 7, 11, 12, 40)) == 0.55
+    pd.testing.assert_frame_equal(table, before)
+
+
+def test_gee_exports_are_looked_up_with_their_own_columns():
+    albedo = pd.DataFrame({'date': ["2024-07-01", "2024-07-17"], 'albedo': [0.12, 0.18]})
+    transmissivity = pd.DataFrame({'time': ["2024-07-11 11:00", "2024-07-11 12:00"], 'clear_sky_index': [0.4, 0.7]})
+    lai = pd.DataFrame({'date': ["2024-07-01"], 'LAI': [3.5]})
+    when = datetime.datetime(2024, 7, 11, 12, 11)
+    assert get_albedo(albedo, when) == 0.18
+    assert get_atmospheric_trans(transmissivity, when) == 0.7
+    assert get_atmospheric_trans(transmissivity.rename(columns = {'clear_sky_index': 'atmospheric_transmissivity'}), when) == 0.7
+    assert get_lai(lai, [when, when]).tolist() == [3.5, 3.5]
+    with pytest.raises(ValueError, match = "No time column"):
+        CovariateIndex(pd.DataFrame({'when': ["2024-07-01"], 'LAI': [3.5]}))
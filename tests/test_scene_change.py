@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from capture_scheduler import FakeClock
+from scene_change import AdaptiveCapture, ChangeDetector, downsample, replay
+
+
+def scene(target = None, shift = 0, seed = 0):
+    rng = np.random.default_rng(seed)
+    frame = rng.normal(7000 + shift, 5, (240, 320))
+    if target is not None:
+        row, col = target
+        frame[row:row + 40, col:col + 40] += 300 # a warm animal, 10 x 10 downsampled pixels
+    return frame.astype(np.uint16)
+
+
+def run(duration, frames, **kwargs):
+    adaptive = AdaptiveCapture(log = None, **kwargs)
+    scheduler = adaptive.start_session(duration, clock = FakeClock())
+    decisions = [adaptive.update(frame) for slot, frame in zip(scheduler, frames)]
+    return decisions, scheduler
+
+
+def test_downsample_averages_whole_blocks():
+    frame = np.arange(6 * 9, dtype = np.uint16).reshape(6, 9)
+    small = downsample(frame, factor = 3)
+    assert small.shape == (2, 3)
+    assert small.dtype == np.float32
+    assert small[0, 0] == frame[:3, :3].mean()
+
+
+def test_only_warm_changes_are_scored():
+    detector = ChangeDetector()
+    assert detector.update(scene(seed = 0)) is None
+    assert detector.update(scene(seed = 1)) == 0
+    # A shift of the whole frame is ambient drift, not a target
+    assert detector.update(scene(shift = 200, seed = 2)) == 0
+    assert detector.update(scene(target = (40, 40), seed = 3)) == pytest.approx(100 / (60 * 80))
+
+
+def test_a_static_scene_backs_off_and_ends_the_session():
+    frames = [scene(target = (40, 40) if seed == 1 else None, seed = seed) for seed in range(8)]
+    decisions, scheduler = run(60, frames, fast_period = 2, slow_period = 4, backoff = 1.5, static_to_end = 3)
+    assert [(decision['time'], decision['action'], decision['period']) for decision in decisions] == [
+        (0, "learn", 2), (2, "active", 2), (4, "static", 3), (7, "static", 4), (11, "end", 4)]
+    assert scheduler.stopped
+
+
+def test_a_moving_target_extends_the_session_up_to_max_duration():
+    frames = [scene(seed = 0), scene(target = (40, 40), seed = 1), scene(target = (120, 200), seed = 2)]
+    decisions, scheduler = run(10, frames, fast_period = 2, extend = 30, max_duration = 20)
+    assert [decision['action'] for decision in decisions] == ["learn", "extend", "active"]
+    # 8 s were left at 2 s: the extension is capped so the session ends 20 s after it started
+    assert decisions[1]['remaining'] == pytest.approx(18)
+    assert decisions[2]['remaining'] == pytest.approx(16)
+
+
+def test_movement_resets_the_static_count_and_the_period():
+    frames = [scene(target = (40, 40) if seed == 2 else None, seed = seed) for seed in range(4)]
+    decisions, scheduler = run(60, frames, fast_period = 2, slow_period = 15, static_to_end = 2)
+    assert [(decision['action'], decision['period']) for decision in decisions] == [
+        ("learn", 2), ("static", 3), ("active", 2), ("static", 3)]
+    assert not scheduler.stopped
+
+
+def test_replay_captures_less_often_once_the_scene_is_static():
+    frames = [scene(target = (40, 8 * i) if 5 <= i < 15 else None, seed = i) for i in range(60)]
+    adaptive = AdaptiveCapture(fast_period = 1, slow_period = 8, extend = 5, static_to_end = None, log = None)
+    captured = replay(frames, 1, adaptive, duration = 60)
+    # Every frame of the moving target is captured, the static scene around it only every few seconds
+    assert set(range(5, 15)) <= set(captured)
+    assert [adaptive.decisions[captured.index(i)]['action'] for i in range(5, 15)] == ["active"] * 10
+    assert len(captured) < 25
+    assert np.all(np.diff(captured)[-3:] == 8)
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from solar_radiation import get_solar_radiation, get_zenith, r_reference, solar_radiation, zenith_angle
+
+
+REFERENCE = pd.read_csv(os.path.join(os.path.dirname(__file__), "data", "solar_reference.csv"), comment = "#")
+CEMBRA = dict(lat = 46.130962, lon = 11.19001, slope = 1.017573714256287, slope_aspect = 92.496437072753906, ELEV = 900.943969726562614)
+
+
+@pytest.mark.parametrize('row', list(REFERENCE.itertuples()), ids = lambda row: f"doy{row.doy}-h{row.hour}-lat{row.lat}")
+def test_trenchr_reference_values(row):
+    zenith = zenith_angle(row.doy, row.lat, row.lon, row.hour)
+    assert zenith == pytest.approx(row.zenith, abs = 1e-5)
+    total = sum(solar_radiation(row.doy, np.radians(zenith), row.tau, row.elev, row.rho))
+    assert total == pytest.approx(row.solrad, abs = 1e-4)
+
+
+def test_reference_table_in_one_vectorized_call():
+    zenith = zenith_angle(REFERENCE['doy'].to_numpy(), 46.130962, 11.19001, REFERENCE['hour'].to_numpy())
+    cembra = (REFERENCE['lat'] == 46.130962).to_numpy()
+    np.testing.assert_allclose(zenith[cembra], REFERENCE['zenith'][cembra], atol = 1e-5)
+
+
+def test_noon_zenith_follows_the_declination():
+    # Within half a degree at the solstices and equinox (hour 12 is not exactly solar noon)
+    assert zenith_angle(172, 0.0, 0.0, 12) == pytest.approx(23.44, abs = 0.5)
+    assert zenith_angle(80, 46.13, 0.0, 12) == pytest.approx(46.13, abs = 1)
+    assert zenith_angle(355, -33.9, 0.0, 12) == pytest.approx(33.9 - 23.44, abs = 0.5)
+    assert zenith_angle(172, 46.13, 11.19, 0) == 90
+
+
+def test_sun_overhead_through_a_clear_atmosphere():
+    direct, diffuse, reflected = solar_radiation(172, 0.0, 1.0, 0.0, rho = 0.2)
+    assert (direct, diffuse, reflected) == pytest.approx((1360, 0, 0.2 * 1360))
+
+
+def test_azimuth_cosine_is_clipped_near_noon():
+    # At Cembra on 8 September at noon the azimuth cosine is 1.0004, which R turns into NaN
+    zenith = get_zenith(np.array(["2024-09-08T12:00"], dtype = 'datetime64[ns]'), 46.130962, 11.19001, 1.0175, 92.4964)
+    assert zenith['SUN_AZIMUTH'][0] == 0
+    assert np.isfinite(zenith['ZENITH_UPDATED'][0])
+    year = pd.date_range("2024-01-01", "2024-12-31 23:00", freq = "h").to_numpy()
+    assert np.all(np.isfinite(get_solar_radiation(year, ATMOSPHERIC_TRANSMISSIVITY = 0.7, ALBEDO = 0.2, hemisphere = "north", **CEMBRA)))
+
+
+def test_southern_branch_mirrors_the_northern_azimuth():
+    # The southern formula is the northern one with the sign flipped, so the azimuths are supplements
+    times = pd.date_range("2024-01-15 07:00", periods = 10, freq = "h").to_numpy()
+    north = get_zenith(times, -33.9, 18.4, 5, 180, HEMISPHERE = "north")
+    south = get_zenith(times, -33.9, 18.4, 5, 180, HEMISPHERE = "south")
+    np.testing.assert_allclose(south['SUN_AZIMUTH'], np.pi - north['SUN_AZIMUTH'])
+    np.testing.assert_array_equal(south['ZENITH_ORIG'], north['ZENITH_ORIG'])
+    assert np.all(np.isfinite(south['ZENITH_UPDATED']))
+
+
+def test_port_matches_the_r_script():
+    pytest.importorskip("rpy2")
+    week = pd.date_range("2024-07-10", "2024-07-16", freq = "h").to_numpy()
+    script = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Solar_Radiation_Functions_for_Python.R")
+    reference = r_reference(week, ATMOSPHERIC_TRANSMISSIVITY = 0.7, ALBEDO = 0.2, hemisphere = "north", script_path = script, **CEMBRA)
+    ported = get_solar_radiation(week, ATMOSPHERIC_TRANSMISSIVITY = 0.7, ALBEDO = 0.2, hemisphere = "north", **CEMBRA)
+    valid = np.isfinite(reference)
+    np.testing.assert_allclose(ported[valid], reference[valid], rtol = 1e-9)
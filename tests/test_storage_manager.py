@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+from frame_writer import save_frame
+from storage_manager import FRAME_BYTES, StorageManager, Volume
+
+
+FRAME = np.full((240, 320), 20000, dtype = np.uint16)
+
+
+def manager_for(directory, bursts = 10, **kwargs):
+    return StorageManager([Volume(directory, name = "card", quota_bytes = bursts * 3 * FRAME_BYTES, **kwargs)], reserve_bytes = 0)
+
+
+def test_written_bursts_give_back_their_whole_reservation(tmp_path):
+    manager = manager_for(str(tmp_path), usage_refresh = 0)
+    save = manager.tracked(save_frame)
+    for burst in range(3):
+        directory = manager.directory_for(3 * manager.frame_bytes)
+        for i in range(3):
+            save(os.path.join(directory, f"burst{burst}_{i}.tiff"), FRAME)
+    volume = manager.volumes[0]
+    assert volume.pending_bytes == 0
+    assert volume.bytes_written == 9 * FRAME.nbytes
+
+
+def test_frames_that_are_not_written_are_released(tmp_path):
+    manager = manager_for(str(tmp_path))
+    save = manager.tracked(save_frame)
+    directory = manager.directory_for(3 * manager.frame_bytes)
+    # One frame written, one dropped by the writer, one never grabbed
+    save(os.path.join(directory, "burst0_0.tiff"), FRAME)
+    manager.release_frames(directory, 2)
+    assert manager.volumes[0].pending_bytes == 0
+
+
+def test_failed_writes_give_back_their_reservation(tmp_path):
+    manager = manager_for(str(tmp_path))
+    def failing_save(filename, frame, metadata = None):
+        raise OSError("card removed")
+    save = manager.tracked(failing_save)
+    directory = manager.directory_for(manager.frame_bytes)
+    try:
+        save(os.path.join(directory, "burst0_0.tiff"), FRAME)
+    except OSError:
+        pass
+    volume = manager.volumes[0]
+    assert volume.pending_bytes == 0
+    assert volume.bytes_written == 0
+
+
+def test_quota_counts_files_already_in_the_directory(tmp_path):
+    (tmp_path / "earlier_run.bin").write_bytes(b"\1" * (8 * 3 * FRAME_BYTES))
+    manager = manager_for(str(tmp_path))
+    for burst in range(2):
+        assert manager.directory_for(3 * FRAME_BYTES) is not None
+    assert manager.directory_for(3 * FRAME_BYTES) is None
+    assert manager.refused == 1
+
+
+def test_quota_follows_writes_between_scans(tmp_path):
+    manager = manager_for(str(tmp_path), bursts = 2)
+    save = manager.tracked(save_frame)
+    directory = manager.directory_for(3 * FRAME_BYTES)
+    for i in range(3):
+        save(os.path.join(directory, f"burst0_{i}.tiff"), FRAME)
+    assert manager.directory_for(3 * FRAME_BYTES) is not None
+    assert manager.directory_for(3 * FRAME_BYTES) is None
@@ -0,0 +1,84 @@
+import pytest
+
+from storage_monitor import StorageMonitor, find_card_mount, list_sd_disks, parse_mountinfo
+
+
+# /proc/self/mountinfo of a raspberry pi without the card, and with the card automounted under /media
+MOUNTINFO = """\
+22 1 179:2 / / rw,noatime shared:1 - ext4 /dev/root rw
+23 22 0:5 / /dev rw,relatime shared:2 - devtmpfs devtmpfs rw,size=1867604k,nr_inodes=466901,mode=755
+30 22 179:1 / /boot/firmware rw,relatime shared:7 - vfat /dev/mmcblk0p1 rw,fmask=0022,dmask=0022
+"""
+
+CARD_LINE = "210 22 8:1 / /media/moorcroftlab/FLIR\\040DATA rw,nosuid,nodev,relatime shared:120 - exfat /dev/sda1 rw,uid=1000\n"
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(MOUNTINFO)
+    sys_block = tmp_path / "block"
+    for disk in ("mmcblk0", "loop0"):
+        (sys_block / disk).mkdir(parents = True)
+    return mountinfo, sys_block
+
+
+def test_parse_mountinfo_reads_the_fields_after_the_separator():
+    mounts = parse_mountinfo(MOUNTINFO + CARD_LINE)
+    assert len(mounts) == 4
+    card = mounts[-1]
+    assert card['mount_point'] == "/media/moorcroftlab/FLIR DATA"
+    assert card['source'] == "/dev/sda1"
+    assert card['fstype'] == "exfat"
+    assert card['options'] == "rw,nosuid,nodev,relatime"
+
+
+def test_parse_mountinfo_skips_malformed_lines():
+    assert parse_mountinfo("garbage\n1 2 3 - ext4\n") == []
+
+
+def test_find_card_mount_prefers_usb_disks():
+    mounts = parse_mountinfo(MOUNTINFO
+                             + "200 22 0:50 / /mnt/backup rw shared:100 - nfs server:/backup rw\n"
+                             + CARD_LINE)
+    assert find_card_mount(mounts)['source'] == "/dev/sda1"
+    assert find_card_mount(parse_mountinfo(MOUNTINFO)) is None
+
+
+def test_list_sd_disks(fixtures, tmp_path):
+    mountinfo, sys_block = fixtures
+    assert list_sd_disks(str(sys_block)) == []
+    (sys_block / "sda").mkdir()
+    assert list_sd_disks(str(sys_block)) == ["sda"]
+    assert list_sd_disks(str(tmp_path / "missing")) == []
+
+
+def test_monitor_notices_the_card_on_refresh(fixtures):
+    mountinfo, sys_block = fixtures
+    events = []
+    with StorageMonitor(str(mountinfo), str(sys_block), watch = False) as monitor:
+        monitor.add_listener(lambda event, mount_point: events.append((event, mount_point)))
+        assert not monitor.is_connected()
+        assert monitor.directory() is None
+
+        mountinfo.write_text(MOUNTINFO + CARD_LINE)
+        (sys_block / "sda").mkdir()
+        monitor.refresh()
+        assert monitor.is_connected()
+        assert monitor.directory() == "/media/moorcroftlab/FLIR DATA/"
+        assert monitor.disks == ["sda"]
+        assert monitor.wait_for_card(0)
+
+        mountinfo.write_text(MOUNTINFO)
+        monitor.refresh()
+        assert not monitor.is_connected()
+    assert events == [('inserted', "/media/moorcroftlab/FLIR DATA"), ('removed', "/media/moorcroftlab/FLIR DATA")]
+
+
+def test_free_space_of_a_missing_mount_point_is_zero(fixtures):
+    mountinfo, sys_block = fixtures
+    mountinfo.write_text(MOUNTINFO + CARD_LINE)
+    with StorageMonitor(str(mountinfo), str(sys_block), watch = False) as monitor:
+        assert monitor.is_connected()
+        assert monitor.free_bytes == 0
+        assert monitor.total_bytes == 0
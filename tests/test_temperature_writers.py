@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+from temperature_writers import (CHUNK_HEADER, NAN_CODE, WRITERS, TemperatureStoreReader, TemperatureStoreWriter,
+                                 _shuffle, _unshuffle, from_scaled, make_writer, read_temperature, to_scaled)
+
+
+def frame(offset = 0.0):
+    rng = np.random.default_rng(0)
+    temperatures = (rng.uniform(-20, 60, (24, 32)) + offset).astype(np.float32)
+    temperatures[0, :3] = np.nan
+    return temperatures
+
+
+@pytest.mark.parametrize('name', sorted(WRITERS))
+def test_every_writer_round_trips(tmp_path, name):
+    outdir = os.path.join(str(tmp_path), "")
+    writer = make_writer(name)
+    frames = [frame(i) for i in range(3)]
+    for i, temperatures in enumerate(frames):
+        writer(np_array = temperatures, outdir = outdir, filename = f"file-{i}" + writer.extension)
+    if hasattr(writer, 'close'):
+        writer.close()
+    if name == 'store':
+        reader = TemperatureStoreReader(writer.store_path(outdir))
+        assert reader.names == ["file-0", "file-1", "file-2"]
+        read = [reader.read(f"file-{i}") for i in range(3)]
+    else:
+        read = [read_temperature(outdir + f"file-{i}" + writer.extension) for i in range(3)]
+    # int16 formats keep centi-degrees, the others are exact
+    tolerance = 0.005 if name in ('tiff16', 'store') else 0
+    for temperatures, back in zip(frames, read):
+        assert back.dtype == np.float32
+        np.testing.assert_allclose(back, temperatures, rtol = 0, atol = tolerance)
+        assert np.array_equal(np.isnan(back), np.isnan(temperatures))
+
+
+def test_scaled_codes_keep_nan_and_clip():
+    codes = to_scaled(np.array([np.nan, 21.456, -400.0, 400.0, -327.67], dtype = np.float32))
+    assert codes.dtype == np.dtype('<i2')
+    assert list(codes) == [NAN_CODE, 2146, NAN_CODE + 1, 32767, -32767]
+    back = from_scaled(codes)
+    assert np.isnan(back[0])
+    assert back[1] == pytest.approx(21.46)
+    # Clipped values stay finite, so they can't be mistaken for NaN
+    assert back[2] == pytest.approx(-327.67) and back[3] == pytest.approx(327.67)
+
+
+def test_byte_shuffle_puts_each_byte_plane_together():
+    stack = np.array([[0x0102, 0x0304], [0x0506, 0x0708]], dtype = '<i2')
+    shuffled = _shuffle(stack)
+    assert shuffled == bytes([0x02, 0x04, 0x06, 0x08, 0x01, 0x03, 0x05, 0x07])
+    np.testing.assert_array_equal(_unshuffle(shuffled, stack.dtype, stack.shape), stack)
+    floats = np.stack([frame(i) for i in range(2)])
+    np.testing.assert_array_equal(_unshuffle(_shuffle(floats), floats.dtype, floats.shape), floats)
+
+
+def test_a_truncated_chunk_is_ignored_and_dropped_on_append(tmp_path):
+    path = str(tmp_path / "session.temps")
+    with TemperatureStoreWriter(path, shape = (24, 32), chunk_frames = 2) as writer:
+        for i in range(4):
+            writer.append(f"frame{i}", frame(i))
+    complete = os.path.getsize(path)
+    with TemperatureStoreWriter(path, shape = (24, 32), chunk_frames = 2) as writer:
+        for i in range(4, 6):
+            writer.append(f"frame{i}", frame(i))
+    # The pi lost power in the middle of the third chunk
+    with open(path, 'r+b') as f:
+        f.truncate(complete + CHUNK_HEADER.size + 10)
+    reader = TemperatureStoreReader(path)
+    assert reader.names == ["frame0", "frame1", "frame2", "frame3"]
+    np.testing.assert_allclose(reader[3], frame(3), atol = 0.005)
+
+    with TemperatureStoreWriter(path, shape = (24, 32), chunk_frames = 2) as writer:
+        assert writer.frame_count == 4
+        writer.append("frame6", frame(6))
+    reader = TemperatureStoreReader(path)
+    assert reader.names == ["frame0", "frame1", "frame2", "frame3", "frame6"]
+    np.testing.assert_allclose(reader.read("frame6"), frame(6), atol = 0.005)
+
+
+def test_a_store_of_another_encoding_is_not_appended_to(tmp_path):
+    path = str(tmp_path / "session.temps")
+    with TemperatureStoreWriter(path, shape = (24, 32)) as writer:
+        writer.append("frame0", frame())
+    with pytest.raises(ValueError):
+        TemperatureStoreWriter(path, shape = (24, 32), scale = None)
@@ -0,0 +1,156 @@
+# ======================== Notes ===========================================
+
+## thermal_trigger.py confirms PIR triggers with the camera itself, so wind and sun don't cost a cold boot.
+## After a capture session the camera is kept powered in a low-rate preview (about one frame per second, nothing saved).
+## While it is warm, a PIR event only starts a capture session if a warm blob shows up in the preview frames:
+## pixels of a block-averaged raw frame that rose above the running background (see ChangeDetector in scene_change.py),
+## grouped into connected components, with at least 'min_area' blocks. Rejected events cost nothing. The camera is powered
+## off after 'warm_time' seconds without a confirmed event. A PIR event while the camera is cold boots it as before.
+## 'evaluate' replays recorded frames and PIR events through the same logic, to measure it on recorded data.
+
+# ======================== Import  Modules ==================================
+
+import numpy as np
+
+from scene_change import ChangeDetector
+
+# ======================== Connected components =============================
+# The function 'label_components' labels the 4-connected components of a boolean mask.
+# Returns the label array (0 is background) and the number of components.
+# The masks are block-averaged frames (60 x 80), so a flood fill over the set pixels is fast enough without scipy.
+
+def label_components(mask):
+    labels = np.zeros(mask.shape, dtype = np.int32)
+    height, width = mask.shape
+    count = 0
+    for start in zip(*np.nonzero(mask)):
+        if labels[start]:
+            continue
+        count += 1
+        labels[start] = count
+        stack = [start]
+        while stack:
+            row, col = stack.pop()
+            for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+                if 0 <= r < height and 0 <= c < width and mask[r, c] and not labels[r, c]:
+                    labels[r, c] = count
+                    stack.append((r, c))
+    return labels, count
+
+# ======================== Blob Detector ====================================
+# The class 'BlobDetector' finds warm blobs that were not in the scene before.
+# Argument 'min_area' is the smallest blob (in downsampled blocks, 4 x 4 pixels each by default) that counts.
+# Argument 'detector' is the ChangeDetector that keeps the background (a new one by default).
+# update(frame) returns the blobs of the frame, largest first, as dictionaries with 'area' (in pixels of the full frame),
+# 'centroid' (row, col in the full frame) and 'peak' (largest rise above the background, in raw counts).
+
+class BlobDetector:
+
+    def __init__(self, min_area = 4, detector = None):
+        self.min_area = min_area
+        self.detector = ChangeDetector() if detector is None else detector
+
+    def reset(self):
+        self.detector.reset()
+
+    def update(self, frame):
+        if self.detector.update(frame) is None:
+            return []
+        changed = self.detector.changed
+        if changed.sum() < self.min_area:
+            return []
+        labels, count = label_components(changed)
+        factor = self.detector.factor
+        rise = self.detector.last_diff
+        blobs = []
+        for label in range(1, count + 1):
+            rows, cols = np.nonzero(labels == label)
+            if len(rows) < self.min_area:
+                continue
+            blobs.append({
+                'area': len(rows) * factor * factor,
+                'centroid': ((rows.mean() + 0.5) * factor, (cols.mean() + 0.5) * factor),
+                'peak': float(rise[rows, cols].max()),
+            })
+        blobs.sort(key = lambda blob: blob['area'], reverse = True)
+        return blobs
+
+# ======================== Hybrid Trigger ===================================
+# The class 'HybridTrigger' decides whether a PIR event seen while the camera is warm is real.
+# Argument 'warm_time' is the time (in seconds) the camera stays in preview after the last capture session.
+# Argument 'preview_period' is the time (in seconds) between preview frames.
+# Argument 'confirm_window' is the time (in seconds) after a PIR event within which a blob must show up to confirm it.
+# Argument 'min_area' is passed to the BlobDetector.
+# Usage (times in seconds on any clock):
+#     trigger.pir_event(now)                 # on a PIR edge
+#     trigger.update(frame, now)             # for every preview frame; returns 'confirmed', 'rejected' or None
+
+class HybridTrigger:
+
+    def __init__(self, warm_time = 600, preview_period = 1.0, confirm_window = 5, min_area = 4, blob_detector = None):
+        self.warm_time = warm_time
+        self.preview_period = preview_period
+        self.confirm_window = confirm_window
+        self.blob_detector = BlobDetector(min_area = min_area) if blob_detector is None else blob_detector
+        self.pending_since = None
+        self.last_blobs = []
+        self.confirmed = 0
+        self.rejected = 0
+        self.frames = 0
+
+    # Start a new preview: forget the background and any pending event
+    def reset(self):
+        self.blob_detector.reset()
+        self.pending_since = None
+        self.last_blobs = []
+
+    # Record a PIR event at time 'now' (an event already waiting for confirmation is kept)
+    def pir_event(self, now):
+        if self.pending_since is None:
+            self.pending_since = now
+
+    # Returns True if a PIR event is waiting for confirmation
+    def pending(self):
+        return self.pending_since is not None
+
+    # Feed a preview frame taken at time 'now'. Returns 'confirmed' or 'rejected' when a pending PIR event is decided, else None.
+    def update(self, frame, now):
+        self.frames += 1
+        self.last_blobs = self.blob_detector.update(frame)
+        if self.pending_since is None:
+            return None
+        if len(self.last_blobs) > 0:
+            self.pending_since = None
+            self.confirmed += 1
+            return 'confirmed'
+        if now - self.pending_since >= self.confirm_window:
+            self.pending_since = None
+            self.rejected += 1
+            return 'rejected'
+        return None
+
+# ======================== Evaluate on recorded data ========================
+# The function 'evaluate' replays recorded preview frames and PIR events through a HybridTrigger.
+# Argument 'frames' is a sequence of frames (e.g. a FrameDataset) and 'frame_times' their times (in seconds).
+# Argument 'pir_times' are the times (in seconds, same clock) of the PIR events. Events before the first frame are ignored.
+# Returns a list of (pir_time, decision) with decision 'confirmed' or 'rejected' (or None if the recording ended first).
+
+def evaluate(frames, frame_times, pir_times, trigger = None):
+    if trigger is None:
+        trigger = HybridTrigger()
+    trigger.reset()
+    events = sorted(t for t in pir_times if t >= frame_times[0])
+    decisions = []
+    group = [] # events waiting for the same decision
+    next_event = 0
+    for frame, now in zip(frames, frame_times):
+        while next_event < len(events) and events[next_event] <= now:
+            group.append(events[next_event])
+            trigger.pir_event(events[next_event])
+            next_event += 1
+        decision = trigger.update(np.asarray(frame), now)
+        if decision is not None:
+            decisions.extend((t, decision) for t in group)
+            group = []
+    decisions.extend((t, None) for t in group + events[next_event:])
+    return decisions